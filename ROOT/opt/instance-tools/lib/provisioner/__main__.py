@@ -16,7 +16,7 @@ Execution phases (sequential):
     4.  Clone git repos + post commands (parallel)   [fail-fast]
     5.  Install pip packages                         [fail-fast]
     5b. Install conda packages                       [fail-fast]
-    6.  Download all files (parallel, two pools)     [fail-fast]
+    6.  Download all files (largest first)           [fail-fast]
     7.  Register supervisor services                 [fail-fast]
     7b. Write late files (write_files_late)          [fail-fast]
     8.  Run post_commands                             [fail-fast]
@@ -34,6 +34,7 @@ Use --force to clear state and re-run everything.
 from __future__ import annotations
 
 import argparse
+import functools
 import json
 import logging
 import os
@@ -44,11 +45,14 @@ import time
 import urllib.parse
 
 from .auth import validate_civitai_token, validate_hf_token
-from .concurrency import cleanup_lockfiles, run_parallel
+from .concurrency import cleanup_lockfiles
 from .dedup import create_symlinks, dedup_downloads, dedup_git_repos
 from .extensions import run_extensions
-from .downloaders.huggingface import download_hf
-from .downloaders.wget import download_wget
+from .downloaders.hf_hub import download_hf_native, expand_repo, hub_headers
+from .downloaders.huggingface import download_hf, parse_hf_url
+from .downloaders.scheduler import DownloadJob, Meter, probe_sizes, run_downloads
+from .downloaders.segmented import ConnectionPool
+from .downloaders.wget import civitai_headers, download_wget
 from .failure import handle_failure, notify_success
 from .installers.apt import install_apt_packages
 from .installers.files import write_files
@@ -56,10 +60,14 @@ from .installers.conda import install_conda_packages
 from .installers.git import clone_git_repos
 from .installers.pip import install_pip_packages
 from .log import setup_logging
+from .package_index import refresh_package_index
 from .subprocess_runner import run_cmd
 from .manifest import apply_env_conventions, apply_env_merge, load_manifest, resolve_conditionals, resolve_manifest_source
 from .schema import CondaPackages, DownloadEntry, Manifest, PipPackages
-from .state import STATE_DIR, clear_all_state, compute_stage_hash, is_stage_complete, mark_stage_complete
+from .store import ModelStore, stored_download
+from .state import (
+    STATE_DIR, clear_all_state, compute_stage_hash, flush_verified, is_stage_complete, mark_stage_complete,
+)
 from .supervisor import register_services
 
 log = logging.getLogger("provisioner")
@@ -157,6 +165,14 @@ def _apply_env_overrides(manifest: Manifest) -> None:
     if val is not None:
         manifest.settings.conda_env = val
 
+    val = os.environ.get("PROVISIONER_MODEL_STORE")
+    if val is not None:
+        if val.lower() in ("1", "true", "yes"):
+            val = os.path.join(os.environ.get("WORKSPACE", "/workspace"), ".model-store")
+        elif val.lower() in ("0", "false", "no"):
+            val = ""
+        manifest.settings.downloads.store = val
+
 
 def run(manifest_path: str, manifest: Manifest, dry_run: bool = False, force: bool = False) -> int:
     """Execute the full provisioning pipeline.
@@ -297,6 +313,7 @@ def run(manifest_path: str, manifest: Manifest, dry_run: bool = False, force: bo
 
     # Phase 5: Install pip packages
     log.info("--- Phase 5: Pip packages ---")
+    installed_envs: list[str | None] = []
     pip_hash_data = json.dumps(
         [_pip_block_hash_data(b, manifest.settings.venv) for b in manifest.pip_packages],
         sort_keys=True,
@@ -307,11 +324,11 @@ def run(manifest_path: str, manifest: Manifest, dry_run: bool = False, force: bo
     else:
         try:
             for block in manifest.pip_packages:
-                install_pip_packages(
+                installed_envs.append(install_pip_packages(
                     block,
                     default_venv=manifest.settings.venv,
                     dry_run=dry_run,
-                )
+                ))
             if not dry_run:
                 mark_stage_complete("pip", pip_hash)
         except Exception as e:
@@ -330,20 +347,32 @@ def run(manifest_path: str, manifest: Manifest, dry_run: bool = False, force: bo
     else:
         try:
             for block in manifest.conda_packages:
-                install_conda_packages(block, default_conda_env=manifest.settings.conda_env, dry_run=dry_run)
+                installed_envs.append(
+                    install_conda_packages(block, default_conda_env=manifest.settings.conda_env, dry_run=dry_run)
+                )
             if not dry_run:
                 mark_stage_complete("conda", conda_hash)
         except Exception as e:
             log.error("Conda installation failed: %s", e)
             return 1
 
-    # Phase 6: Download files (parallel, two pools)
+    # The capability manifest reports package versions from a per-env index
+    refresh_package_index([env for env in installed_envs if env])
+
+    # Phase 6: Download files (one scheduler across HF and generic downloads)
     log.info("--- Phase 6: Downloads ---")
-    # Hash on original list so adding/removing a duplicate dest invalidates cache
+    # Hash on original list so adding/removing a duplicate dest invalidates cache.
+    # Checksums only join the key where set, so existing manifests keep theirs.
     dl_hash_data = json.dumps(
-        sorted([(d.url, d.dest) for d in manifest.downloads], key=lambda t: t[0])
+        sorted(
+            [(d.url, d.dest) + ((d.sha256, d.size) if d.sha256 or d.size is not None else ())
+             for d in manifest.downloads],
+            key=lambda t: t[0],
+        )
     )
     dl_hash = compute_stage_hash("downloads", dl_hash_data)
+    # Files that may have a FileLock beside them; repos add one per file below
+    lock_paths = [d.dest for d in manifest.downloads if d.dest and not d.dest.endswith("/")]
     if not dry_run and is_stage_complete("downloads", dl_hash):
         log.info("Downloads unchanged, skipping")
     else:
@@ -352,39 +381,99 @@ def run(manifest_path: str, manifest: Manifest, dry_run: bool = False, force: bo
         hf_downloads, wget_downloads = _classify_downloads(unique_downloads)
         retry = manifest.settings.retry
         civitai_token = os.environ.get(civitai_token_env, "")
+        hf_token = os.environ.get(hf_token_env, "")
         concurrency = manifest.settings.concurrency
-        dl_failed = False
-
-        if hf_downloads:
-            def _dl_hf(entry: DownloadEntry) -> None:
-                download_hf(entry, retry=retry, dry_run=dry_run)
-
-            hf_results = run_parallel(
-                _dl_hf, hf_downloads,
-                max_workers=concurrency.hf_downloads,
-                label="HF downloads",
+        dl_settings = manifest.settings.downloads
+        # Shared by every native download: per-host connection cap and bandwidth cap
+        dl_pool = ConnectionPool(max_per_host=dl_settings.connections_per_host)
+        dl_meter = Meter(dl_settings.max_bandwidth_mb * 1024 * 1024)
+        store = None
+        if dl_settings.store and not dry_run:
+            store = ModelStore(
+                dl_settings.store, budget=int(dl_settings.store_budget_gb * 1024 ** 3), pool=dl_pool,
             )
-            if any(r is not None for r in hf_results):
-                dl_failed = True
-                log.error("Some HuggingFace downloads failed")
-
-        if not dl_failed and wget_downloads:
-            def _dl_wget(entry: DownloadEntry) -> None:
-                download_wget(entry, retry=retry, civitai_token=civitai_token, dry_run=dry_run)
-
-            wget_results = run_parallel(
-                _dl_wget, wget_downloads,
-                max_workers=concurrency.wget_downloads,
-                label="wget downloads",
+            log.info("Model store: %s", dl_settings.store)
+
+        jobs = []
+        native_hf = dl_settings.engine == "native" and not dry_run
+
+        def _hf_native_job(entry: DownloadEntry) -> DownloadJob:
+            return DownloadJob(
+                entry, "hf",
+                functools.partial(
+                    download_hf_native, entry, retry=retry, token=hf_token,
+                    downloads=dl_settings, pool=dl_pool, meter=dl_meter,
+                ),
+                probe_url=entry.url, size=entry.size, metered=True,
             )
-            if any(r is not None for r in wget_results):
-                dl_failed = True
-                log.error("Some wget downloads failed")
 
-        if not hf_downloads and not wget_downloads:
+        for entry in hf_downloads:
+            try:
+                _, _, file_path = parse_hf_url(entry.url)
+            except ValueError:
+                file_path = None    # download_hf reports it
+            if native_hf and entry.dest and file_path is not None:
+                if file_path:
+                    jobs.append(_hf_native_job(entry))
+                    continue
+                # A repo becomes one job per file: its shards run in parallel
+                try:
+                    jobs.extend(_hf_native_job(f) for f in expand_repo(entry, hub_headers(hf_token), dl_pool))
+                    continue
+                except Exception as e:
+                    log.warning("Could not list HF repo %s (%s); using hf download", entry.url, e)
+            jobs.append(DownloadJob(
+                entry, "hf",
+                functools.partial(download_hf, entry, retry=retry, dry_run=dry_run),
+                probe_url=entry.url if file_path else "",
+            ))
+        for entry in wget_downloads:
+            jobs.append(DownloadJob(
+                entry, "wget",
+                functools.partial(
+                    download_wget, entry, retry=retry, civitai_token=civitai_token, dry_run=dry_run,
+                    downloads=dl_settings, pool=dl_pool, meter=dl_meter,
+                ),
+                probe_url=entry.url,
+                size=entry.size,
+                metered=dl_settings.engine == "native",
+            ))
+
+        lock_paths.extend(j.entry.dest for j in jobs if j.entry.dest and not j.entry.dest.endswith("/"))
+
+        def _probe_headers(job: DownloadJob) -> dict[str, str]:
+            if job.kind == "hf":
+                return hub_headers(hf_token)
+            return civitai_headers(job.entry.url, civitai_token)
+
+        if store is not None:
+            # Whole files at a known path go through the store; repos and
+            # content-disposition dests do not have one
+            for job in jobs:
+                dest = job.entry.dest
+                if job.probe_url and dest and not dest.endswith("/"):
+                    job.run = functools.partial(
+                        stored_download, store, job.entry.url, dest, job.run, _probe_headers(job),
+                        job.entry.sha256, job.entry.size,
+                    )
+
+        if jobs and not dry_run:
+            probe_sizes(jobs, dl_pool, _probe_headers)
+
+        dl_results = run_downloads(
+            jobs,
+            {"hf": concurrency.hf_downloads, "wget": concurrency.wget_downloads},
+            meter=dl_meter,
+        )
+        dl_pool.close()
+        # Once for the whole phase, failed or not: what did verify stays known
+        flush_verified()
+
+        if not jobs:
             log.info("No downloads to process")
 
-        if dl_failed:
+        if any(r is not None for r in dl_results):
+            log.error("Some downloads failed")
             return 1
 
         create_symlinks(dl_symlinks, dry_run=dry_run)
@@ -487,8 +576,7 @@ def run(manifest_path: str, manifest: Manifest, dry_run: bool = False, force: bo
 
     # Cleanup: remove .lock files left by download file locking
     if not dry_run:
-        lock_paths = [d.dest for d in manifest.downloads if d.dest and not d.dest.endswith("/")]
-        cleanup_lockfiles(lock_paths)
+        cleanup_lockfiles(sorted(set(lock_paths)))
 
     log.info("Provisioning complete!")
     return 0
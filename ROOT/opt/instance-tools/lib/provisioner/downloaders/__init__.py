@@ -1,6 +1,7 @@
 """Download handlers for HuggingFace, CivitAI, and generic wget downloads."""
 
+from .hf_hub import download_hf_native
 from .huggingface import download_hf
 from .wget import download_wget
 
-__all__ = ["download_hf", "download_wget"]
+__all__ = ["download_hf", "download_hf_native", "download_wget"]
@@ -1,13 +1,19 @@
-"""Shared retry logic for downloaders."""
+"""Shared retry and integrity-check logic for downloaders."""
 
 from __future__ import annotations
 
+import hashlib
 import logging
+import os
 import time
 from typing import Callable
 
+from ..state import record_verified, verified_sha256
+
 log = logging.getLogger("provisioner")
 
+HASH_CHUNK = 8 * 1024 * 1024
+
 
 def retry_with_backoff(
     fn: Callable[[], bool],
@@ -38,3 +44,47 @@ def retry_with_backoff(
 
     log.error("Failed to download %s after %d attempts", label, max_attempts)
     return False
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of the file at ``path``, read from disk."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def verify_file(path: str, sha256: str = "", size: int | None = None) -> str:
+    """Check ``path`` against an expected ``sha256`` and ``size``.
+
+    Returns what is wrong with it, or "" if nothing is. A digest recorded for
+    the file as it is now is trusted instead of reading the file again; one
+    computed here is recorded.
+    """
+    if size is not None and os.path.getsize(path) != size:
+        return f"size is {os.path.getsize(path)}, expected {size}"
+    if sha256:
+        digest = verified_sha256(path)
+        if not digest:
+            digest = file_digest(path)
+            record_verified(path, digest)
+        if digest != sha256.lower():
+            return f"sha256 is {digest}, expected {sha256.lower()}"
+    return ""
+
+
+def keep_existing(path: str, sha256: str = "", size: int | None = None) -> bool:
+    """True if ``path`` already holds the expected file and need not be downloaded.
+
+    An existing file that fails the checks is deleted, so it is downloaded again.
+    """
+    if not os.path.isfile(path):
+        return False
+    problem = verify_file(path, sha256, size)
+    if not problem:
+        log.info("File already exists: %s (skipping)", path)
+        return True
+    log.warning("Existing file %s does not match the manifest (%s); downloading it again", path, problem)
+    os.unlink(path)
+    return False
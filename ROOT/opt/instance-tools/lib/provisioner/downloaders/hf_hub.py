@@ -0,0 +1,112 @@
+"""In-process HuggingFace Hub downloads.
+
+``hf download`` is a subprocess per entry: it cannot share connections with
+the other downloads, a whole repo is one opaque job to the scheduler, and a
+single file is staged in a temporary directory that may be on another
+filesystem. With the native engine, HuggingFace downloads that have a
+``dest`` are made in-process instead:
+
+* a repo's file list is fetched once from the Hub API, at the commit
+  ``revision`` resolves to, and ``expand_repo`` turns it into one entry per
+  file -- pinned to that commit, with the Hub's size and LFS sha256 -- so the
+  scheduler runs a repo's shards in parallel, largest first, alongside
+  everything else;
+* each file goes through ``download_native``: segmented Range requests over
+  the shared connection pool, written to ``<dest>.part`` beside the dest and
+  renamed into place, with X-Linked-Etag/X-Linked-Size checked on the way.
+
+The HF token is sent to the Hub only; the redirect to the CDN drops it.
+Downloads into the HF cache (no ``dest``) still use ``hf download``, which
+owns that layout. ``$HF_ENDPOINT`` points everything at a mirror, as it does
+for the CLI.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from urllib.parse import quote
+
+from ..schema import DownloadEntry, DownloadSettings, RetrySettings
+from .huggingface import parse_hf_url
+from .segmented import ConnectionPool, get_json
+from .wget import download_native
+
+log = logging.getLogger("provisioner")
+
+DEFAULT_ENDPOINT = "https://huggingface.co"
+
+
+def hub_endpoint() -> str:
+    return os.environ.get("HF_ENDPOINT", "").rstrip("/") or DEFAULT_ENDPOINT
+
+
+def hub_headers(token: str) -> dict[str, str]:
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+
+def file_url(repo: str, revision: str, path: str, endpoint: str | None = None) -> str:
+    return f"{endpoint or hub_endpoint()}/{repo}/resolve/{quote(revision, safe='')}/{quote(path)}"
+
+
+def expand_repo(
+    entry: DownloadEntry,
+    headers: dict[str, str] | None = None,
+    pool: ConnectionPool | None = None,
+    endpoint: str | None = None,
+) -> list[DownloadEntry]:
+    """One entry per file of the repo ``entry`` names, under ``entry.dest``.
+
+    The file list comes from a single Hub API call. Each file's URL is
+    pinned to the commit the revision pointed at, so all shards come from
+    one snapshot, and carries the Hub's size and (for LFS files) sha256.
+    """
+    endpoint = endpoint or hub_endpoint()
+    repo, revision, _ = parse_hf_url(entry.url)
+    revision = revision or "main"
+    # The Hub redirects renamed repos; get_json keeps those redirects on the Hub
+    info = get_json(f"{endpoint}/api/models/{repo}/revision/{quote(revision, safe='')}?blobs=true", headers, pool)
+    commit = info.get("sha") or revision
+    files = []
+    for sibling in info.get("siblings", []):
+        path = sibling.get("rfilename", "")
+        if not path or path.startswith("/") or ".." in path.split("/"):
+            log.warning("Skipping unsafe path %r in %s", path, repo)
+            continue
+        lfs = sibling.get("lfs") or {}
+        size = lfs.get("size", sibling.get("size"))
+        files.append(DownloadEntry(
+            url=file_url(repo, commit, path, endpoint),
+            dest=os.path.join(entry.dest, path),
+            sha256=lfs.get("sha256", ""),
+            size=size if isinstance(size, int) else None,
+        ))
+    log.info("HF repo %s@%s: %d files -> %s", repo, commit[:12], len(files), entry.dest)
+    return files
+
+
+def download_hf_native(
+    entry: DownloadEntry,
+    retry: RetrySettings,
+    token: str = "",
+    downloads: DownloadSettings | None = None,
+    pool: ConnectionPool | None = None,
+    meter=None,
+) -> None:
+    """Download one HuggingFace file to its ``dest`` in-process.
+
+    ``entry.url`` is a ``/resolve/`` URL, or one from ``expand_repo``.
+    A ``dest`` ending in '/' gets the file's own name, as with ``hf download``.
+    """
+    url, dest = entry.url, entry.dest
+    endpoint = hub_endpoint()
+    if endpoint != DEFAULT_ENDPOINT and url.startswith(f"{DEFAULT_ENDPOINT}/"):
+        # $HF_ENDPOINT applies to manifest URLs too
+        url = endpoint + url[len(DEFAULT_ENDPOINT):]
+    if dest.endswith("/"):
+        dest = os.path.join(dest, os.path.basename(url.split("?")[0]))
+
+    download_native(
+        url, dest, hub_headers(token), retry, downloads or DownloadSettings(),
+        pool=pool, meter=meter, sha256=entry.sha256, size=entry.size,
+    )
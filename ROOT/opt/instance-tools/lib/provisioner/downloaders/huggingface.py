@@ -7,6 +7,10 @@ Supports two modes:
 When dest is empty, downloads go to the HF cache ($HF_HOME or
 ~/.cache/huggingface/hub).  This is the standard approach for inference
 engines like vLLM that read models from cache directly.
+
+With the native download engine, downloads that have a dest are made
+in-process instead (see hf_hub.py); this handler serves the HF cache, the
+wget engine, and repos whose file list could not be fetched.
 """
 
 from __future__ import annotations
@@ -21,7 +25,7 @@ import tempfile
 from ..concurrency import FileLock
 from ..schema import DownloadEntry, RetrySettings
 from ..subprocess_runner import run_cmd
-from .base import retry_with_backoff
+from .base import keep_existing, retry_with_backoff, verify_file
 
 log = logging.getLogger("provisioner")
 
@@ -100,8 +104,12 @@ def _download_repo(
 def _download_file(
     repo: str, revision: str, file_path: str,
     dest: str, retry: RetrySettings, dry_run: bool = False,
+    sha256: str = "", size: int | None = None,
 ) -> None:
-    """Download a single file from a HuggingFace repo."""
+    """Download a single file from a HuggingFace repo.
+
+    With a dest, the file is checked against ``sha256``/``size`` once it lands.
+    """
     cache_mode = not dest
 
     if cache_mode:
@@ -137,14 +145,14 @@ def _download_file(
         return
 
     with FileLock(dest):
-        if os.path.isfile(dest):
-            log.info("File already exists: %s (skipping)", dest)
+        if keep_existing(dest, sha256, size):
             return
 
         os.makedirs(os.path.dirname(dest), exist_ok=True)
 
         def _do_download() -> bool:
-            tmp_dir = tempfile.mkdtemp()
+            # Beside dest, so the move below is a rename, not a copy
+            tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(dest), prefix=".hf-")
             try:
                 # `--local-dir` is a direct download in current huggingface_hub
                 # (it does not populate the HF cache), and as of 1.18.0 combining
@@ -169,6 +177,11 @@ def _download_file(
                     return False
 
                 shutil.move(downloaded, dest)
+                problem = verify_file(dest, sha256, size)
+                if problem:
+                    log.warning("Integrity check failed for %s: %s", dest, problem)
+                    os.unlink(dest)
+                    return False
                 log.info("Successfully downloaded: %s", dest)
                 return True
             finally:
@@ -194,6 +207,6 @@ def download_hf(entry: DownloadEntry, retry: RetrySettings, dry_run: bool = Fals
     repo, revision, file_path = parse_hf_url(entry.url)
 
     if file_path:
-        _download_file(repo, revision, file_path, entry.dest, retry, dry_run)
+        _download_file(repo, revision, file_path, entry.dest, retry, dry_run, entry.sha256, entry.size)
     else:
         _download_repo(repo, entry.dest, retry, dry_run)
@@ -0,0 +1,218 @@
+"""One download scheduler across HuggingFace and generic downloads.
+
+Phase 6 used to run HuggingFace downloads to completion in one pool and only
+then start the generic ones in a second, so a single slow 30 GB HF file left
+the other pool idle and the NIC under-used. ``run_downloads`` runs every
+class from one queue instead:
+
+* each class keeps its own cap (``concurrency.hf_downloads`` and
+  ``concurrency.wget_downloads``), and a class with free slots never waits
+  on another;
+* the queue is largest-first, by sizes from one-byte ranged probes
+  (``probe_sizes``), so the longest transfer is not the one left to start
+  last; entries whose size is unknown -- whole-repo downloads -- go first;
+* native downloads share one ``ConnectionPool``, whose per-host limit caps
+  connections to each host across all files, and one ``Meter``, which counts
+  their bytes as they arrive and holds them to the optional bandwidth cap;
+* aggregate throughput is logged every ``report_interval`` seconds and when
+  the queue is done.
+
+Subprocess transfers (``hf download``, the wget engine) are outside the pool
+and the bandwidth cap; their bytes are counted, by probed size, when each
+one finishes.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable
+
+from ..schema import DownloadEntry
+from .segmented import ConnectionPool, probe
+
+log = logging.getLogger("provisioner")
+
+REPORT_INTERVAL = 30    # Seconds between throughput log lines
+PROBE_WORKERS = 8
+
+
+class Meter:
+    """Counts transferred bytes; with ``rate`` > 0, holds them to ``rate`` bytes/s.
+
+    A token bucket holding at most one second of ``rate``, shared by every
+    thread that calls ``consume``.
+    """
+
+    def __init__(
+        self,
+        rate: float = 0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate = rate
+        self.bytes = 0
+        self._clock = clock
+        self._sleep = sleep
+        self._allowance = float(rate)
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def count(self, nbytes: int) -> None:
+        """Record bytes that were transferred without going through ``consume``."""
+        with self._lock:
+            self.bytes += nbytes
+
+    def consume(self, nbytes: int) -> None:
+        """Record ``nbytes`` just received, sleeping as long as the cap requires."""
+        with self._lock:
+            self.bytes += nbytes
+            if self.rate <= 0:
+                return
+            now = self._clock()
+            self._allowance = min(self.rate, self._allowance + (now - self._last) * self.rate) - nbytes
+            self._last = now
+            delay = -self._allowance / self.rate if self._allowance < 0 else 0.0
+        if delay > 0:
+            self._sleep(delay)
+
+
+@dataclass
+class DownloadJob:
+    entry: DownloadEntry
+    kind: str                       # Concurrency class: "hf" or "wget"
+    run: Callable[[], object]       # Returns False when it transferred nothing
+    probe_url: str = ""             # URL whose size is the job's size; "" = unknown
+    size: int | None = None         # Bytes, from probe_sizes
+    metered: bool = False           # Its bytes reach the Meter as they arrive
+
+
+def _format_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def probe_sizes(
+    jobs: list[DownloadJob],
+    pool: ConnectionPool | None = None,
+    headers: Callable[[DownloadJob], dict[str, str]] = lambda job: {},
+) -> None:
+    """Fill in each job's ``size`` from a ranged probe of its ``probe_url``.
+
+    A job whose dest already exists has nothing to fetch (size 0); one whose
+    size is already known, from the manifest or a repo listing, is not
+    probed. Failed probes leave the size unknown; the download itself
+    reports the error.
+    """
+    def size_of(job: DownloadJob) -> None:
+        if job.entry.dest and not job.entry.dest.endswith("/") and os.path.isfile(job.entry.dest):
+            job.size = 0
+            return
+        if not job.probe_url or job.size is not None:
+            return
+        try:
+            job.size = probe(job.probe_url, headers(job), pool).size
+        except Exception as e:
+            log.debug("Could not probe size of %s: %s", job.probe_url, e)
+
+    with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as executor:
+        list(executor.map(size_of, jobs))
+
+
+def run_downloads(
+    jobs: list[DownloadJob],
+    limits: dict[str, int],
+    meter: Meter | None = None,
+    report_interval: float = REPORT_INTERVAL,
+) -> list[Exception | None]:
+    """Run every job, at most ``limits[kind]`` of each kind at once, largest first.
+
+    Returns a list of results in job order: None for success, Exception for
+    failure. A failure does not stop the other downloads.
+    """
+    if not jobs:
+        return []
+
+    meter = meter or Meter()
+    limits = {kind: max(1, limits.get(kind, 1)) for kind in {job.kind for job in jobs}}
+    pending = sorted(range(len(jobs)), key=lambda i: (jobs[i].size is not None, -(jobs[i].size or 0)))
+    results: list[Exception | None] = [None] * len(jobs)
+    running: Counter[str] = Counter()
+    cond = threading.Condition()
+    done = threading.Event()
+    started = time.monotonic()
+
+    log.info(
+        "Starting %d downloads (%s), largest first",
+        len(jobs), ", ".join(f"{kind} max {n} parallel" for kind, n in sorted(limits.items())),
+    )
+
+    def take() -> int | None:
+        with cond:
+            while pending:
+                for i in pending:
+                    if running[jobs[i].kind] < limits[jobs[i].kind]:
+                        pending.remove(i)
+                        running[jobs[i].kind] += 1
+                        return i
+                cond.wait()
+            return None
+
+    def worker() -> None:
+        while (i := take()) is not None:
+            job = jobs[i]
+            try:
+                fetched = job.run() is not False
+                if fetched and not job.metered and job.size:
+                    meter.count(job.size)
+            except Exception as e:
+                results[i] = e
+                log.error("Failed download %s: %s", job.entry.url, e)
+            finally:
+                with cond:
+                    running[job.kind] -= 1
+                    cond.notify_all()
+
+    def report() -> None:
+        while not done.wait(report_interval):
+            elapsed = time.monotonic() - started
+            with cond:
+                active, queued = sum(running.values()), len(pending)
+            log.info(
+                "Downloads: %d running, %d queued, %s so far (%s/s)",
+                active, queued, _format_bytes(meter.bytes), _format_bytes(meter.bytes / elapsed),
+            )
+
+    # Merge concurrent \r progress bars from subprocess downloads
+    from ..subprocess_runner import ProgressTracker, _get_log_streams
+    tracker = ProgressTracker(_get_log_streams()) if len(jobs) > 1 else None
+    reporter = threading.Thread(target=report, name="download-report", daemon=True)
+    if tracker:
+        tracker.start()
+    reporter.start()
+    try:
+        workers = min(len(jobs), sum(limits.values()))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(worker) for _ in range(workers)]:
+                future.result()
+    finally:
+        done.set()
+        if tracker:
+            tracker.stop()
+
+    elapsed = max(time.monotonic() - started, 1e-9)
+    failed = sum(1 for r in results if r is not None)
+    summary = f"{_format_bytes(meter.bytes)} in {elapsed:.0f}s ({_format_bytes(meter.bytes / elapsed)}/s)"
+    if failed:
+        log.warning("%d/%d downloads failed; %s", failed, len(jobs), summary)
+    else:
+        log.info("All %d downloads completed: %s", len(jobs), summary)
+    return results
@@ -0,0 +1,622 @@
+"""In-process segmented HTTP downloader.
+
+Fetches a file as parallel Range requests over pooled keep-alive connections,
+writing each segment with pwrite into a preallocated ``<dest>.part``. Every
+segment that reaches the disk is recorded in ``<dest>.journal`` (next to the
+download's ``.lock``), so when an attempt fails the next one -- a
+retry_with_backoff retry or the next provisioning run -- fetches only the
+segments still missing instead of starting again from byte 0. Servers that
+ignore Range or do not report a size get one streamed GET, as before.
+
+The file's SHA-256 is computed while it downloads, not in a pass afterwards:
+bytes that extend the hashed prefix are hashed from memory as they arrive,
+and a segment that landed ahead of that prefix is read back, from the page
+cache, once the gap before it closes. The digest is checked against the
+caller's expected sha256/size, or else HuggingFace's X-Linked-Etag and
+X-Linked-Size. On a mismatch after a resume, only the segments carried over
+from the earlier attempt are fetched again before giving up on the file.
+
+Credentials are only sent to the host they were given for: a redirect to
+another host (or scheme, or port) drops Authorization and Cookie, as curl
+does. CivitAI depends on this -- its download endpoint 307s to a presigned
+CDN URL that rejects any Authorization header -- and it keeps a token from
+following a redirect to whatever host it names.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import http.client
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from urllib.parse import urljoin, urlsplit
+
+log = logging.getLogger("provisioner")
+
+DEFAULT_CONNECTIONS = 4
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+MAX_REDIRECTS = 10
+TIMEOUT = 60
+JOURNAL_VERSION = 1
+READBACK_SIZE = 8 * 1024 * 1024
+
+_REDIRECTS = frozenset({301, 302, 303, 307, 308})
+_CREDENTIALS = frozenset({"authorization", "cookie"})
+_CONTENT_RANGE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+_UNSATISFIABLE_RANGE = re.compile(r"bytes\s+\*/(\d+)")
+_SHA256 = re.compile(r"[0-9a-f]{64}")
+
+
+class DownloadError(Exception):
+    """A download attempt failed; whatever reached the disk is kept for the next one."""
+
+
+class IntegrityError(DownloadError):
+    """The file is not the expected one: wrong size or SHA-256. Nothing is kept."""
+
+
+# --------------------------------------------------------------------------- #
+# Connections
+# --------------------------------------------------------------------------- #
+
+def _origin(url: str) -> tuple[str, str, int]:
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise DownloadError(f"Unsupported URL: {parts.scheme}://{parts.hostname or ''}")
+    return parts.scheme, parts.hostname.lower(), parts.port or (443 if parts.scheme == "https" else 80)
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections, shared between threads, per origin.
+
+    With ``max_per_host``, at most that many requests are in flight to one
+    origin at a time, however many downloads share the pool.
+    """
+
+    def __init__(self, timeout: float = TIMEOUT, max_idle: int = 8, max_per_host: int | None = None):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_per_host = max_per_host
+        self.opened = 0
+        self._idle: dict[tuple[str, str, int], list[http.client.HTTPConnection]] = {}
+        self._slots: dict[tuple[str, str, int], threading.Semaphore] = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, origin: tuple[str, str, int]) -> threading.Semaphore | None:
+        if not self.max_per_host:
+            return None
+        with self._lock:
+            return self._slots.setdefault(origin, threading.Semaphore(self.max_per_host))
+
+    def _acquire(self, origin: tuple[str, str, int]) -> tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            idle = self._idle.get(origin)
+            if idle:
+                return idle.pop(), True
+            self.opened += 1
+        scheme, host, port = origin
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(host, port, timeout=self.timeout), False
+
+    def _release(self, origin: tuple[str, str, int], conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(origin, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    @contextlib.contextmanager
+    def request(self, method: str, url: str, headers: dict[str, str]):
+        """Yield the response to one request.
+
+        The connection goes back to the pool if the body was read to the end
+        and the server keeps it alive; otherwise it is closed.
+        """
+        origin = _origin(url)
+        slot = self._slot(origin)
+        if slot is None:
+            with self._request(origin, method, url, headers) as response:
+                yield response
+            return
+        with slot:
+            with self._request(origin, method, url, headers) as response:
+                yield response
+
+    @contextlib.contextmanager
+    def _request(self, origin: tuple[str, str, int], method: str, url: str, headers: dict[str, str]):
+        parts = urlsplit(url)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        conn, reused = self._acquire(origin)
+        try:
+            conn.request(method, target, headers=headers)
+            response = conn.getresponse()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            if not reused:
+                raise
+            # An idle connection the server has since closed: once more on a new one
+            conn, _ = self._acquire(origin)
+            try:
+                conn.request(method, target, headers=headers)
+                response = conn.getresponse()
+            except BaseException:
+                conn.close()
+                raise
+        try:
+            yield response
+        except BaseException:
+            conn.close()
+            raise
+        if response.isclosed() and not response.will_close:
+            self._release(origin, conn)
+        else:
+            conn.close()
+
+
+_default_pool = ConnectionPool()
+
+
+# --------------------------------------------------------------------------- #
+# Probe
+# --------------------------------------------------------------------------- #
+
+@dataclass
+class RemoteFile:
+    """What a ranged probe learned about a URL, after following its redirects."""
+
+    url: str                        # Final URL, after redirects
+    headers: dict[str, str]         # Headers safe to send to that URL
+    size: int | None = None
+    ranges: bool = False            # Whether the server answers Range requests
+    validator: str = ""             # ETag, or Last-Modified, for resuming safely
+    filename: str = ""              # From Content-Disposition, if any
+    linked_etag: str = ""           # X-Linked-Etag: HuggingFace's sha256 of an LFS file
+    linked_size: int | None = None  # X-Linked-Size, alongside it
+
+
+def _linked(response, linked: dict) -> None:
+    # HuggingFace puts these on the /resolve/ hop that redirects to its CDN
+    etag, size = response.getheader("X-Linked-Etag"), response.getheader("X-Linked-Size")
+    if etag:
+        linked["etag"] = etag.strip().removeprefix("W/").strip('"')
+    if size and size.isdigit():
+        linked["size"] = int(size)
+
+
+def _disposition_filename(value: str | None) -> str:
+    for part in (value or "").split(";"):
+        part = part.strip()
+        if part.lower().startswith("filename="):
+            return os.path.basename(part.split("=", 1)[1].strip().strip('"').strip("'"))
+    return ""
+
+
+def _without_credentials(headers: dict[str, str]) -> dict[str, str]:
+    return {k: v for k, v in headers.items() if k.lower() not in _CREDENTIALS}
+
+
+def probe(url: str, headers: dict[str, str] | None = None, pool: ConnectionPool | None = None) -> RemoteFile:
+    """Follow ``url``'s redirects with a one-byte ranged GET.
+
+    A ranged GET rather than HEAD: CivitAI 401s HEAD requests with a token
+    that downloads the same file fine, and the reply also says whether the
+    server honours Range.
+    """
+    pool = pool or _default_pool
+    headers = dict(headers or {})
+    linked: dict = {}
+    for _ in range(MAX_REDIRECTS + 1):
+        with pool.request("GET", url, dict(headers, Range="bytes=0-0")) as response:
+            _linked(response, linked)
+            if response.status in _REDIRECTS:
+                location = response.getheader("Location")
+                response.read()
+                if not location:
+                    raise DownloadError(f"HTTP {response.status} without a Location from {urlsplit(url).hostname}")
+                target = urljoin(url, location)
+                if _origin(target) != _origin(url):
+                    headers = _without_credentials(headers)
+                url = target
+                continue
+
+            remote = RemoteFile(
+                url=url,
+                headers=headers,
+                validator=response.getheader("ETag") or response.getheader("Last-Modified") or "",
+                filename=_disposition_filename(response.getheader("Content-Disposition")),
+                linked_etag=linked.get("etag", ""),
+                linked_size=linked.get("size"),
+            )
+            if response.status == 206:
+                match = _CONTENT_RANGE.match(response.getheader("Content-Range") or "")
+                response.read()
+                if match and match.group(3) != "*":
+                    remote.size, remote.ranges = int(match.group(3)), True
+            elif response.status == 200:
+                # Range ignored: the body is the whole file, so leave it unread
+                length = response.getheader("Content-Length")
+                remote.size = int(length) if length and length.isdigit() else None
+            elif response.status == 416:
+                # Nothing to satisfy bytes=0-0 with: an empty file
+                match = _UNSATISFIABLE_RANGE.match(response.getheader("Content-Range") or "")
+                response.read()
+                if not match:
+                    raise DownloadError(f"HTTP 416 from {urlsplit(url).hostname}")
+                remote.size = int(match.group(1))
+            else:
+                raise DownloadError(f"HTTP {response.status} from {urlsplit(url).hostname}")
+            return remote
+    raise DownloadError(f"More than {MAX_REDIRECTS} redirects")
+
+
+def get_json(url: str, headers: dict[str, str] | None = None, pool: ConnectionPool | None = None):
+    """GET and decode a JSON document, following redirects only on ``url``'s origin.
+
+    For API calls that send credentials: a redirect elsewhere is refused
+    rather than followed without them.
+    """
+    pool = pool or _default_pool
+    headers = dict(headers or {})
+    for _ in range(MAX_REDIRECTS + 1):
+        with pool.request("GET", url, headers) as response:
+            body = response.read()
+            if response.status in _REDIRECTS and response.getheader("Location"):
+                target = urljoin(url, response.getheader("Location"))
+                if _origin(target) != _origin(url):
+                    raise DownloadError(f"{urlsplit(url).hostname} redirected to another host: {target}")
+                url = target
+                continue
+            if response.status != 200:
+                raise DownloadError(f"HTTP {response.status} from {url}")
+            try:
+                return json.loads(body)
+            except ValueError as e:
+                raise DownloadError(f"Invalid JSON from {url}: {e}") from e
+    raise DownloadError(f"More than {MAX_REDIRECTS} redirects")
+
+
+# --------------------------------------------------------------------------- #
+# Journal
+# --------------------------------------------------------------------------- #
+
+@dataclass
+class _Journal:
+    """Segments of ``<dest>.part`` that are known to be on disk."""
+
+    path: str
+    url: str
+    size: int
+    validator: str
+    segment_size: int
+    done: set[int] = field(default_factory=set)
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, dest: str, url: str, remote: RemoteFile, segment_size: int) -> "_Journal":
+        """The journal for this exact file, or an empty one if it is missing or stale."""
+        journal = cls(f"{dest}.journal", url, remote.size or 0, remote.validator, segment_size)
+        try:
+            with open(journal.path) as f:
+                data = json.load(f)
+            if (
+                data.get("version") == JOURNAL_VERSION
+                and data.get("url") == url
+                and data.get("size") == journal.size
+                and data.get("validator") == journal.validator
+                and data.get("segment_size") == segment_size
+                and os.path.getsize(f"{dest}.part") == journal.size
+            ):
+                journal.done = {int(i) for i in data.get("done", [])}
+        except (OSError, ValueError, TypeError, AttributeError):
+            pass
+        return journal
+
+    def commit(self, index: int) -> None:
+        with self._lock:
+            self.done.add(index)
+            self._save()
+
+    def forget(self, indices: list[int]) -> None:
+        with self._lock:
+            self.done.difference_update(indices)
+            self._save()
+
+    def _save(self) -> None:
+        data = {
+            "version": JOURNAL_VERSION, "url": self.url, "size": self.size,
+            "validator": self.validator, "segment_size": self.segment_size,
+            "done": sorted(self.done),
+        }
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def remove(self) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+
+
+# --------------------------------------------------------------------------- #
+# Digest
+# --------------------------------------------------------------------------- #
+
+class _StreamDigest:
+    """SHA-256 of ``<dest>.part``, in file order, while segments land out of order.
+
+    ``position`` is the end of the hashed prefix. The segment that contains
+    it hashes its chunks from memory as it writes them; bytes written ahead
+    of it are read back with pread when ``through`` says the gap has closed.
+    """
+
+    def __init__(self, fd: int):
+        self.position = 0
+        self._fd = fd
+        self._hash = hashlib.sha256()
+        self._lock = threading.Lock()
+
+    def _read_to(self, end: int) -> None:
+        while self.position < end:
+            data = os.pread(self._fd, min(READBACK_SIZE, end - self.position), self.position)
+            if not data:
+                raise DownloadError(f"Short read at byte {self.position}")
+            self._hash.update(data)
+            self.position += len(data)
+
+    def update(self, data: bytes) -> None:
+        """Hash bytes that directly follow the prefix (a plain stream)."""
+        self._hash.update(data)
+        self.position += len(data)
+
+    def written(self, start: int, offset: int, chunk: bytes) -> None:
+        """The segment from ``start`` has written ``chunk`` at ``offset``, and everything before it."""
+        with self._lock:
+            if start <= self.position <= offset:
+                self._read_to(offset)
+                self._hash.update(chunk)
+                self.position = offset + len(chunk)
+
+    def through(self, end: int) -> None:
+        """Everything before ``end`` is on disk: hash it."""
+        with self._lock:
+            self._read_to(end)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+@dataclass
+class DownloadResult:
+    fetched: int                    # Bytes transferred by this call
+    sha256: str                     # Of the whole file
+    verified: bool = False          # Checked against an expected digest
+
+
+def _expected(remote: RemoteFile, sha256: str, size: int | None) -> tuple[str, int | None]:
+    """The caller's expected digest and size, else what HuggingFace links to the file."""
+    if not sha256 and _SHA256.fullmatch(remote.linked_etag):
+        sha256 = remote.linked_etag
+    if size is None:
+        size = remote.linked_size
+    return sha256.lower(), size
+
+
+# --------------------------------------------------------------------------- #
+# Download
+# --------------------------------------------------------------------------- #
+
+def _pwrite_all(fd: int, data: bytes, offset: int) -> None:
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view, offset = view[written:], offset + written
+
+
+def _preallocate(fd: int, size: int) -> None:
+    os.ftruncate(fd, size)
+    if size:
+        # Reserve the blocks up front so a full disk fails now, not 40 GB in
+        with contextlib.suppress(AttributeError, OSError):
+            os.posix_fallocate(fd, 0, size)
+
+
+def _fetch_segment(
+    pool: ConnectionPool, remote: RemoteFile, fd: int, start: int, end: int,
+    stop: threading.Event, meter=None, digest: _StreamDigest | None = None,
+) -> int:
+    headers = dict(remote.headers, Range=f"bytes={start}-{end}")
+    host = urlsplit(remote.url).hostname
+    with pool.request("GET", remote.url, headers) as response:
+        if response.status != 206:
+            raise DownloadError(f"HTTP {response.status} for bytes {start}-{end} from {host}")
+        match = _CONTENT_RANGE.match(response.getheader("Content-Range") or "")
+        if not match or int(match.group(1)) != start or int(match.group(2)) != end:
+            raise DownloadError(f"Unexpected Content-Range for bytes {start}-{end} from {host}")
+        offset = start
+        while offset <= end:
+            if stop.is_set():
+                raise DownloadError("Cancelled")
+            chunk = response.read(min(CHUNK_SIZE, end + 1 - offset))
+            if not chunk:
+                raise DownloadError(f"Connection closed at byte {offset} of {start}-{end} from {host}")
+            _pwrite_all(fd, chunk, offset)
+            if digest is not None:
+                digest.written(start, offset, chunk)
+            offset += len(chunk)
+            if meter is not None:
+                meter.consume(len(chunk))
+    return end + 1 - start
+
+
+def _download_stream(
+    pool: ConnectionPool, remote: RemoteFile, part: str, digest: _StreamDigest, meter=None,
+) -> int:
+    """One plain GET, for servers that cannot resume."""
+    fetched = 0
+    with pool.request("GET", remote.url, remote.headers) as response:
+        if response.status != 200:
+            raise DownloadError(f"HTTP {response.status} from {urlsplit(remote.url).hostname}")
+        with open(part, "wb") as f:
+            while chunk := response.read(CHUNK_SIZE):
+                f.write(chunk)
+                digest.update(chunk)
+                fetched += len(chunk)
+                if meter is not None:
+                    meter.consume(len(chunk))
+    return fetched
+
+
+def _fetch_segments(
+    pool: ConnectionPool, remote: RemoteFile, fd: int, segments: list[tuple[int, int, int]],
+    journal: _Journal, connections: int, digest: _StreamDigest | None, meter=None,
+) -> int:
+    """Fetch ``segments`` in parallel, journaling each; stops at the first failure."""
+    if not segments:
+        return 0
+    segment_size = journal.segment_size
+    total = -(-journal.size // segment_size)
+    stop = threading.Event()
+
+    def fetch(segment: tuple[int, int, int]) -> int:
+        index, start, end = segment
+        fetched = _fetch_segment(pool, remote, fd, start, end, stop, meter, digest)
+        # On disk before the journal says so
+        os.fdatasync(fd)
+        journal.commit(index)
+        if digest is not None:
+            contiguous = next((i for i in range(total) if i not in journal.done), total)
+            digest.through(min(contiguous * segment_size, journal.size))
+        return fetched
+
+    with ThreadPoolExecutor(max_workers=max(1, min(connections, len(segments)))) as executor:
+        futures = [executor.submit(fetch, s) for s in segments]
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        failed = next((f for f in done if f.exception() is not None), None)
+        if failed is not None:
+            stop.set()
+            for future in futures:
+                future.cancel()
+            raise failed.exception()
+    return sum(f.result() for f in futures)
+
+
+def _discard(part: str, journal: _Journal | None = None) -> None:
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(part)
+    if journal is not None:
+        journal.remove()
+
+
+def download_segmented(
+    url: str,
+    dest: str,
+    headers: dict[str, str] | None = None,
+    *,
+    connections: int = DEFAULT_CONNECTIONS,
+    segment_size: int = DEFAULT_SEGMENT_SIZE,
+    pool: ConnectionPool | None = None,
+    remote: RemoteFile | None = None,
+    meter=None,
+    sha256: str = "",
+    size: int | None = None,
+) -> DownloadResult:
+    """Download ``url`` to ``dest``, resuming an earlier attempt.
+
+    ``dest`` only appears once complete and checked against ``sha256`` and
+    ``size`` (or the server's X-Linked-Etag/X-Linked-Size). Raises
+    DownloadError (or OSError) on failure, leaving ``<dest>.part`` and
+    ``<dest>.journal`` for the next attempt, or IntegrityError, after
+    discarding them, when the file is not the expected one. Pass ``remote``
+    to reuse a probe made moments ago, and ``meter`` (anything with
+    ``consume(nbytes)``) to count and pace the bytes.
+    """
+    pool = pool or _default_pool
+    remote = remote or probe(url, headers, pool)
+    expected_sha256, expected_size = _expected(remote, sha256, size)
+    part = f"{dest}.part"
+    name = os.path.basename(dest)
+
+    if expected_size is not None and remote.size is not None and remote.size != expected_size:
+        raise IntegrityError(f"{name}: server reports {remote.size} bytes, expected {expected_size}")
+
+    if not remote.ranges or not remote.size:
+        digest = _StreamDigest(-1)
+        fetched = _download_stream(pool, remote, part, digest, meter) if remote.size != 0 else 0
+        if remote.size == 0:
+            open(part, "wb").close()
+        problem = _check(part, digest.hexdigest(), expected_sha256, expected_size)
+        if problem:
+            _discard(part)
+            raise IntegrityError(f"{name}: {problem}")
+        os.replace(part, dest)
+        return DownloadResult(fetched, digest.hexdigest(), bool(expected_sha256))
+
+    segment_size = max(segment_size, CHUNK_SIZE)
+    segments = [(i, start, min(start + segment_size, remote.size) - 1)
+                for i, start in enumerate(range(0, remote.size, segment_size))]
+    journal = _Journal.load(dest, url, remote, segment_size)
+    carried = sorted(journal.done)
+    pending = [s for s in segments if s[0] not in journal.done]
+    if journal.done:
+        log.info("Resuming %s: %d/%d segments already on disk", name, len(journal.done), len(segments))
+
+    fd = os.open(part, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if not journal.done:
+            _preallocate(fd, remote.size)
+        digest = _StreamDigest(fd)
+        # What an earlier attempt left is read back once, up to the first gap
+        digest.through(next((start for i, start, _ in segments if i not in journal.done), remote.size))
+        fetched = _fetch_segments(pool, remote, fd, pending, journal, connections, digest, meter)
+        digest.through(remote.size)
+        problem = _check(part, digest.hexdigest(), expected_sha256, expected_size)
+
+        if problem and carried:
+            # The likeliest culprit is what a previous attempt left behind
+            log.warning(
+                "%s: %s; fetching the %d segments from the earlier attempt again",
+                name, problem, len(carried),
+            )
+            journal.forget(carried)
+            fetched += _fetch_segments(
+                pool, remote, fd, [segments[i] for i in carried], journal, connections, None, meter,
+            )
+            digest = _StreamDigest(fd)
+            digest.through(remote.size)
+            problem = _check(part, digest.hexdigest(), expected_sha256, expected_size)
+    finally:
+        os.close(fd)
+
+    if problem:
+        _discard(part, journal)
+        raise IntegrityError(f"{name}: {problem}")
+    os.replace(part, dest)
+    journal.remove()
+    return DownloadResult(fetched, digest.hexdigest(), bool(expected_sha256))
+
+
+def _check(part: str, digest: str, sha256: str, size: int | None) -> str:
+    """What is wrong with the finished ``part``, or "" if nothing is."""
+    actual = os.path.getsize(part)
+    if size is not None and actual != size:
+        return f"size is {actual}, expected {size}"
+    if sha256 and digest != sha256:
+        return f"sha256 is {digest}, expected {sha256}"
+    return ""
@@ -1,9 +1,18 @@
 """Generic download handler.
 
-Handles plain HTTP downloads with wget, and authenticated CivitAI downloads with
-curl — CivitAI 307s to a presigned CDN host, and wget re-sends --header across that
-host change (leaking the token) while curl drops it.
+By default downloads run in-process (see segmented.py): parallel Range
+requests that resume from the last completed segment after a failure. With
+``settings.downloads.engine: wget`` they go through wget instead, and
+authenticated CivitAI downloads through curl — CivitAI 307s to a presigned CDN
+host, and wget re-sends --header across that host change (leaking the token)
+while curl drops it. The native engine drops credentials on any cross-host
+redirect too.
 Supports content-disposition filename extraction when dest ends with '/'.
+
+An entry's ``sha256``/``size`` are checked: by the native engine while the
+file streams in, by the wget engine after it lands. A file that fails is
+downloaded again; one that passes has its digest recorded, so an existing
+dest is trusted on later runs without being read again.
 """
 
 from __future__ import annotations
@@ -14,9 +23,11 @@ import subprocess
 from urllib.parse import urlparse
 
 from ..concurrency import FileLock
+from ..state import record_verified
 from ..subprocess_runner import run_cmd
-from ..schema import DownloadEntry, RetrySettings
-from .base import retry_with_backoff
+from ..schema import DownloadEntry, DownloadSettings, RetrySettings
+from .base import keep_existing, retry_with_backoff, verify_file
+from .segmented import ConnectionPool, IntegrityError, download_segmented, probe
 
 log = logging.getLogger("provisioner")
 
@@ -62,13 +73,80 @@ def _is_civitai(url: str) -> bool:
     return parsed.scheme == "https" and (host == "civitai.com" or host.endswith(".civitai.com"))
 
 
+def civitai_headers(url: str, civitai_token: str) -> dict[str, str]:
+    """The Authorization header for ``url``: the CivitAI token, on real CivitAI hosts only."""
+    if civitai_token and _is_civitai(url):
+        return {"Authorization": f"Bearer {civitai_token}"}
+    return {}
+
+
+def download_native(
+    url: str,
+    dest: str,
+    headers: dict[str, str],
+    retry: RetrySettings,
+    downloads: DownloadSettings,
+    pool: ConnectionPool | None = None,
+    meter=None,
+    sha256: str = "",
+    size: int | None = None,
+) -> None:
+    """Download ``url`` to a concrete ``dest`` in-process, with retries.
+
+    Shared by generic and HuggingFace downloads. Raises RuntimeError once
+    the retries are exhausted.
+    """
+    with FileLock(dest):
+        if keep_existing(dest, sha256, size):
+            return
+
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+
+        def _do_native_download() -> bool:
+            # A failure keeps dest.part and dest.journal: the retry resumes.
+            # An IntegrityError discards them: the retry starts over.
+            try:
+                result = download_segmented(
+                    url, dest, headers,
+                    connections=downloads.connections_per_file,
+                    segment_size=downloads.segment_size_mb * 1024 * 1024,
+                    pool=pool, meter=meter, sha256=sha256, size=size,
+                )
+            except IntegrityError as e:
+                log.warning("Integrity check failed for %s: %s", url, e)
+                return False
+            if os.path.isfile(dest) and (os.path.getsize(dest) > 0 or size == 0):
+                record_verified(dest, result.sha256)
+                log.info(
+                    "Successfully downloaded: %s (%d bytes fetched%s)",
+                    dest, result.fetched, ", sha256 verified" if result.verified else "",
+                )
+                return True
+            return False
+
+        if not retry_with_backoff(
+            _do_native_download,
+            label=url,
+            max_attempts=retry.max_attempts,
+            initial_delay=retry.initial_delay,
+            backoff_multiplier=retry.backoff_multiplier,
+        ):
+            raise RuntimeError(f"Failed to download {url}")
+
+
 def download_wget(
     entry: DownloadEntry,
     retry: RetrySettings,
     civitai_token: str = "",
     dry_run: bool = False,
+    downloads: DownloadSettings | None = None,
+    pool: ConnectionPool | None = None,
+    meter=None,
 ) -> None:
-    """Download a file using wget.
+    """Download a file in-process, or with wget/curl (``downloads.engine``).
+
+    Native downloads go through ``pool`` and ``meter`` when given, so the
+    scheduler can limit connections per host and bandwidth across files.
 
     For CivitAI URLs, adds Authorization header.
     If dest ends with '/', uses content-disposition for filename.
@@ -76,17 +154,27 @@ def download_wget(
     """
     url = entry.url
     dest = entry.dest
+    downloads = downloads or DownloadSettings()
+    native = downloads.engine == "native"
     auth_header = ""
 
     if _is_civitai(url) and civitai_token:
         auth_header = f"Authorization: Bearer {civitai_token}"
+    headers = civitai_headers(url, civitai_token)
 
     # Resolve dest for content-disposition
     use_content_disposition = dest.endswith("/")
     if use_content_disposition:
         dest_dir = dest.rstrip("/")
         if not dry_run:
-            filename = _get_content_disposition_filename(url, auth_header or None)
+            if native:
+                try:
+                    filename = probe(url, headers, pool).filename
+                except Exception as e:
+                    log.warning("Could not probe %s for a filename: %s", url, e)
+                    filename = ""
+            else:
+                filename = _get_content_disposition_filename(url, auth_header or None)
             if not filename:
                 # Fallback: use last URL path segment
                 filename = os.path.basename(url.split("?")[0]) or "download"
@@ -99,9 +187,14 @@ def download_wget(
         log.info("[DRY RUN] Would download wget %s -> %s", url, dest)
         return
 
+    if native:
+        download_native(
+            url, dest, headers, retry, downloads, pool=pool, meter=meter, sha256=entry.sha256, size=entry.size,
+        )
+        return
+
     with FileLock(dest):
-        if os.path.isfile(dest):
-            log.info("File already exists: %s (skipping)", dest)
+        if keep_existing(dest, entry.sha256, entry.size):
             return
 
         os.makedirs(os.path.dirname(dest), exist_ok=True)
@@ -138,6 +231,11 @@ def download_wget(
                 return False
 
             if os.path.isfile(dest) and os.path.getsize(dest) > 0:
+                problem = verify_file(dest, entry.sha256, entry.size)
+                if problem:
+                    log.warning("Integrity check failed for %s: %s", url, problem)
+                    os.unlink(dest)
+                    return False
                 log.info("Successfully downloaded: %s", dest)
                 return True
 
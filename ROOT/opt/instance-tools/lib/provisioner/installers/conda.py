@@ -74,7 +74,7 @@ def install_conda_packages(
     config: CondaPackages,
     default_conda_env: str = "",
     dry_run: bool = False,
-) -> None:
+) -> str | None:
     """Install conda packages into a conda prefix environment.
 
     Uses mamba if available (Miniforge3 includes it), otherwise conda.
@@ -82,6 +82,9 @@ def install_conda_packages(
 
     If config.env is set, installs into that prefix environment (creating it
     if it doesn't exist). Otherwise installs into the base/active environment.
+
+    Returns the prefix that was installed into, or None when nothing was
+    installed (dry run, empty block).
     """
     packages = config.packages or []
     channels = config.channels or []
@@ -90,7 +93,7 @@ def install_conda_packages(
 
     if not packages:
         log.info("No conda packages to install")
-        return
+        return None
 
     target_label = env_path if env_path else "base environment"
 
@@ -99,7 +102,7 @@ def install_conda_packages(
                  target_label, ", ".join(packages))
         if channels:
             log.info("[DRY RUN] Channels: %s", ", ".join(channels))
-        return
+        return None
 
     tool = _get_conda_tool()
 
@@ -125,3 +128,6 @@ def install_conda_packages(
 
     run_cmd(cmd, label="conda")
     log.info("Conda packages installed successfully")
+
+    # Without -p the tool installs into its own base environment
+    return env_path or os.path.dirname(os.path.dirname(tool))
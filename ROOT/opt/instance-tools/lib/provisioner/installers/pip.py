@@ -43,7 +43,7 @@ def install_pip_packages(
     venv: str = "",
     default_venv: str = "",
     dry_run: bool = False,
-) -> None:
+) -> str | None:
     """Install pip packages and requirements files.
 
     Supports both 'uv' and 'pip' as the install tool.
@@ -53,6 +53,9 @@ def install_pip_packages(
     The venv is resolved as: config.venv > venv arg > default_venv.
     If the block specifies a python version, the venv is auto-created.
     venv="system" installs to system python with --break-system-packages.
+
+    Returns the venv that was installed into, or None when nothing was
+    installed (dry run, empty block) or the target was system python.
     """
     # Resolve venv: block-level > explicit arg > default
     resolved_venv = config.venv or venv or default_venv
@@ -68,7 +71,7 @@ def install_pip_packages(
 
     if not packages and not requirements:
         log.info("No pip packages to install")
-        return
+        return None
 
     target_label = "system python" if is_system else resolved_venv
 
@@ -79,7 +82,7 @@ def install_pip_packages(
         if requirements:
             log.info("[DRY RUN] Would install requirements in %s: %s",
                      target_label, ", ".join(requirements))
-        return
+        return None
 
     # Auto-create venv if needed (not for system python)
     if not is_system and (config.venv or config.python):
@@ -135,3 +138,5 @@ def install_pip_packages(
 
         run_cmd(cmd, label="pip")
         log.info("Requirements installed: %s", req_file)
+
+    return None if is_system else resolved_venv
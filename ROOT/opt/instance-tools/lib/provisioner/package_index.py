@@ -0,0 +1,45 @@
+"""Refresh the portal's installed-package index after pip/conda installs.
+
+The capability manifest (``include=packages``) reads package versions from a
+per-environment index kept by the portal's ``capabilities.packages`` module.
+The index notices a changed site-packages on its own; refreshing it here
+just moves the rescan off the first request after provisioning.
+
+The portal lives in its own venv, so the module is run there rather than
+imported. Best-effort: a missing portal or a failed refresh never fails
+provisioning.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import subprocess
+
+log = logging.getLogger("provisioner")
+
+PORTAL_DIR = "/opt/portal-aio"
+PORTAL_PYTHON = "/opt/portal-aio/venv/bin/python"
+
+
+def refresh_package_index(env_paths: list[str]) -> None:
+    """Rebuild the package index of each environment in ``env_paths``."""
+    envs = list(dict.fromkeys(p for p in env_paths if p))
+    if not envs:
+        return
+    if not os.path.isfile(PORTAL_PYTHON):
+        log.debug("Portal not installed, skipping package index refresh")
+        return
+    try:
+        res = subprocess.run(
+            [PORTAL_PYTHON, "-m", "capabilities.packages", *envs],
+            cwd=PORTAL_DIR, capture_output=True, text=True, timeout=60,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        log.warning("Package index refresh failed: %s", e)
+        return
+    if res.returncode != 0:
+        log.warning("Package index refresh exited %d: %s", res.returncode, res.stderr.strip())
+        return
+    for line in res.stdout.splitlines():
+        log.debug("Package index: %s", line)
@@ -3,11 +3,14 @@
 from __future__ import annotations
 
 import logging
+import re
 from dataclasses import dataclass, field
 
 log = logging.getLogger("provisioner")
 
 VALID_FAILURE_ACTIONS = frozenset({"continue", "stop", "destroy"})
+VALID_DOWNLOAD_ENGINES = frozenset({"native", "wget"})
+_SHA256_RE = re.compile(r"[0-9a-fA-F]{64}")
 
 
 @dataclass
@@ -23,6 +26,17 @@ class ConcurrencySettings:
     wget_downloads: int = 5
 
 
+@dataclass
+class DownloadSettings:
+    engine: str = "native"          # "native": in-process, segmented, resumable; "wget": wget/curl/hf CLI
+    connections_per_file: int = 4
+    segment_size_mb: int = 64
+    connections_per_host: int = 16  # Across all native downloads from one host
+    max_bandwidth_mb: float = 0     # MB/s for native downloads; 0 = unlimited
+    store: str = ""                 # Content-addressed model store directory; "" = off
+    store_budget_gb: float = 0      # LRU-evict the store beyond this size; 0 = unlimited
+
+
 @dataclass
 class Settings:
     venv: str = "/venv/main"
@@ -30,6 +44,7 @@ class Settings:
     log_file: str = "/var/log/portal/provisioning.log"
     concurrency: ConcurrencySettings = field(default_factory=ConcurrencySettings)
     retry: RetrySettings = field(default_factory=RetrySettings)
+    downloads: DownloadSettings = field(default_factory=DownloadSettings)
 
 
 @dataclass
@@ -76,6 +91,8 @@ class GitRepo:
 class DownloadEntry:
     url: str = ""
     dest: str = ""
+    sha256: str = ""                # Expected content digest; "" = not checked
+    size: int | None = None         # Expected size in bytes; None = not checked
 
 
 @dataclass
@@ -213,5 +230,20 @@ def validate_manifest(data: dict) -> Manifest:
             f"Invalid on_failure.action: '{manifest.on_failure.action}' "
             f"(must be one of: {', '.join(sorted(VALID_FAILURE_ACTIONS))})"
         )
+    if manifest.settings.downloads.engine not in VALID_DOWNLOAD_ENGINES:
+        raise ValueError(
+            f"Invalid settings.downloads.engine: '{manifest.settings.downloads.engine}' "
+            f"(must be one of: {', '.join(sorted(VALID_DOWNLOAD_ENGINES))})"
+        )
+    entries = list(manifest.downloads)
+    for cond in manifest.conditional_downloads:
+        entries += cond.downloads + cond.else_downloads
+    for entry in entries:
+        if entry.sha256:
+            if not isinstance(entry.sha256, str) or not _SHA256_RE.fullmatch(entry.sha256):
+                raise ValueError(f"Invalid sha256 for download {entry.url}: '{entry.sha256}' (must be 64 hex digits)")
+            entry.sha256 = entry.sha256.lower()
+        if entry.size is not None and (isinstance(entry.size, bool) or not isinstance(entry.size, int) or entry.size < 0):
+            raise ValueError(f"Invalid size for download {entry.url}: '{entry.size}' (must be a byte count)")
 
     return manifest
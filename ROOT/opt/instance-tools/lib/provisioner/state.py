@@ -3,15 +3,23 @@
 Each stage computes a SHA-256 hash of its inputs before running.
 If the hash matches a stored value, the stage is skipped.
 Hashes are stored in STATE_DIR as individual files.
+
+Downloaded files whose SHA-256 has been computed are recorded in
+STATE_DIR/verified.json, keyed by path and tied to the file's size and
+mtime, so a later run can trust an unchanged file without reading it again.
+The records are read once per run and written back by ``flush_verified``;
+records of files that no longer exist are dropped when they are read.
 """
 
 from __future__ import annotations
 
 import hashlib
+import json
 import logging
 import os
 import shutil
 import stat
+import threading
 
 log = logging.getLogger("provisioner")
 
@@ -72,6 +80,12 @@ STATE_DIR = _resolve_state_dir()
 # we did not create is the part that turns a bad value into an incident.
 _OWNER_MARKER = ".provisioner-state-dir"
 
+_VERIFIED_FILE = "verified.json"
+_verified_lock = threading.Lock()
+_verified: dict | None = None   # In-process copy of verified.json
+_verified_dir = ""              # The STATE_DIR it was read from
+_verified_dirty = False         # Changed since it was read or last flushed
+
 
 def compute_stage_hash(stage_name: str, data: str) -> str:
     """SHA-256 of stage name + serialized input data."""
@@ -116,8 +130,8 @@ def _plant_owner_marker() -> None:
         f.write("provisioner state directory\n")
 
 
-def mark_stage_complete(stage_name: str, current_hash: str) -> None:
-    """Write current_hash to STATE_DIR/{stage_name}.hash."""
+def _ensure_state_dir(purpose: str) -> bool:
+    """Create STATE_DIR if needed; False (with a warning) if it cannot be."""
     # Create the directory OURSELVES and plant the ownership marker ONLY when we
     # did. exist_ok=True would silently adopt a pre-existing foreign directory,
     # so the next `clear_all_state()`/--force would rmtree a tree we never made:
@@ -128,11 +142,17 @@ def mark_stage_complete(stage_name: str, current_hash: str) -> None:
     except FileExistsError:
         created = False
     except OSError as e:
-        log.warning("Could not create state dir '%s' (%s); the stage will re-run "
-                    "next time rather than being skipped", STATE_DIR, e)
-        return
+        log.warning("Could not create state dir '%s' (%s); %s", STATE_DIR, e, purpose)
+        return False
     if created:
         _plant_owner_marker()
+    return True
+
+
+def mark_stage_complete(stage_name: str, current_hash: str) -> None:
+    """Write current_hash to STATE_DIR/{stage_name}.hash."""
+    if not _ensure_state_dir("the stage will re-run next time rather than being skipped"):
+        return
 
     # O_NOFOLLOW: a pre-planted symlink named <stage>.hash in a directory some
     # lower-privileged principal can write (images do create uid 1001 with
@@ -152,6 +172,87 @@ def mark_stage_complete(stage_name: str, current_hash: str) -> None:
     log.debug("Marked stage '%s' complete (hash=%s)", stage_name, current_hash[:12])
 
 
+def _load_verified() -> dict:
+    try:
+        fd = os.open(os.path.join(STATE_DIR, _VERIFIED_FILE), os.O_RDONLY | os.O_NOFOLLOW)
+    except OSError:
+        return {}
+    try:
+        with os.fdopen(fd) as f:
+            data = json.load(f)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _verified_records() -> dict:
+    """The in-process records, read on first use. Caller holds _verified_lock."""
+    global _verified, _verified_dir, _verified_dirty
+    if _verified is None or _verified_dir != STATE_DIR:
+        loaded = _load_verified()
+        # Files deleted since they were recorded would otherwise stay forever
+        _verified = {p: r for p, r in loaded.items() if os.path.exists(p)}
+        _verified_dir = STATE_DIR
+        _verified_dirty = len(_verified) != len(loaded)
+    return _verified
+
+
+def verified_sha256(path: str) -> str:
+    """The recorded SHA-256 of ``path``, or "" if none is recorded for the file as it is now."""
+    with _verified_lock:
+        record = _verified_records().get(os.path.abspath(path))
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ""
+    if isinstance(record, dict) and record.get("size") == st.st_size and record.get("mtime_ns") == st.st_mtime_ns:
+        return str(record.get("sha256", ""))
+    return ""
+
+
+def record_verified(path: str, sha256: str) -> None:
+    """Record that ``path``, as it is now, has content digest ``sha256``.
+
+    Kept in memory until ``flush_verified``.
+    """
+    global _verified_dirty
+    try:
+        st = os.stat(path)
+    except OSError:
+        return
+    with _verified_lock:
+        _verified_records()[os.path.abspath(path)] = {
+            "sha256": sha256, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+        }
+        _verified_dirty = True
+
+
+def flush_verified() -> None:
+    """Write the verified digests back to STATE_DIR if they changed."""
+    global _verified_dirty
+    with _verified_lock:
+        if not _verified_dirty or _verified_dir != STATE_DIR:
+            return
+        if not _ensure_state_dir("files will be hashed again next time"):
+            return
+        # Written beside and renamed over: O_EXCL|O_NOFOLLOW refuses a planted
+        # symlink, and os.replace swaps the name rather than following one
+        target = os.path.join(STATE_DIR, _VERIFIED_FILE)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(_verified, f, separators=(",", ":"))
+            os.replace(tmp, target)
+            _verified_dirty = False
+        except OSError as e:
+            log.warning("Could not record verified digests (%s)", e)
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+
 def _dir_is_ours(path: str) -> bool:
     """True if the provisioner created this state directory.
 
@@ -180,7 +281,13 @@ def _dir_is_ours(path: str) -> bool:
     # final rmdir then fails EBUSY and --force dies on a traceback instead of the
     # clean refusal this guard promises.
     return bool(entries) and all(
-        e == _OWNER_MARKER or e.endswith(".hash") for e in entries)
+        e in (_OWNER_MARKER, _VERIFIED_FILE) or e.endswith(".hash") for e in entries)
+
+
+def _forget_verified() -> None:
+    global _verified, _verified_dirty
+    with _verified_lock:
+        _verified, _verified_dirty = None, False
 
 
 def clear_all_state() -> bool:
@@ -192,6 +299,7 @@ def clear_all_state() -> bool:
     able to see a refusal rather than silently carry on and skip stages against
     stale hashes."""
     if not os.path.isdir(STATE_DIR):
+        _forget_verified()
         return True                            # nothing to clear
     if not _dir_is_ours(STATE_DIR):
         log.warning("Refusing to clear %s: it has no %s marker and holds files the "
@@ -199,5 +307,6 @@ def clear_all_state() -> bool:
                     STATE_DIR, _OWNER_MARKER)
         return False
     shutil.rmtree(STATE_DIR)
+    _forget_verified()
     log.info("Cleared all provisioner state")
     return True
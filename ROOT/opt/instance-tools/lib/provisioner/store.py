@@ -0,0 +1,298 @@
+"""Content-addressed model store shared across dests, templates and reprovisions.
+
+dedup_downloads only collapses identical URLs within one manifest. With
+``settings.downloads.store`` set (usually under ``${WORKSPACE}``), every
+completed file download is also linked into a store keyed by the sha256 of
+its content, and an index remembers which URL -- and which remote identity --
+produced which digest. A later download of the same content, under any dest,
+from another manifest or on the next boot of the same volume, is linked out
+of the store instead of fetched.
+
+* A HuggingFace URL pinned to a commit is immutable: an indexed one is
+  linked without touching the network at all.
+* Any other URL costs one one-byte ranged probe. Its identity is
+  HuggingFace's X-Linked-Etag where present -- the sha256 of the file, so a
+  ``/resolve/main/`` URL and a commit-pinned URL of the same file match --
+  else the host, ETag and size.
+
+Files go in and out by hardlink, then reflink, then copy, so on one
+filesystem a stored file takes its space once however many dests use it.
+When the store grows past ``budget`` bytes, least-recently-used blobs are
+evicted; an evicted blob that is still linked into a dest stays there.
+
+Layout::
+
+    <root>/blobs/<aa>/<sha256>
+    <root>/index.json
+"""
+
+from __future__ import annotations
+
+import contextlib
+import errno
+import fcntl
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from typing import Callable
+from urllib.parse import urlsplit
+
+from .concurrency import FileLock
+from .downloaders.base import HASH_CHUNK, file_digest, keep_existing
+from .downloaders.segmented import ConnectionPool, RemoteFile, probe
+from .state import record_verified, verified_sha256
+
+log = logging.getLogger("provisioner")
+
+INDEX_VERSION = 1
+_FICLONE = 0x40049409   # linux/fs.h: share extents with another file (btrfs, XFS)
+_PINNED_HF = re.compile(r"https://huggingface\.co/[^/]+/[^/]+/resolve/[0-9a-f]{40}/")
+_SHA256 = re.compile(r"[0-9a-f]{64}")
+
+
+def is_pinned(url: str) -> bool:
+    """True for URLs whose content can never change (a commit-pinned HF file)."""
+    return bool(_PINNED_HF.match(url))
+
+
+def identity(remote: RemoteFile) -> str:
+    """What the server says the content is; "" if it says nothing useful."""
+    if _SHA256.fullmatch(remote.linked_etag):
+        return f"sha256:{remote.linked_etag}"
+    if remote.validator and remote.size is not None:
+        return f"{urlsplit(remote.url).hostname}|{remote.validator}|{remote.size}"
+    return ""
+
+
+def clone_file(src: str, dest: str) -> str:
+    """Make ``dest`` have ``src``'s content: hardlink, else reflink, else copy.
+
+    ``dest`` appears atomically. Returns how it was made.
+    """
+    dest_dir = os.path.dirname(dest) or "."
+    os.makedirs(dest_dir, exist_ok=True)
+    tmp = os.path.join(dest_dir, f".{os.path.basename(dest)}.{uuid.uuid4().hex}.tmp")
+    try:
+        try:
+            os.link(src, tmp)
+            how = "hardlink"
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            with open(src, "rb") as s, open(tmp, "wb") as d:
+                try:
+                    fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+                    how = "reflink"
+                except OSError:
+                    shutil.copyfileobj(s, d, HASH_CHUNK)
+                    how = "copy"
+        os.replace(tmp, dest)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp)
+        raise
+    return how
+
+
+class ModelStore:
+    """A content-addressed file store with a URL index and LRU eviction."""
+
+    def __init__(
+        self,
+        root: str,
+        budget: int = 0,
+        pool: ConnectionPool | None = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.root = root
+        self.budget = budget
+        self.pool = pool
+        self._clock = clock
+        self._index_path = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    # --- index ---------------------------------------------------------------- #
+
+    def _load(self) -> dict:
+        try:
+            with open(self._index_path) as f:
+                index = json.load(f)
+            if index.get("version") == INDEX_VERSION:
+                return index
+        except (OSError, ValueError):
+            pass
+        return {"version": INDEX_VERSION, "urls": {}, "identities": {}, "blobs": {}, "paths": {}}
+
+    @staticmethod
+    def _stat(path: str) -> list[int]:
+        st = os.stat(path)
+        return [st.st_size, st.st_mtime_ns]
+
+    def _save(self, index: dict) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+        os.replace(tmp, self._index_path)
+
+    @contextlib.contextmanager
+    def _index(self):
+        """The index, locked against other threads and provisioners, saved on exit."""
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock, FileLock(self._index_path):
+            index = self._load()
+            yield index
+            self._save(index)
+
+    # --- lookup and link ------------------------------------------------------ #
+
+    def resolve(
+        self, url: str, headers: dict[str, str] | None = None, sha256: str = "",
+    ) -> tuple[str | None, str]:
+        """``(digest or None, identity)`` for ``url``, probing it unless it is pinned.
+
+        An expected ``sha256`` that is already stored needs no probe either.
+        """
+        if sha256 and os.path.isfile(self.blob_path(sha256)):
+            return sha256, ""
+        index = self._load()
+        known = index["urls"].get(url)
+        if known and is_pinned(url):
+            return known["digest"], known.get("identity", "")
+        try:
+            ident = identity(probe(url, headers, self.pool))
+        except Exception as e:
+            log.debug("Store: could not probe %s: %s", url, e)
+            return None, ""
+        if not ident:
+            return None, ""
+        if known and known.get("identity") == ident:
+            return known["digest"], ident
+        if ident.startswith("sha256:") and os.path.isfile(self.blob_path(ident[7:])):
+            return ident[7:], ident
+        return index["identities"].get(ident), ident
+
+    def materialize(self, digest: str, dest: str) -> bool:
+        """Link the blob for ``digest`` into ``dest``; False if it is no longer stored."""
+        blob = self.blob_path(digest)
+        if not os.path.isfile(blob):
+            return False
+        how = clone_file(blob, dest)
+        record_verified(dest, digest)
+        with self._index() as index:
+            if digest in index["blobs"]:
+                index["blobs"][digest]["last_used"] = self._clock()
+            index["paths"][dest] = {"digest": digest, "stat": self._stat(dest)}
+        log.info("Store: %s -> %s (%s)", digest[:12], dest, how)
+        return True
+
+    def contains(self, url: str, path: str) -> bool:
+        """Whether ``path`` is known to hold the stored content for ``url``.
+
+        A hardlink is the blob itself; a copy is recognised by its size and
+        mtime, so an unchanged dest is never hashed twice.
+        """
+        index = self._load()
+        known = index["urls"].get(url)
+        if not known:
+            return False
+        try:
+            if os.path.samefile(self.blob_path(known["digest"]), path):
+                return True
+            seen = index["paths"].get(path)
+            return bool(seen) and seen["digest"] == known["digest"] and seen["stat"] == self._stat(path)
+        except OSError:
+            return False
+
+    # --- add and evict -------------------------------------------------------- #
+
+    def add(self, url: str, path: str, ident: str = "") -> str:
+        """Store the downloaded file at ``path`` as ``url``'s content; returns its digest.
+
+        A digest recorded while the file downloaded saves hashing it again.
+        """
+        digest = verified_sha256(path)
+        if not digest:
+            digest = file_digest(path)
+            record_verified(path, digest)
+        blob = self.blob_path(digest)
+        if not os.path.isfile(blob):
+            clone_file(path, blob)
+        with self._index() as index:
+            index["urls"][url] = {"digest": digest, "identity": ident}
+            if ident:
+                index["identities"][ident] = digest
+            index["blobs"][digest] = {"size": os.path.getsize(blob), "last_used": self._clock()}
+            index["paths"][path] = {"digest": digest, "stat": self._stat(path)}
+            self._evict(index, keep=digest)
+        return digest
+
+    def _evict(self, index: dict, keep: str = "") -> None:
+        if not self.budget:
+            return
+        blobs = index["blobs"]
+        total = sum(b["size"] for b in blobs.values())
+        for digest in sorted(blobs, key=lambda d: blobs[d]["last_used"]):
+            if total <= self.budget:
+                break
+            if digest == keep:
+                continue
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.blob_path(digest))
+            total -= blobs.pop(digest)["size"]
+            index["urls"] = {u: e for u, e in index["urls"].items() if e["digest"] != digest}
+            index["identities"] = {i: d for i, d in index["identities"].items() if d != digest}
+            index["paths"] = {p: e for p, e in index["paths"].items() if e["digest"] != digest}
+            log.info("Store: evicted %s (over the %d-byte budget)", digest[:12], self.budget)
+
+
+def stored_download(
+    store: ModelStore,
+    url: str,
+    dest: str,
+    download: Callable[[], None],
+    headers: dict[str, str] | None = None,
+    sha256: str = "",
+    size: int | None = None,
+) -> bool:
+    """Run ``download`` for a concrete ``dest`` through ``store``.
+
+    A stored copy is linked in instead of downloading; a fresh download is
+    added to the store. Store problems never fail the download itself.
+    Stored content is only used when it matches an expected ``sha256``.
+    Returns False when nothing was fetched.
+    """
+    if keep_existing(dest, sha256, size):
+        # Downloaded before the store was enabled: adopt it, once
+        if not store.contains(url, dest):
+            try:
+                store.add(url, dest)
+            except OSError as e:
+                log.warning("Store: could not add %s: %s", dest, e)
+        return False
+
+    ident = ""
+    try:
+        digest, ident = store.resolve(url, headers, sha256)
+        if digest and sha256 and digest != sha256:
+            log.warning("Store: %s is stored as %s, expected %s; downloading it", url, digest[:12], sha256[:12])
+        elif digest and store.materialize(digest, dest):
+            return False
+    except OSError as e:
+        log.warning("Store: lookup for %s failed: %s", url, e)
+
+    download()
+    if os.path.isfile(dest):
+        try:
+            store.add(url, dest, ident)
+        except OSError as e:
+            log.warning("Store: could not add %s: %s", dest, e)
+    return True
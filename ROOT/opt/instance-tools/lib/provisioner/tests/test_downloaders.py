@@ -14,7 +14,7 @@ from provisioner.downloaders.wget import (
     _is_civitai,
     download_wget,
 )
-from provisioner.schema import DownloadEntry, RetrySettings
+from provisioner.schema import DownloadEntry, DownloadSettings, RetrySettings
 
 
 # ---------- parse_hf_url ----------
@@ -370,7 +370,10 @@ class TestDownloadWgetCommand:
     """curl (not wget) is used for authenticated CivitAI downloads, since wget
     forwards --header across cross-host redirects and CivitAI's download
     endpoint 307s to a presigned CDN URL that 400s on any Authorization
-    header. Every other case keeps using wget."""
+    header. Every other case keeps using wget. These cover the wget engine;
+    the native engine is covered in test_segmented.py."""
+
+    WGET = DownloadSettings(engine="wget")
 
     @patch("provisioner.downloaders.wget.run_cmd")
     @patch("provisioner.downloaders.wget.FileLock")
@@ -383,7 +386,7 @@ class TestDownloadWgetCommand:
 
         entry = DownloadEntry(url="https://civitai.com/api/download/models/123", dest=str(tmp_path / "model.bin"))
         with pytest.raises(RuntimeError):
-            download_wget(entry, retry=RetrySettings(max_attempts=1), civitai_token="tok")
+            download_wget(entry, retry=RetrySettings(max_attempts=1), civitai_token="tok", downloads=self.WGET)
 
         cmd = mock_run_cmd.call_args[0][0]
         assert cmd[0] == "curl"
@@ -402,7 +405,7 @@ class TestDownloadWgetCommand:
 
         entry = DownloadEntry(url="https://example.com/file.bin", dest=str(tmp_path / "file.bin"))
         with pytest.raises(RuntimeError):
-            download_wget(entry, retry=RetrySettings(max_attempts=1))
+            download_wget(entry, retry=RetrySettings(max_attempts=1), downloads=self.WGET)
 
         cmd = mock_run_cmd.call_args[0][0]
         assert cmd[0] == "wget"
@@ -419,7 +422,7 @@ class TestDownloadWgetCommand:
 
         entry = DownloadEntry(url="https://civitai.com/api/download/models/123", dest=str(tmp_path / "model.bin"))
         with pytest.raises(RuntimeError):
-            download_wget(entry, retry=RetrySettings(max_attempts=1))
+            download_wget(entry, retry=RetrySettings(max_attempts=1), downloads=self.WGET)
 
         cmd = mock_run_cmd.call_args[0][0]
         assert cmd[0] == "wget"
@@ -436,7 +439,7 @@ class TestDownloadWgetCommand:
 
         entry = DownloadEntry(url="https://example.com/file.bin", dest=str(tmp_path / "file.bin"))
         with pytest.raises(RuntimeError):
-            download_wget(entry, retry=RetrySettings(max_attempts=1), civitai_token="tok")
+            download_wget(entry, retry=RetrySettings(max_attempts=1), civitai_token="tok", downloads=self.WGET)
 
         cmd = mock_run_cmd.call_args[0][0]
         assert cmd[0] == "wget"
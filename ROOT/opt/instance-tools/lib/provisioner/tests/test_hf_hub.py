@@ -0,0 +1,249 @@
+"""Tests for provisioner.downloaders.hf_hub -- in-process HuggingFace downloads.
+
+Run against a stub Hub on loopback: the revision API, /resolve/ URLs that
+redirect (with X-Linked-* headers) to a CDN on another host name, and a CDN
+that serves Range requests and refuses credentials.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.parse import unquote, urlsplit
+
+import pytest
+
+from provisioner.concurrency import cleanup_lockfiles
+from provisioner.downloaders.hf_hub import download_hf_native, expand_repo
+from provisioner.downloaders.scheduler import DownloadJob, run_downloads
+from provisioner.downloaders.segmented import ConnectionPool, DownloadError
+from provisioner.schema import DownloadEntry, DownloadSettings, RetrySettings
+
+COMMIT = "0123456789abcdef0123456789abcdef01234567"
+TOKEN = "hf_test"
+FILES = {
+    "config.json": b'{"model_type": "llama"}',
+    "model-00001-of-00002.safetensors": os.urandom(3 * 1024 * 1024 + 7),
+    "model-00002-of-00002.safetensors": os.urandom(2 * 1024 * 1024),
+    "tokenizer/vocab.txt": b"a\nb\n",
+}
+LFS = {name for name in FILES if name.endswith(".safetensors")}
+ONE_RETRY = RetrySettings(max_attempts=1)
+SETTINGS = DownloadSettings(segment_size_mb=1)
+
+
+def _sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class _Hub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b"", headers: dict | None = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        hub = self.server
+        path = urlsplit(self.path).path
+        hub.requests.append((self.headers.get("Host", ""), path, self.headers.get("Authorization")))
+
+        if path.startswith("/cdn/"):
+            return self._cdn(unquote(path[len("/cdn/"):]))
+        if hub.gated and self.headers.get("Authorization") != f"Bearer {TOKEN}":
+            return self._send(401)
+
+        match = re.fullmatch(r"/api/models/org/model/revision/([^/]+)", path)
+        if match:
+            siblings = []
+            for name, data in hub.files.items():
+                sibling = {"rfilename": name, "size": len(data)}
+                if name in LFS:
+                    sibling["lfs"] = {"sha256": _sha(data), "size": len(data)}
+                siblings.append(sibling)
+            return self._send(200, json.dumps({"sha": COMMIT, "siblings": siblings}).encode())
+
+        match = re.fullmatch(r"/org/model/resolve/([^/]+)/(.+)", path)
+        if match and unquote(match.group(2)) in hub.files:
+            name = unquote(match.group(2))
+            headers = {"Location": f"http://localhost:{hub.server_address[1]}/cdn/{match.group(2)}"}
+            if name in LFS:
+                headers["X-Linked-Etag"] = f'"{_sha(hub.files[name])}"'
+                headers["X-Linked-Size"] = str(len(hub.files[name]))
+            return self._send(302, headers=headers)
+        self._send(404)
+
+    def _cdn(self, name: str) -> None:
+        if self.headers.get("Authorization"):
+            return self._send(400)      # Presigned URLs reject credentials
+        data = self.server.cdn.get(name, self.server.files.get(name))
+        if data is None:
+            return self._send(404)
+        match = re.match(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if not match:
+            return self._send(200, data, {"ETag": '"cdn"'})
+        start, end = int(match.group(1)), min(int(match.group(2)), len(data) - 1)
+        if start >= len(data):
+            return self._send(416, headers={"Content-Range": f"bytes */{len(data)}"})
+        self._send(206, data[start:end + 1], {
+            "ETag": '"cdn"', "Content-Range": f"bytes {start}-{end}/{len(data)}",
+        })
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Hub)
+    httpd.daemon_threads = True
+    httpd.files, httpd.cdn, httpd.gated, httpd.requests = dict(FILES), {}, True, []
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    monkeypatch.setenv("HF_ENDPOINT", httpd.url)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _jobs(entries, pool):
+    return [
+        DownloadJob(
+            e, "hf",
+            lambda e=e: download_hf_native(e, ONE_RETRY, TOKEN, SETTINGS, pool),
+            probe_url=e.url, size=e.size, metered=True,
+        )
+        for e in entries
+    ]
+
+
+class TestExpandRepo:
+    def test_one_pinned_entry_per_file(self, hub, tmp_path):
+        entry = DownloadEntry(url="https://huggingface.co/org/model", dest=str(tmp_path / "model"))
+        files = expand_repo(entry, {"Authorization": f"Bearer {TOKEN}"}, ConnectionPool())
+
+        by_name = {os.path.relpath(f.dest, entry.dest): f for f in files}
+        assert set(by_name) == set(FILES)
+        shard = by_name["model-00001-of-00002.safetensors"]
+        assert shard.url == f"{hub.url}/org/model/resolve/{COMMIT}/model-00001-of-00002.safetensors"
+        assert shard.sha256 == _sha(FILES["model-00001-of-00002.safetensors"])
+        assert shard.size == len(FILES["model-00001-of-00002.safetensors"])
+        # Small files are not in LFS: a size, but no sha256
+        assert by_name["config.json"].sha256 == "" and by_name["config.json"].size == len(FILES["config.json"])
+        # The list is fetched once
+        assert [p for _, p, _ in hub.requests] == ["/api/models/org/model/revision/main"]
+
+    def test_paths_outside_dest_are_skipped(self, hub, tmp_path):
+        hub.files = {"../escape.bin": b"x", "ok.bin": b"y"}
+        entry = DownloadEntry(url="https://huggingface.co/org/model", dest=str(tmp_path))
+        files = expand_repo(entry, {"Authorization": f"Bearer {TOKEN}"}, ConnectionPool())
+        assert [f.dest for f in files] == [str(tmp_path / "ok.bin")]
+
+    def test_gated_repo_without_token(self, hub, tmp_path):
+        entry = DownloadEntry(url="https://huggingface.co/org/model", dest=str(tmp_path))
+        with pytest.raises(DownloadError, match="HTTP 401"):
+            expand_repo(entry, {}, ConnectionPool())
+
+
+class TestRepoDownload:
+    def test_shards_download_in_parallel_into_dest(self, hub, tmp_path):
+        dest = tmp_path / "model"
+        pool = ConnectionPool()
+        entry = DownloadEntry(url="https://huggingface.co/org/model", dest=str(dest))
+        files = expand_repo(entry, {"Authorization": f"Bearer {TOKEN}"}, pool)
+
+        results = run_downloads(_jobs(files, pool), {"hf": 3}, report_interval=60)
+        cleanup_lockfiles([f.dest for f in files])
+
+        assert results == [None] * len(FILES)
+        for name, data in FILES.items():
+            assert (dest / name).read_bytes() == data
+        # Nothing staged outside dest, nothing left over inside it
+        leftovers = [p for p in dest.rglob("*") if p.suffix in (".part", ".journal", ".lock")]
+        assert leftovers == []
+        # The token reaches the Hub, never the CDN
+        assert all(auth is None for host, path, auth in hub.requests if path.startswith("/cdn/"))
+        assert all(auth == f"Bearer {TOKEN}" for host, path, auth in hub.requests if "/resolve/" in path)
+
+    def test_corrupt_shard_fails_its_sha256_check(self, hub, tmp_path):
+        name = "model-00002-of-00002.safetensors"
+        hub.cdn[name] = b"\0" * len(FILES[name])
+        entry = DownloadEntry(url="https://huggingface.co/org/model", dest=str(tmp_path))
+        pool = ConnectionPool()
+        files = expand_repo(entry, {"Authorization": f"Bearer {TOKEN}"}, pool)
+
+        results = run_downloads(_jobs(files, pool), {"hf": 3}, report_interval=60)
+
+        failed = [f.dest for f, r in zip(files, results) if r is not None]
+        assert failed == [str(tmp_path / name)]
+        assert not (tmp_path / name).exists()
+        assert not (tmp_path / f"{name}.part").exists()
+
+
+class TestSingleFile:
+    def test_manifest_url_follows_hf_endpoint(self, hub, tmp_path):
+        name = "model-00001-of-00002.safetensors"
+        entry = DownloadEntry(url=f"https://huggingface.co/org/model/resolve/main/{name}", dest=f"{tmp_path}/")
+        download_hf_native(entry, ONE_RETRY, TOKEN, SETTINGS, ConnectionPool())
+        assert (tmp_path / name).read_bytes() == FILES[name]
+        # Checked against X-Linked-Etag without a sha256 in the manifest
+        assert any(path == f"/org/model/resolve/main/{name}" for _, path, _ in hub.requests)
+
+    def test_linked_etag_mismatch_is_not_accepted(self, hub, tmp_path):
+        name = "model-00001-of-00002.safetensors"
+        hub.cdn[name] = FILES[name][::-1]
+        entry = DownloadEntry(url=f"https://huggingface.co/org/model/resolve/main/{name}", dest=str(tmp_path / name))
+        with pytest.raises(RuntimeError, match="Failed to download"):
+            download_hf_native(entry, ONE_RETRY, TOKEN, SETTINGS, ConnectionPool())
+        assert not (tmp_path / name).exists()
+        assert not (tmp_path / f"{name}.part").exists()
+
+
+class TestPhase6Wiring:
+    @patch("provisioner.__main__.probe_sizes")
+    @patch("provisioner.__main__.run_downloads", return_value=[])
+    def test_repo_entries_become_per_file_jobs(self, mock_run, mock_probe, tmp_path):
+        from provisioner.__main__ import run
+        from provisioner.schema import Manifest
+
+        manifest = Manifest()
+        manifest.downloads = [DownloadEntry(url="https://huggingface.co/org/model", dest=str(tmp_path))]
+        shards = [DownloadEntry(url=f"https://huggingface.co/org/model/resolve/{COMMIT}/{n}",
+                                dest=str(tmp_path / n), size=i) for i, n in enumerate(["a", "b"])]
+        with patch("provisioner.__main__.expand_repo", return_value=shards) as expand:
+            run("/nonexistent.yaml", manifest)
+        expand.assert_called_once()
+        jobs = mock_run.call_args.args[0]
+        assert [(j.kind, j.entry.dest, j.size, j.metered) for j in jobs] == [
+            ("hf", str(tmp_path / "a"), 0, True), ("hf", str(tmp_path / "b"), 1, True),
+        ]
+
+    @patch("provisioner.__main__.probe_sizes")
+    def test_lock_files_of_repo_files_are_cleaned_up(self, mock_probe, tmp_path):
+        from provisioner.__main__ import run
+        from provisioner.schema import Manifest
+
+        manifest = Manifest()
+        manifest.downloads = [DownloadEntry(url="https://huggingface.co/org/model", dest=str(tmp_path))]
+        shards = [DownloadEntry(url=f"https://huggingface.co/org/model/resolve/{COMMIT}/{n}",
+                                dest=str(tmp_path / n)) for n in ("a", "sub/b")]
+
+        def fake_run(jobs, *args, **kwargs):
+            for job in jobs:      # What download_native's FileLock leaves behind
+                os.makedirs(os.path.dirname(job.entry.dest), exist_ok=True)
+                open(f"{job.entry.dest}.lock", "w").close()
+            return [None] * len(jobs)
+
+        with patch("provisioner.__main__.expand_repo", return_value=shards), \
+                patch("provisioner.__main__.run_downloads", side_effect=fake_run):
+            assert run("/nonexistent.yaml", manifest) == 0
+        assert list(tmp_path.rglob("*.lock")) == []
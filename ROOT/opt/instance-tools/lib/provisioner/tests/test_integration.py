@@ -121,6 +121,16 @@ class TestApplyEnvOverrides:
         _apply_env_overrides(manifest)
         assert manifest.settings.venv == "/venv/custom"
 
+    def test_model_store_override(self, monkeypatch):
+        manifest = Manifest()
+        monkeypatch.setenv("WORKSPACE", "/data")
+        monkeypatch.setenv("PROVISIONER_MODEL_STORE", "yes")
+        _apply_env_overrides(manifest)
+        assert manifest.settings.downloads.store == "/data/.model-store"
+        monkeypatch.setenv("PROVISIONER_MODEL_STORE", "0")
+        _apply_env_overrides(manifest)
+        assert manifest.settings.downloads.store == ""
+
     def test_webhook_on_success_override(self, monkeypatch):
         manifest = Manifest()
         monkeypatch.setenv("PROVISIONER_WEBHOOK_ON_SUCCESS", "true")
@@ -560,7 +570,7 @@ class TestErrorHandling:
     @patch("provisioner.__main__.install_apt_packages")
     @patch("provisioner.__main__.clone_git_repos")
     @patch("provisioner.__main__.install_pip_packages")
-    @patch("provisioner.__main__.run_parallel", return_value=[ValueError("download failed")])
+    @patch("provisioner.__main__.run_downloads", return_value=[ValueError("download failed")])
     @patch("provisioner.__main__.register_services")
     def test_download_failure_is_fatal(
         self, mock_svc, mock_parallel, mock_pip, mock_git, mock_apt, mock_civ, mock_hf,
@@ -583,7 +593,7 @@ class TestErrorHandling:
     @patch("provisioner.__main__.install_apt_packages")
     @patch("provisioner.__main__.clone_git_repos")
     @patch("provisioner.__main__.install_pip_packages")
-    @patch("provisioner.__main__.run_parallel", return_value=[ValueError("download failed")])
+    @patch("provisioner.__main__.run_downloads", return_value=[ValueError("download failed")])
     @patch("provisioner.__main__.register_services")
     @patch("provisioner.__main__.run_cmd")
     def test_download_failure_aborts_post_commands(
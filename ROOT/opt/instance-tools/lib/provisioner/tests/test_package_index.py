@@ -0,0 +1,47 @@
+"""Tests for provisioner.package_index -- post-install package index refresh."""
+
+from __future__ import annotations
+
+import subprocess
+from unittest.mock import MagicMock, patch
+
+from provisioner.installers.pip import install_pip_packages
+from provisioner.package_index import PORTAL_DIR, PORTAL_PYTHON, refresh_package_index
+from provisioner.schema import PipPackages
+
+
+class TestRefreshPackageIndex:
+    @patch("provisioner.package_index.subprocess.run")
+    @patch("provisioner.package_index.os.path.isfile", return_value=True)
+    def test_runs_portal_module_once_per_env(self, mock_isfile, mock_run):
+        mock_run.return_value = MagicMock(returncode=0, stdout="/venv/main: 3 distributions indexed\n")
+        refresh_package_index(["/venv/main", "/venv/main", "/opt/miniforge3"])
+        cmd = mock_run.call_args[0][0]
+        assert cmd == [PORTAL_PYTHON, "-m", "capabilities.packages", "/venv/main", "/opt/miniforge3"]
+        assert mock_run.call_args[1]["cwd"] == PORTAL_DIR
+
+    @patch("provisioner.package_index.subprocess.run")
+    def test_nothing_installed(self, mock_run):
+        refresh_package_index([])
+        mock_run.assert_not_called()
+
+    @patch("provisioner.package_index.subprocess.run")
+    @patch("provisioner.package_index.os.path.isfile", return_value=False)
+    def test_skipped_without_portal(self, mock_isfile, mock_run):
+        refresh_package_index(["/venv/main"])
+        mock_run.assert_not_called()
+
+    @patch("provisioner.package_index.subprocess.run",
+           side_effect=subprocess.TimeoutExpired(cmd="python", timeout=60))
+    @patch("provisioner.package_index.os.path.isfile", return_value=True)
+    def test_failures_are_not_raised(self, mock_isfile, mock_run, caplog):
+        refresh_package_index(["/venv/main"])
+        assert "Package index refresh failed" in caplog.text
+
+
+class TestInstalledEnvReporting:
+    @patch("provisioner.installers.pip.run_cmd")
+    def test_pip_returns_the_venv(self, mock_run):
+        assert install_pip_packages(PipPackages(packages=["torch"]), default_venv="/venv/main") == "/venv/main"
+        assert install_pip_packages(PipPackages(packages=["torch"], venv="system")) is None
+        assert install_pip_packages(PipPackages(packages=["torch"]), default_venv="/venv/main", dry_run=True) is None
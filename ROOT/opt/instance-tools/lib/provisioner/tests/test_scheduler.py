@@ -0,0 +1,173 @@
+"""Tests for provisioner.downloaders.scheduler -- the phase 6 download queue."""
+
+from __future__ import annotations
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from provisioner.downloaders.scheduler import DownloadJob, Meter, probe_sizes, run_downloads
+from provisioner.downloaders.segmented import ConnectionPool
+from provisioner.schema import DownloadEntry
+
+
+def _job(name, kind="wget", size=None, run=None, dest=""):
+    return DownloadJob(
+        DownloadEntry(url=f"https://example.com/{name}", dest=dest),
+        kind, run or (lambda: None), probe_url=f"https://example.com/{name}", size=size,
+    )
+
+
+class TestRunDownloads:
+    def test_empty(self):
+        assert run_downloads([], {"hf": 3, "wget": 5}) == []
+
+    def test_classes_run_concurrently(self):
+        """A long HF download no longer holds back the generic downloads."""
+        wget_done = threading.Event()
+
+        def slow_hf():
+            assert wget_done.wait(5), "wget download never started"
+
+        jobs = [_job("big", "hf", size=30 << 30, run=slow_hf), _job("small", run=wget_done.set)]
+        assert run_downloads(jobs, {"hf": 1, "wget": 1}, report_interval=60) == [None, None]
+
+    def test_per_class_caps(self):
+        lock = threading.Lock()
+        active = {"hf": 0, "wget": 0}
+        peak = {"hf": 0, "wget": 0}
+
+        def runner(kind):
+            def run():
+                with lock:
+                    active[kind] += 1
+                    peak[kind] = max(peak[kind], active[kind])
+                time.sleep(0.02)
+                with lock:
+                    active[kind] -= 1
+            return run
+
+        jobs = [_job(f"h{i}", "hf", run=runner("hf")) for i in range(6)]
+        jobs += [_job(f"w{i}", "wget", run=runner("wget")) for i in range(10)]
+        run_downloads(jobs, {"hf": 2, "wget": 3}, report_interval=60)
+        assert peak == {"hf": 2, "wget": 3}
+
+    def test_largest_first_with_unknown_sizes_leading(self):
+        order = []
+        jobs = [
+            _job(name, size=size, run=lambda name=name: order.append(name))
+            for name, size in [("small", 10), ("repo", None), ("huge", 1000), ("mid", 100)]
+        ]
+        run_downloads(jobs, {"wget": 1}, report_interval=60)
+        assert order == ["repo", "huge", "mid", "small"]
+
+    def test_failures_are_reported_in_job_order_without_stopping_others(self):
+        ran = []
+
+        def fail():
+            raise RuntimeError("boom")
+
+        jobs = [_job("a", run=fail), _job("b", run=lambda: ran.append("b"))]
+        results = run_downloads(jobs, {"wget": 1}, report_interval=60)
+        assert isinstance(results[0], RuntimeError) and results[1] is None
+        assert ran == ["b"]
+
+    def test_unmetered_jobs_count_their_probed_size(self):
+        meter = Meter()
+        jobs = [_job("a", "hf", size=500), _job("b", size=700)]
+        jobs[1].metered = True
+        run_downloads(jobs, {"hf": 1, "wget": 1}, meter=meter, report_interval=60)
+        # The metered job reports its own bytes as they arrive
+        assert meter.bytes == 500
+
+
+class TestMeter:
+    def test_unlimited_only_counts(self):
+        sleep = MagicMock()
+        meter = Meter(sleep=sleep)
+        meter.consume(10 << 20)
+        assert meter.bytes == 10 << 20
+        sleep.assert_not_called()
+
+    def test_holds_to_the_rate(self):
+        now = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        meter = Meter(rate=100, clock=lambda: now[0], sleep=sleep)
+        meter.consume(100)          # The one-second burst
+        meter.consume(50)
+        meter.consume(50)
+        assert sleeps == [pytest.approx(0.5), pytest.approx(0.5)]
+        assert meter.bytes == 200
+
+
+class TestProbeSizes:
+    @patch("provisioner.downloaders.scheduler.probe")
+    def test_sizes_from_probes(self, mock_probe, tmp_path):
+        def probe(url, headers, pool):
+            if url.endswith("broken"):
+                raise OSError("down")
+            return MagicMock(size=42)
+
+        mock_probe.side_effect = probe
+        existing = tmp_path / "have.bin"
+        existing.write_bytes(b"x")
+        jobs = [_job("file"), _job("have", dest=str(existing)), _job("broken"), _job("repo")]
+        jobs[3].probe_url = ""
+        probe_sizes(jobs, headers=lambda job: {"Authorization": "Bearer t"})
+        assert [j.size for j in jobs] == [42, 0, None, None]
+        # Neither the existing file nor the repo is probed
+        assert mock_probe.call_count == 2
+        assert all(c.args[1] == {"Authorization": "Bearer t"} for c in mock_probe.call_args_list)
+
+
+class TestConnectionsPerHost:
+    def test_pool_caps_in_flight_requests_per_host(self):
+        lock = threading.Lock()
+        state = {"active": 0, "peak": 0}
+
+        class Slow(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with lock:
+                    state["active"] += 1
+                    state["peak"] = max(state["peak"], state["active"])
+                time.sleep(0.05)
+                with lock:
+                    state["active"] -= 1
+                self.send_response(200)
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"ok")
+
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), Slow)
+        httpd.daemon_threads = True
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        pool = ConnectionPool(max_per_host=2)
+        url = f"http://127.0.0.1:{httpd.server_address[1]}/"
+
+        def fetch():
+            with pool.request("GET", url, {}) as response:
+                response.read()
+
+        try:
+            threads = [threading.Thread(target=fetch) for _ in range(6)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+        assert state["peak"] == 2
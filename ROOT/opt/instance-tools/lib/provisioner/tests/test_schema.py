@@ -269,6 +269,51 @@ class TestBuildNested:
             })
             assert m.on_failure.action == action
 
+    def test_download_settings(self):
+        m = validate_manifest({"version": 1})
+        assert m.settings.downloads.engine == "native"
+        m = validate_manifest({
+            "version": 1,
+            "settings": {"downloads": {"engine": "wget", "connections_per_file": 8}},
+        })
+        assert m.settings.downloads.engine == "wget"
+        assert m.settings.downloads.connections_per_file == 8
+        assert m.settings.downloads.segment_size_mb == 64
+        assert m.settings.downloads.store == ""
+
+    def test_model_store_settings(self):
+        m = validate_manifest({
+            "version": 1,
+            "settings": {"downloads": {"store": "/workspace/.model-store", "store_budget_gb": 200}},
+        })
+        assert m.settings.downloads.store == "/workspace/.model-store"
+        assert m.settings.downloads.store_budget_gb == 200
+
+    def test_download_checksums(self):
+        m = validate_manifest({
+            "version": 1,
+            "downloads": [{"url": "https://example.com/m.bin", "dest": "/m.bin", "sha256": "AB" * 32, "size": 42}],
+        })
+        assert m.downloads[0].sha256 == "ab" * 32
+        assert m.downloads[0].size == 42
+        assert validate_manifest({"version": 1, "downloads": [{"url": "u"}]}).downloads[0].size is None
+
+    @pytest.mark.parametrize("entry, match", [
+        ({"sha256": "abc"}, "Invalid sha256"),
+        ({"size": -1}, "Invalid size"),
+        ({"size": "big"}, "Invalid size"),
+    ])
+    def test_invalid_download_checksums_rejected(self, entry, match):
+        with pytest.raises(ValueError, match=match):
+            validate_manifest({
+                "version": 1,
+                "conditional_downloads": [{"when": "hf_token_valid", "downloads": [dict(url="u", **entry)]}],
+            })
+
+    def test_invalid_download_engine_rejected(self):
+        with pytest.raises(ValueError, match="Invalid settings.downloads.engine"):
+            validate_manifest({"version": 1, "settings": {"downloads": {"engine": "aria2"}}})
+
     def test_write_files_construction(self):
         m = validate_manifest({
             "version": 1,
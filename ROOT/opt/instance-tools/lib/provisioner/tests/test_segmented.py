@@ -0,0 +1,297 @@
+"""Tests for provisioner.downloaders.segmented -- in-process resumable downloads.
+
+Run against a local http.server stand-in that serves Range requests, counts
+the bytes it sends and can be told to fail part-way through a response.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+
+from provisioner.downloaders.segmented import (
+    ConnectionPool,
+    DownloadError,
+    IntegrityError,
+    download_segmented,
+    get_json,
+    probe,
+)
+from provisioner.downloaders.wget import download_wget
+from provisioner.schema import DownloadEntry, DownloadSettings, RetrySettings
+
+SEGMENT = 1024 * 1024
+PAYLOAD = bytes(range(256)) * (4 * SEGMENT // 256) + b"tail"   # 4 segments and a bit
+PAYLOAD_SHA256 = hashlib.sha256(PAYLOAD).hexdigest()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+        if self.path.startswith("/redirect"):
+            self.send_response(307)
+            self.send_header("Location", server.redirect_to)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body, status, extra = server.payload, 200, {}
+        match = re.match(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if match and server.ranges:
+            start, end = int(match.group(1)), min(int(match.group(2)), len(server.payload) - 1)
+            body, status = server.payload[start:end + 1], 206
+            extra["Content-Range"] = f"bytes {start}-{end}/{len(server.payload)}"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", server.etag)
+        self.send_header("Content-Disposition", 'attachment; filename="model.safetensors"')
+        for key, value in {**server.linked, **extra}.items():
+            self.send_header(key, value)
+        self.end_headers()
+
+        # fail_after: how many more full responses before one is cut short
+        with server.lock:
+            fail = server.fail_after == 0 and len(body) > 1
+            if server.fail_after is not None and len(body) > 1:
+                server.fail_after = None if fail else server.fail_after - 1
+        if fail:
+            # Half a response, then a dead connection
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+        server.sent += len(body)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.daemon_threads = True
+    httpd.payload, httpd.ranges, httpd.fail_after = PAYLOAD, True, None
+    httpd.requests, httpd.sent, httpd.lock = [], 0, threading.Lock()
+    httpd.redirect_to, httpd.etag, httpd.linked = "", '"v1"', {}
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestProbe:
+    def test_reports_size_ranges_validator_and_filename(self, server):
+        remote = probe(f"{server.url}/file", pool=ConnectionPool())
+        assert remote.size == len(PAYLOAD)
+        assert remote.ranges is True
+        assert remote.validator == '"v1"'
+        assert remote.filename == "model.safetensors"
+
+    def test_cross_host_redirect_drops_credentials(self, server):
+        # 127.0.0.1 and localhost are different hosts as far as credentials go
+        port = server.server_address[1]
+        server.redirect_to = f"http://localhost:{port}/file"
+        remote = probe(f"{server.url}/redirect", {"Authorization": "Bearer tok"}, ConnectionPool())
+        assert remote.url == f"http://localhost:{port}/file"
+        assert remote.headers == {}
+        sent = {path: headers for path, headers in server.requests}
+        assert sent["/redirect"]["Authorization"] == "Bearer tok"
+        assert "Authorization" not in sent["/file"]
+
+    def test_same_host_redirect_keeps_credentials(self, server):
+        server.redirect_to = "/file"
+        remote = probe(f"{server.url}/redirect", {"Authorization": "Bearer tok"}, ConnectionPool())
+        assert remote.headers == {"Authorization": "Bearer tok"}
+
+
+class TestGetJson:
+    def test_follows_same_host_redirects(self, server):
+        server.payload, server.redirect_to = b'{"sha": "abc"}', "/api"
+        assert get_json(f"{server.url}/redirect", {"Authorization": "Bearer tok"}, ConnectionPool()) == {"sha": "abc"}
+        assert [h.get("Authorization") for _, h in server.requests] == ["Bearer tok"] * 2
+
+    def test_refuses_redirects_to_another_host(self, server):
+        server.redirect_to = f"http://localhost:{server.server_address[1]}/api"
+        with pytest.raises(DownloadError, match="another host"):
+            get_json(f"{server.url}/redirect", {"Authorization": "Bearer tok"}, ConnectionPool())
+        assert len(server.requests) == 1
+
+    def test_invalid_json(self, server):
+        server.payload = b"<html>"
+        with pytest.raises(DownloadError, match="Invalid JSON"):
+            get_json(f"{server.url}/api", pool=ConnectionPool())
+
+
+class TestDownloadSegmented:
+    def test_parallel_segments_over_pooled_connections(self, server, tmp_path):
+        dest = str(tmp_path / "model.bin")
+        pool = ConnectionPool()
+        result = download_segmented(f"{server.url}/file", dest, connections=2, segment_size=SEGMENT, pool=pool)
+        assert result.fetched == len(PAYLOAD)
+        assert result.sha256 == PAYLOAD_SHA256 and not result.verified
+        assert open(dest, "rb").read() == PAYLOAD
+        assert not os.path.exists(f"{dest}.part") and not os.path.exists(f"{dest}.journal")
+        ranges = [h.get("Range") for _, h in server.requests]
+        assert len(ranges) == 1 + 5 and ranges[0] == "bytes=0-0"
+        # Five segments and a probe, over no more than one connection per worker
+        assert pool.opened <= 2
+
+    def test_retry_resumes_from_the_last_committed_segment(self, server, tmp_path):
+        dest = str(tmp_path / "model.bin")
+        url = f"{server.url}/file"
+        server.fail_after = 2     # The third segment response dies half-way
+        with pytest.raises(Exception):
+            download_segmented(url, dest, connections=1, segment_size=SEGMENT, pool=ConnectionPool())
+        assert not os.path.exists(dest)
+        journal = json.load(open(f"{dest}.journal"))
+        assert journal["done"] == [0, 1]
+
+        server.fail_after, server.sent = None, 0
+        result = download_segmented(url, dest, connections=2, segment_size=SEGMENT, pool=ConnectionPool())
+        assert open(dest, "rb").read() == PAYLOAD
+        assert result.fetched == len(PAYLOAD) - 2 * SEGMENT
+        assert server.sent == result.fetched + 1    # Plus the probe's one byte
+        # The carried-over segments are read back into the digest
+        assert result.sha256 == PAYLOAD_SHA256
+
+    def test_changed_file_is_not_resumed(self, server, tmp_path):
+        dest = str(tmp_path / "model.bin")
+        url = f"{server.url}/file"
+        server.fail_after = 1
+        with pytest.raises(Exception):
+            download_segmented(url, dest, connections=1, segment_size=SEGMENT, pool=ConnectionPool())
+
+        server.payload, server.etag = PAYLOAD[::-1], '"v2"'
+        result = download_segmented(url, dest, connections=2, segment_size=SEGMENT, pool=ConnectionPool())
+        assert result.fetched == len(PAYLOAD)
+        assert open(dest, "rb").read() == PAYLOAD[::-1]
+
+    def test_server_without_ranges_gets_one_streamed_get(self, server, tmp_path):
+        server.ranges = False
+        dest = str(tmp_path / "model.bin")
+        result = download_segmented(
+            f"{server.url}/file", dest, segment_size=SEGMENT, pool=ConnectionPool(), sha256=PAYLOAD_SHA256,
+        )
+        assert open(dest, "rb").read() == PAYLOAD
+        assert not os.path.exists(f"{dest}.journal")
+        assert result.verified
+
+    def test_http_error_raises(self, server, tmp_path):
+        with patch.object(_Handler, "do_GET", lambda self: self.send_error(404)):
+            with pytest.raises(DownloadError, match="HTTP 404"):
+                download_segmented(f"{server.url}/missing", str(tmp_path / "x"), pool=ConnectionPool())
+
+
+class TestIntegrity:
+    def test_expected_sha256_is_checked_while_streaming(self, server, tmp_path):
+        dest = str(tmp_path / "model.bin")
+        with patch("provisioner.downloaders.segmented.os.pread", wraps=os.pread) as pread:
+            result = download_segmented(
+                f"{server.url}/file", dest, connections=1, segment_size=SEGMENT,
+                pool=ConnectionPool(), sha256=PAYLOAD_SHA256.upper(), size=len(PAYLOAD),
+            )
+        assert result.verified and result.sha256 == PAYLOAD_SHA256
+        # One connection writes in file order: every byte is hashed from memory
+        pread.assert_not_called()
+
+    def test_mismatch_discards_the_file(self, server, tmp_path):
+        dest = str(tmp_path / "model.bin")
+        with pytest.raises(IntegrityError, match="sha256 is"):
+            download_segmented(
+                f"{server.url}/file", dest, connections=2, segment_size=SEGMENT,
+                pool=ConnectionPool(), sha256="0" * 64,
+            )
+        assert os.listdir(tmp_path) == []
+
+    def test_linked_size_is_checked_before_downloading(self, server, tmp_path):
+        server.linked = {"X-Linked-Size": str(len(PAYLOAD) + 1)}
+        with pytest.raises(IntegrityError, match="expected"):
+            download_segmented(f"{server.url}/file", str(tmp_path / "m"), pool=ConnectionPool())
+        assert len(server.requests) == 1     # Only the probe
+
+    def test_linked_etag_is_checked_automatically(self, server, tmp_path):
+        server.linked = {"X-Linked-Etag": f'"{PAYLOAD_SHA256}"', "X-Linked-Size": str(len(PAYLOAD))}
+        result = download_segmented(f"{server.url}/file", str(tmp_path / "m"), pool=ConnectionPool())
+        assert result.verified
+
+        server.linked = {"X-Linked-Etag": '"' + "f" * 64 + '"'}
+        with pytest.raises(IntegrityError):
+            download_segmented(f"{server.url}/file", str(tmp_path / "n"), pool=ConnectionPool())
+
+    def test_mismatch_after_resume_refetches_only_the_carried_segments(self, server, tmp_path):
+        dest = str(tmp_path / "model.bin")
+        url = f"{server.url}/file"
+        server.fail_after = 2
+        with pytest.raises(DownloadError):
+            download_segmented(url, dest, connections=1, segment_size=SEGMENT, pool=ConnectionPool())
+        # Corrupt a segment the journal says is done
+        with open(f"{dest}.part", "r+b") as f:
+            f.seek(SEGMENT + 10)
+            f.write(b"rot")
+
+        server.fail_after, server.sent = None, 0
+        result = download_segmented(
+            url, dest, connections=2, segment_size=SEGMENT, pool=ConnectionPool(), sha256=PAYLOAD_SHA256,
+        )
+        assert open(dest, "rb").read() == PAYLOAD
+        assert result.verified
+        # The three missing segments, then the two carried over -- the whole file once
+        assert result.fetched == len(PAYLOAD)
+
+
+class TestDownloadWgetNative:
+    def test_content_disposition_dest_and_retry_resume(self, server, tmp_path):
+        server.fail_after = 3
+        entry = DownloadEntry(url=f"{server.url}/file", dest=f"{tmp_path}/models/")
+        with patch("provisioner.downloaders.base.time.sleep"):
+            download_wget(
+                entry, retry=RetrySettings(max_attempts=2),
+                downloads=DownloadSettings(connections_per_file=1, segment_size_mb=1),
+            )
+        dest = tmp_path / "models" / "model.safetensors"
+        assert dest.read_bytes() == PAYLOAD
+        assert not os.path.exists(f"{dest}.journal")
+
+    def test_civitai_token_is_not_sent_across_hosts(self, server, tmp_path):
+        port = server.server_address[1]
+        server.redirect_to = f"http://localhost:{port}/file"
+        entry = DownloadEntry(url="https://civitai.com/api/download/models/1", dest=str(tmp_path / "m.bin"))
+
+        def probe_local(url, headers=None, pool=None):
+            assert headers == {"Authorization": "Bearer tok"}
+            return probe(f"{server.url}/redirect", headers, pool)
+
+        with patch("provisioner.downloaders.segmented.probe", probe_local):
+            download_wget(entry, retry=RetrySettings(max_attempts=1), civitai_token="tok",
+                          downloads=DownloadSettings(segment_size_mb=1))
+        assert (tmp_path / "m.bin").read_bytes() == PAYLOAD
+        file_requests = [h for path, h in server.requests if path == "/file"]
+        assert file_requests and all("Authorization" not in h for h in file_requests)
+
+    def test_verified_digest_is_recorded_and_trusted(self, server, tmp_path):
+        entry = DownloadEntry(url=f"{server.url}/file", dest=str(tmp_path / "m.bin"), sha256=PAYLOAD_SHA256)
+        download_wget(entry, retry=RetrySettings(max_attempts=1), downloads=DownloadSettings(segment_size_mb=1))
+        server.requests.clear()
+        with patch("provisioner.downloaders.base.file_digest") as digest:
+            download_wget(entry, retry=RetrySettings(max_attempts=1))
+        digest.assert_not_called()
+        assert server.requests == []
+
+    def test_existing_file_that_fails_the_check_is_fetched_again(self, server, tmp_path):
+        dest = tmp_path / "m.bin"
+        dest.write_bytes(b"truncated")
+        entry = DownloadEntry(url=f"{server.url}/file", dest=str(dest), size=len(PAYLOAD))
+        download_wget(entry, retry=RetrySettings(max_attempts=1), downloads=DownloadSettings(segment_size_mb=1))
+        assert dest.read_bytes() == PAYLOAD
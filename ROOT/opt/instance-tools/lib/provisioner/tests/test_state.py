@@ -2,7 +2,9 @@
 
 from __future__ import annotations
 
+import json
 import os
+from unittest.mock import patch
 
 import pytest
 
@@ -10,8 +12,11 @@ from provisioner.state import (
     STATE_DIR,
     clear_all_state,
     compute_stage_hash,
+    flush_verified,
     is_stage_complete,
     mark_stage_complete,
+    record_verified,
+    verified_sha256,
 )
 
 
@@ -84,6 +89,62 @@ class TestMarkStageComplete:
         assert is_stage_complete("apt", "old") is False
 
 
+class TestVerifiedDigests:
+    def test_recorded_digest_is_trusted_while_the_file_is_unchanged(self, tmp_path):
+        path = tmp_path / "model.bin"
+        path.write_bytes(b"weights")
+        record_verified(str(path), "a" * 64)
+        assert verified_sha256(str(path)) == "a" * 64
+
+        path.write_bytes(b"other weights")
+        assert verified_sha256(str(path)) == ""
+
+    def test_unknown_file(self, tmp_path):
+        assert verified_sha256(str(tmp_path / "missing")) == ""
+
+    def test_clear_removes_records(self, _use_tmp_state_dir, tmp_path):
+        path = tmp_path / "model.bin"
+        path.write_bytes(b"weights")
+        record_verified(str(path), "a" * 64)
+        assert clear_all_state() is True
+        assert verified_sha256(str(path)) == ""
+
+
+    def test_records_are_read_once_and_written_on_flush(self, _use_tmp_state_dir, tmp_path):
+        paths = []
+        for i in range(20):
+            path = tmp_path / f"shard-{i}.bin"
+            path.write_bytes(b"x" * i)
+            paths.append(str(path))
+        with patch("provisioner.state._load_verified", return_value={}) as load, \
+                patch("provisioner.state.json.dump", wraps=json.dump) as dump:
+            for i, path in enumerate(paths):
+                record_verified(path, f"{i:064x}")
+                assert verified_sha256(path) == f"{i:064x}"
+            assert dump.call_count == 0
+            flush_verified()
+            flush_verified()               # Nothing new: no second write
+        assert load.call_count == 1 and dump.call_count == 1
+        with open(os.path.join(_use_tmp_state_dir, "verified.json")) as f:
+            assert len(json.load(f)) == 20
+
+    def test_records_of_deleted_files_are_dropped(self, _use_tmp_state_dir, tmp_path):
+        kept, deleted = tmp_path / "kept.bin", tmp_path / "deleted.bin"
+        kept.write_bytes(b"a")
+        deleted.write_bytes(b"b")
+        record_verified(str(kept), "a" * 64)
+        record_verified(str(deleted), "b" * 64)
+        flush_verified()
+
+        deleted.unlink()
+        with patch("provisioner.state._verified", None):   # Next run
+            flush_verified()
+            assert verified_sha256(str(kept)) == "a" * 64
+            flush_verified()
+        with open(os.path.join(_use_tmp_state_dir, "verified.json")) as f:
+            assert list(json.load(f)) == [str(kept)]
+
+
 class TestClearAllState:
     def test_clears_existing_state(self, _use_tmp_state_dir):
         mark_stage_complete("apt", "hash1")
@@ -0,0 +1,169 @@
+"""Tests for provisioner.store -- the content-addressed model store."""
+
+from __future__ import annotations
+
+import errno
+import hashlib
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from provisioner.downloaders.segmented import RemoteFile
+from provisioner import store as store_module
+from provisioner.store import ModelStore, clone_file, identity, is_pinned, stored_download
+
+PINNED = "https://huggingface.co/org/model/resolve/0123456789abcdef0123456789abcdef01234567/model.safetensors"
+MAIN = "https://huggingface.co/org/model/resolve/main/model.safetensors"
+CONTENT = b"weights" * 1000
+DIGEST = hashlib.sha256(CONTENT).hexdigest()
+
+
+def _remote(**kw):
+    return RemoteFile(url=kw.pop("url", "https://cdn.example.com/f"), headers={}, **kw)
+
+
+def _downloader(dest, content=CONTENT):
+    calls = []
+
+    def download():
+        calls.append(dest)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with open(dest, "wb") as f:
+            f.write(content)
+    return download, calls
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ModelStore(str(tmp_path / "store"))
+
+
+class TestIdentity:
+    def test_pinned_urls(self):
+        assert is_pinned(PINNED)
+        assert not is_pinned(MAIN)
+        assert not is_pinned("https://example.com/resolve/0123456789abcdef0123456789abcdef01234567/x")
+
+    def test_linked_etag_is_a_global_content_identity(self):
+        assert identity(_remote(linked_etag=DIGEST, validator='"abc"', size=7)) == f"sha256:{DIGEST}"
+
+    def test_plain_etags_are_scoped_to_their_host(self):
+        assert identity(_remote(validator='"abc"', size=7)) == 'cdn.example.com|"abc"|7'
+        assert identity(_remote(size=7)) == ""
+
+
+class TestStoredDownload:
+    @patch("provisioner.store.probe")
+    def test_second_dest_is_linked_not_downloaded(self, mock_probe, store, tmp_path):
+        mock_probe.return_value = _remote(linked_etag=DIGEST, size=len(CONTENT))
+        first, second = str(tmp_path / "a" / "m.safetensors"), str(tmp_path / "b" / "m.safetensors")
+
+        download, calls = _downloader(first)
+        assert stored_download(store, MAIN, first, download) is True
+        download, calls2 = _downloader(second)
+        assert stored_download(store, PINNED, second, download) is False
+
+        assert calls == [first] and calls2 == []
+        assert open(second, "rb").read() == CONTENT
+        # Hardlinked: one inode for the blob and both dests
+        assert os.stat(first).st_ino == os.stat(second).st_ino == os.stat(store.blob_path(DIGEST)).st_ino
+
+    @patch("provisioner.store.probe", side_effect=AssertionError("no network expected"))
+    def test_indexed_pinned_url_skips_the_network(self, mock_probe, store, tmp_path):
+        src = tmp_path / "src.bin"
+        src.write_bytes(CONTENT)
+        store.add(PINNED, str(src))
+
+        fresh = ModelStore(store.root)     # Next boot, same volume
+        dest = str(tmp_path / "models" / "m.safetensors")
+        download, calls = _downloader(dest)
+        assert stored_download(fresh, PINNED, dest, download) is False
+        assert calls == [] and open(dest, "rb").read() == CONTENT
+
+    @patch("provisioner.store.probe")
+    def test_changed_remote_is_downloaded_again(self, mock_probe, store, tmp_path):
+        url = "https://example.com/model.bin"
+        mock_probe.return_value = _remote(validator='"v1"', size=len(CONTENT))
+        download, _ = _downloader(str(tmp_path / "a.bin"))
+        stored_download(store, url, str(tmp_path / "a.bin"), download)
+
+        mock_probe.return_value = _remote(validator='"v2"', size=len(CONTENT))
+        download, calls = _downloader(str(tmp_path / "b.bin"), b"new weights")
+        assert stored_download(store, url, str(tmp_path / "b.bin"), download) is True
+        assert calls and open(tmp_path / "b.bin", "rb").read() == b"new weights"
+
+    @patch("provisioner.store.probe", side_effect=OSError("offline"))
+    def test_existing_dest_is_adopted_once(self, mock_probe, store, tmp_path):
+        dest = tmp_path / "old.bin"
+        dest.write_bytes(CONTENT)
+        download = MagicMock()
+        with patch("provisioner.store.file_digest", wraps=store_module.file_digest) as digest:
+            stored_download(store, PINNED, str(dest), download)
+            stored_download(store, PINNED, str(dest), download)
+        assert digest.call_count == 1
+        download.assert_not_called()
+        assert os.path.isfile(store.blob_path(DIGEST))
+
+    @patch("provisioner.store.probe", side_effect=AssertionError("no network expected"))
+    def test_expected_sha256_is_found_without_a_probe(self, mock_probe, store, tmp_path):
+        src = tmp_path / "src.bin"
+        src.write_bytes(CONTENT)
+        store.add("https://example.com/elsewhere", str(src))
+        dest = str(tmp_path / "m.bin")
+        download, calls = _downloader(dest)
+        assert stored_download(store, MAIN, dest, download, sha256=DIGEST) is False
+        assert calls == []
+
+    @patch("provisioner.store.probe")
+    def test_stored_content_must_match_the_expected_sha256(self, mock_probe, store, tmp_path):
+        mock_probe.return_value = _remote(validator='"v1"', size=len(CONTENT))
+        url = "https://example.com/model.bin"
+        download, _ = _downloader(str(tmp_path / "a.bin"))
+        stored_download(store, url, str(tmp_path / "a.bin"), download)
+
+        download, calls = _downloader(str(tmp_path / "b.bin"))
+        stored_download(store, url, str(tmp_path / "b.bin"), download, sha256="0" * 64)
+        assert calls
+
+    @patch("provisioner.store.probe", side_effect=OSError("offline"))
+    def test_failed_download_is_not_stored(self, mock_probe, store, tmp_path):
+        def download():
+            raise RuntimeError("Failed to download")
+
+        with pytest.raises(RuntimeError):
+            stored_download(store, MAIN, str(tmp_path / "x.bin"), download)
+        assert not os.path.exists(os.path.join(store.root, "blobs"))
+
+
+class TestEviction:
+    def test_least_recently_used_blobs_go_first(self, tmp_path):
+        now = [0.0]
+        store = ModelStore(str(tmp_path / "store"), budget=2500, clock=lambda: now[0])
+        digests = []
+        for name in ("a", "b", "c"):
+            now[0] += 1
+            path = tmp_path / name
+            path.write_bytes(name.encode() * 1000)
+            digests.append(store.add(f"https://example.com/{name}", str(path)))
+            if name == "b":
+                now[0] += 1
+                store.materialize(digests[0], str(tmp_path / "a2"))   # "a" used again
+
+        present = [os.path.isfile(store.blob_path(d)) for d in digests]
+        assert present == [True, False, True]
+        # Evicted from the store, not from the dest that still links it
+        assert (tmp_path / "b").read_bytes() == b"b" * 1000
+        assert not store.contains("https://example.com/b", str(tmp_path / "b"))
+
+
+class TestCloneFile:
+    def test_falls_back_to_a_copy_across_filesystems(self, tmp_path):
+        src = tmp_path / "src"
+        src.write_bytes(CONTENT)
+        with patch("provisioner.store.os.link", side_effect=OSError(errno.EXDEV, "cross-device")), \
+                patch("provisioner.store.fcntl.ioctl", side_effect=OSError(errno.EOPNOTSUPP, "no reflink")):
+            how = clone_file(str(src), str(tmp_path / "sub" / "dest"))
+        assert how == "copy"
+        assert (tmp_path / "sub" / "dest").read_bytes() == CONTENT
+        assert os.listdir(tmp_path / "sub") == ["dest"]
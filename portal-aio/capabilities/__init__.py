@@ -9,8 +9,14 @@ It is deliberately import-clean: it never imports the portal app, so it can be
 called both from the live portal endpoint (which injects freshly-collected
 supervisor/metrics data) and from the boot script / ``vast-capabilities`` CLI
 to write a static snapshot without a running web server.
+
+``cache`` keeps the live endpoint cheap to poll: expensive static probes are
+memoized against the files they read, and ``ManifestCache`` serves built
+manifests for a short TTL with single-flight builds and ETags. ``readiness``
+probes each service's internal port for the health endpoints.
 """
 
+from .cache import ManifestCache, etag_matches
 from .manifest import (
     SCHEMA_VERSION,
     assemble,
@@ -19,12 +25,18 @@ from .manifest import (
     load_fragments,
     parse_portal_config,
 )
+from .readiness import ReadinessChecker, find_service, load_checks
 
 __all__ = [
+    "ManifestCache",
+    "ReadinessChecker",
     "SCHEMA_VERSION",
     "assemble",
     "assemble_live",
     "assemble_static",
+    "etag_matches",
+    "find_service",
+    "load_checks",
     "load_fragments",
     "parse_portal_config",
 ]
@@ -0,0 +1,178 @@
+"""Caching for the capability manifest.
+
+A manifest build probes a lot of the system: ``ldconfig -p``, the CUDA
+helpers, nvidia-smi, fragment and portal.yaml parsing, and with
+``include=packages`` a package index lookup per environment. Agents poll the
+manifest endpoints, so the work is cached in two layers:
+
+* **Static facts** are memoized with ``memoize`` under a key that includes
+  the stat fingerprint (``fingerprint``) of every file they are derived
+  from. They are recomputed only when one of those files changes — a
+  package install, a new fragment, a rewritten ldconfig cache — and the
+  only cost of a hit is a few ``stat`` calls.
+* **Live facts** (supervisor states, listening ports, metrics) are what a
+  build still collects each time. ``ManifestCache`` keeps each built
+  manifest for a short TTL, shares one in-flight build between concurrent
+  callers, and pre-serializes the body with an ETag so unchanged manifests
+  can be answered with ``304 Not Modified``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import copy
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, Iterable, NamedTuple, Optional
+
+DEFAULT_TTL = 2.0      # Seconds a built manifest is served before rebuilding
+MEMO_ENTRIES = 32      # Keys remembered per memoized function
+
+_memoized: list = []   # Every memoize()d function, for clear()
+
+
+def fingerprint(*paths: str) -> tuple:
+    """``(path, mtime_ns, size, inode)`` for each path (None fields if missing).
+
+    ``os.stat`` follows symlinks, so repointing ``/usr/local/cuda`` at another
+    toolkit changes the fingerprint too.
+    """
+    out = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            out.append((path, st.st_mtime_ns, st.st_size, st.st_ino))
+        except OSError:
+            out.append((path, None, None, None))
+    return tuple(out)
+
+
+def memoize(key: Callable[..., Hashable]):
+    """Cache a function's result under ``key(*args, **kwargs)``.
+
+    The key must capture everything the result depends on — typically the
+    arguments plus ``fingerprint`` of the files read. Results are deep-copied
+    on the way out so callers cannot mutate the cached value. The decorated
+    function gains ``cache_clear()``.
+    """
+    def decorator(fn):
+        entries: OrderedDict = OrderedDict()
+        lock = threading.Lock()
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            k = key(*args, **kwargs)
+            with lock:
+                if k in entries:
+                    entries.move_to_end(k)
+                    return copy.deepcopy(entries[k])
+            value = fn(*args, **kwargs)
+            with lock:
+                entries[k] = value
+                while len(entries) > MEMO_ENTRIES:
+                    entries.popitem(last=False)
+            return copy.deepcopy(value)
+
+        def cache_clear():
+            with lock:
+                entries.clear()
+
+        wrapper.cache_clear = cache_clear
+        _memoized.append(wrapper)
+        return wrapper
+    return decorator
+
+
+def clear() -> None:
+    """Forget every memoized static fact."""
+    for fn in _memoized:
+        fn.cache_clear()
+
+
+def _canonical(manifest: dict) -> bytes:
+    # generated_at changes on every build; leave it out so an unchanged
+    # manifest keeps its ETag across rebuilds
+    body = {k: v for k, v in manifest.items() if k != "generated_at"}
+    return json.dumps(body, sort_keys=True, separators=(",", ":"), default=str).encode()
+
+
+def etag_for(manifest: dict) -> str:
+    return '"' + hashlib.sha256(_canonical(manifest)).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an ``If-None-Match`` header matches ``etag`` (weak comparison)."""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or any(t.removeprefix("W/") == etag for t in tags)
+
+
+class CachedManifest(NamedTuple):
+    manifest: dict
+    body: bytes        # JSON, serialized once per build
+    etag: str
+    built_at: float    # Monotonic time
+
+
+class ManifestCache:
+    """Short-TTL, single-flight cache of manifests keyed by ``include`` set."""
+
+    def __init__(
+        self,
+        build: Callable[[set[str]], Awaitable[dict]],
+        *,
+        ttl: float = DEFAULT_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._build = build
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: dict[frozenset, CachedManifest] = {}
+        self._pending: dict[frozenset, asyncio.Future] = {}
+        self._generation = 0   # Bumped by invalidate(); older builds are not cached
+        self.builds = 0
+
+    async def _make(self, key: frozenset) -> CachedManifest:
+        generation = self._generation
+        self.builds += 1
+        manifest = await self._build(set(key))
+        body = json.dumps(manifest, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+        entry = CachedManifest(manifest, body, etag_for(manifest), self._clock())
+        if generation == self._generation:
+            self._entries[key] = entry
+        return entry
+
+    def _forget(self, key: frozenset, future: asyncio.Future) -> None:
+        # invalidate() may already have replaced this build with a newer one
+        if self._pending.get(key) is future:
+            del self._pending[key]
+
+    async def get(self, include: Iterable[str] = ()) -> CachedManifest:
+        """The manifest for ``include``, built at most once per TTL however many ask."""
+        key = frozenset(include)
+        entry = self._entries.get(key)
+        if entry is not None and self._clock() - entry.built_at < self.ttl:
+            return entry
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = asyncio.ensure_future(self._make(key))
+            pending.add_done_callback(functools.partial(self._forget, key))
+        # Shielded: a caller that disconnects does not cancel the build the
+        # other waiters are sharing
+        return await asyncio.shield(pending)
+
+    def invalidate(self) -> None:
+        """Drop built manifests (not memoized static facts), e.g. after a provision.
+
+        Builds already in flight still answer the callers waiting on them,
+        but later callers start a new build and the old result is not cached.
+        """
+        self._generation += 1
+        self._entries.clear()
+        self._pending.clear()
@@ -11,6 +11,9 @@ Data tiers (see the design plan):
   supervisor process states, GPU/metrics, provisioning status. The live portal
   endpoint injects ``processes`` and ``metrics`` it has already collected; the
   static snapshot omits them.
+
+The expensive probes (ldconfig, the CUDA helpers, YAML parsing, package
+versions) are memoized against the files they read; see ``cache``.
 """
 
 from __future__ import annotations
@@ -26,6 +29,9 @@ from typing import Iterable, Optional
 
 import yaml
 
+from . import packages
+from .cache import fingerprint, memoize
+
 SCHEMA_VERSION = 1
 
 FRAGMENTS_DIR = "/etc/vast_capabilities.d"
@@ -66,6 +72,19 @@ def _workspace_is_volume() -> bool:
         return False
 
 
+_NVIDIA_VERSION = "/proc/driver/nvidia/version"
+_LD_CACHE = "/etc/ld.so.cache"
+_VULKAN_ICD_DIRS = ("/etc/vulkan/icd.d", "/usr/share/vulkan/icd.d", "/opt/nvidia-drivers/lib64")
+_CUDA_DRIVER_VERSION = "/opt/instance-tools/bin/cuda-driver-version"
+
+
+def _ld_key() -> tuple:
+    """What the loader-visible library set depends on."""
+    ld_path = os.environ.get("LD_LIBRARY_PATH", "")
+    return (ld_path, fingerprint(_LD_CACHE, *(d for d in ld_path.split(":") if d)))
+
+
+@memoize(key=_ld_key)
 def _ldconfig_libs() -> set:
     """Shared-library sonames visible to the dynamic linker (ldconfig cache +
     LD_LIBRARY_PATH) — used to detect which NVIDIA driver libs are present."""
@@ -88,7 +107,7 @@ def _ldconfig_libs() -> set:
 
 
 def _has_nvidia_vulkan_icd() -> bool:
-    for d in ("/etc/vulkan/icd.d", "/usr/share/vulkan/icd.d", "/opt/nvidia-drivers/lib64"):
+    for d in _VULKAN_ICD_DIRS:
         try:
             if any("nvidia" in f.lower() and f.endswith(".json") for f in os.listdir(d)):
                 return True
@@ -97,6 +116,7 @@ def _has_nvidia_vulkan_icd() -> bool:
     return False
 
 
+@memoize(key=lambda: (_ld_key(), fingerprint(_NVIDIA_VERSION, *_VULKAN_ICD_DIRS)))
 def _gpu_render_caps() -> Optional[dict]:
     """Whether the NVIDIA graphics/render userspace libs are present.
 
@@ -104,7 +124,7 @@ def _gpu_render_caps() -> Optional[dict]:
     OpenGL/OptiX/EGL/Vulkan libs are missing (undetectable before renting).
     Returns None when no NVIDIA driver is present (nothing to report).
     """
-    if not os.path.exists("/proc/driver/nvidia/version"):
+    if not os.path.exists(_NVIDIA_VERSION):
         return None
     libs = _ldconfig_libs()
     caps: dict = {
@@ -123,7 +143,7 @@ def _gpu_render_caps() -> Optional[dict]:
 
 def _driver_version() -> Optional[str]:
     try:
-        with open("/proc/driver/nvidia/version") as f:
+        with open(_NVIDIA_VERSION) as f:
             for tok in f.readline().split():
                 if re.match(r"^\d+\.\d+(\.\d+)?$", tok):
                     return tok
@@ -279,18 +299,39 @@ def _cuda_forward_compat() -> Optional[dict]:
     }
 
 
-def _cuda_info() -> Optional[dict]:
+def _cuda_key(compute_capability: Optional[list[str]] = None) -> tuple:
+    """What _cuda_info's answer depends on: the driver, the loader's library
+    set, the toolkit (CUDA_HOME, nvcc on PATH) and the forward-compat switch."""
+    home = _cuda_home()
+    return (
+        tuple(sorted(set(compute_capability or ()))),
+        _ld_key(),
+        os.environ.get("PATH", ""),
+        home,
+        fingerprint(
+            _NVIDIA_VERSION, _COMPAT_LDCONF, _CUDA_DRIVER_VERSION, home,
+            os.path.join(home, "bin", "nvcc"), os.path.join(home, "compat"),
+            os.path.join(home, "include", "cuda_runtime.h"),
+        ),
+    )
+
+
+@memoize(key=_cuda_key)
+def _cuda_info(compute_capability: Optional[list[str]] = None) -> Optional[dict]:
     """CUDA context for an agent: host driver version, the max CUDA the driver
     supports, the GPU compute capability, a precise inventory of which CUDA
     components are actually installed, and any forward-compatibility libs.
 
+    ``compute_capability`` is what the live portal already read through NVML;
+    without it nvidia-smi is asked.
+
     Returns None without an NVIDIA driver. Critical because images vary: the
     'stock' image ships no CUDA at all (relies on the host-injected driver), the
     'mini'/runtime base ships a curated *subset* (nvcc + cudart but not cuBLAS/
     cuDNN), and full nvidia/cuda-devel-derived images ship everything. Installing
     the wrong CUDA/driver packages from the (configured) nvidia apt repo breaks CUDA.
     """
-    if not os.path.exists("/proc/driver/nvidia/version"):
+    if not os.path.exists(_NVIDIA_VERSION):
         return None
     libs = _ldconfig_libs()
     components = _cuda_components(libs)
@@ -311,18 +352,21 @@ def _cuda_info() -> Optional[dict]:
         # driver branch 610 renamed that field from "CUDA Version" to "CUDA UMD
         # Version", so the old regex returned nothing on every 610 host. See
         # /opt/instance-tools/bin/cuda-driver-version.
-        out = subprocess.run(["/opt/instance-tools/bin/cuda-driver-version"],
+        out = subprocess.run([_CUDA_DRIVER_VERSION],
                              capture_output=True, text=True, timeout=10).stdout.strip()
         if re.fullmatch(r"[0-9]+\.[0-9]+", out):
             info["driver_max_cuda"] = out
     except Exception:
         pass
     try:  # GPU compute capability (e.g. "10.0"/"12.0" = Blackwell) — best-effort
-        out = subprocess.run(
-            ["nvidia-smi", "--query-gpu=compute_cap", "--format=csv,noheader"],
-            capture_output=True, text=True, timeout=5,
-        ).stdout
-        caps = sorted({c.strip() for c in out.splitlines() if c.strip()})
+        if compute_capability:
+            caps = sorted(set(compute_capability))
+        else:
+            out = subprocess.run(
+                ["nvidia-smi", "--query-gpu=compute_cap", "--format=csv,noheader"],
+                capture_output=True, text=True, timeout=5,
+            ).stdout
+            caps = sorted({c.strip() for c in out.splitlines() if c.strip()})
         if caps:
             info["compute_capability"] = caps[0] if len(caps) == 1 else caps
             # Blackwell (sm_10.0/sm_12.0) and newer need CUDA >= 12.8 framework builds;
@@ -479,6 +523,7 @@ def parse_portal_config(raw: str) -> list[dict]:
     return services
 
 
+@memoize(key=lambda: fingerprint(PORTAL_YAML))
 def _read_portal_yaml() -> Optional[list[dict]]:
     """Read services from the generated ``/etc/portal.yaml`` (non-blocking)."""
     if not os.path.isfile(PORTAL_YAML):
@@ -501,7 +546,7 @@ def _read_portal_yaml() -> Optional[list[dict]]:
         return None
 
 
-def _services_source() -> list[dict]:
+def services_source() -> list[dict]:
     """Prefer the generated portal.yaml; fall back to the PORTAL_CONFIG env."""
     svc = _read_portal_yaml()
     if svc is not None:
@@ -509,6 +554,11 @@ def _services_source() -> list[dict]:
     return parse_portal_config(os.environ.get("PORTAL_CONFIG", ""))
 
 
+def _fragments_key(fragments_dir: str = FRAGMENTS_DIR) -> tuple:
+    return (fragments_dir, fingerprint(fragments_dir, *sorted(glob.glob(os.path.join(fragments_dir, "*.yaml")))))
+
+
+@memoize(key=_fragments_key)
 def load_fragments(fragments_dir: str = FRAGMENTS_DIR) -> dict:
     """Merge every ``*.yaml`` fragment (sorted) into one declaration block.
 
@@ -519,6 +569,7 @@ def load_fragments(fragments_dir: str = FRAGMENTS_DIR) -> dict:
         "tools": [],
         "python_environments": [],
         "openai_endpoints": [],
+        "readiness": [],
         "image": {},
     }
     envs_by_name: dict[str, dict] = {}
@@ -541,6 +592,8 @@ def load_fragments(fragments_dir: str = FRAGMENTS_DIR) -> dict:
             merged["tools"].append(tool)
         for ep in frag.get("openai_endpoints", []) or []:
             merged["openai_endpoints"].append(ep)
+        for entry in frag.get("readiness", []) or []:
+            merged["readiness"].append(entry)
         for env in frag.get("python_environments", []) or []:
             name = env.get("name") or env.get("path")
             if not name:
@@ -602,46 +655,29 @@ def _detect_env_kind(path: str) -> Optional[str]:
     return None
 
 
+def _packages_key(venv_path: str, names: Iterable[str]) -> tuple:
+    # Installing or removing a package adds or removes a *.dist-info directory,
+    # which changes the mtime of site-packages
+    return (venv_path, tuple(names), fingerprint(*packages.site_packages_dirs(venv_path)))
+
+
+@memoize(key=_packages_key)
 def _probe_packages(venv_path: str, names: Iterable[str]) -> dict:
     """Return ``{name: version}`` for installed packages in ``venv_path``.
 
-    Runs the target venv's own python so we see *that* environment's packages
-    (the portal runs in a different venv). Best-effort, time-boxed; only called
-    when the caller opts in via ``include=['packages']``.
+    Read from the environment's package index (see ``packages``), which is
+    rebuilt from the dist-info metadata on disk when site-packages changes —
+    no interpreter is started. Only called when the caller opts in via
+    ``include=['packages']``.
     """
-    names = [n for n in names if n]
-    if not names:
-        return {}
-    py = os.path.join(venv_path, "bin", "python")
-    if not os.path.isfile(py):
-        return {}
-    script = (
-        "import json,sys\n"
-        "from importlib.metadata import version, PackageNotFoundError\n"
-        "out={}\n"
-        "for n in sys.argv[1:]:\n"
-        "    try: out[n]=version(n)\n"
-        "    except PackageNotFoundError: out[n]=None\n"
-        "    except Exception: out[n]=None\n"
-        "print(json.dumps(out))\n"
-    )
-    try:
-        res = subprocess.run(
-            [py, "-c", script, *names],
-            capture_output=True, text=True, timeout=20,
-        )
-        if res.returncode == 0:
-            return json.loads(res.stdout)
-    except Exception:
-        pass
-    return {}
+    return packages.versions(venv_path, names)
 
 
 # --------------------------------------------------------------------------- #
 # Matching helpers                                                            #
 # --------------------------------------------------------------------------- #
 
-def _normalize(s: str) -> str:
+def normalize_name(s: str) -> str:
     """Lowercase and strip separators so 'instance_portal' matches 'Instance Portal'."""
     return "".join(c for c in (s or "").lower() if c.isalnum())
 
@@ -655,7 +691,7 @@ def _launch_has_jupyter() -> bool:
         return False
 
 
-def _match_process(service: dict, processes: list[dict]) -> Optional[dict]:
+def match_process(service: dict, processes: list[dict]) -> Optional[dict]:
     """Match a service to a supervisor process by name / search term.
 
     Uses the same substring convention as the provisioner's
@@ -663,11 +699,11 @@ def _match_process(service: dict, processes: list[dict]) -> Optional[dict]:
     in (or contains) the service label, compared with separators normalised
     (``instance_portal`` <-> ``Instance Portal``).
     """
-    label = _normalize(service.get("name"))
+    label = normalize_name(service.get("name"))
     if not label:
         return None
     for proc in processes:
-        pname = _normalize(proc.get("name"))
+        pname = normalize_name(proc.get("name"))
         if not pname:
             continue
         if pname == label or pname in label or label in pname:
@@ -709,12 +745,14 @@ def assemble(
     processes: Optional[list[dict]] = None,
     metrics: Optional[dict] = None,
     gpu: Optional[str] = None,
+    compute_capability: Optional[list[str]] = None,
     include: Iterable[str] = (),
 ) -> dict:
     """Compose the manifest. Pure: all live data is passed in.
 
     ``include`` may contain ``"packages"`` (probe package versions) and
     ``"metrics"`` (the caller-supplied ``metrics`` dict is attached).
+    ``compute_capability`` (e.g. ``["9.0"]``) spares probing nvidia-smi.
     """
     include = set(include or ())
     fragments = fragments if fragments is not None else load_fragments()
@@ -744,12 +782,12 @@ def assemble(
                 if public_ip and mapped_port else None
             ),
         }
-        proc = _match_process(svc, processes)
+        proc = match_process(svc, processes)
         entry["supervisor_process"] = proc.get("name") if proc else None
         entry["state"] = proc.get("state") if proc else "unknown"
         # Jupyter under /.launch is run by the Vast platform, not supervisor, so
         # it has no matching process — report that rather than a misleading "unknown".
-        if entry["state"] == "unknown" and "jupyter" in _normalize(svc.get("name")) and _launch_has_jupyter():
+        if entry["state"] == "unknown" and "jupyter" in normalize_name(svc.get("name")) and _launch_has_jupyter():
             entry["state"] = "vast-managed"
 
         hint = ep_hints.get(svc.get("name"))
@@ -791,7 +829,7 @@ def assemble(
     render = _gpu_render_caps()
     if render is not None:
         hardware["gpu"]["render"] = render
-    cuda = _cuda_info()
+    cuda = _cuda_info(compute_capability)
     if cuda is not None:
         hardware["gpu"]["cuda"] = cuda
     if "metrics" in include and metrics:
@@ -879,15 +917,17 @@ def assemble_live(
     processes: Optional[list[dict]] = None,
     metrics: Optional[dict] = None,
     gpu: Optional[str] = None,
+    compute_capability: Optional[list[str]] = None,
     include: Iterable[str] = (),
 ) -> dict:
     """Convenience for the portal: read services + fragments, attach live data."""
     return assemble(
-        services=_services_source(),
+        services=services_source(),
         fragments=load_fragments(),
         processes=processes,
         metrics=metrics,
         gpu=gpu,
+        compute_capability=compute_capability,
         include=include,
     )
 
@@ -899,7 +939,7 @@ def assemble_static() -> dict:
     live state. Safe to call without the portal app running.
     """
     return assemble(
-        services=_services_source(),
+        services=services_source(),
         fragments=load_fragments(),
         processes=None,
         metrics=None,
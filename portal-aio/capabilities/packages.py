@@ -0,0 +1,181 @@
+"""Installed-package index for python environments.
+
+``include=packages`` reports the versions of each environment's
+``packages_of_interest``. Asking the environment's own interpreter
+(``importlib.metadata``) costs an interpreter start per environment, so
+instead the ``*.dist-info`` / ``*.egg-info`` directories in its
+site-packages are read directly — only the ``Name`` and ``Version`` headers.
+
+The result is kept on disk, one JSON index per environment under
+``INDEX_DIR``, stamped with the mtime of every site-packages directory it
+was built from. Installing, upgrading or removing a distribution adds or
+removes a metadata directory, which changes that mtime, so a stale index is
+detected with one ``stat`` per directory and rebuilt. The provisioner
+refreshes the index after its pip and conda phases
+(``python -m capabilities.packages ENV...``), so the first request after a
+provision does not pay for the scan either.
+"""
+
+from __future__ import annotations
+
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+from typing import Iterable, Optional
+
+INDEX_DIR = os.environ.get("CAPABILITIES_INDEX_DIR", "/var/cache/vast-capabilities")
+INDEX_VERSION = 1
+
+_SEPARATORS = re.compile(r"[-_.]+")
+
+
+def canonicalize(name: str) -> str:
+    """PEP 503 normalized name: ``Flash_Attn`` and ``flash-attn`` are one package."""
+    return _SEPARATORS.sub("-", name).lower()
+
+
+def site_packages_dirs(env_path: str) -> list[str]:
+    return sorted(glob.glob(os.path.join(env_path, "lib", "python*", "site-packages")))
+
+
+def _stamp(site_dirs: Iterable[str]) -> dict[str, Optional[int]]:
+    out = {}
+    for path in site_dirs:
+        try:
+            out[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            out[path] = None
+    return out
+
+
+def read_metadata(path: str) -> tuple[Optional[str], Optional[str]]:
+    """``(Name, Version)`` from a METADATA / PKG-INFO file; the body is not read."""
+    name = version = None
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if not line.strip():
+                    break   # End of the headers
+                key, _, value = line.partition(":")
+                if key == "Name":
+                    name = value.strip()
+                elif key == "Version":
+                    version = value.strip()
+                if name and version:
+                    break
+    except OSError:
+        pass
+    return name, version
+
+
+def _from_dirname(entry: str) -> tuple[Optional[str], Optional[str]]:
+    # "torch-2.7.1.dist-info", "six-1.16.0-py3.12.egg-info": the escaped name
+    # never contains "-", so it is everything before the first one
+    stem = entry.rsplit(".", 1)[0]
+    parts = stem.split("-")
+    return (parts[0], parts[1]) if len(parts) >= 2 else (None, None)
+
+
+def scan(site_dir: str) -> dict[str, str]:
+    """``{canonical name: version}`` for every distribution installed in ``site_dir``."""
+    packages: dict[str, str] = {}
+    try:
+        entries = sorted(os.listdir(site_dir))
+    except OSError:
+        return packages
+    for entry in entries:
+        if entry.endswith(".dist-info"):
+            metadata = os.path.join(site_dir, entry, "METADATA")
+        elif entry.endswith(".egg-info"):
+            metadata = os.path.join(site_dir, entry)
+            if os.path.isdir(metadata):
+                metadata = os.path.join(metadata, "PKG-INFO")
+        else:
+            continue
+        name, version = read_metadata(metadata)
+        if not (name and version):
+            name, version = _from_dirname(entry)
+        if name and version:
+            packages.setdefault(canonicalize(name), version)
+    return packages
+
+
+def index_path(env_path: str, index_dir: Optional[str] = None) -> str:
+    digest = hashlib.sha256(os.path.abspath(env_path).encode()).hexdigest()[:16]
+    slug = os.path.basename(os.path.normpath(env_path)) or "root"
+    return os.path.join(index_dir or INDEX_DIR, f"packages-{slug}-{digest}.json")
+
+
+def refresh(env_path: str, index_dir: Optional[str] = None) -> dict[str, str]:
+    """Rescan ``env_path`` and rewrite its index; returns the packages found.
+
+    Writing is best-effort: without a writable index directory the scan
+    result is still returned, it just is not kept.
+    """
+    site_dirs = site_packages_dirs(env_path)
+    stamp = _stamp(site_dirs)
+    packages: dict[str, str] = {}
+    for site_dir in site_dirs:
+        for name, version in scan(site_dir).items():
+            packages.setdefault(name, version)
+    index = {"version": INDEX_VERSION, "env": env_path, "site_dirs": stamp, "packages": packages}
+    path = index_path(env_path, index_dir)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(index, f, separators=(",", ":"))
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError:
+        pass
+    return packages
+
+
+def load(env_path: str, index_dir: Optional[str] = None) -> dict[str, str]:
+    """``{canonical name: version}`` for ``env_path``, from its index while still current."""
+    stamp = _stamp(site_packages_dirs(env_path))
+    try:
+        with open(index_path(env_path, index_dir)) as f:
+            index = json.load(f)
+        if (
+            index.get("version") == INDEX_VERSION
+            and index.get("env") == env_path
+            and index.get("site_dirs") == stamp
+        ):
+            return index["packages"]
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+    return refresh(env_path, index_dir)
+
+
+def versions(env_path: str, names: Iterable[str], index_dir: Optional[str] = None) -> dict:
+    """``{name: version or None}`` for each requested name, keyed as requested."""
+    names = [n for n in names if n]
+    if not names or not os.path.isdir(env_path):
+        return {}
+    packages = load(env_path, index_dir)
+    return {n: packages.get(canonicalize(n)) for n in names}
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """``python -m capabilities.packages ENV...``: rebuild the index of each environment."""
+    envs = sys.argv[1:] if argv is None else argv
+    if not envs:
+        print("usage: python -m capabilities.packages ENV...", file=sys.stderr)
+        return 2
+    for env_path in envs:
+        packages = refresh(env_path)
+        print(f"{env_path}: {len(packages)} distributions indexed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
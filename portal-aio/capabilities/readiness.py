@@ -0,0 +1,188 @@
+"""Service readiness for load-balancer health checks.
+
+A service is ready when all of these hold:
+
+* its supervisor program (matched by name, as for the manifest) is RUNNING —
+  a service with no matching program is judged on its probe alone;
+* its ``internal_port`` from ``/etc/portal.yaml`` answers: an HTTP GET of
+  the service's readiness path returns 2xx, or, where no path is declared,
+  a TCP connection is accepted.
+
+Readiness paths come from the capability fragments: an explicit
+``readiness`` entry, or else the ``models_path`` of the service's
+``openai_endpoints`` hint — an OpenAI server that lists its models has
+finished loading them::
+
+    readiness:
+      - service: ComfyUI
+        path: /system_stats
+
+Probes go to localhost, behind the Caddy auth edge, so they need no token.
+``ReadinessChecker`` runs every probe concurrently with a short timeout and
+keeps the result for ``ttl`` seconds, sharing one sweep between concurrent
+callers, so a load balancer checking every second costs at most one sweep
+per ``ttl``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Optional
+
+from .manifest import load_fragments, match_process, normalize_name, services_source
+
+DEFAULT_TTL = 1.0        # Seconds a sweep is reused
+DEFAULT_TIMEOUT = 0.5    # Seconds per probe
+_MAX_STATUS_LINE = 1024
+
+
+@dataclass
+class Check:
+    """What ``check_service`` needs to know about one service."""
+
+    service: str
+    port: Optional[int]
+    path: Optional[str] = None   # HTTP readiness path; None means a TCP connect
+
+
+def readiness_checks(services: list[dict], fragments: dict) -> list[Check]:
+    """One ``Check`` per service, with the fragment-declared path if there is one."""
+    paths = {e.get("service"): e.get("models_path") for e in fragments.get("openai_endpoints", []) if e.get("models_path")}
+    paths.update({e.get("service"): e.get("path") for e in fragments.get("readiness", []) if e.get("path")})
+    checks = []
+    for svc in services:
+        name = svc.get("name")
+        if not name:
+            continue
+        port = svc.get("internal_port")
+        checks.append(Check(name, int(port) if port else None, paths.get(name)))
+    return checks
+
+
+def load_checks() -> list[Check]:
+    """Checks for the services in ``/etc/portal.yaml`` and the installed fragments."""
+    return readiness_checks(services_source(), load_fragments())
+
+
+def find_service(result: dict, name: str) -> Optional[dict]:
+    """The entry for ``name`` in a sweep, matched like ``instance_portal`` <-> ``Instance Portal``."""
+    wanted = normalize_name(name)
+    for service in result["services"]:
+        if service["service"] == name or normalize_name(service["service"]) == wanted:
+            return service
+    return None
+
+
+async def probe_tcp(port: int, timeout: float = DEFAULT_TIMEOUT, host: str = "localhost") -> tuple[bool, str]:
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except asyncio.TimeoutError:
+        return False, f"connect timed out after {timeout:g}s"
+    except OSError as e:
+        return False, e.strerror or str(e)
+    writer.close()
+    return True, "accepting connections"
+
+
+async def probe_http(port: int, path: str, timeout: float = DEFAULT_TIMEOUT, host: str = "localhost") -> tuple[bool, str]:
+    """GET ``path``; ready on a 2xx status. Only the status line is read."""
+    async def get() -> int:
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            writer.write(
+                f"GET {path} HTTP/1.1\r\nHost: localhost:{port}\r\n"
+                "User-Agent: portal-readiness\r\nConnection: close\r\n\r\n".encode()
+            )
+            await writer.drain()
+            line = await reader.readuntil(b"\r\n")
+        finally:
+            writer.close()
+        parts = line[:_MAX_STATUS_LINE].split()
+        if len(parts) < 2 or not parts[0].startswith(b"HTTP/"):
+            raise ValueError("not an HTTP response")
+        return int(parts[1])
+
+    try:
+        status = await asyncio.wait_for(get(), timeout)
+    except asyncio.TimeoutError:
+        return False, f"GET {path} timed out after {timeout:g}s"
+    except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+        return False, f"GET {path}: {getattr(e, 'strerror', None) or e}"
+    return 200 <= status < 300, f"GET {path} returned {status}"
+
+
+async def check_service(check: Check, processes: Optional[list[dict]], timeout: float = DEFAULT_TIMEOUT) -> dict:
+    """Readiness of one service given the current supervisor ``processes``."""
+    result = asdict(check)
+    proc = match_process({"name": check.service}, processes) if processes else None
+    result["program"] = proc["name"] if proc else None
+    result["state"] = proc["state"] if proc else None
+    if check.port is None:
+        result["probe"] = "no internal port"
+        probe_ok = False
+    elif check.path:
+        probe_ok, result["probe"] = await probe_http(check.port, check.path, timeout)
+    else:
+        probe_ok, result["probe"] = await probe_tcp(check.port, timeout)
+    result["ready"] = probe_ok and (proc is None or proc["state"] == "RUNNING")
+    return result
+
+
+class ReadinessChecker:
+    """Sweeps every service concurrently, at most once per ``ttl``."""
+
+    def __init__(
+        self,
+        checks: Callable[[], list[Check]],
+        processes: Callable[[], Awaitable[Optional[list[dict]]]],
+        *,
+        ttl: float = DEFAULT_TTL,
+        timeout: float = DEFAULT_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._checks = checks
+        self._processes = processes
+        self.ttl = ttl
+        self.timeout = timeout
+        self._clock = clock
+        self._result: Optional[dict] = None
+        self._checked_at: Optional[float] = None
+        self._pending: Optional[asyncio.Future] = None
+        self.sweeps = 0
+
+    async def _sweep(self) -> dict:
+        self.sweeps += 1
+        try:
+            processes = await self._processes()
+            supervisor = None
+        except Exception as e:
+            # Cannot tell what supervisor thinks: not ready, rather than probe-only
+            processes, supervisor = None, str(e)
+        checks = self._checks()
+        services = await asyncio.gather(*(check_service(c, processes, self.timeout) for c in checks))
+        if supervisor is not None:
+            for service in services:
+                service["ready"] = False
+                service["state"] = f"unknown ({supervisor})"
+        result = {
+            "ready": supervisor is None and all(s["ready"] for s in services),
+            "services": list(services),
+            "checked_at": time.time(),
+        }
+        self._result, self._checked_at = result, self._clock()
+        return result
+
+    async def get(self) -> dict:
+        """The latest sweep, running a new one if it is older than ``ttl``."""
+        if self._result is not None and self._clock() - self._checked_at < self.ttl:
+            return self._result
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._sweep())
+            self._pending.add_done_callback(self._clear_pending)
+        return await asyncio.shield(self._pending)
+
+    def _clear_pending(self, future: asyncio.Future) -> None:
+        if self._pending is future:
+            self._pending = None
@@ -0,0 +1,35 @@
+"""Log streaming internals for the instance portal.
+
+The portal tails ``/var/log/portal/*.log`` and streams it to browsers and
+agents over ``/ws-logs``. The pieces of that pipeline that do not need the
+FastAPI app — noticing that a file changed, emulating the terminal that
+wrote it, rendering ANSI to HTML, fanning messages out to clients, paging
+through, searching, archiving and rotating log files — live here so they can
+be tested on their own.
+
+Like ``capabilities`` this package is import-clean: it never imports the
+portal app and depends on nothing beyond the standard library.
+"""
+
+from .archive import iter_log_zip
+from .fanout import ClientQueue
+from .history import LineIndex
+from .render import LogLine, ansi_to_html
+from .rotate import Rotation, rotate_file
+from .search import LogSearch
+from .terminal import Terminal
+from .watch import DirectoryWatcher, inotify_available
+
+__all__ = [
+    "ClientQueue",
+    "DirectoryWatcher",
+    "LineIndex",
+    "LogLine",
+    "LogSearch",
+    "Rotation",
+    "Terminal",
+    "ansi_to_html",
+    "inotify_available",
+    "iter_log_zip",
+    "rotate_file",
+]
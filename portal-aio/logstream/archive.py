@@ -0,0 +1,145 @@
+"""Streaming zip archives of the log directory.
+
+``iter_log_zip`` is a plain (synchronous) generator: each file is deflated a
+chunk at a time and the compressed bytes are yielded as soon as a useful
+amount has accumulated, so memory stays flat and the first byte goes out
+immediately no matter how large the logs are. The archive is written for an
+unseekable sink — sizes and CRCs follow each entry in a data descriptor — which
+is exactly what a chunked HTTP response is.
+
+Being synchronous, it should be driven from a worker thread; Starlette's
+``StreamingResponse`` already does that for sync iterators.
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import logging
+import os
+import stat
+import time
+import zipfile
+from typing import Iterator, Optional
+
+logger = logging.getLogger("log_monitor")
+
+READ_CHUNK = 1024 * 1024      # Bytes read from a log file per step
+YIELD_THRESHOLD = 64 * 1024   # Compressed bytes buffered before yielding
+
+
+class _Sink:
+    """Write-only file object collecting what ``ZipFile`` produces.
+
+    It deliberately has no ``tell``/``seek`` so ``ZipFile`` treats it as
+    unseekable and never tries to go back and patch a local header.
+    """
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+        self.size = 0
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        self.size = 0
+        return data
+
+
+def _select(
+    log_dir: str,
+    pattern: Optional[str],
+    since: Optional[float],
+) -> Iterator[tuple[str, str, os.stat_result]]:
+    """(path, arcname, stat) for each regular file that passes the filters.
+
+    ``pattern`` is matched against the path relative to ``log_dir``
+    (``*`` also matches ``/``, so ``*.log`` selects every log at any depth).
+    Arcnames keep ``log_dir``'s own name as the top-level folder.
+    """
+    parent = os.path.dirname(os.path.abspath(log_dir))
+    for root, dirs, files in os.walk(log_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if pattern and not fnmatch.fnmatch(os.path.relpath(path, log_dir), pattern):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            if since is not None and st.st_mtime < since:
+                continue
+            yield path, os.path.relpath(path, parent), st
+
+
+def _zip_info(arcname: str, st: os.stat_result) -> zipfile.ZipInfo:
+    """``ZipInfo.from_file`` without a second stat of a file that may be gone."""
+    date_time = time.localtime(st.st_mtime)[:6]
+    if date_time[0] < 1980:
+        date_time = (1980, 1, 1, 0, 0, 0)   # Earliest a zip can represent
+    info = zipfile.ZipInfo(arcname, date_time)
+    info.external_attr = (st.st_mode & 0xFFFF) << 16
+    info.file_size = st.st_size
+    info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+
+def iter_log_zip(
+    log_dir: str,
+    *,
+    pattern: Optional[str] = None,
+    since: Optional[float] = None,
+    max_bytes: Optional[int] = None,
+) -> Iterator[bytes]:
+    """Yield a deflated zip of ``log_dir`` as it is being built.
+
+    Filters: ``pattern`` (glob on the relative path), ``since`` (only files
+    modified at or after this epoch time) and ``max_bytes`` (keep at most the
+    last ``max_bytes`` of each file — the recent end is what matters in a
+    log). Each file is read up to the size it had when it was reached, so a
+    log that keeps growing cannot stall the archive. Unreadable files are
+    skipped.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        for path, arcname, st in _select(log_dir, pattern, since):
+            try:
+                f = open(path, "rb")
+            except OSError as e:
+                logger.debug(f"Skipping {path} in log archive: {e}")
+                continue
+            with f:
+                remaining = st.st_size
+                if max_bytes is not None and remaining > max_bytes:
+                    f.seek(remaining - max_bytes)
+                    remaining = max_bytes
+                info = _zip_info(arcname, st)
+                # force_zip64: the final size is unknown up front on an unseekable sink
+                with zf.open(info, "w", force_zip64=True) as entry:
+                    while remaining > 0:
+                        try:
+                            chunk = f.read(min(READ_CHUNK, remaining))
+                        except OSError as e:
+                            logger.warning(f"Log archive truncated {path}: {e}")
+                            break
+                        if not chunk:
+                            break  # File shrank (truncated/rotated) while reading
+                        entry.write(chunk)
+                        remaining -= len(chunk)
+                        if sink.size >= YIELD_THRESHOLD:
+                            yield sink.take()
+            if sink.size:
+                yield sink.take()
+    # Central directory
+    if sink.size:
+        yield sink.take()
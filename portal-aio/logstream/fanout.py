@@ -0,0 +1,164 @@
+"""Per-client outbound queues for the log WebSocket.
+
+The tailer must never wait on a browser. Each connected client gets a
+``ClientQueue``: the tailer ``put``s already-serialized messages into it
+synchronously, and the client's own writer task (``run``) drains it once per
+flush tick as a single ``batch`` frame. While a message waits for the tick:
+
+* consecutive ``overwrite`` (or ``overwrite_block``) messages for the same
+  file collapse to the latest one — a tqdm bar redrawn 200 times between
+  ticks costs the client one update, not 200;
+* everything else is kept in order and shipped together in one frame.
+
+When nothing has been queued for ``heartbeat_interval`` seconds the writer
+sends a ``heartbeat`` frame of its own, so an idle client can tell a quiet
+stream from a dead one without any other task waking up on its behalf.
+
+A client may also narrow what it receives: with ``files`` set, log messages
+for any other file are dropped at ``put`` and never queued at all.
+
+A client that cannot keep up is cut loose rather than allowed to slow anyone
+else down: if its backlog exceeds ``max_pending`` messages, or a single send
+stalls for ``send_timeout`` seconds, ``run`` returns and the caller closes the
+socket. The browser reconnects and receives a fresh, consistent history.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+FLUSH_INTERVAL = 0.05   # Seconds between batched frames per client
+MAX_PENDING = 5000      # Queued log messages before a client is dropped
+SEND_TIMEOUT = 10.0     # Seconds a single frame may take to send
+HEARTBEAT_INTERVAL = 10.0  # Idle seconds before a heartbeat frame is sent
+
+# Message types where a newer message fully supersedes the previous one for
+# the same file, provided nothing else for that file was queued in between.
+_COALESCE_TYPES = frozenset({"overwrite", "overwrite_block"})
+
+
+class ClientQueue:
+    """Bounded, coalescing outbound queue for one WebSocket client."""
+
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable[None]],
+        *,
+        flush_interval: float = FLUSH_INTERVAL,
+        max_pending: int = MAX_PENDING,
+        send_timeout: float = SEND_TIMEOUT,
+        heartbeat_interval: Optional[float] = HEARTBEAT_INTERVAL,
+    ):
+        self._send = send
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.send_timeout = send_timeout
+        self.heartbeat_interval = heartbeat_interval
+        # Entries are (payload, msg_type); msg_type None marks a standalone
+        # frame (system message, history, heartbeat) that is never batched.
+        # Superseded entries are set to None and skipped at flush time.
+        self._items: list[Optional[tuple[str, Optional[str]]]] = []
+        self._pending = 0
+        self._batched = 0   # Queued log messages (the rest are standalone frames)
+        self._last_for_file: dict[str, tuple[int, str]] = {}
+        self._ready = asyncio.Event()
+        self.files: Optional[frozenset[str]] = None  # Subscribed files; None = every file
+        self.overflowed = False
+        self.closed = False
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return self._pending
+
+    def put(self, payload: str, msg_type: Optional[str] = None, file: str = "") -> None:
+        """Queue a serialized message. Never blocks.
+
+        Pass ``msg_type`` (and ``file``) for log messages so they can be
+        batched and coalesced; omit it for frames that must go out verbatim.
+        Log messages for files outside ``files`` are ignored.
+        """
+        if self.closed or self.overflowed:
+            return
+        if msg_type is not None:
+            if self.files is not None and file not in self.files:
+                return
+            last = self._last_for_file.get(file)
+            if last is not None and last[1] == msg_type and msg_type in _COALESCE_TYPES:
+                self._items[last[0]] = None
+                self._pending -= 1
+                self._batched -= 1
+                self.coalesced += 1
+            self._last_for_file[file] = (len(self._items), msg_type)
+            if self._pending >= self.max_pending:
+                self.overflowed = True
+                self._ready.set()
+                return
+        self._items.append((payload, msg_type))
+        self._pending += 1
+        if msg_type is not None:
+            self._batched += 1
+        self._ready.set()
+
+    def close(self) -> None:
+        self.closed = True
+        self._ready.set()
+
+    def _take_frames(self) -> list[str]:
+        items, self._items = self._items, []
+        self._pending = 0
+        self._batched = 0
+        self._last_for_file.clear()
+        frames: list[str] = []
+        batch: list[str] = []
+
+        def flush_batch():
+            if len(batch) == 1:
+                frames.append(batch[0])
+            elif batch:
+                frames.append('{"type": "batch", "messages": [' + ", ".join(batch) + "]}")
+            batch.clear()
+
+        for item in items:
+            if item is None:
+                continue
+            payload, msg_type = item
+            if msg_type is None:
+                flush_batch()
+                frames.append(payload)
+            else:
+                batch.append(payload)
+        flush_batch()
+        return frames
+
+    async def run(self) -> None:
+        """Drain the queue until closed, overflowed or a send fails/stalls.
+
+        While idle it queues a ``heartbeat`` every ``heartbeat_interval``
+        seconds (None disables them). Send errors propagate; an overflow or a stalled send just returns so
+        the caller can close the socket.
+        """
+        while not self.closed:
+            try:
+                await asyncio.wait_for(self._ready.wait(), self.heartbeat_interval)
+            except asyncio.TimeoutError:
+                self.put("heartbeat")
+            if self.overflowed:
+                return
+            if self._batched:
+                # Let a tick's worth of messages accumulate (and coalesce);
+                # a lone pong or heartbeat goes out straight away
+                await asyncio.sleep(self.flush_interval)
+            self._ready.clear()
+            for frame in self._take_frames():
+                try:
+                    await asyncio.wait_for(self._send(frame), self.send_timeout)
+                except asyncio.TimeoutError:
+                    self.overflowed = True
+                    return
+                self.frames_sent += 1
+                self.bytes_sent += len(frame)
+            if self.overflowed:
+                return
@@ -0,0 +1,154 @@
+"""Paginated access to log history on disk.
+
+The WebSocket stream only carries the last ``MAX_LINES`` lines. Anything older
+is read back from the file itself, a page at a time, so the portal never has to
+hold a whole log in memory.
+
+``LineIndex`` keeps a sparse map from line numbers to byte offsets — one
+checkpoint every ``CHECKPOINT_LINES`` lines — and extends it incrementally as
+the file grows. A page request ("``limit`` lines ending before byte
+``before``") bisects to the nearest checkpoint and reads forward from there, so
+each request touches at most a few checkpoints' worth of bytes no matter how
+deep into the file it is. The index resets itself when the file is replaced
+(new inode) or truncated.
+"""
+
+from __future__ import annotations
+
+import bisect
+import os
+import re
+import threading
+from typing import Optional
+
+from .render import ansi_to_html
+
+CHECKPOINT_LINES = 1000
+MAX_PAGE_LINES = 2000
+_SCAN_CHUNK = 1024 * 1024
+
+# Any CSI sequence (SGR included) — stripped for the plain-text format.
+_CSI_RE = re.compile(r'\x1b\[\??[0-9;]*[A-Za-z]')
+
+FORMATS = ("text", "html", "raw")
+
+
+def strip_csi(text: str) -> str:
+    """``text`` without its CSI sequences (colours, cursor movement)."""
+    return _CSI_RE.sub('', text)
+
+
+def collapse_cr(line: str) -> str:
+    """What a terminal would show for a line containing bare ``\\r``s."""
+    line = line.rstrip('\r')
+    if '\r' in line:
+        line = line.rsplit('\r', 1)[-1]
+    return line
+
+
+def format_line(line: str, fmt: str) -> str:
+    """Render one raw log line as ``text`` (ANSI stripped), ``html`` or ``raw``."""
+    if fmt == "raw":
+        return line
+    line = collapse_cr(line)
+    if fmt == "html":
+        return ansi_to_html(line)
+    return strip_csi(line)
+
+
+class LineIndex:
+    """Sparse line-number → byte-offset index for one log file."""
+
+    def __init__(self, path: str, checkpoint_lines: int = CHECKPOINT_LINES):
+        self.path = path
+        self.checkpoint_lines = checkpoint_lines
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, inode: Optional[int]) -> None:
+        self.inode = inode
+        self.indexed = 0        # Bytes scanned so far
+        self.lines = 0          # Complete lines in the scanned bytes
+        # checkpoints[k] is the byte offset where line k*checkpoint_lines starts
+        self.checkpoints = [0]
+
+    def refresh(self) -> int:
+        """Bring the index up to date with the file. Returns the file size."""
+        st = os.stat(self.path)
+        if st.st_ino != self.inode or st.st_size < self.indexed:
+            self._reset(st.st_ino)
+        if st.st_size > self.indexed:
+            self._scan(st.st_size)
+        return st.st_size
+
+    def _scan(self, size: int) -> None:
+        every = self.checkpoint_lines
+        with open(self.path, "rb") as f:
+            f.seek(self.indexed)
+            pos = self.indexed
+            while pos < size:
+                chunk = f.read(min(_SCAN_CHUNK, size - pos))
+                if not chunk:
+                    break
+                until_checkpoint = every - (self.lines % every)
+                count = chunk.count(b"\n")
+                if count < until_checkpoint:
+                    self.lines += count
+                else:
+                    i = -1
+                    while True:
+                        i = chunk.find(b"\n", i + 1)
+                        if i < 0:
+                            break
+                        self.lines += 1
+                        if self.lines % every == 0:
+                            self.checkpoints.append(pos + i + 1)
+                pos += len(chunk)
+        self.indexed = size
+
+    def _read(self, start: int, end: int) -> list[bytes]:
+        """Raw lines in ``[start, end)``; a trailing partial line is kept."""
+        if end <= start:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+        if data.endswith(b"\n"):
+            data = data[:-1]
+        return data.split(b"\n")
+
+    def page(self, before: Optional[int] = None, limit: int = 200, fmt: str = "text") -> dict:
+        """Up to ``limit`` lines ending at byte offset ``before`` (default: EOF).
+
+        Returns the lines plus ``start`` — the offset of the first returned
+        line, to pass as ``before`` for the next (older) page — and
+        ``first_line``, its zero-based line number.
+        """
+        limit = max(1, min(limit, MAX_PAGE_LINES))
+        with self._lock:
+            size = self.refresh()
+            end = size if before is None else max(0, min(before, size))
+            k = bisect.bisect_right(self.checkpoints, end) - 1
+            # A checkpoint exactly at `end` starts a line we must not include
+            if k > 0 and self.checkpoints[k] == end:
+                k -= 1
+            seg_start = self.checkpoints[k]
+            lines = self._read(seg_start, end)
+            while len(lines) < limit and k > 0:
+                k -= 1
+                lines = self._read(self.checkpoints[k], seg_start) + lines
+                seg_start = self.checkpoints[k]
+            first_line = k * self.checkpoint_lines
+            if len(lines) > limit:
+                drop = len(lines) - limit
+                seg_start += sum(len(line) + 1 for line in lines[:drop])
+                first_line += drop
+                lines = lines[drop:]
+        return {
+            "lines": [format_line(line.decode("utf-8", errors="replace"), fmt) for line in lines],
+            "start": seg_start,
+            "end": end,
+            "first_line": first_line,
+            "size": size,
+            "has_more": seg_start > 0,
+        }
@@ -0,0 +1,104 @@
+"""ANSI → HTML rendering for the log viewer.
+
+Rendering is the most expensive per-line step in the log pipeline, so lines are
+rendered at most once: ``LogLine`` carries the raw text and renders its HTML on
+first use, and ``ansi_to_html`` itself is memoised so the identical rows that a
+redrawn progress block re-sends (and a reconnecting client re-requests) hit the
+cache instead of the regex engine.
+"""
+
+from __future__ import annotations
+
+import functools
+import html as html_module
+import re
+from typing import Optional
+
+# ANSI color maps
+# Tuned for the dark log viewer background (--logs-bg ~#0b0f19).
+# Standard colors (30-37) are lifted from pure CGA values so they remain
+# legible on dark surfaces; bright colors (90-97) are softened to avoid glare.
+_ANSI_FG_COLORS = {
+    30: '#4b5563', 31: '#f87171', 32: '#4ade80', 33: '#fbbf24', 34: '#60a5fa', 35: '#c084fc', 36: '#22d3ee', 37: '#d1d5db',
+    90: '#9ca3af', 91: '#fca5a5', 92: '#86efac', 93: '#fde68a', 94: '#93bbfd', 95: '#d8b4fe', 96: '#67e8f9', 97: '#f3f4f6',
+}
+_ANSI_BG_COLORS = {
+    40: '#1f2937', 41: '#991b1b', 42: '#166534', 43: '#92400e', 44: '#1e3a5f', 45: '#6b21a8', 46: '#155e75', 47: '#4b5563',
+    100: '#374151', 101: '#f87171', 102: '#4ade80', 103: '#fbbf24', 104: '#60a5fa', 105: '#c084fc', 106: '#22d3ee', 107: '#e5e7eb',
+}
+
+# Opening span for every SGR code we render, resolved once.
+_SGR_SPANS = {
+    1: '<span style="font-weight:bold">',
+    2: '<span style="opacity:0.7">',
+    **{code: f'<span style="color:{color}">' for code, color in _ANSI_FG_COLORS.items()},
+    **{code: f'<span style="background-color:{color}">' for code, color in _ANSI_BG_COLORS.items()},
+}
+
+# Regex to strip C0/C1 control characters except tab (\x09).
+# \r and \n are already consumed by _process_chunk before text reaches here.
+_CONTROL_CHAR_RE = re.compile(r'[\x00-\x08\x0b-\x0d\x0e-\x1a\x7f]')
+
+# Strip cursor movement, erase, and other non-SGR CSI sequences.
+# These are interpreted by _process_chunk(); they must not appear in HTML.
+_CSI_NON_SGR_RE = re.compile(r'\x1b\[\??[0-9;]*[A-Za-ln-z]')
+
+# Splits text on SGR sequences; the capture group puts the sequence bodies at
+# odd indices of the result.
+_SGR_SPLIT_RE = re.compile(r'\x1b\[([0-9;]*)m')
+
+
+@functools.lru_cache(maxsize=4096)
+def ansi_to_html(text: str) -> str:
+    """Convert ANSI escape codes to HTML spans. HTML-escapes text content.
+    Strips stray control characters (SI, SO, BEL, etc.) that are invisible
+    in a real terminal but render as garbage in HTML."""
+    if '\x1b' not in text:
+        return html_module.escape(_CONTROL_CHAR_RE.sub('', text))
+    # Strip non-SGR CSI sequences (cursor movement, erase, etc.)
+    text = _CSI_NON_SGR_RE.sub('', text)
+    # Split on ANSI sequences, escape text parts, convert codes to spans
+    parts = _SGR_SPLIT_RE.split(text)
+    result = []
+    open_spans = 0
+    for i, part in enumerate(parts):
+        if i % 2:
+            codes = [int(c) for c in part.split(';') if c] if part else [0]
+            for code in codes:
+                if code == 0:
+                    result.append('</span>' * open_spans)
+                    open_spans = 0
+                else:
+                    span = _SGR_SPANS.get(code)
+                    # Unknown codes: silently ignored
+                    if span:
+                        result.append(span)
+                        open_spans += 1
+        elif part:
+            cleaned = _CONTROL_CHAR_RE.sub('', part)
+            result.append(html_module.escape(cleaned))
+    result.append('</span>' * open_spans)
+    return ''.join(result)
+
+
+class LogLine:
+    """One log line as stored in the portal's buffers: raw text + cached HTML.
+
+    ``file`` names the log it came from, so a replay of the interleaved
+    history can still tell clients which file each line belongs to.
+    """
+    __slots__ = ('text', 'file', '_html')
+
+    def __init__(self, text: str, file: str = ""):
+        self.text = text
+        self.file = file
+        self._html: Optional[str] = None
+
+    @property
+    def html(self) -> str:
+        if self._html is None:
+            self._html = ansi_to_html(self.text)
+        return self._html
+
+    def __repr__(self) -> str:
+        return f"LogLine({self.text!r})"
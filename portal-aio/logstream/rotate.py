@@ -0,0 +1,237 @@
+"""Size-based log rotation that is safe for writers holding the file open.
+
+The files under ``/var/log/portal`` are written by processes that keep their
+descriptor open for their whole life (the provisioner's ``FileHandler``,
+supervisor's stdout capture, ``log-tee``). Replacing such a file with a
+trimmed copy leaves every one of those writers appending to the unlinked
+inode. Rotation here therefore always works on the file in place:
+
+* **collapse** — ``fallocate(FALLOC_FL_COLLAPSE_RANGE)`` removes the head of
+  the file, block aligned, in one atomic step; ``O_APPEND`` writers simply
+  carry on at the new end and the last ``keep`` bytes stay in the file.
+* **copy-truncate** — where the filesystem cannot collapse (tmpfs, older
+  kernels), the file is copied out and truncated to zero.
+
+Either way the removed bytes are first written to a gzip generation next to
+the file (``name.log.<timestamp>.gz``), and the oldest generations in the
+directory are deleted once they exceed a byte budget.
+
+``rotate_file`` is blocking and meant to run in a worker thread. Its
+``limit`` argument is how far the caller's tailer has read: a collapse never
+removes bytes beyond it, and anything copy-truncate has to take from beyond
+it is handed back in ``Rotation.unread`` so the tailer can still stream it.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import glob
+import gzip
+import logging
+import os
+import time
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger("log_monitor")
+
+FALLOC_FL_COLLAPSE_RANGE = 0x08
+COPY_CHUNK = 1024 * 1024
+ARCHIVE_SUFFIX = ".gz"
+
+# st_dev values of filesystems where collapse failed as unsupported
+_no_collapse: set[int] = set()
+_fallocate = None
+
+
+class Rotation(NamedTuple):
+    removed: int          # Bytes removed from the head of the file
+    method: str           # "collapse" or "copy-truncate"
+    archive: Optional[str] = None
+    unread: bytes = b""   # Bytes past `limit` that left the file (copy-truncate only)
+
+
+def _libc_fallocate():
+    global _fallocate
+    if _fallocate is None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fn = libc.fallocate
+            fn.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+            fn.restype = ctypes.c_int
+            _fallocate = fn
+        except (OSError, AttributeError):
+            _fallocate = False
+    return _fallocate or None
+
+
+def collapse_head(fd: int, length: int) -> None:
+    """Remove the first ``length`` bytes of the file. Raises ``OSError``."""
+    fn = _libc_fallocate()
+    if fn is None:
+        raise OSError(errno.ENOSYS, "fallocate unavailable")
+    if fn(fd, FALLOC_FL_COLLAPSE_RANGE, 0, length) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+
+def _archive_path(path: str) -> str:
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    candidate = f"{path}.{stamp}{ARCHIVE_SUFFIX}"
+    n = 1
+    while os.path.exists(candidate):
+        candidate = f"{path}.{stamp}-{n}{ARCHIVE_SUFFIX}"
+        n += 1
+    return candidate
+
+
+def prune_archives(directory: str, budget: int) -> list[str]:
+    """Delete the oldest generations in ``directory`` until they fit in ``budget`` bytes."""
+    entries = []
+    # Only our own <name>.log.<YYYYmmdd-HHMMSS>[-n].gz names, never logrotate's
+    pattern = f"*.log.[0-9]*-[0-9]*{ARCHIVE_SUFFIX}"
+    for path in glob.glob(os.path.join(glob.escape(directory), pattern)):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, path, st.st_size))
+    entries.sort()
+    total = sum(size for _, _, size in entries)
+    removed = []
+    for _, path, size in entries:
+        if total <= budget:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total -= size
+        removed.append(path)
+    return removed
+
+
+class _Archive:
+    """A gzip generation written to a temp name and renamed into place on commit."""
+
+    def __init__(self, path: str):
+        self.path = _archive_path(path)
+        self._tmp = self.path + ".tmp"
+        self._file = gzip.open(self._tmp, "wb", compresslevel=6)
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+
+    def commit(self) -> str:
+        self._file.close()
+        os.replace(self._tmp, self.path)
+        return self.path
+
+    def discard(self) -> None:
+        self._file.close()
+        try:
+            os.unlink(self._tmp)
+        except OSError:
+            pass
+
+
+def _copy_truncate(path: str, limit: Optional[int], archive: Optional[_Archive]) -> Rotation:
+    unread = []
+    copied = 0
+    with open(path, "rb") as src:
+        while True:
+            chunk = src.read(COPY_CHUNK)
+            if not chunk:
+                # Truncate the moment we reach EOF: anything written between
+                # that read and this call is the only thing that can be lost
+                os.truncate(path, 0)
+                break
+            if archive is not None:
+                archive.write(chunk)
+            if limit is not None and copied + len(chunk) > limit:
+                unread.append(chunk[max(0, limit - copied):])
+            copied += len(chunk)
+    return Rotation(copied, "copy-truncate", archive.commit() if archive else None, b"".join(unread))
+
+
+def rotate_file(
+    path: str,
+    *,
+    max_size: int,
+    keep: int,
+    limit: Optional[int] = None,
+    budget: Optional[int] = None,
+) -> Optional[Rotation]:
+    """Rotate ``path`` in place if it is larger than ``max_size``.
+
+    Keeps (about) the last ``keep`` bytes when the filesystem can collapse
+    ranges. ``limit`` is the tailer's read position (see module docstring).
+    With a ``budget`` the removed bytes are archived and old generations
+    pruned to fit; with ``budget=None`` they are discarded. Returns None
+    when nothing was rotated.
+    """
+    fd = os.open(path, os.O_RDWR)
+    try:
+        st = os.fstat(fd)
+        size = st.st_size
+        if size <= max_size:
+            return None
+        result = None
+        if st.st_dev not in _no_collapse:
+            block = max(st.st_blksize, 4096)
+            length = size - keep
+            if limit is not None:
+                length = min(length, limit)
+            length -= length % block
+            if length <= 0:
+                return None  # The tailer has not caught up yet; try next round
+            result = _with_archive(path, budget, lambda archive: _collapse(fd, length, archive, st.st_dev))
+        if result is None:
+            result = _with_archive(path, budget, lambda archive: _copy_truncate(path, limit, archive))
+    finally:
+        os.close(fd)
+
+    logger.info(
+        f"Rotated {path} ({result.method}): removed {result.removed / 1024 / 1024:.1f} MB"
+        + (f", archived to {os.path.basename(result.archive)}" if result.archive else "")
+    )
+    if budget:
+        for old in prune_archives(os.path.dirname(path), budget):
+            logger.info(f"Removed old log generation {old}")
+    return result
+
+
+def _with_archive(path: str, budget: Optional[int], rotate) -> Optional[Rotation]:
+    """Run ``rotate(archive)``; the generation is kept only if it returns a Rotation."""
+    archive = _Archive(path) if budget else None
+    try:
+        result = rotate(archive)
+    except BaseException:
+        if archive is not None:
+            archive.discard()
+        raise
+    if result is None and archive is not None:
+        archive.discard()
+    return result
+
+
+def _collapse(fd: int, length: int, archive: Optional[_Archive], dev: int) -> Optional[Rotation]:
+    """Archive then collapse the first ``length`` bytes; None if unsupported here."""
+    if archive is not None:
+        offset = 0
+        while offset < length:
+            chunk = os.pread(fd, min(COPY_CHUNK, length - offset), offset)
+            if not chunk:
+                break
+            archive.write(chunk)
+            offset += len(chunk)
+    try:
+        collapse_head(fd, length)
+    except OSError as e:
+        if e.errno in (errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL, errno.ENOTTY):
+            logger.info(f"fallocate collapse unsupported here ({e.strerror}), using copy-truncate")
+            _no_collapse.add(dev)
+            return None
+        raise
+    return Rotation(length, "collapse", archive.commit() if archive else None)
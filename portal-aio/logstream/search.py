@@ -0,0 +1,180 @@
+"""Regex and severity search over log files.
+
+A ``LogSearch`` holds one query (a regex, a minimum severity, or both) and
+scans any number of files or in-memory line buffers for it, yielding match
+records with optional surrounding context. Files are read in fixed-size
+chunks and each chunk is tested as a whole before it is split into lines, so
+the common case — a multi-megabyte log with a handful of hits — costs one
+regex pass per chunk rather than one per line, and memory use does not
+depend on file size.
+
+The search stops once ``max_results`` matches have been produced; ``truncated``
+then records that more existed.
+"""
+
+from __future__ import annotations
+
+import re
+from collections import deque
+from typing import Iterable, Iterator, Optional
+
+# Portal logs keep SGR colour codes that would otherwise split words
+# ("\x1b[31mERROR") and defeat simple patterns; matching sees what the
+# text view shows.
+from .history import collapse_cr, strip_csi
+
+SEARCH_CHUNK = 1024 * 1024   # Bytes read per step
+MAX_RESULTS = 200            # Default cap on matches per search
+MAX_CONTEXT = 20             # Largest allowed context (lines either side)
+
+# Severity levels, least to most severe. Searching for a level also matches
+# everything more severe than it.
+_LEVEL_PATTERNS = {
+    "warning": r"\bWARN(?:ING)?\b|(?i:\bwarning:)",
+    "error": (
+        r"\b(?:ERROR|CRITICAL|FATAL)\b|(?i:\berror:)"
+        r"|Traceback \(most recent call last\)|\b\w+(?:Error|Exception):"
+        r"|(?i:out of memory)"
+    ),
+}
+LEVELS = tuple(_LEVEL_PATTERNS)
+
+
+def _level_regex(level: str) -> re.Pattern:
+    if level not in _LEVEL_PATTERNS:
+        raise ValueError(f"level must be one of {', '.join(LEVELS)}")
+    wanted = LEVELS[LEVELS.index(level):]
+    return re.compile("|".join(_LEVEL_PATTERNS[name] for name in wanted), re.MULTILINE)
+
+
+class LogSearch:
+    """One search query, applied to files or line buffers in turn."""
+
+    def __init__(
+        self,
+        pattern: Optional[str] = None,
+        *,
+        level: Optional[str] = None,
+        context: int = 0,
+        max_results: int = MAX_RESULTS,
+        ignore_case: bool = False,
+    ):
+        """Raise ``ValueError`` for an invalid regex or level, or an empty query."""
+        if not pattern and not level:
+            raise ValueError("a pattern or a level is required")
+        self._regexes: list[re.Pattern] = []
+        if pattern:
+            flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+            try:
+                self._regexes.append(re.compile(pattern, flags))
+            except re.error as e:
+                raise ValueError(f"invalid pattern: {e}") from None
+        if level:
+            self._regexes.append(_level_regex(level))
+        self.context = max(0, min(context, MAX_CONTEXT))
+        self.max_results = max_results
+        self.matched = 0
+        self.truncated = False
+
+    def _matches(self, text: str) -> bool:
+        return all(regex.search(text) for regex in self._regexes)
+
+    def _scan(
+        self,
+        file: str,
+        blocks: Iterable[tuple[list[str], bool]],
+        numbered: bool = True,
+    ) -> Iterator[dict]:
+        """Match line by line; a block flagged False is known to hold no match."""
+        ctx = self.context
+        before: deque[str] = deque(maxlen=ctx)
+        waiting: deque[dict] = deque()   # Matches still collecting after-context
+        line_no = 0
+        for lines, may_match in blocks:
+            if not may_match and not waiting:
+                line_no += len(lines)
+                if ctx:
+                    before.extend(lines[-ctx:])
+                continue
+            for i, text in enumerate(lines):
+                if not may_match and not waiting:
+                    # After-context complete; skip the rest of a matchless block
+                    rest = lines[i:]
+                    line_no += len(rest)
+                    before.extend(rest[-ctx:])
+                    break
+                line_no += 1
+                for record in waiting:
+                    record["after"].append(text)
+                while waiting and len(waiting[0]["after"]) >= ctx:
+                    yield waiting.popleft()
+                if may_match and self._matches(text):
+                    if self.matched >= self.max_results:
+                        self.truncated = True
+                        yield from waiting
+                        return
+                    self.matched += 1
+                    record = {
+                        "type": "match",
+                        "file": file,
+                        "line": line_no if numbered else None,
+                        "text": text,
+                        "before": list(before),
+                        "after": [],
+                    }
+                    if ctx:
+                        waiting.append(record)
+                    else:
+                        yield record
+                if ctx:
+                    before.append(text)
+        yield from waiting
+
+    def search_lines(self, file: str, lines: Iterable[str]) -> Iterator[dict]:
+        """Search raw portal-log lines already in memory (no line numbers)."""
+        if self.truncated:
+            return
+        cleaned = [collapse_cr(strip_csi(line)) for line in lines]
+        yield from self._scan(file, [(cleaned, True)], numbered=False)
+
+    def search_file(self, file: str, path: str, *, raw: bool = False) -> Iterator[dict]:
+        """Search a log file on disk, reported under the name ``file``.
+
+        ``raw`` marks a portal log (ANSI and ``\\r`` redraws present) rather
+        than its clean companion; lines are cleaned before matching.
+        """
+        if self.truncated:
+            return
+        yield from self._scan(file, self._file_blocks(path, raw))
+
+    def _file_blocks(self, path: str, raw: bool) -> Iterator[tuple[list[str], bool]]:
+        with open(path, "rb") as f:
+            tail = b""
+            while True:
+                chunk = f.read(SEARCH_CHUNK)
+                if not chunk:
+                    if tail:
+                        yield self._block(tail, raw)
+                    return
+                data = tail + chunk
+                cut = data.rfind(b"\n")
+                if cut < 0:
+                    tail = data   # A line longer than a chunk: keep reading
+                    continue
+                tail = data[cut + 1:]
+                yield self._block(data[:cut], raw)
+
+    def _block(self, data: bytes, raw: bool) -> tuple[list[str], bool]:
+        text = data.decode("utf-8", errors="replace")
+        if raw:
+            text = strip_csi(text)
+        lines = text.split("\n")
+        if raw and "\r" in text:
+            # Collapse redraws and CRLF endings before the block test too:
+            # MULTILINE ^ and $ do not see \r as a line boundary
+            lines = [collapse_cr(line) for line in lines]
+            text = "\n".join(lines)
+        return lines, self._matches(text)
+
+    def summary(self) -> dict:
+        return {"type": "summary", "matches": self.matched, "truncated": self.truncated}
@@ -0,0 +1,357 @@
+"""Incremental virtual terminal for one portal log file.
+
+Portal logs keep colours and ``\\r``, and the provisioner's parallel download
+tracker (``subprocess_runner.ProgressTracker``) writes its bars as a
+cursor-up block: ``\\x1b[NA`` then ``\\x1b[1G<bar>\\x1b[K\\n`` per bar. To show
+that faithfully the tailer feeds each chunk it reads into a ``Terminal``,
+which keeps a small screen of rows with a cursor row *and column*, and
+reports back only what changed since the last chunk:
+
+* ``("append", text)`` / ``("overwrite", text)`` — line mode, exactly as a
+  plain log behaves: completed lines, plus a live preview of the current
+  partial line (progress bars redrawn with ``\\r``);
+* ``("block", lines, replace)`` — a cursor-up block started or changed size;
+  the first ``replace`` of its rows had already gone out as ordinary lines;
+* ``("rows", [(index, text), ...])`` — rows of the current block whose
+  contents changed, and nothing else;
+* ``("commit", lines)`` — the block is finished; its rows are ordinary lines
+  from now on.
+
+Rows are stored as ANSI text (colour codes only). Writing at the end of a row
+— almost every write in practice — is a string append; only a write or erase
+in the middle of a row splits it into styled cells.
+
+A lone ``\\r`` clears the line, not just the cursor column. ``log-tee`` strips
+erase sequences from portal logs, so a program's ``\\r<shorter text>\\x1b[K``
+arrives here as ``\\r<shorter text>``, and clearing is the only way to render
+it the way the program's own terminal did.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Optional
+
+# Splits on ANSI CSI sequences (including DEC private-mode sequences like
+# \x1b[?25l), \r\n, \r, \n
+TOKEN_RE = re.compile(r'(\x1b\[\??[0-9;]*[A-Za-z]|\r\n|\r|\n)')
+_SGR_SPLIT_RE = re.compile(r'(\x1b\[[0-9;]*m)')
+
+KEEP_ROWS = 100        # Completed rows kept above the live area for cursor-up
+MAX_BLOCK_ROWS = 400   # A block this tall is committed as plain lines
+MAX_MOVE = 500         # Clamp for cursor movement counts
+
+
+def _apply_sgr(style: str, params: str) -> str:
+    """Style in effect after an SGR with ``params`` is applied to ``style``.
+
+    A style is the concatenation of the SGR sequences since the last reset,
+    which is exactly what has to be replayed to restore it.
+    """
+    codes = params.split(';')
+    reset = max((i for i, code in enumerate(codes) if code in ('', '0')), default=-1)
+    if reset < 0:
+        return style + f'\x1b[{params}m'
+    rest = codes[reset + 1:]
+    return f'\x1b[{";".join(rest)}m' if rest else ''
+
+
+def _switch(old: str, new: str) -> str:
+    """Escape sequence taking the style from ``old`` to ``new``."""
+    if not old:
+        return new
+    return '\x1b[0m' + new
+
+
+class _Row:
+    __slots__ = ('text', 'width', 'style', 'sent', 'shown')
+
+    def __init__(self):
+        self.text = ''     # ANSI text (SGR only)
+        self.width = 0     # Visible columns
+        self.style = ''    # Style in effect at the end of text
+        self.sent: Optional[str] = None  # text as clients last saw it
+        self.shown = False  # Clients hold a line for this row (outside a block)
+
+    def clear(self) -> None:
+        self.text = ''
+        self.width = 0
+        self.style = ''
+
+    def cells(self) -> list[tuple[str, str]]:
+        cells = []
+        style = ''
+        for part in _SGR_SPLIT_RE.split(self.text):
+            if part.startswith('\x1b['):
+                style = _apply_sgr(style, part[2:-1])
+            else:
+                cells.extend((ch, style) for ch in part)
+        return cells
+
+    def set_cells(self, cells: list[tuple[str, str]]) -> None:
+        out = []
+        style = ''
+        for ch, cell_style in cells:
+            if cell_style != style:
+                out.append(_switch(style, cell_style))
+                style = cell_style
+            out.append(ch)
+        self.text = ''.join(out)
+        self.width = len(cells)
+        self.style = style
+
+    def write(self, col: int, text: str, style: str) -> None:
+        if col > self.width:
+            # Cursor was moved past the end: the gap is blank, unstyled
+            self.text += _switch(self.style, '') + ' ' * (col - self.width)
+            self.width = col
+            self.style = ''
+        if col == 0 and len(text) >= self.width:
+            self.clear()
+        if col == self.width:
+            if style != self.style:
+                self.text += _switch(self.style, style)
+                self.style = style
+            self.text += text
+            self.width += len(text)
+            return
+        cells = self.cells()
+        cells[col:col + len(text)] = [(ch, style) for ch in text]
+        self.set_cells(cells)
+
+    def erase(self, start: int, end: Optional[int]) -> None:
+        """Blank columns [start, end); ``end=None`` erases to the end of the row."""
+        if end is None:
+            if start <= 0:
+                self.clear()
+            elif start < self.width:
+                self.set_cells(self.cells()[:start])
+            return
+        end = min(end, self.width)
+        if start >= end:
+            return
+        cells = self.cells()
+        cells[start:end] = [(' ', '')] * (end - start)
+        self.set_cells(cells)
+
+
+class Terminal:
+    """Screen state for one log file, fed chunk by chunk."""
+
+    def __init__(self):
+        self.rows: list[_Row] = [_Row()]
+        self.row = 0                 # Cursor row
+        self.col = 0                 # Cursor column
+        self.style = ''              # Current SGR style
+        self.cr = False              # Lone \r seen; clears the row unless a newline follows
+        self.emitted_up_to = 0       # Rows [0..emitted_up_to) went out as lines
+        self.line_active = False     # Clients hold a preview of row emitted_up_to
+        self.in_block = False        # Cursor-up seen: rows from block_top are a live block
+        self.block_top = 0
+        self.block_bottom = 0        # Lowest cursor row reached by a chunk with cursor-up
+        self.block_replace = 0       # Block rows that had already gone out as lines
+        self.block_size = 0          # Rows in the block as clients last saw it
+
+    # --- input ------------------------------------------------------------ #
+
+    def _resolve_cr(self) -> None:
+        if self.cr:
+            self.rows[self.row].clear()
+            self.cr = False
+
+    def _down(self, n: int) -> None:
+        self.row += n
+        while self.row >= len(self.rows):
+            self.rows.append(_Row())
+
+    def feed(self, text: str) -> list[tuple]:
+        """Apply a chunk of output and return the resulting events."""
+        top_reached: Optional[int] = None   # Highest row a cursor-up moved to
+        for part in TOKEN_RE.split(text):
+            if not part:
+                continue
+            if part == '\n' or part == '\r\n':
+                self.cr = False
+                self._down(1)
+                self.col = 0
+                continue
+            if part == '\r':
+                self.cr = True
+                self.col = 0
+                continue
+            if not part.startswith('\x1b['):
+                self._resolve_cr()
+                self.rows[self.row].write(self.col, part, self.style)
+                self.col += len(part)
+                continue
+
+            params, letter = part[2:-1], part[-1]
+            if params.startswith('?'):
+                continue  # Show/hide cursor etc.
+            if letter == 'm':
+                # Style only; a pending \r clear waits for the text
+                self.style = _apply_sgr(self.style, params)
+                continue
+            self._resolve_cr()
+            try:
+                n = int(params) if params else None
+            except ValueError:
+                n = None
+            if letter in 'AF':
+                # Cursor up (A) / previous line (F)
+                self.row = max(0, self.row - min(n or 1, MAX_MOVE))
+                if letter == 'F':
+                    self.col = 0
+                top_reached = self.row if top_reached is None else min(top_reached, self.row)
+            elif letter in 'BE':
+                # Cursor down (B) / next line (E)
+                self._down(min(n or 1, MAX_MOVE))
+                if letter == 'E':
+                    self.col = 0
+            elif letter == 'C':
+                self.col += min(n or 1, MAX_MOVE)
+            elif letter == 'D':
+                self.col = max(0, self.col - (n or 1))
+            elif letter == 'G':
+                # Cursor horizontal absolute (1-based)
+                self.col = max(0, min(n or 1, MAX_MOVE) - 1)
+            elif letter == 'K':
+                # Erase in line: 0 = cursor→end, 1 = start→cursor, 2 = whole line
+                mode = n or 0
+                row = self.rows[self.row]
+                if mode == 0:
+                    row.erase(self.col, None)
+                elif mode == 1:
+                    row.erase(0, self.col + 1)
+                elif mode == 2:
+                    row.clear()
+            elif letter == 'J':
+                # Erase in display: 0 = cursor→end, 2 = whole screen (rows below)
+                mode = n or 0
+                if mode in (0, 2):
+                    self.rows[self.row].erase(0 if mode == 2 else self.col, None)
+                    for row in self.rows[self.row + 1:]:
+                        row.clear()
+            # Other CSI: ignore
+        return self._emit(top_reached)
+
+    # --- output ----------------------------------------------------------- #
+
+    def _emit(self, top_reached: Optional[int]) -> list[tuple]:
+        events: list[tuple] = []
+        if top_reached is not None:
+            if self.in_block and top_reached < self.block_top:
+                # Moved above the block: finish it and start a taller one
+                self._commit(events, self.block_bottom)
+            if not self.in_block:
+                self._start_block(events, top_reached)
+            else:
+                self._update_block(events)
+            self.block_bottom = max(self.block_bottom, self.row)
+        elif self.in_block:
+            if self.row > self.block_bottom:
+                # Output continued below the block: it is finished
+                self._commit(events, self.row)
+            else:
+                self._update_block(events)
+        if self.in_block and len(self.rows) - self.block_top > MAX_BLOCK_ROWS:
+            self._commit(events, self.row)
+        if not self.in_block:
+            self._emit_lines(events)
+        self._trim()
+        return events
+
+    def _emit_lines(self, events: list[tuple], end: Optional[int] = None) -> None:
+        """Line mode: rows completed before ``end`` (default: the cursor row),
+        then — when ``end`` is the cursor row — a preview of the partial row."""
+        preview = end is None
+        end = self.row if end is None else end
+        for i in range(self.emitted_up_to, min(end, len(self.rows))):
+            row = self.rows[i]
+            if i == self.emitted_up_to and self.line_active:
+                # First completed line replaces the partial preview
+                events.append(("overwrite", row.text))
+                row.shown = True
+            elif row.text:
+                events.append(("append", row.text))
+                row.shown = True
+            else:
+                row.shown = False
+            row.sent = row.text
+            self.line_active = False
+        self.emitted_up_to = max(self.emitted_up_to, end)
+
+        current = self.rows[self.row]
+        if preview and current.text and current.text != current.sent:
+            events.append(("overwrite" if self.line_active else "append", current.text))
+            current.sent = current.text
+            current.shown = True
+            self.line_active = True
+
+    def _start_block(self, events: list[tuple], top: int) -> None:
+        if top > self.emitted_up_to:
+            # Completed lines above the block go out as ordinary lines first
+            self._emit_lines(events, top)
+        # Lines clients already show for rows that are now inside the block
+        replace = sum(1 for row in self.rows[top:self.emitted_up_to] if row.shown)
+        if self.line_active and self.emitted_up_to >= top:
+            replace += 1
+        for row in self.rows[top:]:
+            row.shown = False
+        self.in_block = True
+        self.block_top = top
+        self.block_bottom = self.row
+        self.block_replace = replace
+        self.line_active = False
+        self.block_size = 0
+        self._update_block(events)
+
+    def _update_block(self, events: list[tuple]) -> None:
+        block = self.rows[self.block_top:]
+        if len(block) != self.block_size:
+            events.append(("block", [row.text for row in block], self.block_replace))
+            for row in block:
+                row.sent = row.text
+            self.block_size = len(block)
+            return
+        changed = []
+        for i, row in enumerate(block):
+            if row.text != row.sent:
+                changed.append((i, row.text))
+                row.sent = row.text
+        if changed:
+            events.append(("rows", changed))
+
+    def _commit(self, events: list[tuple], end: int) -> None:
+        """Finish the block; rows [block_top, end) become ordinary lines."""
+        end = max(self.block_top, min(end, len(self.rows)))
+        lines = [row.text for row in self.rows[self.block_top:end] if row.text]
+        events.append(("commit", lines))
+        for row in self.rows[self.block_top:end]:
+            row.sent = row.text
+            row.shown = bool(row.text)
+        # Rows below the cursor that were part of the block are gone
+        del self.rows[max(end, self.row + 1):]
+        if self.row < len(self.rows):
+            self.rows[self.row].sent = None
+        self.in_block = False
+        self.emitted_up_to = end
+        self.line_active = False
+        self.block_size = 0
+
+    def _trim(self) -> None:
+        floor = self.block_top if self.in_block else min(self.emitted_up_to, self.row)
+        if floor <= 2 * KEEP_ROWS:
+            return
+        shift = floor - KEEP_ROWS
+        del self.rows[:shift]
+        self.row -= shift
+        self.emitted_up_to -= shift
+        self.block_top = max(0, self.block_top - shift)
+        self.block_bottom = max(0, self.block_bottom - shift)
+
+    def block_lines(self) -> Optional[list[str]]:
+        """Rows of the live block, or None when not in block mode."""
+        if not self.in_block:
+            return None
+        return [row.text for row in self.rows[self.block_top:]]
@@ -0,0 +1,186 @@
+"""Event-driven change notification for a single log directory.
+
+``DirectoryWatcher`` answers one question for the tailer: *which files in this
+directory might have new bytes?* On Linux it asks the kernel via inotify (bound
+with ctypes, so there is no extra dependency) and sleeps in the event loop until
+something is written, created, renamed in or deleted. Where inotify is missing
+(non-Linux, seccomp-filtered containers, ``max_user_instances`` exhausted) it
+degrades to the portal's old behaviour: a full rescan every ``poll_interval``.
+
+The watcher deliberately reports names, not events. Inode changes, truncation
+and deletion are all decided by the caller from ``os.stat`` — exactly as the
+polling tailer always did — so both modes share one set of file semantics.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import sys
+from typing import Optional
+
+logger = logging.getLogger("log_monitor")
+
+# <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0o2000000)
+
+# What the tailer cares about. IN_MOVED_FROM/IN_DELETE let it drop state for a
+# file that went away; IN_MOVED_TO covers the write-temp + rename pattern.
+WATCH_MASK = (
+    IN_MODIFY | IN_CREATE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+_READ_SIZE = 64 * 1024
+
+_libc = None
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+    return _libc
+
+
+def inotify_available() -> bool:
+    """True when the platform exposes ``inotify_init1`` (Linux glibc/musl)."""
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        return hasattr(_load_libc(), "inotify_init1")
+    except OSError:
+        return False
+
+
+def parse_events(buf: bytes) -> list[tuple[int, int, str]]:
+    """Decode a read() of an inotify fd into ``(wd, mask, name)`` tuples."""
+    events = []
+    offset = 0
+    while offset + _EVENT.size <= len(buf):
+        wd, mask, _cookie, length = _EVENT.unpack_from(buf, offset)
+        offset += _EVENT.size
+        name = buf[offset:offset + length].split(b"\0", 1)[0]
+        offset += length
+        events.append((wd, mask, os.fsdecode(name)))
+    return events
+
+
+class DirectoryWatcher:
+    """Wait for changes to ``*<suffix>`` files in one directory.
+
+    Call :meth:`start` once from inside the running event loop, then
+    :meth:`changes` in a loop. ``changes`` returns:
+
+    * a set of file names that may have changed (possibly empty on timeout);
+    * ``None`` when the caller must rescan the whole directory — always the
+      case in polling mode, and in inotify mode after a queue overflow or when
+      the directory itself was moved or deleted.
+    """
+
+    def __init__(self, directory: str, suffix: str = ".log", poll_interval: float = 0.2):
+        self.directory = directory
+        self.suffix = suffix
+        self.poll_interval = poll_interval
+        self._fd: Optional[int] = None
+        self._wd: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: set[str] = set()
+        self._rescan = False
+        self._wakeup = asyncio.Event()
+
+    @property
+    def using_inotify(self) -> bool:
+        return self._fd is not None
+
+    def start(self) -> bool:
+        """Set up inotify if possible. Returns True when event-driven."""
+        if not inotify_available():
+            logger.info(f"inotify unavailable, polling {self.directory} every {self.poll_interval}s")
+            return False
+        libc = _load_libc()
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            logger.warning(f"inotify_init1 failed ({os.strerror(err)}), falling back to polling")
+            return False
+        wd = libc.inotify_add_watch(fd, os.fsencode(self.directory), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            os.close(fd)
+            logger.warning(
+                f"inotify_add_watch({self.directory}) failed ({os.strerror(err)}), falling back to polling"
+            )
+            return False
+        self._fd, self._wd = fd, wd
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(fd, self._on_readable)
+        logger.info(f"Watching {self.directory} with inotify")
+        return True
+
+    def close(self) -> None:
+        if self._fd is None:
+            return
+        if self._loop is not None:
+            self._loop.remove_reader(self._fd)
+        os.close(self._fd)
+        self._fd = self._wd = None
+
+    def _fall_back_to_polling(self, reason: str) -> None:
+        logger.warning(f"inotify watch on {self.directory} lost ({reason}), falling back to polling")
+        self.close()
+        self._rescan = True
+        self._wakeup.set()
+
+    def _on_readable(self) -> None:
+        try:
+            buf = os.read(self._fd, _READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._fall_back_to_polling(str(e))
+            return
+        for wd, mask, name in parse_events(buf):
+            if mask & IN_Q_OVERFLOW:
+                self._rescan = True
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED) and wd == self._wd:
+                self._fall_back_to_polling("directory removed")
+                return
+            elif name.endswith(self.suffix):
+                self._pending.add(name)
+        if self._pending or self._rescan:
+            self._wakeup.set()
+
+    async def changes(self, timeout: Optional[float] = None) -> Optional[set[str]]:
+        """Wait for the next batch of changes (see class docstring)."""
+        if self._fd is None:
+            await asyncio.sleep(self.poll_interval)
+            return None
+        if not (self._pending or self._rescan):
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._wakeup.clear()
+        if self._rescan:
+            self._rescan = False
+            self._pending.clear()
+            return None
+        changed, self._pending = self._pending, set()
+        return changed
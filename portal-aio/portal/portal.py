@@ -1,10 +1,11 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, StreamingResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, RedirectResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
-from typing import Optional, List
-from collections import deque
+from typing import Literal, Optional, List
+from collections import Counter, deque
+from pydantic import BaseModel, Field
 import yaml
 import json
 import math
@@ -12,94 +13,41 @@ import httpx
 import asyncio
 import aiofiles
 import os
-import io
 import re
-import html as html_module
-import zipfile
 from datetime import datetime
 import logging
 import time
 import ipaddress
 import subprocess
-import socket
 import xmlrpc.client
-import http.client
-import GPUtil
 import psutil
 import sys
+import threading
+import dataclasses
 
-# Make the sibling `capabilities` package importable (portal runs with cwd
-# /opt/portal-aio/portal, so its parent dir must be on sys.path).
+# Make the sibling `capabilities`, `logstream`, `supervision` and `telemetry` packages
+# importable (portal runs with cwd /opt/portal-aio/portal, so its parent dir must be
+# on sys.path).
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from capabilities import assemble_live
+from capabilities import ManifestCache, ReadinessChecker, assemble_live, etag_matches, find_service, load_checks
 from capabilities.models import (
     OpenAIEndpoint,
     ProvisionRequest,
     ProvisionResponse,
     ServiceInfo,
 )
+from logstream import ClientQueue, DirectoryWatcher, LineIndex, LogLine, LogSearch, Terminal, iter_log_zip, rotate_file
+from logstream.history import FORMATS as LOG_FORMATS
+from logstream.search import MAX_CONTEXT as SEARCH_MAX_CONTEXT, MAX_RESULTS as SEARCH_MAX_RESULTS
+from supervision import SupervisorClient, SupervisorMonitor, format_processes, hidden_programs
+from supervision.batch import Action as SupervisorAction, BatchError, run_batch
+from telemetry import GPUTelemetry, MetricsSampler, attribute_processes, parse_window
+from telemetry.openmetrics import (
+    OPENMETRICS_CONTENT_TYPE, PROMETHEUS_CONTENT_TYPE, Family, render as render_metrics, sample_families,
+    wants_openmetrics,
+)
+from telemetry.sampler import MAX_POINTS as METRICS_MAX_POINTS
 
-# ANSI color maps
-# Tuned for the dark log viewer background (--logs-bg ~#0b0f19).
-# Standard colors (30-37) are lifted from pure CGA values so they remain
-# legible on dark surfaces; bright colors (90-97) are softened to avoid glare.
-_ANSI_FG_COLORS = {
-    30: '#4b5563', 31: '#f87171', 32: '#4ade80', 33: '#fbbf24', 34: '#60a5fa', 35: '#c084fc', 36: '#22d3ee', 37: '#d1d5db',
-    90: '#9ca3af', 91: '#fca5a5', 92: '#86efac', 93: '#fde68a', 94: '#93bbfd', 95: '#d8b4fe', 96: '#67e8f9', 97: '#f3f4f6',
-}
-_ANSI_BG_COLORS = {
-    40: '#1f2937', 41: '#991b1b', 42: '#166534', 43: '#92400e', 44: '#1e3a5f', 45: '#6b21a8', 46: '#155e75', 47: '#4b5563',
-    100: '#374151', 101: '#f87171', 102: '#4ade80', 103: '#fbbf24', 104: '#60a5fa', 105: '#c084fc', 106: '#22d3ee', 107: '#e5e7eb',
-}
-
-# Regex to strip C0/C1 control characters except tab (\x09).
-# \r and \n are already consumed by _process_chunk before text reaches here.
-_CONTROL_CHAR_RE = re.compile(r'[\x00-\x08\x0b-\x0d\x0e-\x1a\x7f]')
-
-# Strip cursor movement, erase, and other non-SGR CSI sequences.
-# These are interpreted by _process_chunk(); they must not appear in HTML.
-_CSI_NON_SGR_RE = re.compile(r'\x1b\[\??[0-9;]*[A-Za-ln-z]')
-
-# Tokenizer for _process_chunk: splits on ANSI CSI sequences (including
-# DEC private-mode sequences like \x1b[?25l), \r\n, \r, \n
-_CHUNK_TOKEN_RE = re.compile(r'(\x1b\[\??[0-9;]*[A-Za-z]|\r\n|\r|\n)')
-
-def ansi_to_html(text: str) -> str:
-    """Convert ANSI escape codes to HTML spans. HTML-escapes text content.
-    Strips stray control characters (SI, SO, BEL, etc.) that are invisible
-    in a real terminal but render as garbage in HTML."""
-    # Strip non-SGR CSI sequences (cursor movement, erase, etc.)
-    text = _CSI_NON_SGR_RE.sub('', text)
-    # Split on ANSI sequences, escape text parts, convert codes to spans
-    parts = re.split(r'(\x1b\[[0-9;]*m)', text)
-    result = []
-    open_spans = 0
-    for part in parts:
-        m = re.match(r'\x1b\[([0-9;]*)m', part)
-        if m:
-            codes = [int(c) for c in m.group(1).split(';') if c] if m.group(1) else [0]
-            for code in codes:
-                if code == 0:
-                    result.append('</span>' * open_spans)
-                    open_spans = 0
-                elif code == 1:
-                    result.append('<span style="font-weight:bold">')
-                    open_spans += 1
-                elif code == 2:
-                    result.append('<span style="opacity:0.7">')
-                    open_spans += 1
-                elif code in _ANSI_FG_COLORS:
-                    result.append(f'<span style="color:{_ANSI_FG_COLORS[code]}">')
-                    open_spans += 1
-                elif code in _ANSI_BG_COLORS:
-                    result.append(f'<span style="background-color:{_ANSI_BG_COLORS[code]}">')
-                    open_spans += 1
-                # Unknown codes: silently ignored
-        else:
-            cleaned = _CONTROL_CHAR_RE.sub('', part)
-            result.append(html_module.escape(cleaned))
-    result.append('</span>' * open_spans)
-    return ''.join(result)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO,
@@ -111,6 +59,18 @@ logger = logging.getLogger("log_monitor")
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
 tunnel_manager=os.environ.get("TUNNEL_MANAGER", "http://localhost:11112")
+tunnel_api_timeout=httpx.Timeout(connect=5.0, read=30.0, write=5.0, pool=5.0)
+tunnel_api_limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0)
+
+# One keep-alive pool to the tunnel manager for the life of the app, opened in
+# lifespan; a client per request paid a TCP connect for every call
+tunnel_client: Optional[httpx.AsyncClient] = None
+
+def _tunnel_client() -> httpx.AsyncClient:
+    global tunnel_client
+    if tunnel_client is None or tunnel_client.is_closed:
+        tunnel_client = httpx.AsyncClient(base_url=tunnel_manager, timeout=tunnel_api_timeout, limits=tunnel_api_limits)
+    return tunnel_client
 
 
 @asynccontextmanager
@@ -121,16 +81,24 @@ async def lifespan(app):
     # Prime psutil CPU counter so first real poll returns a meaningful value
     psutil.cpu_percent(interval=None)
     app.state.monitor_task = asyncio.create_task(
-        monitor_log_directory("/var/log/portal")
+        monitor_log_directory(PORTAL_LOG_DIR)
     )
+    app.state.metrics_task = asyncio.create_task(metrics_sampler.run())
+    app.state.supervisor_task = asyncio.create_task(supervisor_monitor.run())
+    _tunnel_client()
     yield
     # Shutdown
-    if hasattr(app.state, 'monitor_task'):
-        app.state.monitor_task.cancel()
+    for name in ('monitor_task', 'metrics_task', 'supervisor_task'):
+        task = getattr(app.state, name, None)
+        if task is None:
+            continue
+        task.cancel()
         try:
-            await app.state.monitor_task
+            await task
         except asyncio.CancelledError:
             pass
+    if tunnel_client is not None:
+        await tunnel_client.aclose()
 
 app = FastAPI(
     lifespan=lifespan,
@@ -275,32 +243,31 @@ def get_instance_properties() -> dict:
         "direct_https": "true" if os.environ.get("ENABLE_HTTPS", "false").lower() == "true" else "false"
     }
 
+_gpu_telemetry: Optional[GPUTelemetry] = None
+_gpu_telemetry_lock = threading.Lock()
+
+def get_gpu_telemetry() -> GPUTelemetry:
+    """The process-wide GPU telemetry providers, detected on first use.
+
+    Detection loads NVML (or finds nvidia-smi/rocm-smi) once; the providers
+    then keep their handles for the life of the portal.
+    """
+    global _gpu_telemetry
+    with _gpu_telemetry_lock:
+        if _gpu_telemetry is None:
+            try:
+                _gpu_telemetry = GPUTelemetry.detect()
+            except ValueError as e:
+                logger.error(f"GPU_TELEMETRY: {e}; detecting providers automatically")
+                _gpu_telemetry = GPUTelemetry.detect("auto")
+        return _gpu_telemetry
+
 def get_gpu_info() -> str:
     """Get formatted GPU information for both NVIDIA and AMD GPUs"""
     gpu_models = {}
-    
-    # Try to get NVIDIA GPUs
-    try:
-        nvidia_gpus = GPUtil.getGPUs()
-        for gpu in nvidia_gpus:
-            if gpu.name in gpu_models:
-                gpu_models[gpu.name] += 1
-            else:
-                gpu_models[gpu.name] = 1
-    except Exception:
-        pass
-    
-    # Try to get AMD GPUs
-    try:
-        rocm_gpus = get_rocm_gpus()
-        for gpu in rocm_gpus:
-            if gpu.name in gpu_models:
-                gpu_models[gpu.name] += 1
-            else:
-                gpu_models[gpu.name] = 1
-    except Exception:
-        pass
-    
+    for gpu in get_gpu_telemetry().gpus():
+        gpu_models[gpu.name] = gpu_models.get(gpu.name, 0) + 1
+
     # Check if any GPUs are available
     if not gpu_models:
         return "No GPU detected"
@@ -315,96 +282,6 @@ def get_gpu_info() -> str:
     
     return ", ".join(result)
 
-def get_rocm_gpus() -> list:
-    """Get AMD GPU information using rocm-smi command line tool"""
-    try:
-        # Check if rocm-smi is available
-        rocm_available = subprocess.run(
-            ['which', 'rocm-smi'], 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE
-        ).returncode == 0
-        
-        if not rocm_available:
-            return []
-        
-        # First get GPU info with memory and usage
-        result = subprocess.run(
-            ['rocm-smi', '--showmeminfo', 'vram', '--showuse', '--json'], 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE, 
-            text=True
-        )
-        
-        if result.returncode != 0:
-            return []
-        
-        # Parse JSON output for memory and usage
-        rocm_data = json.loads(result.stdout)
-        
-        # Get additional GPU info including name
-        name_result = subprocess.run(
-            ['rocm-smi', '--showproductname', '--json'], 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE, 
-            text=True
-        )
-        
-        # Parse GPU name data if available
-        gpu_names = {}
-        if name_result.returncode == 0:
-            try:
-                name_data = json.loads(name_result.stdout)
-                for card_id, card_data in name_data.items():
-                    if isinstance(card_data, dict):
-                        # Try to construct a meaningful name from available fields
-                        vendor = card_data.get('Card Vendor', '').split('[')[-1].split(']')[0] if '[' in card_data.get('Card Vendor', '') else card_data.get('Card Vendor', '')
-                        sku = card_data.get('Card SKU', '')
-                        gfx = card_data.get('GFX Version', '')
-                        
-                        if vendor and sku:
-                            gpu_names[card_id] = f"{vendor} {sku} ({gfx})"
-                        elif vendor:
-                            gpu_names[card_id] = f"{vendor} GPU"
-                        else:
-                            gpu_names[card_id] = "AMD GPU"
-            except Exception:
-                pass
-
-        gpus = []
-        
-        for card_id, card_data in rocm_data.items():
-            if not isinstance(card_data, dict):
-                continue
-                
-            # Create a GPU object similar to GPUtil's structure
-            gpu = type('', (), {})()
-            gpu.id = int(card_id.replace('card', ''))
-            
-            # Set GPU name from the name data if available, otherwise use a default
-            gpu.name = gpu_names.get(card_id, 'AMD GPU')
-            
-            # Extract memory info based on the actual output format
-            gpu.memoryTotal = int(card_data.get('VRAM Total Memory (B)', 0))
-            gpu.memoryTotal_mb = round(gpu.memoryTotal / (1024 * 1024), 2)  # Convert to MB
-            
-            gpu.memoryUsed = int(card_data.get('VRAM Total Used Memory (B)', 0))
-            gpu.memoryUsed_mb = round(gpu.memoryUsed / (1024 * 1024), 2)  # Convert to MB
-            
-            # Extract GPU utilization
-            gpu_busy = card_data.get('GPU use (%)', 0)
-            try:
-                gpu.load = float(gpu_busy) / 100.0 if isinstance(gpu_busy, (int, float, str)) else 0
-            except (ValueError, TypeError):
-                gpu.load = 0
-                
-            gpus.append(gpu)
-            
-        return gpus
-    except Exception as e:
-        print(f"Error getting ROCm GPU info: {str(e)}")
-        return []
-    
 def is_in_container() -> bool:
     """Check if we're running inside a container"""
     return os.path.exists('/sys/fs/cgroup/memory/memory.limit_in_bytes') or os.path.exists('/sys/fs/cgroup/memory.max')
@@ -627,14 +504,13 @@ def get_workspace_volume_info() -> Optional[dict]:
 templates.env.filters["strip_port"] = strip_port
 
 tunnels = {}
-tunnel_api_timeout=httpx.Timeout(connect=5.0, read=30.0, write=5.0, pool=5.0)
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request, token: Optional[str] = None) -> HTMLResponse:
     if token is not None:
         return RedirectResponse(url="/", status_code=302)
 
-    await set_external_ip(request.headers.get("X-Forwarded-Host"))
+    report_external_ip(request.headers.get("X-Forwarded-Host"))
     return templates.TemplateResponse(request, "index.html", {
         "instance": get_instance_properties(),
         "extra_links": get_extra_links(),  # {"before": [...], "after": [...]}
@@ -644,6 +520,33 @@ async def read_root(request: Request, token: Optional[str] = None) -> HTMLRespon
 async def health_check() -> JSONResponse:
     return JSONResponse({"status": "ok"})
 
+READINESS_TTL = float(os.environ.get("READINESS_TTL", "1"))  # Seconds a readiness sweep is reused
+READINESS_TIMEOUT = float(os.environ.get("READINESS_TIMEOUT", "0.5"))  # Seconds per service probe
+
+readiness_checker = ReadinessChecker(
+    load_checks, lambda: _collect_supervisor(), ttl=READINESS_TTL, timeout=READINESS_TIMEOUT,
+)
+
+@app.get("/health/ready")
+async def health_ready() -> JSONResponse:
+    """200 once every service is RUNNING and answering on its internal port, else 503.
+
+    Services come from /etc/portal.yaml; readiness paths (e.g. /v1/models)
+    from the capability fragments. Probes run concurrently and the result is
+    reused for READINESS_TTL seconds, so this is cheap enough for a 1 s
+    load-balancer check.
+    """
+    result = await readiness_checker.get()
+    return JSONResponse(result, status_code=200 if result["ready"] else 503)
+
+@app.get("/health/{service}")
+async def health_service(service: str) -> JSONResponse:
+    """Readiness of one service from the same sweep as /health/ready: 200, 503 or 404."""
+    entry = find_service(await readiness_checker.get(), service)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Service '{service}' not found")
+    return JSONResponse(entry, status_code=200 if entry["ready"] else 503)
+
 @app.get("/get-applications")
 async def get_applications(request: Request) -> JSONResponse:
     applications = load_config()
@@ -656,14 +559,9 @@ async def get_applications(request: Request) -> JSONResponse:
 
 async def _tunnel_proxy(method: str, path: str):
     """Proxy a request to the tunnel manager service."""
-    url = f"{tunnel_manager}{path}"
-    async with httpx.AsyncClient(timeout=tunnel_api_timeout) as client:
-        if method == "GET":
-            response = await client.get(url)
-        else:
-            response = await client.post(url)
-        response.raise_for_status()
-        return response.json()
+    response = await _tunnel_client().request(method, path)
+    response.raise_for_status()
+    return response.json()
 
 @app.get("/get-direct-url/{port}")
 async def get_direct_url(port: int):
@@ -784,52 +682,38 @@ _unstoppable_env = os.environ.get("PORTAL_UNSTOPPABLE", "")
 UNSTOPPABLE_PROCESSES = frozenset(
     {"instance_portal", "caddy", "tunnel_manager"} | {s.strip() for s in _unstoppable_env.split(",") if s.strip()}
 )
+SUPERVISOR_POLL_INTERVAL = float(os.environ.get("SUPERVISOR_POLL_INTERVAL", "1"))  # Seconds between pushed polls
+SSE_KEEPALIVE = 15  # Seconds between comments on an idle event stream
 
-class _UnixStreamHTTPConnection(http.client.HTTPConnection):
-    """HTTP connection over a Unix domain socket."""
-    def connect(self):
-        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        self.sock.connect(SUPERVISOR_SOCK)
-
-class _UnixStreamTransport(xmlrpc.client.Transport):
-    def make_connection(self, host):
-        return _UnixStreamHTTPConnection(host)
-
-def _get_supervisor_proxy() -> xmlrpc.client.ServerProxy:
-    return xmlrpc.client.ServerProxy(
-        "http://localhost",
-        transport=_UnixStreamTransport(),
-    )
+supervisor_client = SupervisorClient(SUPERVISOR_SOCK)
 
 def _is_launch_managed() -> bool:
     """Check if /.launch exists (Vast manages jupyter directly)."""
     return os.path.isfile("/.launch")
 
+def _read_supervisor_uncached() -> list:
+    # Hide processes that skipped startup (not in portal.yaml), and jupyter
+    # when /.launch is present (Vast manages it directly)
+    hidden = hidden_programs()
+    if _is_launch_managed():
+        hidden.add("jupyter")
+    return format_processes(
+        supervisor_client.call("supervisor.getAllProcessInfo"),
+        hidden=hidden,
+        unstoppable=UNSTOPPABLE_PROCESSES,
+    )
+
+supervisor_monitor = SupervisorMonitor(
+    _read_supervisor_uncached, interval=SUPERVISOR_POLL_INTERVAL, max_age=SUPERVISOR_POLL_INTERVAL,
+)
+
+def _read_supervisor() -> list:
+    """Blocking half of _collect_supervisor, for callers already in a worker thread."""
+    return supervisor_monitor.current()
+
 async def _collect_supervisor() -> list:
     """Collect supervisor process info. Shared by the route and the manifest."""
-    proxy = _get_supervisor_proxy()
-    all_info = await asyncio.to_thread(proxy.supervisor.getAllProcessInfo)
-    launch_managed = _is_launch_managed()
-    result = []
-    for proc in all_info:
-        # Hide jupyter when /.launch is present (Vast manages it directly)
-        if launch_managed and proc["name"] == "jupyter":
-            continue
-        # Hide processes that skipped startup (not in portal.yaml)
-        skip_marker = f"/tmp/supervisor-skip/{proc['name']}"
-        if os.path.isfile(skip_marker):
-            continue
-        result.append({
-            "name": proc["name"],
-            "group": proc["group"],
-            "state": proc["statename"],
-            "description": proc.get("description", ""),
-            "pid": proc.get("pid", 0),
-            "start": proc.get("start", 0),
-            "now": proc.get("now", 0),
-            "unstoppable": proc["name"] in UNSTOPPABLE_PROCESSES,
-        })
-    return result
+    return await supervisor_monitor.get()
 
 @app.get("/supervisor/processes")
 async def get_supervisor_processes():
@@ -839,11 +723,44 @@ async def get_supervisor_processes():
         logger.error(f"Failed to get supervisor processes: {e}")
         raise HTTPException(status_code=500, detail="Failed to communicate with supervisor")
 
+@app.get("/supervisor/events")
+async def supervisor_events() -> StreamingResponse:
+    """Server-sent events: the process list now, then again whenever a state changes."""
+    async def stream():
+        async with supervisor_monitor.subscribe() as updates:
+            while True:
+                try:
+                    version, processes = await asyncio.wait_for(updates.get(), SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: processes\nid: {version}\ndata: {json.dumps(processes)}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _detached_restart(name: str) -> None:
+    # Use supervisorctl restart in a fully detached subprocess.
+    # This is critical for self-restart (instance_portal): the XML-RPC
+    # stop+start approach fails because stopping the portal kills this
+    # very process before startProcess can execute.
+    # start_new_session=True puts the child in its own process group so
+    # it survives killasgroup=true in the supervisor config.
+    subprocess.Popen(
+        ["supervisorctl", "restart", name],
+        start_new_session=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
 @app.post("/supervisor/process/{name}/start")
 async def supervisor_start_process(name: str):
     try:
-        proxy = _get_supervisor_proxy()
-        await asyncio.to_thread(proxy.supervisor.startProcess, name)
+        await asyncio.to_thread(supervisor_client.call, "supervisor.startProcess", name)
+        supervisor_monitor.poke()
         return {"status": "ok", "name": name, "action": "start"}
     except xmlrpc.client.Fault as e:
         raise HTTPException(status_code=400, detail=e.faultString)
@@ -856,8 +773,8 @@ async def supervisor_stop_process(name: str):
     if name in UNSTOPPABLE_PROCESSES:
         raise HTTPException(status_code=403, detail=f"Process '{name}' cannot be stopped")
     try:
-        proxy = _get_supervisor_proxy()
-        await asyncio.to_thread(proxy.supervisor.stopProcess, name)
+        await asyncio.to_thread(supervisor_client.call, "supervisor.stopProcess", name)
+        supervisor_monitor.poke()
         return {"status": "ok", "name": name, "action": "stop"}
     except xmlrpc.client.Fault as e:
         raise HTTPException(status_code=400, detail=e.faultString)
@@ -868,24 +785,13 @@ async def supervisor_stop_process(name: str):
 @app.post("/supervisor/process/{name}/restart")
 async def supervisor_restart_process(name: str):
     try:
-        proxy = _get_supervisor_proxy()
         # Check the process exists first
-        all_info = await asyncio.to_thread(proxy.supervisor.getAllProcessInfo)
+        all_info = await asyncio.to_thread(supervisor_client.call, "supervisor.getAllProcessInfo")
         if not any(p["name"] == name for p in all_info):
             raise HTTPException(status_code=404, detail=f"Process '{name}' not found")
 
-        # Use supervisorctl restart in a fully detached subprocess.
-        # This is critical for self-restart (instance_portal): the XML-RPC
-        # stop+start approach fails because stopping the portal kills this
-        # very process before startProcess can execute.
-        # start_new_session=True puts the child in its own process group so
-        # it survives killasgroup=true in the supervisor config.
-        subprocess.Popen(
-            ["supervisorctl", "restart", name],
-            start_new_session=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
+        _detached_restart(name)
+        supervisor_monitor.poke()
         return {"status": "ok", "name": name, "action": "restart"}
     except HTTPException:
         raise
@@ -893,112 +799,247 @@ async def supervisor_restart_process(name: str):
         logger.error(f"Failed to restart process {name}: {e}")
         raise HTTPException(status_code=500, detail="Failed to communicate with supervisor")
 
+class SupervisorBatchAction(BaseModel):
+    action: Literal["start", "stop", "restart"]
+    name: Optional[str] = Field(None, description="Program name, or group:name")
+    group: Optional[str] = Field(None, description="Whole process group")
+
+class SupervisorBatchRequest(BaseModel):
+    actions: List[SupervisorBatchAction] = Field(..., min_length=1, max_length=100)
+    wait: bool = Field(False, description="Wait until started programs are RUNNING (and stopped ones down)")
+    timeout: float = Field(60, gt=0, le=600, description="Seconds the whole batch may wait")
+
+@app.post("/supervisor/batch")
+async def supervisor_batch(req: SupervisorBatchRequest) -> JSONResponse:
+    """Start, stop and restart several programs or groups in one request.
+
+    Stops and starts are each issued together in one XML-RPC multicall, so
+    programs change state in parallel. Unstoppable programs are refused for
+    stop and restarted through a detached supervisorctl, as for the single
+    restart route; ``wait`` does not cover those. Returns one result per
+    program; the response is 207 if any of them failed.
+    """
+    try:
+        actions = [SupervisorAction(a.action, a.name, a.group) for a in req.actions]
+        results = await asyncio.to_thread(
+            run_batch, supervisor_client, actions,
+            unstoppable=UNSTOPPABLE_PROCESSES, wait=req.wait, timeout=req.timeout,
+            detached_restart=_detached_restart,
+        )
+    except BatchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Supervisor batch failed: {e}")
+        raise HTTPException(status_code=500, detail="Failed to communicate with supervisor")
+    finally:
+        supervisor_monitor.poke()
+    ok = all(r["status"] == "ok" for r in results)
+    return JSONResponse({"ok": ok, "results": results}, status_code=200 if ok else 207)
+
+
+EXTERNAL_IP_REFRESH = 600  # Seconds before an unchanged IP is reported again (tunnel manager restarts forget it)
 
-async def set_external_ip(forwarded_host: Optional[str]) -> None:
+_reported_ip: Optional[str] = None
+_reported_at = 0.0
+_background_tasks: set[asyncio.Task] = set()
+
+def _external_ip(forwarded_host: Optional[str]) -> Optional[str]:
+    """The public IP from X-Forwarded-Host, when the request came in on the portal's own port."""
     if not forwarded_host:
-        return
+        return None
     try:
         ip, port = forwarded_host.split(":")
         ipaddress.IPv4Address(ip)  # validate
-        if port != os.environ.get("VAST_TCP_PORT_1111"):
-            return
-        async with httpx.AsyncClient() as client:
-            await client.put(f"{tunnel_manager}/set-public-ip/{ip}")
-    except Exception:
+    except ValueError:
+        return None
+    return ip if port == os.environ.get("VAST_TCP_PORT_1111") else None
+
+async def set_external_ip(ip: str) -> None:
+    global _reported_ip
+    try:
+        response = await _tunnel_client().put(f"/set-public-ip/{ip}")
+        response.raise_for_status()
+    except Exception as e:
+        logger.debug(f"Failed to report external IP {ip}: {e}")
+        if _reported_ip == ip:
+            _reported_ip = None  # Retry on the next page load
+
+def report_external_ip(forwarded_host: Optional[str]) -> None:
+    """Tell the tunnel manager our public IP without holding up the page; once per change."""
+    global _reported_ip, _reported_at
+    ip = _external_ip(forwarded_host)
+    if ip is None:
+        return
+    if ip == _reported_ip and time.monotonic() - _reported_at < EXTERNAL_IP_REFRESH:
         return
+    _reported_ip, _reported_at = ip, time.monotonic()
+    task = asyncio.create_task(set_external_ip(ip))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
 
 ## Log reader functions
 # Constants
+PORTAL_LOG_DIR = "/var/log/portal"
 MAX_LINES = 750  # Maximum lines to keep in buffer
-POLL_INTERVAL = 0.2  # File polling interval in seconds
+POLL_INTERVAL = 0.2  # Rescan interval when inotify is unavailable
 LOG_MAX_SIZE = 5 * 1024 * 1024   # Rotate log files larger than 5 MB
 LOG_KEEP_SIZE = 1 * 1024 * 1024  # Keep the last 1 MB after rotation
+LOG_ARCHIVE_BUDGET = 20 * 1024 * 1024  # Compressed rotated generations kept per log directory
 LOG_ROTATE_INTERVAL = 30         # Check sizes every N seconds
 
 # State for WebSocket and monitoring
-websocket_clients = set()  # Set of connected WebSocket clients
-client_tasks = {}  # Client ID to asyncio Task
-chronological_log_buffer = deque(maxlen=MAX_LINES)  # Single buffer for all logs in chronological order
-file_specific_buffers = {}  # Filename -> Deque (for debugging/specific file views if needed)
+websocket_clients: dict[WebSocket, ClientQueue] = {}  # Connected WebSocket clients and their outbound queues
+chronological_log_buffer = deque(maxlen=MAX_LINES)  # Single buffer of LogLines for all logs in chronological order
+file_specific_buffers = {}  # Filename -> Deque of LogLines (for debugging/specific file views if needed)
+_history_payload: Optional[str] = None  # chronological_log_buffer serialized for replay; None = stale
 file_positions = {}  # Filename -> Last position
 file_mtimes = {}    # Filename -> Last modification time
 file_inodes = {}    # Filename -> Last inode number
+_line_indexes: dict[str, LineIndex] = {}  # Filename -> sparse line-offset index for /logs/{file}
 
 # Per-file terminal emulation state (persists across chunk reads)
-class _FileTermState:
-    __slots__ = ('lines', 'cursor_row', 'emitted_up_to', 'line_active', 'in_block', 'pending_cr')
-    def __init__(self):
-        self.lines: list[str] = [""]   # Virtual screen lines
-        self.cursor_row: int = 0       # Current cursor row
-        self.emitted_up_to: int = 0    # Rows [0..emitted_up_to) already sent as 'append'
-        self.line_active: bool = False  # Client has a live span for current partial line
-        self.in_block: bool = False    # Cursor-up seen → block mode
-        self.pending_cr: bool = False  # \r at end of last chunk (may be start of \r\n)
-
-_file_term_state: dict[str, _FileTermState] = {}
-_file_block_sizes: dict[str, int] = {}
-
-# Dedicated task for each client to handle heartbeats and messages
-async def client_handler(websocket: WebSocket, client_id: int) -> None:
-    """Handle a single client's WebSocket connection"""
+_file_term_state: dict[str, Terminal] = {}
+_active_blocks: dict[str, list[LogLine]] = {}  # Filename -> rows of its live progress block
+
+# Counters exported by /metrics. Connected clients' frames and bytes are
+# added in when rendering; these hold the totals of clients already gone.
+portal_stats = {
+    "ws_connections": 0,
+    "ws_frames_sent": 0,
+    "ws_bytes_sent": 0,
+    "ws_clients_dropped": 0,       # Cut off for falling behind
+    "log_messages_broadcast": 0,
+    "log_rotated_bytes": 0,
+}
+log_rotations: Counter = Counter()  # Rotation method -> count
+
+def _greet_client(queue: ClientQueue) -> None:
+    """Queue the connection banner and the history a new client starts from."""
+    queue.put(json.dumps({
+        "type": "system",
+        "html": '<div class="log-system-message" style="color:green;text-align:center;font-style:italic;margin:5px 0;border-bottom:1px dotted #ccc;">Connected to log stream</div>'
+    }))
+
+    if queue.files is None:
+        # Send historical logs from the single chronological buffer as one frame
+        history = _history_message()
+        if history:
+            queue.put(history)
+
+        # Progress blocks still being redrawn are not in the history
+        for filename, block in _active_blocks.items():
+            queue.put(json.dumps(_block_message(filename, block)), "overwrite_block", filename)
+    else:
+        # Subscribed on connect (?files=): only those files' history
+        for filename in sorted(queue.files):
+            _replay_file(queue, filename)
+
+async def client_reader(websocket: WebSocket, queue: ClientQueue, client_id: int) -> None:
+    """Read a client's messages until it disconnects.
+
+    The task sits in receive, so an idle connection costs nothing here and
+    a "ping" is answered as soon as it arrives. Everything goes out through
+    the client's queue, whose writer task is the only coroutine that ever
+    sends on this socket and also sends heartbeats while the stream is idle.
+    Dead peers are detected by the server's protocol-level pings (uvicorn
+    closes a connection that stops answering them), which ends the receive.
+    """
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            logger.info(f"WebSocket client {client_id} disconnected normally")
+            return
+        text = message.get("text")
+        if not text:
+            continue
+        if text == "ping":
+            queue.put("pong")
+        elif text.startswith("{"):
+            _handle_client_message(queue, text, client_id)
+        else:
+            logger.debug(f"Received message from client {client_id}: {text[:50]}...")
+
+def _subscription(value) -> Optional[list[str]]:
+    """Parse a subscription: "*" or null for every file, else a list of log names."""
+    if value is None or value in ("*", ""):
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, list):
+        raise ValueError("subscribe must be a list of log file names or \"*\"")
+    files = []
+    for name in value:
+        if not isinstance(name, str) or os.path.basename(name.strip()) != name.strip():
+            raise ValueError(f"invalid log file name: {name!r}")
+        if name.strip() and name.strip() not in files:
+            files.append(name.strip())
+    return files
+
+def _replay_file(queue: ClientQueue, filename: str) -> None:
+    """Queue one file's buffered lines, then its live progress block if any."""
+    lines = list(file_specific_buffers.get(filename, ()))
+    block = _active_blocks.get(filename)
+    if block:
+        # The block's rows sit at the end of the file buffer
+        lines = lines[:len(lines) - len(block)]
+    queue.put(json.dumps({
+        "type": "history",
+        "file": filename,
+        "lines": [line.html for line in lines],
+    }))
+    if block:
+        queue.put(json.dumps(_block_message(filename, block)), "overwrite_block", filename)
+
+def _subscribe(queue: ClientQueue, files: Optional[list[str]], replay: bool = True) -> None:
+    """Route only ``files`` to a client (None = every file).
+
+    Each file the client was not already subscribed to is replayed from its
+    file-specific buffer; going back to every file replays the interleaved
+    history instead. Runs without awaiting, so no line can slip in between
+    the replay and the switch.
+    """
+    previous = queue.files
+    queue.files = None if files is None else frozenset(files)
+    queue.put(json.dumps({"type": "subscribed", "files": "*" if files is None else files}))
+    if not replay:
+        return
+    if files is None:
+        if previous is not None:
+            history = _history_message()
+            if history:
+                queue.put(history)
+            for filename, block in _active_blocks.items():
+                queue.put(json.dumps(_block_message(filename, block)), "overwrite_block", filename)
+        return
+    for filename in files:
+        if previous is None or filename not in previous:
+            _replay_file(queue, filename)
+
+def _handle_client_message(queue: ClientQueue, message: str, client_id: int) -> None:
+    """Apply a JSON control message from a client: ``{"subscribe": [...], "replay": bool}``."""
     try:
-        # Send connection confirmation
-        await websocket.send_text(json.dumps({
-            "type": "system",
-            "html": '<div class="log-system-message" style="color:green;text-align:center;font-style:italic;margin:5px 0;border-bottom:1px dotted #ccc;">Connected to log stream</div>'
-        }))
-
-        # Send historical logs from the single chronological buffer
-        for line in chronological_log_buffer:
-            html_content = ansi_to_html(line)
-            await websocket.send_text(json.dumps({"type": "append", "html": html_content}))
-        
-        # Heartbeat loop
-        while True:
-            # Process any messages from client (including pings)
-            try:
-                # Very short timeout to avoid blocking the task
-                message = await asyncio.wait_for(websocket.receive_text(), timeout=0.1)
-                logger.debug(f"Received message from client {client_id}: {message[:50]}...")
-                
-                # If it's a ping, send a pong
-                if message == "ping":
-                    await websocket.send_text("pong")
-            except asyncio.TimeoutError:
-                # No message received, that's expected
-                pass
-            
-            # Send heartbeat every 10 seconds
-            await asyncio.sleep(10)
-            try:
-                await websocket.send_text("heartbeat")
-                logger.debug(f"Sent heartbeat to client {client_id}")
-            except Exception as e:
-                logger.error(f"Failed to send heartbeat to client {client_id}: {e}")
-                # Connection is probably broken, exit the loop
-                break
-    
-    except WebSocketDisconnect:
-        logger.info(f"WebSocket client {client_id} disconnected normally")
-    except asyncio.CancelledError:
-        logger.info(f"Client handler for {client_id} was cancelled")
-    except Exception as e:
-        logger.error(f"Error in client handler for {client_id}: {e}", exc_info=True)
-    finally:
-        # Clean up client state
-        remove_client(websocket, client_id)
+        data = json.loads(message)
+        if not isinstance(data, dict) or "subscribe" not in data:
+            raise ValueError("expected {\"subscribe\": [...]}")
+        files = _subscription(data["subscribe"])
+    except ValueError as e:
+        queue.put(json.dumps({"type": "error", "detail": str(e)}))
+        return
+    logger.debug(f"Client {client_id} subscribed to {files or 'all files'}")
+    _subscribe(queue, files, replay=data.get("replay", True) is not False)
 
 # Remove a client
 def remove_client(websocket: WebSocket, client_id: int) -> None:
-    """Safely remove a client and cancel its task"""
-    if websocket in websocket_clients:
-        websocket_clients.remove(websocket)
-    
-    if client_id in client_tasks:
-        client_tasks[client_id].cancel()
-        del client_tasks[client_id]
-    
+    """Stop queueing messages for a client"""
+    queue = websocket_clients.pop(websocket, None)
+    if queue is not None:
+        queue.close()
+        portal_stats["ws_frames_sent"] += queue.frames_sent
+        portal_stats["ws_bytes_sent"] += queue.bytes_sent
+        if queue.overflowed:
+            portal_stats["ws_clients_dropped"] += 1
+
     logger.info(f"Client {client_id} removed, remaining clients: {len(websocket_clients)}")
 
 # Get all log files in the directory
@@ -1021,35 +1062,38 @@ async def get_log_files(directory: str) -> List[str]:
         logger.error(f"Error listing directory {directory}: {e}")
         return []
 
-# Send message to all connected clients
-async def broadcast_message(message: str, msg_type: str = "append", filename: str = "") -> None:
-    """Send a formatted log message to all connected clients in parallel"""
-    if not websocket_clients:
-        return
+def _history_message() -> Optional[str]:
+    """The chronological buffer as a single pre-serialized "history" frame.
 
-    html_content = ansi_to_html(message)
-    json_msg = json.dumps({"type": msg_type, "html": html_content, "file": filename})
-
-    clients = list(websocket_clients)
-    send_tasks = []
-    for client in clients:
-        task = asyncio.create_task(send_to_client(client, json_msg))
-        send_tasks.append(task)
-
-    results = await asyncio.gather(*send_tasks, return_exceptions=True)
+    Built on first use and shared by every client that connects until the
+    next line is appended, so a burst of reconnects costs one json.dumps.
+    """
+    global _history_payload
+    if _history_payload is None and chronological_log_buffer:
+        _history_payload = json.dumps({
+            "type": "history",
+            "lines": [line.html for line in chronological_log_buffer],
+            "files": [line.file for line in chronological_log_buffer],
+        })
+    return _history_payload
 
-    disconnected_clients = set()
-    for client, result in zip(clients, results):
-        if isinstance(result, Exception):
-            logger.error(f"Error sending to client {id(client)}: {result}")
-            disconnected_clients.add(client)
+# Send message to all connected clients
+def broadcast_message(message: dict) -> None:
+    """Queue a log message for every connected client.
 
-    websocket_clients.difference_update(disconnected_clients)
+    The message is serialized once and handed to each client's ClientQueue,
+    which batches and coalesces it on its own flush tick. Nothing here waits
+    on a client, so a slow browser tab cannot hold up the tailer.
+    """
+    if not websocket_clients:
+        return
 
-async def send_to_client(client: WebSocket, content: str) -> bool:
-    """Helper function to send content to a single client"""
-    await client.send_text(content)
-    return True
+    portal_stats["log_messages_broadcast"] += 1
+    json_msg = json.dumps(message)
+    msg_type = message["type"]
+    filename = message.get("file", "")
+    for queue in websocket_clients.values():
+        queue.put(json_msg, msg_type, filename)
 
 # Tail a single log file
 async def tail_log_file(filepath: str) -> None:
@@ -1098,12 +1142,12 @@ async def tail_log_file(filepath: str) -> None:
                 logger.info(f"File {filename} was replaced (new inode)")
                 last_position = 0
                 _file_term_state.pop(filename, None)
-                _file_block_sizes.pop(filename, None)
+                _active_blocks.pop(filename, None)
             elif current_size < last_position:
                 logger.info(f"File {filename} was truncated")
                 last_position = 0
                 _file_term_state.pop(filename, None)
-                _file_block_sizes.pop(filename, None)
+                _active_blocks.pop(filename, None)
             else:
                 logger.debug(f"File {filename} changed: size={current_size}, last_pos={last_position}")
 
@@ -1124,261 +1168,158 @@ async def tail_log_file(filepath: str) -> None:
 
 
 async def _process_chunk(text: str, filename: str) -> None:
-    """Process a chunk of text with terminal-like \\r, \\n, and cursor-up handling.
+    """Feed a chunk of a log file to its virtual terminal and emit the changes.
 
-    Maintains per-file state across calls so partial lines are not flushed
-    prematurely.  Supports \\x1b[A (cursor up) for nested progress bars (tqdm).
-
-    Lines are kept between chunks so cursor-up in a later chunk can reference
-    lines written in an earlier chunk.
+    The terminal persists across calls, so partial lines are not flushed
+    prematurely and cursor-up in a later chunk can reach lines written in an
+    earlier one. Only what changed goes out: new lines, the current partial
+    line, or the individual rows of a progress block that were redrawn.
     """
-    state = _file_term_state.get(filename)
-    if state is None:
-        state = _FileTermState()
-        _file_term_state[filename] = state
-
-    # If previous chunk ended with \r, prepend it so the split sees it
-    if state.pending_cr:
-        text = '\r' + text
-        state.pending_cr = False
-
-    parts = _CHUNK_TOKEN_RE.split(text)
-
-    had_cursor_up = False
-    for i, part in enumerate(parts):
-        if not part:
-            continue
-
-        if part == '\r\n' or part == '\n':
-            # Line complete — advance cursor
-            state.cursor_row += 1
-            if state.cursor_row >= len(state.lines):
-                state.lines.append("")
-            elif state.in_block:
-                # In block mode (cursor-up active), the next line is about
-                # to be rewritten.  Clear it so new text replaces old
-                # content instead of appending to it.
-                state.lines[state.cursor_row] = ""
-        elif part == '\r':
-            # Peek ahead: if next non-empty part is \n or \r\n, this \r
-            # is just part of a line ending (PTY onlcr artifact), not an
-            # overwrite.  Only clear the line for lone \r (progress bars).
-            next_part = None
-            for j in range(i + 1, len(parts)):
-                if parts[j]:
-                    next_part = parts[j]
-                    break
-            if next_part in ('\n', '\r\n'):
-                pass  # skip — the following \n/\r\n will commit the line
-            elif next_part is None:
-                # \r at end of chunk — may be start of \r\n split across reads
-                state.pending_cr = True
-            else:
-                state.lines[state.cursor_row] = ""
-        elif part.startswith('\x1b['):
-            # CSI sequence
-            body = part[2:]
-            letter = body[-1]
-            param_str = body[:-1]
-            # Strip DEC private-mode prefix (e.g. \x1b[?25l)
-            if param_str.startswith('?'):
-                pass  # ignore show/hide cursor, etc.
-            elif letter == 'A' or letter == 'F':
-                # Cursor up (A) / Cursor previous line (F)
-                try:
-                    n = int(param_str) if param_str else 1
-                except ValueError:
-                    n = 1
-                n = min(n, 500)
-                state.cursor_row = max(0, state.cursor_row - n)
-                state.in_block = True
-                had_cursor_up = True
-            elif letter == 'B' or letter == 'E':
-                # Cursor down (B) / Cursor next line (E)
-                try:
-                    n = int(param_str) if param_str else 1
-                except ValueError:
-                    n = 1
-                n = min(n, 500)
-                state.cursor_row += n
-                while state.cursor_row >= len(state.lines):
-                    state.lines.append("")
-            elif letter == 'G':
-                # Cursor horizontal absolute — move to column N.
-                # We don't track columns; treat as \r (column 1).
-                state.lines[state.cursor_row] = ""
-            elif letter == 'K':
-                # Erase in line: 0/default = cursor→end, 1 = start→cursor,
-                # 2 = entire line.  Without column tracking, only param 2
-                # (entire line) can be handled correctly.  Param 0/1 are
-                # no-ops — the line was already cleared by \r or \x1b[G
-                # before new text was written, so there is nothing beyond
-                # the cursor to erase.
-                try:
-                    p = int(param_str) if param_str else 0
-                except ValueError:
-                    p = 0
-                if p == 2:
-                    state.lines[state.cursor_row] = ""
-            elif letter == 'J':
-                # Erase in display — clear visible lines below cursor
-                try:
-                    p = int(param_str) if param_str else 0
-                except ValueError:
-                    p = 0
-                if p in (0, 2):
-                    for r in range(state.cursor_row, len(state.lines)):
-                        state.lines[r] = ""
-            elif letter == 'm':
-                # SGR (color/style) — preserve in line content
-                state.lines[state.cursor_row] += part
-            # Other CSI (cursor show/hide, etc.): ignore
-        else:
-            # Plain text — append to current line
-            state.lines[state.cursor_row] += part
-
-    # --- Emission ---
-    if state.in_block:
-        if had_cursor_up:
-            # Still actively using cursor-up: emit all lines as a block
-            await _emit_block(filename, state.lines)
-        else:
-            # No cursor-up this chunk — progress bars finished, transition
-            # back to line mode.  Flush remaining block lines as appends.
-            await _emit_block(filename, state.lines)
-            state.in_block = False
-            state.emitted_up_to = state.cursor_row
-            state.line_active = False
-            _file_block_sizes.pop(filename, None)
-
-        # Trim old lines in block mode to prevent unbounded growth.
-        # Keep a window around the cursor so cursor-up still works.
-        if len(state.lines) > 400:
-            # Keep the last 200 lines (enough for any progress bar block)
-            keep = 200
-            trim = len(state.lines) - keep
-            state.lines = state.lines[trim:]
-            state.cursor_row = max(0, state.cursor_row - trim)
-            state.emitted_up_to = max(0, state.emitted_up_to - trim)
-    else:
-        # Single-line mode — backward compatible
-        # Emit newly completed lines (emitted_up_to .. cursor_row)
-        for i in range(state.emitted_up_to, state.cursor_row):
-            line = state.lines[i] if i < len(state.lines) else ""
-            if line or state.line_active:
-                if i == state.emitted_up_to and state.line_active:
-                    # First completed line overwrites the partial preview
-                    await _emit_line(filename, line, "overwrite")
-                elif line:
-                    await _emit_line(filename, line, "append")
-                state.line_active = False
-        state.emitted_up_to = state.cursor_row
-
-        # Preview current (incomplete) line
-        current = state.lines[state.cursor_row] if state.cursor_row < len(state.lines) else ""
-        if current:
-            msg_type = "overwrite" if state.line_active else "append"
-            await _emit_line(filename, current, msg_type)
-            state.line_active = True
-
-        # Trim old completed lines to prevent unbounded growth
-        if state.emitted_up_to > 200:
-            trim = state.emitted_up_to
-            state.lines = state.lines[trim:]
-            state.cursor_row -= trim
-            state.emitted_up_to = 0
+    term = _file_term_state.get(filename)
+    if term is None:
+        term = Terminal()
+        _file_term_state[filename] = term
+
+    for event in term.feed(text):
+        kind = event[0]
+        if kind == "append" or kind == "overwrite":
+            await _emit_line(filename, event[1], kind)
+        elif kind == "block":
+            await _emit_block(filename, event[1], event[2])
+        elif kind == "rows":
+            await _emit_rows(filename, event[1])
+        elif kind == "commit":
+            await _commit_block(filename, event[1])
 
 
 async def _emit_line(filename: str, text: str, msg_type: str) -> None:
     """Store a line in buffers and broadcast to clients.
 
+    The line is wrapped in a LogLine once here, so its HTML is rendered at
+    most once no matter how many clients receive or later replay it.
+
     "overwrite" messages update the per-file buffer and are broadcast live
     to connected clients, but are NOT stored in the chronological buffer.
     This prevents hundreds of intermediate progress-bar states from stacking
     up when multiple log files are active and interleaving writes.
     When the line completes it is emitted as "append" and stored normally.
     """
+    global _history_payload
+    line = LogLine(text, filename)
     if msg_type == "overwrite":
         # Replace last entry in file-specific buffer
         buf = file_specific_buffers.get(filename)
         if buf:
-            buf[-1] = text
+            buf[-1] = line
         else:
-            file_specific_buffers.setdefault(filename, deque(maxlen=MAX_LINES)).append(text)
+            file_specific_buffers.setdefault(filename, deque(maxlen=MAX_LINES)).append(line)
         # Skip chronological buffer — live clients get the broadcast,
         # new clients will see the final state when it becomes an "append".
     else:
-        file_specific_buffers.setdefault(filename, deque(maxlen=MAX_LINES)).append(text)
-        chronological_log_buffer.append(text)
+        file_specific_buffers.setdefault(filename, deque(maxlen=MAX_LINES)).append(line)
+        chronological_log_buffer.append(line)
+        _history_payload = None
 
-    await broadcast_message(text, msg_type, filename)
+    if websocket_clients:
+        broadcast_message({"type": msg_type, "html": line.html, "file": filename})
 
 
-async def _emit_block(filename: str, lines: list[str]) -> None:
-    """Store and broadcast a multi-line progress block."""
-    html_lines = [ansi_to_html(line) for line in lines]
-    if not any(lines):
-        return
-
-    new_size = len(lines)
+async def _emit_block(filename: str, lines: list[str], replace: int = 0) -> None:
+    """Store and broadcast a whole multi-line progress block.
 
-    # Replace previous block entries in file-specific buffer
-    prev_size = _file_block_sizes.get(filename, 0)
+    Sent when a block starts or changes height. ``replace`` counts the
+    file's most recent lines that the block's top rows take over; they are
+    dropped from the buffers when the block starts so history never shows
+    them twice.
+    """
+    global _history_payload
     buf = file_specific_buffers.get(filename)
-    if buf is not None:
-        for _ in range(min(prev_size, len(buf))):
-            buf.pop()
-    else:
+    if buf is None:
         buf = deque(maxlen=MAX_LINES)
         file_specific_buffers[filename] = buf
-    for line in lines:
-        buf.append(line or "")
+
+    previous = _active_blocks.get(filename)
+    if previous is None:
+        for _ in range(min(replace, len(buf))):
+            old = buf.pop()
+            try:
+                chronological_log_buffer.remove(old)
+                _history_payload = None
+            except ValueError:
+                pass
+    else:
+        # Replace previous block entries in file-specific buffer
+        for _ in range(min(len(previous), len(buf))):
+            buf.pop()
+
+    block = [LogLine(line, filename) for line in lines]
+    buf.extend(block)
+    _active_blocks[filename] = block
 
     # Skip chronological buffer for block updates — live clients get the
-    # broadcast, new clients see the final state when block mode ends.
+    # broadcast, new clients get the live block on connect.
 
-    _file_block_sizes[filename] = new_size
+    if websocket_clients:
+        broadcast_message(_block_message(filename, block, replace))
 
-    json_msg = json.dumps({
+
+def _block_message(filename: str, block: list[LogLine], replace: int = 0) -> dict:
+    return {
         "type": "overwrite_block",
-        "lines": html_lines,
-        "file": filename
-    })
+        "lines": [line.html for line in block],
+        "file": filename,
+        "replace": replace,
+    }
+
 
-    clients = list(websocket_clients)
-    if not clients:
+async def _emit_rows(filename: str, rows: list[tuple[int, str]]) -> None:
+    """Store and broadcast only the redrawn rows of a file's live block."""
+    block = _active_blocks.get(filename)
+    if block is None:
         return
-    send_tasks = [asyncio.create_task(send_to_client(c, json_msg)) for c in clients]
-    results = await asyncio.gather(*send_tasks, return_exceptions=True)
-    disconnected = {c for c, r in zip(clients, results) if isinstance(r, Exception)}
-    websocket_clients.difference_update(disconnected)
+    buf = file_specific_buffers.get(filename)
+    offset = len(buf) - len(block) if buf is not None else None
+    patch = []
+    for index, text in rows:
+        if index >= len(block):
+            continue
+        line = LogLine(text, filename)
+        block[index] = line
+        if offset is not None and offset + index >= 0:
+            buf[offset + index] = line
+        patch.append([index, line.html])
+
+    if websocket_clients and patch:
+        broadcast_message({"type": "overwrite_rows", "rows": patch, "file": filename})
+
+
+async def _commit_block(filename: str, lines: list[str]) -> None:
+    """End a file's progress block; its final rows become ordinary lines."""
+    global _history_payload
+    block = _active_blocks.pop(filename, None)
+    buf = file_specific_buffers.setdefault(filename, deque(maxlen=MAX_LINES))
+    if block is not None:
+        for _ in range(min(len(block), len(buf))):
+            buf.pop()
+    final = [LogLine(line, filename) for line in lines]
+    buf.extend(final)
+    chronological_log_buffer.extend(final)
+    _history_payload = None
+
+    if websocket_clients:
+        broadcast_message({
+            "type": "commit_block",
+            "lines": [line.html for line in final],
+            "file": filename,
+        })
 
 
-def _rotate_single_file(filepath: str) -> None:
-    """Truncate a single log file, keeping the last LOG_KEEP_SIZE bytes.
+def _count_rotation(result) -> None:
+    log_rotations[result.method] += 1
+    portal_stats["log_rotated_bytes"] += result.removed
 
-    Atomically replaces the file via write-to-temp + rename so readers
-    see a clean inode change and re-read from the start.
-    """
-    size = os.path.getsize(filepath)
-    if size <= LOG_MAX_SIZE:
-        return
-    logger.info(f"Rotating {filepath}: {size / 1024 / 1024:.1f} MB > {LOG_MAX_SIZE / 1024 / 1024:.0f} MB limit")
-    with open(filepath, "rb") as f:
-        f.seek(max(0, size - LOG_KEEP_SIZE))
-        tail = f.read()
-    # Skip a partial first line
-    nl = tail.find(b"\n")
-    if nl >= 0:
-        tail = tail[nl + 1:]
-    tmp = filepath + ".rotate"
-    with open(tmp, "wb") as f:
-        f.write(tail)
-    os.replace(tmp, filepath)
-    logger.info(f"Rotated {filepath}: kept {len(tail)} bytes")
-
-
-def _rotate_log_file(filepath: str) -> None:
+
+async def _rotate_log_file(filepath: str) -> None:
     """Rotate a portal log file and its corresponding clean log in /var/log/.
 
     The provisioner logging creates paired files:
@@ -1386,70 +1327,120 @@ def _rotate_log_file(filepath: str) -> None:
       /var/log/X.log          (clean text for external logging)
     Both are rotated together to keep disk usage bounded.
 
-    After rotation, updates the file tracking state so tail_log_file
-    doesn't re-read the kept tail as new data.
+    Rotation runs in a worker thread and works on the file in place (see
+    logstream.rotate), so writers holding the file open keep writing to it.
+    The file is tailed first and the rotation never removes bytes the tailer
+    has not read, so the tail position can simply be shifted afterwards:
+    nothing is lost from the stream or replayed into it.
     """
+    filename = os.path.basename(filepath)
     try:
-        _rotate_single_file(filepath)
-        # Update tracking so we don't re-read the kept tail
-        filename = os.path.basename(filepath)
-        stat = os.stat(filepath)
-        file_positions[filename] = stat.st_size
-        file_mtimes[filename] = stat.st_mtime
-        file_inodes[filename] = stat.st_ino
+        if os.path.getsize(filepath) > LOG_MAX_SIZE:
+            await tail_log_file(filepath)
+            position = file_positions.get(filename, 0)
+            result = await asyncio.to_thread(
+                rotate_file, filepath,
+                max_size=LOG_MAX_SIZE, keep=LOG_KEEP_SIZE, limit=position, budget=LOG_ARCHIVE_BUDGET,
+            )
+            if result is not None:
+                _count_rotation(result)
+                stat = os.stat(filepath)
+                file_positions[filename] = max(0, position - result.removed)
+                file_mtimes[filename] = stat.st_mtime
+                file_inodes[filename] = stat.st_ino
+                # Offsets shifted under the index; rebuild it on next use
+                _line_indexes.pop(filename, None)
+                if result.unread:
+                    await _process_chunk(result.unread.decode('utf-8', errors='replace'), filename)
+
         # Also rotate the companion clean log (e.g. /var/log/portal/X.log → /var/log/X.log)
         directory, basename = os.path.split(filepath)
         if os.path.basename(directory) == "portal":
             clean_path = os.path.join(os.path.dirname(directory), basename)
-            if os.path.exists(clean_path):
-                _rotate_single_file(clean_path)
+            if os.path.exists(clean_path) and os.path.getsize(clean_path) > LOG_MAX_SIZE:
+                result = await asyncio.to_thread(
+                    rotate_file, clean_path,
+                    max_size=LOG_MAX_SIZE, keep=LOG_KEEP_SIZE, budget=LOG_ARCHIVE_BUDGET,
+                )
+                if result is not None:
+                    _count_rotation(result)
     except Exception as e:
         logger.error(f"Failed to rotate {filepath}: {e}")
 
 
+def _forget_log_file(filename: str) -> None:
+    """Drop all tracking state for a log file that no longer exists."""
+    logger.info(f"File {filename} was removed, cleaning up")
+    file_positions.pop(filename, None)
+    file_mtimes.pop(filename, None)
+    file_inodes.pop(filename, None)
+    file_specific_buffers.pop(filename, None)
+    _file_term_state.pop(filename, None)
+    _active_blocks.pop(filename, None)
+    _line_indexes.pop(filename, None)
+
+
 # Main monitoring loop
 async def monitor_log_directory(directory: str) -> None:
-    """Main task to monitor log directory and tail files"""
+    """Main task to monitor log directory and tail files.
+
+    Sleeps until inotify reports that a file in ``directory`` was written,
+    created, renamed in or deleted, then tails only those files. Falls back
+    to rescanning every POLL_INTERVAL when inotify is unavailable.
+    """
     logger.info(f"Starting log monitoring in {directory}")
+    loop = asyncio.get_event_loop()
     last_rotate_check = 0.0
+    watcher = DirectoryWatcher(directory, suffix=".log", poll_interval=POLL_INTERVAL)
+    watcher.start()
+    # None means "rescan the whole directory": the first pass, every pass in
+    # polling mode, and after an inotify queue overflow.
+    changed: Optional[set[str]] = None
 
-    while True:
-        try:
-            # Get current log files
-            log_files = await get_log_files(directory)
-
-            # Monitor each file
-            for log_file in log_files:
-                filepath = os.path.join(directory, log_file)
-                await tail_log_file(filepath)
-
-            # Clean up deleted files
-            for filename in list(file_positions.keys()):
-                if filename not in log_files:
-                    logger.info(f"File {filename} was removed, cleaning up")
-                    file_positions.pop(filename, None)
-                    file_mtimes.pop(filename, None)
-                    file_inodes.pop(filename, None)
-                    file_specific_buffers.pop(filename, None)
-                    _file_term_state.pop(filename, None)
-                    _file_block_sizes.pop(filename, None)
-
-            # Periodically check log file sizes and rotate if needed
-            now = asyncio.get_event_loop().time()
-            if now - last_rotate_check > LOG_ROTATE_INTERVAL:
-                last_rotate_check = now
-                for log_file in log_files:
-                    _rotate_log_file(os.path.join(directory, log_file))
-
-            # Small delay before next poll
-            await asyncio.sleep(POLL_INTERVAL)
-
-        except asyncio.CancelledError:
-            logger.info("Monitor task cancelled")
-            break
-        except Exception as e:
-            logger.error(f"Error in monitor_log_directory: {e}")
-            await asyncio.sleep(1)
+    try:
+        while True:
+            try:
+                if changed is None:
+                    # Get current log files
+                    log_files = await get_log_files(directory)
+
+                    # Monitor each file
+                    for log_file in log_files:
+                        filepath = os.path.join(directory, log_file)
+                        await tail_log_file(filepath)
+
+                    # Clean up deleted files
+                    for filename in list(file_positions.keys()):
+                        if filename not in log_files:
+                            _forget_log_file(filename)
+                else:
+                    for log_file in sorted(changed):
+                        filepath = os.path.join(directory, log_file)
+                        if os.path.exists(filepath):
+                            await tail_log_file(filepath)
+                        elif log_file in file_positions:
+                            _forget_log_file(log_file)
+
+                # Periodically check log file sizes and rotate if needed
+                now = loop.time()
+                if now - last_rotate_check > LOG_ROTATE_INTERVAL:
+                    last_rotate_check = now
+                    for log_file in await get_log_files(directory):
+                        await _rotate_log_file(os.path.join(directory, log_file))
+
+                # Wait for the next change, waking in time for the rotation check
+                timeout = max(0.0, LOG_ROTATE_INTERVAL - (loop.time() - last_rotate_check))
+                changed = await watcher.changes(timeout)
+
+            except asyncio.CancelledError:
+                logger.info("Monitor task cancelled")
+                break
+            except Exception as e:
+                logger.error(f"Error in monitor_log_directory: {e}")
+                await asyncio.sleep(1)
+                changed = None
+    finally:
+        watcher.close()
 
 # WebSocket connection handler
 async def websocket_logs(websocket: WebSocket) -> None:
@@ -1458,82 +1449,226 @@ async def websocket_logs(websocket: WebSocket) -> None:
     
     # Generate client ID and add to clients list
     client_id = id(websocket)
-    websocket_clients.add(websocket)
+    queue = ClientQueue(websocket.send_text)
+    try:
+        files = _subscription(websocket.query_params.get("files"))
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e)[:120])
+        return
+    if files is not None:
+        queue.files = frozenset(files)
+    websocket_clients[websocket] = queue
+    portal_stats["ws_connections"] += 1
     logger.info(f"WebSocket client {client_id} connected, total clients: {len(websocket_clients)}")
-    
-    # Create a dedicated task for this client
-    client_task = asyncio.create_task(client_handler(websocket, client_id))
-    client_tasks[client_id] = client_task
-    
+    _greet_client(queue)
+
+    # One task reads from the socket, the other drains the queue onto it
+    reader_task = asyncio.create_task(client_reader(websocket, queue, client_id))
+    writer_task = asyncio.create_task(queue.run())
+
     try:
-        # Wait for the client handler to complete
-        await client_task
+        # Wait for either side to finish: the reader on disconnect, the
+        # writer on a send error or when the client falls too far behind
+        await asyncio.wait({reader_task, writer_task}, return_when=asyncio.FIRST_COMPLETED)
+        if reader_task.done() and not reader_task.cancelled() and reader_task.exception() is not None:
+            logger.error(f"Error reading from client {client_id}: {reader_task.exception()}")
+        if writer_task.done() and not writer_task.cancelled():
+            error = writer_task.exception()
+            if isinstance(error, WebSocketDisconnect):
+                logger.info(f"WebSocket client {client_id} disconnected")
+            elif error is not None:
+                logger.error(f"Error sending to client {client_id}: {error}")
+            elif queue.overflowed:
+                logger.warning(f"WebSocket client {client_id} fell behind, dropping it")
+                try:
+                    await asyncio.wait_for(websocket.close(code=1013), timeout=1)
+                except Exception:
+                    pass
     except asyncio.CancelledError:
         # Expected when client disconnects, no need to log as error
         logger.debug(f"WebSocket client {client_id} disconnected")
     except Exception as e:
         logger.error(f"Error in main websocket handler for client {client_id}: {e}")
     finally:
-        # Ensure client is removed
+        reader_task.cancel()
+        writer_task.cancel()
         remove_client(websocket, client_id)
 
 @app.websocket("/ws-logs")
 async def logs_websocket(websocket: WebSocket) -> None:
     await websocket_logs(websocket)
 
+def _portal_log_path(file: str) -> str:
+    """Resolve a log name to its path in PORTAL_LOG_DIR, or raise 404."""
+    if os.path.basename(file) != file or not file.endswith(".log"):
+        raise HTTPException(status_code=404, detail="Log file not found")
+    path = os.path.join(PORTAL_LOG_DIR, file)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Log file not found")
+    return path
+
+@app.get("/logs")
+async def list_logs() -> JSONResponse:
+    """List the portal log files, oldest-modified first."""
+    files = []
+    for name in await get_log_files(PORTAL_LOG_DIR):
+        try:
+            st = os.stat(os.path.join(PORTAL_LOG_DIR, name))
+        except OSError:
+            continue
+        files.append({"file": name, "size": st.st_size, "mtime": st.st_mtime})
+    return JSONResponse(files)
+
+def _search_targets(files: Optional[str]) -> list[str]:
+    """Log names to search: the comma-separated `files`, or every portal log (newest first)."""
+    if files:
+        names = [name.strip() for name in files.split(",") if name.strip()]
+        for name in names:
+            _portal_log_path(name)
+        return names
+    try:
+        names = [f for f in os.listdir(PORTAL_LOG_DIR) if f.endswith(".log")]
+    except OSError:
+        return []
+    return sorted(names, key=lambda f: _mtime(os.path.join(PORTAL_LOG_DIR, f)), reverse=True)
+
+def _mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+# Registered before /logs/{file} so "search" is not taken for a file name
+@app.get("/logs/search")
+async def search_logs(
+    q: Optional[str] = None,
+    files: Optional[str] = None,
+    context: int = Query(0, ge=0, le=SEARCH_MAX_CONTEXT),
+    limit: int = Query(SEARCH_MAX_RESULTS, ge=1, le=5000),
+    level: Optional[str] = None,
+    ignore_case: bool = False,
+    recent: bool = False,
+) -> StreamingResponse:
+    """
+    Search the logs, streaming matches as newline-delimited JSON.
+
+    Each portal log is searched through its clean companion in /var/log
+    (no ANSI codes, progress redraws on their own lines) when one exists.
+    Every match is a `{"type": "match", "file", "line", "text", "before",
+    "after"}` record; a final `{"type": "summary", "matches", "truncated"}`
+    record ends the stream.
+
+    Parameters:
+    - q: Regular expression to look for
+    - files: Comma-separated log names to restrict the search to (default: all)
+    - context: Lines of context to include before and after each match
+    - limit: Stop after this many matches
+    - level: Only lines at or above a severity (`warning`, `error`); combines with `q`
+    - ignore_case: Case-insensitive `q`
+    - recent: Only search the lines the portal holds in memory (no disk reads, no line numbers)
+    """
+    try:
+        search = LogSearch(q, level=level, context=context, max_results=limit, ignore_case=ignore_case)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    names = _search_targets(files)
+
+    if recent:
+        # Snapshot on the event loop; the tailer mutates these deques
+        snapshot = [(name, [line.text for line in file_specific_buffers.get(name, ())]) for name in names]
+
+        def matches():
+            for name, lines in snapshot:
+                yield from search.search_lines(name, lines)
+    else:
+        clean_dir = os.path.dirname(PORTAL_LOG_DIR)
+
+        def matches():
+            for name in names:
+                clean_path = os.path.join(clean_dir, name)
+                raw = not os.path.isfile(clean_path)
+                path = os.path.join(PORTAL_LOG_DIR, name) if raw else clean_path
+                try:
+                    yield from search.search_file(name, path, raw=raw)
+                except OSError as e:
+                    logger.debug(f"Log search skipped {path}: {e}")
+
+    # A sync generator: StreamingResponse iterates it in the threadpool
+    def generate():
+        for record in matches():
+            yield json.dumps(record) + "\n"
+        yield json.dumps(search.summary()) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.get("/logs/{file}")
+async def get_log_page(
+    file: str,
+    before: Optional[int] = None,
+    limit: int = 200,
+    fmt: str = Query("text", alias="format"),
+) -> JSONResponse:
+    """
+    Page backwards through a portal log file on disk.
+
+    Parameters:
+    - before: Byte offset to read up to (default: end of file). Pass the
+      previous response's `start` to fetch the next older page.
+    - limit: Number of lines to return (max 2000)
+    - format: `text` (ANSI stripped), `html` (as the log viewer renders it) or `raw`
+    """
+    if fmt not in LOG_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(LOG_FORMATS)}")
+    path = _portal_log_path(file)
+    index = _line_indexes.get(file)
+    if index is None:
+        index = _line_indexes[file] = LineIndex(path)
+    try:
+        page = await asyncio.to_thread(index.page, before, limit, fmt)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Log file not found")
+    return JSONResponse({"file": file, **page})
+
 @app.get("/download-logs")
-async def download_logs(filename: str = None) -> StreamingResponse:
+async def download_logs(
+    filename: str = None,
+    pattern: Optional[str] = Query(None, alias="glob"),
+    since: Optional[float] = None,
+    max_bytes: Optional[int] = Query(None, ge=1),
+) -> StreamingResponse:
     """
-    Zip the /var/log directory and serve it as a downloadable file.
-    
+    Zip the /var/log directory and stream it as a downloadable file.
+
+    The archive is compressed in a worker thread and sent as it is built, so
+    large logs neither sit in memory nor block the event loop.
+
     Parameters:
     - filename: Optional custom filename for the zip file
+    - glob: Only include files whose path under /var/log matches (e.g. ``portal/*.log``)
+    - since: Only include files modified at or after this Unix timestamp
+    - max_bytes: Include at most the last ``max_bytes`` of each file
     """
-    try:
-        # Create a memory buffer to store the zip file
-        zip_buffer = io.BytesIO()
-        
-        # Define the directory to zip
-        log_dir = "/var/log"
-        
-        # Check if the directory exists
-        if not os.path.exists(log_dir):
-            raise HTTPException(status_code=404, detail="Log directory not found")
-        
-        # Use provided filename or generate one with timestamp
-        if not filename:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            zip_filename = f"logs_{timestamp}.zip"
-        else:
-            # Ensure the filename ends with .zip
-            zip_filename = filename if filename.endswith('.zip') else f"{filename}.zip"
-        
-        # Create a zip file in the memory buffer
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # Walk through the directory and add all files to the zip
-            for root, dirs, files in os.walk(log_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    # Calculate the relative path for the file inside the zip
-                    relative_path = os.path.relpath(file_path, os.path.dirname(log_dir))
-                    try:
-                        zipf.write(file_path, relative_path)
-                    except (PermissionError, zipfile.LargeZipFile, OSError) as e:
-                        # Skip files that can't be accessed or are too large
-                        continue
-        
-        # Reset the buffer position to the beginning
-        zip_buffer.seek(0)
-        
-        # Return the zip file as a downloadable response
-        return StreamingResponse(
-            zip_buffer,
-            media_type="application/zip",
-            headers={"Content-Disposition": f'attachment; filename="{os.path.basename(zip_filename).replace(chr(34), "_")}"'}
-        )
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error creating zip file: {str(e)}")
+    # Define the directory to zip
+    log_dir = "/var/log"
+
+    # Check if the directory exists
+    if not os.path.isdir(log_dir):
+        raise HTTPException(status_code=404, detail="Log directory not found")
+
+    # Use provided filename or generate one with timestamp
+    if not filename:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        zip_filename = f"logs_{timestamp}.zip"
+    else:
+        # Ensure the filename ends with .zip
+        zip_filename = filename if filename.endswith('.zip') else f"{filename}.zip"
+
+    # A sync generator: StreamingResponse iterates it in the threadpool
+    return StreamingResponse(
+        iter_log_zip(log_dir, pattern=pattern, since=since, max_bytes=max_bytes),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{os.path.basename(zip_filename).replace(chr(34), "_")}"'}
+    )
 
 def _is_finite_num(value) -> bool:
     """True only for real, finite numbers (excludes bool, NaN and +/-Inf)."""
@@ -1557,22 +1692,52 @@ def _json_safe(obj):
     return obj
 
 
-async def _collect_metrics() -> dict:
-    """Collect system metrics. Shared by the route and the manifest."""
+GPU_METRICS_DETAIL = ('devices', 'processes')  # Opt-in keys of metrics['gpu']
+METRICS_DETAIL = ('supervisor',)  # Opt-in top-level keys of a metrics sample
+
+def _collect_gpu_processes(telemetry: GPUTelemetry, supervisor: Optional[list]) -> list:
+    """Processes holding GPU memory, with the supervisor program each belongs to."""
+    processes = telemetry.processes()
+    if not processes:
+        return []
+    programs = {p['pid']: p['name'] for p in supervisor or () if p['pid']}
+    attribute_processes(processes, programs)
+    processes.sort(key=lambda p: (p.gpu is None, p.gpu or 0, -(p.memory_used or 0)))
+    return [dataclasses.asdict(p) for p in processes]
+
+def _metrics_view(metrics: dict, include: set[str]) -> dict:
+    """``metrics`` without the detail keys that were not asked for."""
+    view = {k: v for k, v in metrics.items() if k not in METRICS_DETAIL or k in include}
+    gpu = metrics.get('gpu')
+    if isinstance(gpu, dict):
+        view['gpu'] = {k: v for k, v in gpu.items() if k not in GPU_METRICS_DETAIL or k in include}
+    return view
+
+def _collect_metrics() -> dict:
+    """Collect one sample of system metrics.
+
+    Can block (the GPUtil and rocm-smi providers fork their CLIs): only
+    metrics_sampler calls this, from a worker thread. Everything else reads
+    the sampler.
+    """
     # Try to get container memory metrics first
     container_memory = get_container_memory_stats()
-    
+    if not container_memory:
+        memory = psutil.virtual_memory()
+        container_memory = {
+            'total': memory.total,
+            'used': memory.used,
+            'percent': memory.percent
+        }
+    disk = psutil.disk_usage('/')
+
     # Initialize metrics dictionary with memory info
     metrics = {
-        'ram': container_memory if container_memory else {
-            'total': psutil.virtual_memory().total,
-            'used': psutil.virtual_memory().used,
-            'percent': psutil.virtual_memory().percent
-        },
+        'ram': container_memory,
         'disk': {
-            'total': psutil.disk_usage('/').total,
-            'used': psutil.disk_usage('/').used,
-            'percent': psutil.disk_usage('/').percent
+            'total': disk.total,
+            'used': disk.used,
+            'percent': disk.percent
         }
     }
     
@@ -1587,55 +1752,36 @@ async def _collect_metrics() -> dict:
     if volume_info:
         metrics['volume'] = volume_info
     
-    # Get GPU metrics from both NVIDIA and AMD sources
-    all_gpus = []
-    nvidia_error = None
-    rocm_error = None
-    
-    # Try to get NVIDIA GPUs (offloaded — GPUtil shells out to nvidia-smi, blocking)
+    # Supervisor programs: exported by /metrics, and the owners of GPU processes
     try:
-        nvidia_gpus = await asyncio.to_thread(GPUtil.getGPUs)
-        all_gpus.extend(nvidia_gpus)
+        metrics['supervisor'] = _read_supervisor()
     except Exception as e:
-        nvidia_error = str(e)
+        logger.debug(f"Metrics: supervisor unavailable: {e}")
+        metrics['supervisor'] = None
+
+    # Get GPU metrics from every available provider (NVML, nvidia-smi, rocm-smi)
+    telemetry = get_gpu_telemetry()
+    all_gpus, gpu_errors = telemetry.read()
 
-    # Try to get ROCm GPUs (offloaded — get_rocm_gpus shells out to rocm-smi, blocking)
-    try:
-        rocm_gpus = await asyncio.to_thread(get_rocm_gpus)
-        all_gpus.extend(rocm_gpus)
-    except Exception as e:
-        rocm_error = str(e)
-        
     # Calculate metrics if any GPUs are found
     if all_gpus:
-        # GPUtil casts any nvidia-smi field it cannot parse to float('nan').
-        # The GB10 (DGX Spark) has no dedicated framebuffer, so it reports
-        # memory.total and memory.used as "[N/A]" (a MIG-enabled parent device
-        # does too); those arrive here as NaN. Filter out non-finite values:
-        # they would otherwise propagate into the response and crash Starlette's
-        # JSONResponse (which encodes with allow_nan=False).
-        loads = [g.load for g in all_gpus if _is_finite_num(g.load)]
+        # Providers report None for fields a device does not have. The GB10
+        # (DGX Spark) has no dedicated framebuffer, so it reports no memory
+        # total or used (a MIG-enabled parent device does not either).
+        loads = [g.load for g in all_gpus if g.load is not None]
         avg_load = sum(loads) / len(loads) if loads else 0.0
 
-        # Sum total and used memory across all GPUs
-        # Handle potential unit differences between NVIDIA and ROCm
+        # Sum total and used memory (MB) across all GPUs
         total_memory = 0.0
         used_memory = 0.0
         memory_available = False
 
         for gpu in all_gpus:
-            # For ROCm GPUs, memoryTotal might be in bytes, while NVIDIA is in MB
-            if hasattr(gpu, 'memoryTotal_mb'):
-                # Use the MB values directly if available
-                gpu_total, gpu_used = gpu.memoryTotal_mb, gpu.memoryUsed_mb
-            else:
-                # Assume standard GPUtil format which is already in MB
-                gpu_total, gpu_used = gpu.memoryTotal, gpu.memoryUsed
             # Only count GPUs that actually report memory; preserves valid data
             # in mixed fleets where some GPUs report and others don't.
-            if _is_finite_num(gpu_total) and _is_finite_num(gpu_used):
-                total_memory += gpu_total
-                used_memory += gpu_used
+            if gpu.memory_total is not None and gpu.memory_used is not None:
+                total_memory += gpu.memory_total
+                used_memory += gpu.memory_used
                 memory_available = True
 
         # Calculate overall memory usage percentage
@@ -1643,7 +1789,7 @@ async def _collect_metrics() -> dict:
 
         metrics['gpu'] = {
             'count': len(all_gpus),
-            'avg_load_percent': float(avg_load * 100),  # Convert to percentage
+            'avg_load_percent': float(avg_load),
             # None (not 0) when memory is unreported, so the UI can tell the
             # difference between "0 MB used" and "not available".
             'memory_used': float(used_memory) if memory_available else None,
@@ -1653,14 +1799,19 @@ async def _collect_metrics() -> dict:
         }
         
         # Add GPU details by type
-        nvidia_count = len([gpu for gpu in all_gpus if hasattr(gpu, 'id') and not isinstance(gpu.id, str)])
-        rocm_count = len(all_gpus) - nvidia_count
+        nvidia_count = sum(1 for gpu in all_gpus if gpu.vendor == 'nvidia')
+        rocm_count = sum(1 for gpu in all_gpus if gpu.vendor == 'amd')
         
         if nvidia_count > 0:
             metrics['gpu']['nvidia_count'] = nvidia_count
         if rocm_count > 0:
             metrics['gpu']['amd_count'] = rocm_count
-            
+
+        # Per-device and per-process detail; /system-metrics only returns
+        # these when asked (?include=devices,processes)
+        metrics['gpu']['devices'] = [dataclasses.asdict(gpu) for gpu in all_gpus]
+        metrics['gpu']['processes'] = _collect_gpu_processes(telemetry, metrics['supervisor'])
+
     else:
         metrics['gpu'] = {
             'count': 0,
@@ -1668,25 +1819,113 @@ async def _collect_metrics() -> dict:
             'memory_used': 0,
             'memory_total': 0,
             'memory_percent': 0,
-            'memory_unit': 'MB'  # Keep consistent unit notation
+            'memory_unit': 'MB',  # Keep consistent unit notation
+            'devices': [],
+            'processes': [],
         }
         
         # Add error information if applicable
-        errors = {}
-        if nvidia_error:
-            errors['nvidia'] = nvidia_error
-        if rocm_error:
-            errors['rocm'] = rocm_error
-            
-        if errors:
-            metrics['gpu']['errors'] = errors
+        if gpu_errors:
+            metrics['gpu']['errors'] = gpu_errors
 
     return _json_safe(metrics)
 
 
+METRICS_INTERVAL = float(os.environ.get("METRICS_INTERVAL", "5"))  # Seconds between samples
+METRICS_HISTORY = float(os.environ.get("METRICS_HISTORY", "3600"))  # Seconds of history kept
+
+metrics_sampler = MetricsSampler(_collect_metrics, interval=METRICS_INTERVAL, history=METRICS_HISTORY)
+
+
 @app.get("/system-metrics")
-async def get_system_metrics() -> JSONResponse:
-    return JSONResponse(content=await _collect_metrics())
+async def get_system_metrics(include: Optional[str] = None) -> JSONResponse:
+    """The latest metrics sample.
+
+    - include: Comma-separated extras: ``devices`` (per-GPU load, memory,
+      temperature, power, clocks, MIG instances), ``processes`` (GPU memory
+      per process, with the supervisor program that owns it) and/or
+      ``supervisor`` (program states as of the sample)
+    """
+    return JSONResponse(content=_metrics_view(await metrics_sampler.current(), _parse_include(include)))
+
+
+@app.get("/system-metrics/history")
+async def get_system_metrics_history(
+    window: str = "15m",
+    points: int = Query(120, ge=1, le=METRICS_MAX_POINTS),
+) -> JSONResponse:
+    """Recent CPU/RAM/disk/GPU percentages for sparklines.
+
+    - window: How far back to go, in seconds or with an s/m/h/d suffix (``15m``)
+    - points: Average consecutive samples down to at most this many points
+
+    Returns ``{"interval", "window", "series": {"t": [...], "cpu": [...], ...}}``
+    where ``t`` is Unix time and missing values are null.
+    """
+    try:
+        seconds = parse_window(window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(content=metrics_sampler.window(min(seconds, metrics_sampler.history), points))
+
+
+def _portal_families() -> list[Family]:
+    """The portal's own counters: log WebSocket fan-out, tailing and rotation."""
+    clients = list(websocket_clients.values())
+    connected = Family("portal_ws_clients", "gauge", "Connected log WebSocket clients")
+    connected.add(len(clients))
+    connections = Family("portal_ws_connections", "counter", "Log WebSocket connections accepted")
+    connections.add(portal_stats["ws_connections"])
+    frames = Family("portal_ws_sent_frames", "counter", "Frames sent to log WebSocket clients")
+    frames.add(portal_stats["ws_frames_sent"] + sum(q.frames_sent for q in clients))
+    sent = Family("portal_ws_sent_bytes", "counter", "Bytes sent to log WebSocket clients")
+    sent.add(portal_stats["ws_bytes_sent"] + sum(q.bytes_sent for q in clients))
+    dropped = Family("portal_ws_dropped_clients", "counter", "Log WebSocket clients disconnected for falling behind")
+    dropped.add(portal_stats["ws_clients_dropped"])
+    broadcast = Family("portal_log_broadcast_messages", "counter", "Log messages broadcast to WebSocket clients")
+    broadcast.add(portal_stats["log_messages_broadcast"])
+
+    # Bytes written to each log that the tailer has not read yet
+    lag = Family("portal_log_tail_lag_bytes", "gauge", "Bytes written to a log file but not yet tailed")
+    for filename, position in list(file_positions.items()):
+        try:
+            size = os.stat(os.path.join(PORTAL_LOG_DIR, filename)).st_size
+        except OSError:
+            continue
+        lag.add(max(0, size - position), file=filename)
+
+    rotations = Family("portal_log_rotations", "counter", "Log file rotations")
+    for method in sorted({"collapse", "copy-truncate", *log_rotations}):
+        rotations.add(log_rotations[method], method=method)
+    rotated = Family("portal_log_rotated_bytes", "counter", "Bytes moved out of log files by rotation")
+    rotated.add(portal_stats["log_rotated_bytes"])
+    return [connected, connections, frames, sent, dropped, broadcast, lag, rotations, rotated]
+
+
+_metrics_exposition: dict[bool, tuple[Optional[float], str]] = {}  # OpenMetrics? -> (sampled_at, text)
+
+@app.get("/metrics")
+async def get_metrics(request: Request) -> Response:
+    """System, GPU, supervisor and portal metrics in OpenMetrics text format.
+
+    Rendered from the sampler's latest sample, at most once per sample per
+    format, so any number of scrapers costs one render per
+    ``METRICS_INTERVAL``. Scrapers that do not ask for OpenMetrics in
+    ``Accept`` get the Prometheus 0.0.4 text format.
+    """
+    openmetrics = wants_openmetrics(request.headers.get("accept"))
+    sample = await metrics_sampler.current()
+    cached = _metrics_exposition.get(openmetrics)
+    if cached is None or cached[0] != metrics_sampler.sampled_at:
+        sampled = Family("instance_metrics_sample_timestamp_seconds", "gauge", "When these metrics were sampled")
+        sampled.add(metrics_sampler.sampled_at)
+        families = [sampled, *sample_families(sample, now=metrics_sampler.sampled_at), *_portal_families()]
+        cached = (metrics_sampler.sampled_at, render_metrics(families, openmetrics))
+        _metrics_exposition[openmetrics] = cached
+    return Response(
+        content=cached[1],
+        media_type=OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE,
+    )
 
 
 # --------------------------------------------------------------------------- #
@@ -1696,22 +1935,26 @@ async def get_system_metrics() -> JSONResponse:
 # --------------------------------------------------------------------------- #
 
 async def _build_capabilities(include: set[str]) -> dict:
-    # Supervisor states are already offloaded. The GPU summary and manifest
-    # assembly run blocking subprocesses (nvidia-smi via GPUtil, ldconfig/nvidia-smi
-    # inside assemble_live, each timeout=5), so offload them too — otherwise a single
-    # /capabilities call stalls the event loop and the live pollers. metrics are opt-in.
+    # Supervisor states are already offloaded. GPU state comes from the telemetry
+    # providers (in-process NVML where available, which also supplies the compute
+    # capability), but the GPUtil/rocm-smi fallbacks and manifest assembly
+    # (ldconfig inside assemble_live, timeout=5) still block, so offload them too —
+    # otherwise a single /capabilities call stalls the event loop and the live
+    # pollers. metrics are opt-in. Routes call this through capabilities_cache.
     try:
         processes = await _collect_supervisor()
     except Exception as e:
         logger.warning(f"capabilities: supervisor unavailable: {e}")
         processes = []
-    metrics = await _collect_metrics() if "metrics" in include else None
+    metrics = _metrics_view(await metrics_sampler.current(), set()) if "metrics" in include else None
     gpu = await asyncio.to_thread(get_gpu_info)
+    driver = await asyncio.to_thread(get_gpu_telemetry().driver)
     return await asyncio.to_thread(
         assemble_live,
         processes=processes,
         metrics=metrics,
         gpu=gpu,
+        compute_capability=driver.get("compute_capability"),
         include=include,
     )
 
@@ -1722,19 +1965,38 @@ def _parse_include(include: Optional[str]) -> set[str]:
     return {p.strip() for p in include.split(",") if p.strip()}
 
 
+CAPABILITIES_TTL = float(os.environ.get("CAPABILITIES_TTL", "2"))  # Seconds a built manifest is reused
+
+# Static facts (CUDA, driver, fragments, package versions) are memoized inside
+# the capabilities package until their source files change; this adds the
+# short TTL for live facts and one shared build for concurrent callers.
+capabilities_cache = ManifestCache(_build_capabilities, ttl=CAPABILITIES_TTL)
+
+
+async def _capabilities_response(request: Request, include: Optional[str]) -> Response:
+    """The cached manifest, or 304 if the caller's If-None-Match still matches."""
+    cached = await capabilities_cache.get(_parse_include(include))
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+
 @app.get("/capabilities", summary="Machine-readable capability manifest")
-async def get_capabilities(include: Optional[str] = None) -> JSONResponse:
+async def get_capabilities(request: Request, include: Optional[str] = None) -> Response:
     """Full instance manifest for AI agents.
 
     Pass `?include=metrics,packages` to add live CPU/GPU/RAM metrics and probed
     package versions (both omitted by default to keep the response fast).
+    Responses carry an ETag; send it back as If-None-Match to get a 304 while
+    nothing but `generated_at` has changed.
     """
-    return JSONResponse(await _build_capabilities(_parse_include(include)))
+    return await _capabilities_response(request, include)
 
 
 @app.get("/.well-known/vast-capabilities", include_in_schema=False)
-async def get_capabilities_well_known(include: Optional[str] = None) -> JSONResponse:
-    return JSONResponse(await _build_capabilities(_parse_include(include)))
+async def get_capabilities_well_known(request: Request, include: Optional[str] = None) -> Response:
+    return await _capabilities_response(request, include)
 
 
 @app.get(
@@ -1743,7 +2005,7 @@ async def get_capabilities_well_known(include: Optional[str] = None) -> JSONResp
     summary="Running/known services with reachable URLs",
 )
 async def get_capabilities_services():
-    manifest = await _build_capabilities(set())
+    manifest = (await capabilities_cache.get()).manifest
     # Return the plain list so FastAPI validates/serialises via response_model
     # and the OpenAPI schema matches actual output.
     return manifest.get("services", [])
@@ -1755,7 +2017,7 @@ async def get_capabilities_services():
     summary="OpenAI /v1 endpoints exposed by running services",
 )
 async def get_capabilities_endpoints():
-    manifest = await _build_capabilities(set())
+    manifest = (await capabilities_cache.get()).manifest
     return manifest.get("endpoints_openai", [])
 
 
@@ -1838,6 +2100,9 @@ async def post_capabilities_provision(req: ProvisionRequest):
         logger.error(f"Failed to launch provisioner: {e}")
         raise HTTPException(status_code=500, detail="Failed to launch provisioner")
 
+    # Provisioning status (and soon packages) change; don't serve the old manifest
+    capabilities_cache.invalidate()
+
     return {
         "status": "started",
         "detail": "Provisioner launched in the background",
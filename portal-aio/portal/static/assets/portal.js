@@ -1136,7 +1136,9 @@ window.InstancePortal = (function() {
     // ─── Services (Supervisor Process Management) ────────────────────
     const services = {
         _data: [],
+        _receivedAt: 0,  // When _data arrived; its 'now' fields are as of then
         _pollInterval: null,
+        _events: null,  // EventSource pushing process states as they change
         _pending: {},  // name -> action being performed
 
         fetch: async function() {
@@ -1144,11 +1146,25 @@ window.InstancePortal = (function() {
                 const response = await fetch('/supervisor/processes');
                 if (!response.ok) return;
                 this._data = await response.json();
+                this._receivedAt = Date.now();
             } catch (e) {
                 console.warn('Supervisor not available:', e.message);
             }
         },
 
+        // Let the portal push state changes instead of polling for them
+        subscribe: function() {
+            if (typeof EventSource === 'undefined') return false;
+            this._events = new EventSource('/supervisor/events');
+            this._events.addEventListener('processes', (event) => {
+                this._data = JSON.parse(event.data);
+                this._receivedAt = Date.now();
+                this.ui.render();
+                this.updateAppCards();
+            });
+            return true;
+        },
+
         action: async function(name, action) {
             this._pending[name] = action;
             this.ui.render();
@@ -1171,7 +1187,8 @@ window.InstancePortal = (function() {
             } finally {
                 delete this._pending[name];
                 // Refresh after a short delay to let supervisor settle
-                setTimeout(() => this.refresh(), 500);
+                // (pushed over the event stream when subscribed)
+                if (!this._events) setTimeout(() => this.refresh(), 500);
             }
         },
 
@@ -1264,13 +1281,19 @@ window.InstancePortal = (function() {
             await this.fetch();
             this.ui.render();
             this.updateAppCards();
-            this._pollInterval = setInterval(() => this.refresh(), 10000);
+            if (this.subscribe()) {
+                // States arrive as they change; just keep uptimes ticking
+                this._pollInterval = setInterval(() => this.ui.render(), 10000);
+            } else {
+                this._pollInterval = setInterval(() => this.refresh(), 10000);
+            }
         },
 
         ui: {
             _formatUptime: function(startTs, nowTs) {
                 if (!startTs || startTs === 0) return '';
-                const secs = nowTs - startTs;
+                const elapsed = Math.floor((Date.now() - services._receivedAt) / 1000);
+                const secs = nowTs + Math.max(0, elapsed) - startTs;
                 if (secs < 60) return `${secs}s`;
                 if (secs < 3600) return `${Math.floor(secs / 60)}m ${secs % 60}s`;
                 const h = Math.floor(secs / 3600);
@@ -1510,7 +1533,8 @@ window.InstancePortal = (function() {
             logConsole: 'log-console',
             pauseButton: 'pause-button',
             copyButton: 'copyLogsBtn',
-            downloadButton: 'downloadLogsBtn'
+            downloadButton: 'downloadLogsBtn',
+            fileSelect: 'log-file-select'
         },
         
         // Connection state
@@ -1520,6 +1544,14 @@ window.InstancePortal = (function() {
         lastSpansByFile: {},  // file -> [span, ...] array for per-file overwrite tracking
         _activeOverwrites: new Set(),  // files currently in overwrite (progress bar) mode
         _unpinTimers: {},  // file -> timeout ID for auto-unpin
+        _blockFiles: new Set(),  // files with a live progress block (lastSpansByFile holds its rows)
+
+        // Single-file view: older history is paged in from /logs/{file}
+        selectedFile: '',  // '' = all files (live interleaved stream)
+        historyStart: null,  // byte offset of the oldest loaded line, null = start of file reached
+        historyLines: 0,  // older lines paged in; exempt from maxLogLines trimming
+        loadingHistory: false,
+        readingHistory: false,  // user scrolled up: don't yank them to the bottom
         
         // Connection management
         reconnectTimer: null,
@@ -1574,7 +1606,7 @@ window.InstancePortal = (function() {
         
         // Scroll to bottom of logs
         scrollToBottom: function() {
-            if (!this.isPaused) {
+            if (!this.isPaused && !this.readingHistory) {
                 const logConsole = document.getElementById(this.elements.logConsole);
                 if (logConsole) {
                     logConsole.scrollTop = logConsole.scrollHeight;
@@ -1674,13 +1706,14 @@ window.InstancePortal = (function() {
         // Trim log console to maxLogLines, skipping actively-tracked spans
         // (progress bars / blocks). Active spans are pinned at the bottom.
         _trimLog: function(logConsole) {
-            const excess = logConsole.childElementCount - this.maxLogLines;
+            const maxLines = this.maxLogLines + this.historyLines;
+            const excess = logConsole.childElementCount - maxLines;
             if (excess <= 0) return;
             const active = this._getActiveSpans();
             let removed = 0;
             // Limit iterations to avoid infinite loops if all spans are active
             let maxIter = excess + active.size;
-            while (logConsole.childElementCount > this.maxLogLines && maxIter-- > 0) {
+            while (logConsole.childElementCount > maxLines && maxIter-- > 0) {
                 const first = logConsole.firstChild;
                 if (!first) break;
                 if (active.has(first)) {
@@ -1738,6 +1771,7 @@ window.InstancePortal = (function() {
 
             const span = document.createElement('span');
             span.innerHTML = html;
+            if (file) span.dataset.file = file;
             const anchor = this._pinnedAnchor(logConsole);
             if (anchor) {
                 logConsole.insertBefore(span, anchor);
@@ -1746,8 +1780,10 @@ window.InstancePortal = (function() {
             }
             if (file) {
                 const oldSpans = this.lastSpansByFile[file];
-                if (oldSpans && oldSpans.length > 1) {
-                    // Block-to-line transition: remove old block spans
+                if (oldSpans && (oldSpans.length > 1 || this._blockFiles.has(file))) {
+                    // A block that was never committed (file truncated or
+                    // replaced, or we missed the commit): drop its stale rows
+                    this._blockFiles.delete(file);
                     for (const s of oldSpans) {
                         if (s !== span && s.parentNode === logConsole) {
                             logConsole.removeChild(s);
@@ -1782,6 +1818,7 @@ window.InstancePortal = (function() {
             if (target && target.parentNode === logConsole) {
                 target.innerHTML = html;
                 // Clean up block-to-line transition: remove stale block spans
+                if (file) this._blockFiles.delete(file);
                 if (file && spans.length > 1) {
                     for (let i = 0; i < spans.length - 1; i++) {
                         if (spans[i].parentNode === logConsole) {
@@ -1808,47 +1845,131 @@ window.InstancePortal = (function() {
             this.scrollToBottom();
         },
 
-        // Overwrite a multi-line block for a specific file (nested progress bars)
-        overwriteBlock: function(htmlLines, file) {
+        // Remove the `count` most recent lines of `file` from the console
+        _removeRecentLines: function(logConsole, file, count) {
+            let node = logConsole.lastElementChild;
+            while (node && count > 0) {
+                const prev = node.previousElementSibling;
+                if (node.dataset && node.dataset.file === file) {
+                    logConsole.removeChild(node);
+                    count--;
+                }
+                node = prev;
+            }
+        },
+
+        // Resize a file's block spans to htmlLines and fill them in
+        _setBlockSpans: function(logConsole, spans, htmlLines, file) {
+            // Shrink excess spans
+            while (spans.length > htmlLines.length) {
+                const span = spans.pop();
+                if (span.parentNode === logConsole) logConsole.removeChild(span);
+            }
+            // Update existing spans
+            for (let i = 0; i < spans.length; i++) {
+                spans[i].innerHTML = htmlLines[i];
+            }
+            // Grow: add new spans after last existing (or in the pinned zone)
+            const anchor = spans.length > 0 ? spans[spans.length - 1].nextSibling : null;
+            while (spans.length < htmlLines.length) {
+                const span = document.createElement('span');
+                span.innerHTML = htmlLines[spans.length];
+                span.dataset.file = file;
+                logConsole.insertBefore(span, anchor);
+                spans.push(span);
+            }
+        },
+
+        // Overwrite a multi-line block for a specific file (nested progress bars).
+        // When the block is new to us, its first `replace` rows take over the
+        // file's most recent lines, which were sent before the cursor moved up.
+        overwriteBlock: function(htmlLines, file, replace) {
             if (this.isPaused) return;
             const logConsole = document.getElementById(this.elements.logConsole);
             if (!logConsole) return;
 
-            const existing = this.lastSpansByFile[file];
-            if (existing && existing.length > 0 && existing[0].parentNode === logConsole) {
-                // Shrink excess spans
-                while (existing.length > htmlLines.length) {
-                    logConsole.removeChild(existing.pop());
-                }
-                // Update existing spans
-                for (let i = 0; i < existing.length; i++) {
-                    existing[i].innerHTML = htmlLines[i];
-                }
-                // Grow: add new spans after last existing
-                const anchor = existing[existing.length - 1].nextSibling;
-                while (existing.length < htmlLines.length) {
-                    const span = document.createElement('span');
-                    span.innerHTML = htmlLines[existing.length];
-                    logConsole.insertBefore(span, anchor);
-                    existing.push(span);
-                }
-                if (!this._activeOverwrites.has(file)) {
-                    // First block overwrite — move spans to pinned zone
-                    for (const s of existing) logConsole.appendChild(s);
-                }
-                this._activeOverwrites.add(file);
-                this._scheduleUnpin(file);
+            if (!this._blockFiles.has(file)) {
+                if (replace) this._removeRecentLines(logConsole, file, replace);
+                this.lastSpansByFile[file] = [];
+                this._blockFiles.add(file);
+                // First block overwrite — spans go to the pinned zone
+                this._activeOverwrites.delete(file);
+            }
+            const spans = this.lastSpansByFile[file];
+            this._setBlockSpans(logConsole, spans, htmlLines, file);
+            if (!this._activeOverwrites.has(file)) {
+                for (const s of spans) logConsole.appendChild(s);
+            }
+            this._activeOverwrites.add(file);
+            this._scheduleUnpin(file);
+
+            this._trimLog(logConsole);
+            this.scrollToBottom();
+        },
+
+        // Update only the redrawn rows of a file's live block
+        overwriteRows: function(rows, file) {
+            if (this.isPaused || !this._blockFiles.has(file)) return;
+            const spans = this.lastSpansByFile[file];
+            if (!spans) return;
+            for (const [index, html] of rows) {
+                if (spans[index]) spans[index].innerHTML = html;
+            }
+            this._activeOverwrites.add(file);
+            this._scheduleUnpin(file);
+            this.scrollToBottom();
+        },
+
+        // A block finished: its final rows stay where they are as plain lines
+        commitBlock: function(htmlLines, file) {
+            if (this.isPaused) return;
+            const logConsole = document.getElementById(this.elements.logConsole);
+            if (!logConsole) return;
+
+            if (!this._blockFiles.has(file)) {
+                for (const html of htmlLines) this.appendLog(html, file);
+                return;
+            }
+            const spans = this.lastSpansByFile[file];
+            this._setBlockSpans(logConsole, spans, htmlLines, file);
+            this._blockFiles.delete(file);
+            this._activeOverwrites.delete(file);
+            clearTimeout(this._unpinTimers[file]);
+            delete this._unpinTimers[file];
+            if (spans.length > 0) {
+                this.lastSpansByFile[file] = [spans[spans.length - 1]];
             } else {
-                // Create fresh block
-                const spans = htmlLines.map(html => {
-                    const span = document.createElement('span');
-                    span.innerHTML = html;
-                    logConsole.appendChild(span);
-                    return span;
-                });
-                this.lastSpansByFile[file] = spans;
-                this._activeOverwrites.add(file);
-                this._scheduleUnpin(file);
+                delete this.lastSpansByFile[file];
+            }
+
+            this._trimLog(logConsole);
+            this.scrollToBottom();
+        },
+
+        // Replay the server's history frame (sent once on connect) in one
+        // DOM pass instead of one append + trim per line. `files` is the
+        // file of every line, or one file for all of them; spans carry it
+        // as appendLog's do, so a block starting next can take them over.
+        appendHistory: function(htmlLines, files) {
+            if (this.isPaused || !htmlLines || htmlLines.length === 0) return;
+
+            const logConsole = document.getElementById(this.elements.logConsole);
+            if (!logConsole) return;
+
+            const fragment = document.createDocumentFragment();
+            const start = Math.max(0, htmlLines.length - this.maxLogLines);
+            for (let i = start; i < htmlLines.length; i++) {
+                const span = document.createElement('span');
+                span.innerHTML = htmlLines[i];
+                const file = Array.isArray(files) ? files[i] : files;
+                if (file) span.dataset.file = file;
+                fragment.appendChild(span);
+            }
+            const anchor = this._pinnedAnchor(logConsole);
+            if (anchor) {
+                logConsole.insertBefore(fragment, anchor);
+            } else {
+                logConsole.appendChild(fragment);
             }
 
             this._trimLog(logConsole);
@@ -1871,6 +1992,137 @@ window.InstancePortal = (function() {
             this.scrollToBottom();
         },
         
+        // Dispatch a single decoded log message
+        handleMessage: function(msg) {
+            const file = msg.file || '';
+            if (this.selectedFile && msg.type !== 'system' && file !== this.selectedFile) {
+                // Single-file view: history comes from disk, other files are hidden
+                return;
+            }
+            if (msg.type === 'overwrite_block') {
+                this.overwriteBlock(msg.lines, file, msg.replace || 0);
+            } else if (msg.type === 'overwrite_rows') {
+                this.overwriteRows(msg.rows, file);
+            } else if (msg.type === 'commit_block') {
+                this.commitBlock(msg.lines, file);
+            } else if (msg.type === 'overwrite') {
+                this.overwriteLog(msg.html, file);
+            } else if (msg.type === 'history') {
+                // In single-file view the history was already loaded from disk
+                if (!this.selectedFile) this.appendHistory(msg.lines, msg.files || file);
+            } else if (msg.type === 'system') {
+                this.appendSystemMessage(msg.html);
+            } else if (msg.type === 'subscribed') {
+                // Acknowledges _subscribeSelected; nothing to render
+            } else if (msg.type === 'error') {
+                console.error('Log stream error:', msg.detail);
+            } else {
+                this.appendLog(msg.html, file);
+            }
+        },
+
+        // Refresh the file selector from /logs, keeping the current choice
+        loadFileList: async function() {
+            const select = document.getElementById(this.elements.fileSelect);
+            if (!select) return;
+            try {
+                const response = await fetch('/logs');
+                if (!response.ok) return;
+                const files = await response.json();
+                const current = this.selectedFile;
+                select.innerHTML = '<option value="">All logs</option>';
+                for (const f of files) {
+                    const option = document.createElement('option');
+                    option.value = f.file;
+                    option.textContent = f.file;
+                    select.appendChild(option);
+                }
+                select.value = current;
+            } catch (error) {
+                console.error('Error listing log files:', error);
+            }
+        },
+
+        _resetConsole: function() {
+            const logConsole = document.getElementById(this.elements.logConsole);
+            if (logConsole) logConsole.innerHTML = '';
+            this.lastSpansByFile = {};
+            this._activeOverwrites.clear();
+            this._blockFiles.clear();
+            for (const file in this._unpinTimers) clearTimeout(this._unpinTimers[file]);
+            this._unpinTimers = {};
+            this.historyStart = null;
+            this.historyLines = 0;
+            this.readingHistory = false;
+        },
+
+        // In single-file view only that file's frames are worth sending;
+        // its history comes from disk, so the server need not replay it
+        _subscribeSelected: function() {
+            if (!this.selectedFile || !this.webSocket || this.webSocket.readyState !== WebSocket.OPEN) return;
+            this.webSocket.send(JSON.stringify({subscribe: [this.selectedFile], replay: false}));
+        },
+
+        // Switch between the live all-files stream and a single file
+        selectFile: async function(file) {
+            this.selectedFile = file;
+            this._resetConsole();
+            if (!file) {
+                // Reconnect so the server replays the interleaved history
+                this.reconnect();
+                return;
+            }
+            this._subscribeSelected();
+            const page = await this._fetchPage(file, null);
+            if (page && this.selectedFile === file) {
+                this.appendHistory(page.lines, file);
+                this.historyStart = page.has_more ? page.start : null;
+            }
+        },
+
+        _fetchPage: async function(file, before) {
+            let url = `/logs/${encodeURIComponent(file)}?format=html&limit=${this.maxLogLines}`;
+            if (before !== null) url += `&before=${before}`;
+            try {
+                const response = await fetch(url);
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return await response.json();
+            } catch (error) {
+                console.error('Error loading log history:', error);
+                window.app.showToast(`Error loading log history: ${error.message}`, 'error');
+                return null;
+            }
+        },
+
+        // Prepend the next older page of the selected file (on scroll to top)
+        loadOlderHistory: async function() {
+            if (!this.selectedFile || this.historyStart === null || this.loadingHistory) return;
+            const logConsole = document.getElementById(this.elements.logConsole);
+            if (!logConsole) return;
+
+            this.loadingHistory = true;
+            const file = this.selectedFile;
+            try {
+                const page = await this._fetchPage(file, this.historyStart);
+                if (!page || this.selectedFile !== file) return;
+                const fragment = document.createDocumentFragment();
+                for (const html of page.lines) {
+                    const span = document.createElement('span');
+                    span.innerHTML = html;
+                    span.dataset.file = file;
+                    fragment.appendChild(span);
+                }
+                // Keep the lines the user is looking at in place
+                const previousHeight = logConsole.scrollHeight;
+                logConsole.insertBefore(fragment, logConsole.firstChild);
+                logConsole.scrollTop += logConsole.scrollHeight - previousHeight;
+                this.historyLines += page.lines.length;
+                this.historyStart = page.has_more ? page.start : null;
+            } finally {
+                this.loadingHistory = false;
+            }
+        },
+
         // Setup connection monitoring
         setupConnectionMonitoring: function() {
             // Clear existing timers
@@ -1953,6 +2205,7 @@ window.InstancePortal = (function() {
                     
                     // Set up connection monitoring
                     this.setupConnectionMonitoring();
+                    this._subscribeSelected();
                     
                     // Add a system message
                     const now = new Date().toLocaleTimeString();
@@ -1978,21 +2231,19 @@ window.InstancePortal = (function() {
                     
                     // Handle regular log messages
                     if (!this.isPaused && data) {
+                        let msg;
                         try {
-                            const msg = JSON.parse(data);
-                            const file = msg.file || '';
-                            if (msg.type === 'overwrite_block') {
-                                this.overwriteBlock(msg.lines, file);
-                            } else if (msg.type === 'overwrite') {
-                                this.overwriteLog(msg.html, file);
-                            } else if (msg.type === 'system') {
-                                this.appendSystemMessage(msg.html);
-                            } else {
-                                this.appendLog(msg.html, file);
-                            }
+                            msg = JSON.parse(data);
                         } catch (e) {
                             // Fallback for non-JSON messages (legacy)
                             this.appendLog(data, '');
+                            return;
+                        }
+                        if (msg.type === 'batch') {
+                            // One frame per server flush tick
+                            for (const m of msg.messages) this.handleMessage(m);
+                        } else {
+                            this.handleMessage(msg);
                         }
                     }
                 });
@@ -2111,6 +2362,26 @@ window.InstancePortal = (function() {
             if (downloadBtn) {
                 downloadBtn.addEventListener('click', () => this.downloadLogs());
             }
+
+            // Set up the single-file selector (list refreshed whenever it is opened)
+            const fileSelect = document.getElementById(this.elements.fileSelect);
+            if (fileSelect) {
+                fileSelect.addEventListener('focus', () => this.loadFileList());
+                fileSelect.addEventListener('change', () => this.selectFile(fileSelect.value));
+            }
+
+            // Lazy-load older history when a single file is scrolled to the top
+            const logConsole = document.getElementById(this.elements.logConsole);
+            if (logConsole) {
+                logConsole.addEventListener('scroll', () => {
+                    if (!this.selectedFile) return;
+                    const fromBottom = logConsole.scrollHeight - logConsole.scrollTop - logConsole.clientHeight;
+                    this.readingHistory = fromBottom > 50;
+                    if (logConsole.scrollTop < 50) {
+                        this.loadOlderHistory();
+                    }
+                });
+            }
             
             // Handle visibility change to reconnect when tab becomes visible
             document.addEventListener('visibilitychange', () => {
@@ -2136,6 +2407,7 @@ window.InstancePortal = (function() {
         // Initialize the log manager
         init: function() {
             this.setupEventListeners();
+            this.loadFileList();
             this.connect();
             return this;
         }
@@ -0,0 +1,22 @@
+"""Supervisor access for the instance portal.
+
+The portal lists, starts and stops the supervisord programs that run the
+instance's services. ``SupervisorClient`` talks to supervisord's XML-RPC
+API over its Unix socket, reusing connections, and ``SupervisorMonitor``
+keeps one shared, change-notifying view of process states so browsers can
+be pushed updates instead of each polling.
+
+Like ``capabilities``, ``logstream`` and ``telemetry`` this package is
+import-clean: it never imports the portal app and depends on nothing beyond
+the standard library.
+"""
+
+from .client import SupervisorClient
+from .monitor import SupervisorMonitor, format_processes, hidden_programs
+
+__all__ = [
+    "SupervisorClient",
+    "SupervisorMonitor",
+    "format_processes",
+    "hidden_programs",
+]
@@ -0,0 +1,243 @@
+"""Start, stop and restart many supervisor programs in one request.
+
+Restarting a group of inference workers one program per request is N round
+trips, and each restart waited out a full stop before the next began. A
+batch instead:
+
+1. resolves every action against one ``getAllProcessInfo`` read, so unknown
+   names and ``unstoppable`` programs are refused before anything runs;
+2. stops everything that is to stop or restart in one ``system.multicall``
+   with ``wait=False`` (``stopProcessGroup`` for whole groups), so programs
+   wind down in parallel, and waits until all of them are down;
+3. starts everything that is to start or restart in a second multicall;
+4. optionally waits for RUNNING.
+
+Waiting follows the same readiness rules as the image's test library
+(``assert_service_running``): one wall-clock deadline covers the whole
+batch, RUNNING is the only ready state, and FATAL is terminal and reported
+at once rather than waited out.
+
+Restarting an unstoppable program (the portal itself, caddy, the tunnel
+manager) cannot go through XML-RPC — stopping the portal would kill the
+request doing the restart — so those are handed to ``detached_restart``.
+They run after the batch returns and are never waited for, even with
+``wait``; their results say so in ``detail``.
+"""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Callable, Collection, Iterable, Optional
+
+from .client import SupervisorClient
+
+ACTIONS = ("start", "stop", "restart")
+DOWN_STATES = frozenset({"STOPPED", "EXITED", "FATAL"})
+DEFAULT_TIMEOUT = 60.0   # Seconds for the whole batch, stops and starts together
+POLL_INTERVAL = 0.5
+
+# supervisor.xmlrpc.Faults
+_SUCCESS = 80
+_ALREADY_STARTED = 60
+_NOT_RUNNING = 70
+
+
+class BatchError(ValueError):
+    """The batch itself is malformed (as opposed to one of its actions failing)."""
+
+
+@dataclass
+class Action:
+    """One action on a program (``name``, optionally ``group:name``) or a whole ``group``."""
+
+    action: str
+    name: Optional[str] = None
+    group: Optional[str] = None
+
+    def __post_init__(self):
+        if self.action not in ACTIONS:
+            raise BatchError(f"unknown action {self.action!r}; expected one of {', '.join(ACTIONS)}")
+        if bool(self.name) == bool(self.group):
+            raise BatchError("each action needs exactly one of 'name' or 'group'")
+
+    @property
+    def target(self) -> str:
+        return self.name or f"{self.group}:*"
+
+
+def _full_name(info: dict) -> str:
+    return info["name"] if info["group"] == info["name"] else f"{info['group']}:{info['name']}"
+
+
+def _resolve(action: Action, processes: list[dict]) -> list[dict]:
+    if action.group:
+        return [p for p in processes if p["group"] == action.group]
+    exact = [p for p in processes if _full_name(p) == action.name]
+    if exact:
+        return exact
+    members = [p for p in processes if p["name"] == action.name]
+    if len(members) > 1:
+        # One action must not silently reach same-named programs in every group
+        raise BatchError(
+            f"{action.name!r} is in several groups ({', '.join(sorted(p['group'] for p in members))}); "
+            f"use group:name"
+        )
+    return members
+
+
+def _fault(value) -> Optional[tuple[int, str]]:
+    # multicall reports a failed call as a fault struct in place of its result
+    if isinstance(value, dict) and "faultCode" in value:
+        return value["faultCode"], value["faultString"]
+    return None
+
+
+def _states(client: SupervisorClient) -> dict[str, str]:
+    return {_full_name(p): p["statename"] for p in client.call("supervisor.getAllProcessInfo")}
+
+
+class _Step:
+    """An action, the programs it resolved to, and one result per program."""
+
+    def __init__(self, action: Action, members: list[dict]):
+        self.action = action
+        self.members = members
+        self.results = {
+            _full_name(p): {"action": action.action, "target": action.target, "name": _full_name(p),
+                            "status": "ok", "state": None, "detail": ""}
+            for p in members
+        } or {
+            action.target: {"action": action.action, "target": action.target, "name": action.target,
+                            "status": "error", "state": None, "detail": "not found"}
+        }
+
+    def fail(self, detail: str, names: Optional[Iterable[str]] = None) -> None:
+        for name in self.results if names is None else names:
+            if name in self.results:
+                self.results[name].update(status="error", detail=detail)
+
+    def ok(self) -> set[str]:
+        """Programs nothing has gone wrong for yet."""
+        return {n for n, r in self.results.items() if r["status"] == "ok"}
+
+
+def _submit(client: SupervisorClient, method: str, steps: list[_Step], tolerated: int) -> None:
+    """One multicall of ``<method>Process`` / ``<method>ProcessGroup``, without waiting.
+
+    ``tolerated`` is the fault that means there was nothing to do
+    (ALREADY_STARTED for a start, NOT_RUNNING for a stop).
+    """
+    calls = []   # (step, program or None for a group, call)
+    for step in steps:
+        if step.action.group:
+            calls.append((step, None, {"methodName": f"supervisor.{method}ProcessGroup",
+                                       "params": [step.action.group, False]}))
+        else:
+            for p in step.members:
+                calls.append((step, _full_name(p), {"methodName": f"supervisor.{method}Process",
+                                                    "params": [_full_name(p), False]}))
+    if not calls:
+        return
+    values = client.call("system.multicall", [call for _, _, call in calls])
+    for (step, name, _), value in zip(calls, values):
+        fault = _fault(value)
+        if fault:
+            if fault[0] != tolerated:
+                step.fail(fault[1], None if name is None else [name])
+        elif name is None:
+            # Group calls answer per member: {name, group, status, description}
+            for item in value:
+                if item["status"] not in (_SUCCESS, tolerated):
+                    step.fail(item["description"], [_full_name(item)])
+
+
+def run_batch(
+    client: SupervisorClient,
+    actions: Iterable[Action],
+    *,
+    unstoppable: Collection[str] = (),
+    wait: bool = False,
+    timeout: float = DEFAULT_TIMEOUT,
+    detached_restart: Optional[Callable[[str], None]] = None,
+    poll: float = POLL_INTERVAL,
+    clock: Callable[[], float] = time.monotonic,
+    sleep: Callable[[float], None] = time.sleep,
+) -> list[dict]:
+    """Run ``actions`` and return one result per affected program.
+
+    Each result is ``{"action", "target", "name", "status", "state", "detail"}``
+    where ``status`` is ``"ok"`` or ``"error"``. Per-program failures never
+    raise; errors reaching supervisor at all do, and so does a bare program
+    name that exists in more than one group (``BatchError``).
+    """
+    actions = list(actions)
+    if not actions:
+        raise BatchError("no actions given")
+    deadline = clock() + timeout
+    processes = client.call("supervisor.getAllProcessInfo")
+
+    # --- 1. resolve and refuse ----------------------------------------------- #
+    steps = [_Step(action, _resolve(action, processes)) for action in actions]
+    stops: list[_Step] = []
+    starts: list[_Step] = []
+    detached: list[_Step] = []
+    for step in steps:
+        if not step.members:
+            continue
+        protected = [p["name"] for p in step.members if p["name"] in unstoppable]
+        if protected and step.action.action == "stop":
+            step.fail(f"cannot be stopped ({', '.join(protected)})")
+        elif protected and step.action.action == "restart":
+            detached.append(step)
+        else:
+            if step.action.action in ("stop", "restart"):
+                stops.append(step)
+            if step.action.action in ("start", "restart"):
+                starts.append(step)
+
+    def wait_for(names: set[str], ready: Callable[[str], bool]) -> dict[str, str]:
+        states = _states(client)
+        while not all(ready(states.get(n, "")) for n in names) and clock() < deadline:
+            sleep(poll)
+            states = _states(client)
+        return states
+
+    # --- 2. stop, in parallel ------------------------------------------------ #
+    _submit(client, "stop", stops, _NOT_RUNNING)
+    # A restart must be down before it can start; a stop only if asked to wait
+    awaited = [s for s in stops if s.action.action == "restart" or wait]
+    down = set().union(*(s.ok() for s in awaited))
+    if down:
+        states = wait_for(down, lambda state: state in DOWN_STATES)
+        for step in awaited:
+            step.fail(f"not stopped after {timeout:g}s", {n for n in step.ok() if states.get(n) not in DOWN_STATES})
+
+    # --- 3. start, in parallel ----------------------------------------------- #
+    starts = [s for s in starts if s.ok() == set(s.results)]
+    _submit(client, "start", starts, _ALREADY_STARTED)
+    for step in detached:
+        if detached_restart is None:
+            step.fail("cannot be restarted here")
+            continue
+        detached_restart(step.action.target)
+        for result in step.results.values():
+            result["detail"] = "restart handed to supervisorctl" + (", not waited for" if wait else "")
+
+    # --- 4. wait for RUNNING ------------------------------------------------- #
+    starting = set().union(*(s.ok() for s in starts))
+    if wait and starting:
+        states = wait_for(starting, lambda state: state in ("RUNNING", "FATAL"))
+        for step in starts:
+            for name in step.ok():
+                if states.get(name) == "FATAL":
+                    step.fail("entered FATAL and will not start", [name])
+                elif states.get(name) != "RUNNING":
+                    step.fail(f"not running after {timeout:g}s", [name])
+    else:
+        states = _states(client)
+
+    results = [r for step in steps for r in step.results.values()]
+    for result in results:
+        result["state"] = states.get(result["name"])
+    return results
@@ -0,0 +1,113 @@
+"""XML-RPC client for supervisord's Unix socket with connection reuse.
+
+``xmlrpc.client.Transport`` already keeps an HTTP/1.1 connection alive
+between calls (and retries once when a cached connection has gone cold),
+but only if ``make_connection`` hands back the cached connection; the
+portal used to build a new proxy, and so a new socket, for every call.
+
+A ``ServerProxy`` is not safe to share between threads, and some calls
+block for seconds (``stopProcess`` waits for the program to exit), so
+``SupervisorClient`` keeps a small pool of idle proxies: a call borrows
+one, and a slow stop never holds up a status read.
+"""
+
+from __future__ import annotations
+
+import http.client
+import socket
+import threading
+import xmlrpc.client
+from typing import Optional
+
+DEFAULT_SOCKET = "/var/run/supervisor.sock"
+POOL_SIZE = 4   # Idle connections kept for reuse
+
+
+class _UnixStreamHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix domain socket."""
+
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        super().__init__("localhost")
+        self._path = path
+        self._socket_timeout = timeout
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self._socket_timeout)
+        try:
+            sock.connect(self._path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class _UnixStreamTransport(xmlrpc.client.Transport):
+    """Transport that keeps its Unix socket connection open between calls."""
+
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        super().__init__()
+        self._path = path
+        self._timeout = timeout
+        self.connects = 0
+
+    def make_connection(self, host):
+        if self._connection and host == self._connection[0]:
+            return self._connection[1]
+        self.connects += 1
+        self._connection = host, _UnixStreamHTTPConnection(self._path, self._timeout)
+        return self._connection[1]
+
+
+class SupervisorClient:
+    """Calls supervisord's XML-RPC API over a pool of kept-alive connections.
+
+    ``timeout`` applies to each socket operation; the default None matches
+    what supervisorctl does, since ``stopProcess`` legitimately waits for
+    a program's ``stopwaitsecs``.
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, *, timeout: Optional[float] = None, pool_size: int = POOL_SIZE):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._idle: list[xmlrpc.client.ServerProxy] = []
+        self._lock = threading.Lock()
+
+    def _proxy(self) -> xmlrpc.client.ServerProxy:
+        return xmlrpc.client.ServerProxy(
+            "http://localhost",
+            transport=_UnixStreamTransport(self.socket_path, self.timeout),
+        )
+
+    def call(self, method: str, *args):
+        """Call ``method`` (e.g. ``"supervisor.getAllProcessInfo"``) with ``args``."""
+        with self._lock:
+            proxy = self._idle.pop() if self._idle else None
+        if proxy is None:
+            proxy = self._proxy()
+        try:
+            result = getattr(proxy, method)(*args)
+        except xmlrpc.client.Fault:
+            # A fault is a well-formed response; the connection is still good
+            self._release(proxy)
+            raise
+        except BaseException:
+            proxy("close")()
+            raise
+        self._release(proxy)
+        return result
+
+    def _release(self, proxy: xmlrpc.client.ServerProxy) -> None:
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(proxy)
+                return
+        proxy("close")()
+
+    def close(self) -> None:
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for proxy in idle:
+            proxy("close")()
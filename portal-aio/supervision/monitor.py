@@ -0,0 +1,212 @@
+"""One shared view of supervisor's process states, pushed on change.
+
+Every portal tab used to poll ``/supervisor/processes`` on its own, and each
+poll was a fresh XML-RPC connection plus an ``os.path.isfile`` per program
+for skip markers. A ``SupervisorMonitor`` reads the process list once for
+everyone:
+
+* ``get``/``current`` answer from the last read while it is younger than
+  ``max_age``, sharing one read between concurrent callers;
+* ``run`` polls every ``interval`` seconds, but only while something is
+  subscribed, and ``subscribe`` hands out queues that receive the list
+  each time a program changes state.
+
+supervisord's own event notifications (``PROCESS_STATE_*``) only reach
+``[eventlistener:x]`` child processes over their stdin, so they cannot be
+subscribed to from the portal directly; one poll per interval over a
+kept-alive socket costs the same however many browsers are watching.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import copy
+import logging
+import os
+import re
+import threading
+import time
+from typing import AsyncIterator, Callable, Collection, Iterable, Mapping, Optional
+
+logger = logging.getLogger("log_monitor")
+
+SKIP_DIR = "/tmp/supervisor-skip"   # Programs that skipped startup leave a marker here
+DEFAULT_INTERVAL = 1.0              # Seconds between polls while someone is subscribed
+DEFAULT_MAX_AGE = 1.0               # Seconds a read answers get()/current()
+
+# Fields that change on every read without anything having happened
+_VOLATILE = ("now",)
+# RUNNING programs are described as "pid N, uptime H:MM:SS", which ticks too
+_UPTIME_RE = re.compile(r",?\s*uptime [\d:]+(?: days?,? [\d:]+)?")
+
+
+def hidden_programs(skip_dir: str = SKIP_DIR) -> set[str]:
+    """Programs with a skip marker; one directory read instead of a stat per program."""
+    try:
+        return set(os.listdir(skip_dir))
+    except OSError:
+        return set()
+
+
+def format_processes(
+    all_info: Iterable[Mapping],
+    *,
+    hidden: Collection[str] = (),
+    unstoppable: Collection[str] = (),
+) -> list[dict]:
+    """``getAllProcessInfo`` entries in the portal's shape, minus ``hidden`` programs."""
+    result = []
+    for proc in all_info:
+        if proc["name"] in hidden:
+            continue
+        result.append({
+            "name": proc["name"],
+            "group": proc["group"],
+            "state": proc["statename"],
+            "description": proc.get("description", ""),
+            "pid": proc.get("pid", 0),
+            "start": proc.get("start", 0),
+            "now": proc.get("now", 0),
+            "unstoppable": proc["name"] in unstoppable,
+        })
+    return result
+
+
+def _signature(processes: list[dict]) -> list[dict]:
+    return [
+        {k: _UPTIME_RE.sub("", v) if k == "description" else v for k, v in p.items() if k not in _VOLATILE}
+        for p in processes
+    ]
+
+
+class SupervisorMonitor:
+    """Caches ``read()`` and pushes its result to subscribers when it changes."""
+
+    def __init__(
+        self,
+        read: Callable[[], list],
+        *,
+        interval: float = DEFAULT_INTERVAL,
+        max_age: float = DEFAULT_MAX_AGE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self._read = read
+        self.interval = interval
+        self.max_age = max_age
+        self._clock = clock
+        self.processes: Optional[list] = None
+        self.read_at: Optional[float] = None
+        self.version = 0            # Bumped each time the states change
+        self.reads = 0
+        self._signature: Optional[list] = None
+        self._read_lock = threading.Lock()
+        self._pending: Optional[asyncio.Future] = None
+        self._subscribers: set[asyncio.Queue] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    def _fresh(self, max_age: float) -> bool:
+        return self.read_at is not None and self._clock() - self.read_at < max_age
+
+    def refresh(self, max_age: float = 0) -> list:
+        """Read now (blocking) unless another thread just did; returns a copy."""
+        with self._read_lock:
+            if not self._fresh(max_age):
+                processes = self._read()
+                self.reads += 1
+                self.read_at = self._clock()
+                self.processes = processes
+                signature = _signature(processes)
+                if signature != self._signature:
+                    self._signature = signature
+                    self.version += 1
+                    self._notify()
+            return copy.deepcopy(self.processes)
+
+    def current(self, max_age: Optional[float] = None) -> list:
+        """The process list, at most ``max_age`` old, for callers in a worker thread."""
+        return self.refresh(self.max_age if max_age is None else max_age)
+
+    async def get(self, max_age: Optional[float] = None) -> list:
+        """The process list, at most ``max_age`` old; concurrent callers share a read."""
+        max_age = self.max_age if max_age is None else max_age
+        if self._fresh(max_age):
+            return copy.deepcopy(self.processes)
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(asyncio.to_thread(self.refresh, max_age))
+            self._pending.add_done_callback(self._clear_pending)
+        return copy.deepcopy(await asyncio.shield(self._pending))
+
+    def _clear_pending(self, future: asyncio.Future) -> None:
+        if self._pending is future:
+            self._pending = None
+
+    def poke(self) -> None:
+        """Poll again as soon as possible, e.g. after starting or stopping a program."""
+        self.read_at = None
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    # --- push ---------------------------------------------------------------- #
+
+    def _notify(self) -> None:
+        # Called from whichever thread read; queues belong to the event loop
+        if self._loop is None or not self._subscribers:
+            return
+        processes = copy.deepcopy(self.processes)
+        try:
+            self._loop.call_soon_threadsafe(self._publish, self.version, processes)
+        except RuntimeError:   # Loop closed during shutdown
+            pass
+
+    def _publish(self, version: int, processes: list) -> None:
+        for queue in self._subscribers:
+            # Only the newest list matters to a subscriber that is behind
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait((version, processes))
+
+    def _bind(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._wake = asyncio.Event()
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self) -> AsyncIterator[asyncio.Queue]:
+        """A queue of ``(version, processes)``, starting with the current list."""
+        self._bind()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self._subscribers.add(queue)
+        if self.processes is not None:
+            queue.put_nowait((self.version, copy.deepcopy(self.processes)))
+        self._wake.set()
+        try:
+            yield queue
+        finally:
+            self._subscribers.discard(queue)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    async def run(self) -> None:
+        """Poll every ``interval`` while anyone is subscribed; idle otherwise."""
+        self._bind()
+        while True:
+            if not self._subscribers:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            self._wake.clear()
+            try:
+                await self.get(max_age=self.interval / 2)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug(f"Supervisor poll failed: {e}")
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), self.interval)
@@ -0,0 +1,33 @@
+"""System telemetry for the instance portal.
+
+Metrics are sampled in the background rather than per request: a
+``MetricsSampler`` collects them at a fixed interval in a worker thread and
+keeps the latest sample plus a fixed-size ``RingSeries`` of recent values,
+so serving ``/system-metrics`` is a dictionary read and
+``/system-metrics/history`` a slice of preallocated arrays.
+
+Like ``capabilities`` and ``logstream`` this package is import-clean: it
+never imports the portal app and depends on nothing beyond the standard
+library. The portal supplies the function that actually collects a sample;
+GPU state comes from the pluggable providers in ``telemetry.gpu``, and
+``telemetry.processes`` maps GPU processes back to supervisor programs.
+"""
+
+from .gpu import GPU, FakeProvider, GPUProcess, GPUProvider, GPUTelemetry, GPUTelemetryError, MIGDevice
+from .processes import attribute_processes
+from .sampler import MetricsSampler
+from .series import RingSeries, parse_window
+
+__all__ = [
+    "FakeProvider",
+    "GPU",
+    "GPUProcess",
+    "GPUProvider",
+    "GPUTelemetry",
+    "GPUTelemetryError",
+    "MIGDevice",
+    "MetricsSampler",
+    "RingSeries",
+    "attribute_processes",
+    "parse_window",
+]
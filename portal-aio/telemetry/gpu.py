@@ -0,0 +1,617 @@
+"""GPU telemetry providers.
+
+Every consumer of GPU state in the portal (the metrics sampler, the GPU
+summary on the index page, the capability manifest) reads it through a
+``GPUTelemetry``, which holds whichever providers work on this machine:
+
+* ``NVMLProvider`` — NVIDIA, in process. Loads ``libnvidia-ml.so.1`` with
+  ctypes, initialises NVML once and keeps the device handles, so a full read
+  of every GPU is a few dozen library calls (well under a millisecond) rather
+  than a fork of ``nvidia-smi``.
+* ``GPUtilProvider`` — NVIDIA via GPUtil, which forks and parses
+  ``nvidia-smi``. Only used when NVML cannot be loaded.
+* ``RocmSmiProvider`` — AMD via ``rocm-smi --json``.
+* ``FakeProvider`` — returns fixed ``GPU`` records, for tests and GPU-less
+  development.
+
+``GPU_TELEMETRY`` (comma-separated provider names, default ``auto``) pins the
+choice. Fields a device or driver does not report are None rather than NaN.
+
+Providers that can also list the processes holding GPU memory (NVML and
+rocm-smi) return them as ``GPUProcess`` records; ``telemetry.processes``
+maps those back to the supervisor programs that started them.
+"""
+
+from __future__ import annotations
+
+import copy
+import ctypes
+import json
+import logging
+import math
+import os
+import shutil
+import subprocess
+import threading
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+logger = logging.getLogger("log_monitor")
+
+ROCM_SMI_TIMEOUT = 10   # Seconds
+
+
+class GPUTelemetryError(Exception):
+    """A provider could not be initialised or read."""
+
+
+@dataclass
+class MIGDevice:
+    """One MIG instance carved out of a GPU."""
+
+    gpu_instance: Optional[int]
+    uuid: Optional[str] = None
+    memory_used: Optional[float] = None    # MB
+    memory_total: Optional[float] = None   # MB
+
+
+@dataclass
+class GPU:
+    """One GPU as reported by a provider. Units are in the comments."""
+
+    index: int
+    name: str
+    vendor: str                            # "nvidia" or "amd"
+    uuid: Optional[str] = None
+    load: Optional[float] = None           # Utilization, percent
+    memory_used: Optional[float] = None    # MB
+    memory_total: Optional[float] = None   # MB
+    temperature: Optional[float] = None    # Celsius
+    power_draw: Optional[float] = None     # Watts
+    power_limit: Optional[float] = None    # Watts
+    clock_sm: Optional[int] = None         # MHz
+    clock_memory: Optional[int] = None     # MHz
+    ecc_errors: Optional[int] = None       # Uncorrected ECC errors since the driver loaded
+    mig: Optional[list[MIGDevice]] = None  # MIG instances; None unless MIG mode is on
+
+
+@dataclass
+class GPUProcess:
+    """A process holding memory on a GPU."""
+
+    pid: int
+    vendor: str
+    gpu: Optional[int] = None              # GPU index; None if the provider cannot say
+    memory_used: Optional[float] = None    # MB
+    gpu_instance: Optional[int] = None     # MIG GPU instance the process runs in
+    name: Optional[str] = None             # Process name, filled in by telemetry.processes
+    program: Optional[str] = None          # Owning supervisor program, likewise
+
+
+def _finite(value) -> Optional[float]:
+    """``value`` as a float, or None if it is missing, not a number, NaN or Inf."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+class GPUProvider:
+    """Interface for a source of GPU state."""
+
+    name = ""
+    kind = ""   # Key for this provider's errors in the metrics output
+
+    def gpus(self) -> list[GPU]:
+        """Read every GPU now. Raises on failure."""
+        raise NotImplementedError
+
+    def processes(self) -> list[GPUProcess]:
+        """Processes holding GPU memory, if the provider can list them."""
+        return []
+
+    def driver(self) -> dict:
+        """Whatever of ``driver_version`` / ``compute_capability`` is known."""
+        return {}
+
+    def close(self) -> None:
+        pass
+
+
+# --------------------------------------------------------------------------- #
+# NVML                                                                        #
+# --------------------------------------------------------------------------- #
+
+_NVML_SUCCESS = 0
+_NVML_ERROR_INSUFFICIENT_SIZE = 7
+_NVML_VALUE_NOT_AVAILABLE = 2**64 - 1   # usedGpuMemory when the driver cannot tell
+_NVML_NO_INSTANCE = 2**32 - 1           # gpuInstanceId outside MIG mode
+_NVML_DEVICE_MIG_ENABLE = 1
+_NVML_TEMPERATURE_GPU = 0
+_NVML_CLOCK_SM = 1
+_NVML_CLOCK_MEM = 2
+_NVML_MEMORY_ERROR_TYPE_UNCORRECTED = 1
+_NVML_VOLATILE_ECC = 0
+_NVML_STRING_BUFFER = 96
+
+
+class _NvmlUtilization(ctypes.Structure):
+    _fields_ = [("gpu", ctypes.c_uint), ("memory", ctypes.c_uint)]
+
+
+class _NvmlMemory(ctypes.Structure):
+    _fields_ = [("total", ctypes.c_ulonglong), ("free", ctypes.c_ulonglong), ("used", ctypes.c_ulonglong)]
+
+
+class _NvmlProcessInfo(ctypes.Structure):
+    # nvmlProcessInfo_v2_t, as taken by the _v2 and _v3 process queries
+    _fields_ = [
+        ("pid", ctypes.c_uint),
+        ("usedGpuMemory", ctypes.c_ulonglong),
+        ("gpuInstanceId", ctypes.c_uint),
+        ("computeInstanceId", ctypes.c_uint),
+    ]
+
+
+def _megabytes(value: int) -> float:
+    return round(value / (1024 * 1024), 2)
+
+
+class NVMLProvider(GPUProvider):
+    """NVIDIA GPUs through an NVML handle held for the life of the provider."""
+
+    name = "nvml"
+    kind = "nvidia"
+
+    def __init__(self, library: str = "libnvidia-ml.so.1"):
+        try:
+            self._lib = ctypes.CDLL(library)
+        except OSError as e:
+            raise GPUTelemetryError(f"cannot load {library}: {e}") from None
+        self._lib.nvmlErrorString.restype = ctypes.c_char_p
+        self._check(self._lib.nvmlInit_v2(), "nvmlInit")
+        self._lock = threading.Lock()
+        try:
+            count = ctypes.c_uint()
+            self._check(self._lib.nvmlDeviceGetCount_v2(ctypes.byref(count)), "nvmlDeviceGetCount")
+            self._handles = []
+            for i in range(count.value):
+                handle = ctypes.c_void_p()
+                self._check(self._lib.nvmlDeviceGetHandleByIndex_v2(i, ctypes.byref(handle)), "nvmlDeviceGetHandleByIndex")
+                self._handles.append(handle)
+            # Static per device: read once
+            self._names = [self._string(self._lib.nvmlDeviceGetName, h) or "NVIDIA GPU" for h in self._handles]
+            self._uuids = [self._string(self._lib.nvmlDeviceGetUUID, h) for h in self._handles]
+        except Exception:
+            self._lib.nvmlShutdown()
+            raise
+
+    def _check(self, rc: int, what: str) -> None:
+        if rc != _NVML_SUCCESS:
+            raise GPUTelemetryError(f"{what} failed: {self._lib.nvmlErrorString(rc).decode(errors='replace')}")
+
+    def _string(self, fn, *args) -> Optional[str]:
+        buf = ctypes.create_string_buffer(_NVML_STRING_BUFFER)
+        if fn(*args, buf, ctypes.c_uint(_NVML_STRING_BUFFER)) != _NVML_SUCCESS:
+            return None
+        return buf.value.decode(errors="replace")
+
+    def _uint(self, fn, *args) -> Optional[int]:
+        """Call an NVML getter with a trailing unsigned out-parameter; None if unsupported."""
+        out = ctypes.c_uint()
+        if fn(*args, ctypes.byref(out)) != _NVML_SUCCESS:
+            return None
+        return out.value
+
+    def gpus(self) -> list[GPU]:
+        lib = self._lib
+        gpus = []
+        with self._lock:
+            for i, handle in enumerate(self._handles or ()):
+                gpu = GPU(index=i, name=self._names[i], vendor="nvidia", uuid=self._uuids[i])
+                util = _NvmlUtilization()
+                if lib.nvmlDeviceGetUtilizationRates(handle, ctypes.byref(util)) == _NVML_SUCCESS:
+                    gpu.load = float(util.gpu)
+                # Unsupported on devices without dedicated memory (e.g. GB10) and MIG parents
+                memory = _NvmlMemory()
+                if lib.nvmlDeviceGetMemoryInfo(handle, ctypes.byref(memory)) == _NVML_SUCCESS:
+                    gpu.memory_used = _megabytes(memory.used)
+                    gpu.memory_total = _megabytes(memory.total)
+                temperature = self._uint(lib.nvmlDeviceGetTemperature, handle, _NVML_TEMPERATURE_GPU)
+                gpu.temperature = float(temperature) if temperature is not None else None
+                power = self._uint(lib.nvmlDeviceGetPowerUsage, handle)
+                gpu.power_draw = power / 1000 if power is not None else None
+                limit = self._uint(lib.nvmlDeviceGetEnforcedPowerLimit, handle)
+                gpu.power_limit = limit / 1000 if limit is not None else None
+                gpu.clock_sm = self._uint(lib.nvmlDeviceGetClockInfo, handle, _NVML_CLOCK_SM)
+                gpu.clock_memory = self._uint(lib.nvmlDeviceGetClockInfo, handle, _NVML_CLOCK_MEM)
+                ecc = ctypes.c_ulonglong()
+                if lib.nvmlDeviceGetTotalEccErrors(
+                    handle, _NVML_MEMORY_ERROR_TYPE_UNCORRECTED, _NVML_VOLATILE_ECC, ctypes.byref(ecc)
+                ) == _NVML_SUCCESS:
+                    gpu.ecc_errors = ecc.value
+                gpu.mig = self._mig_devices(handle)
+                gpus.append(gpu)
+        return gpus
+
+    def _mig_devices(self, handle) -> Optional[list[MIGDevice]]:
+        """The MIG instances on ``handle``, or None if MIG is off or unsupported."""
+        lib = self._lib
+        get_mode = getattr(lib, "nvmlDeviceGetMigMode", None)
+        current, pending = ctypes.c_uint(), ctypes.c_uint()
+        if get_mode is None or get_mode(handle, ctypes.byref(current), ctypes.byref(pending)) != _NVML_SUCCESS:
+            return None
+        if current.value != _NVML_DEVICE_MIG_ENABLE:
+            return None
+        devices = []
+        for slot in range(self._uint(lib.nvmlDeviceGetMaxMigDeviceCount, handle) or 0):
+            mig = ctypes.c_void_p()
+            rc = lib.nvmlDeviceGetMigDeviceHandleByIndex(handle, slot, ctypes.byref(mig))
+            if rc != _NVML_SUCCESS:
+                continue  # NOT_FOUND: slot not populated
+            device = MIGDevice(
+                gpu_instance=self._uint(lib.nvmlDeviceGetGpuInstanceId, mig),
+                uuid=self._string(lib.nvmlDeviceGetUUID, mig),
+            )
+            memory = _NvmlMemory()
+            if lib.nvmlDeviceGetMemoryInfo(mig, ctypes.byref(memory)) == _NVML_SUCCESS:
+                device.memory_used = _megabytes(memory.used)
+                device.memory_total = _megabytes(memory.total)
+            devices.append(device)
+        return devices
+
+    def _query_processes(self, name: str, handle) -> list[_NvmlProcessInfo]:
+        fn = getattr(self._lib, f"{name}_v3", None) or getattr(self._lib, f"{name}_v2", None)
+        if fn is None:
+            return []
+        count = ctypes.c_uint(0)
+        rc = fn(handle, ctypes.byref(count), None)
+        # Processes can start between the sizing call and the real one: retry
+        # with headroom a couple of times. Any other error means the query is
+        # not supported on this device, which is not worth failing a sample for.
+        for _ in range(3):
+            if rc != _NVML_ERROR_INSUFFICIENT_SIZE:
+                return []
+            infos = (_NvmlProcessInfo * (count.value + 8))()
+            count = ctypes.c_uint(len(infos))
+            rc = fn(handle, ctypes.byref(count), infos)
+            if rc == _NVML_SUCCESS:
+                return list(infos[:count.value])
+        return []
+
+    def processes(self) -> list[GPUProcess]:
+        found: dict[tuple[int, int], GPUProcess] = {}
+        with self._lock:
+            for i, handle in enumerate(self._handles or ()):
+                for query in ("nvmlDeviceGetComputeRunningProcesses", "nvmlDeviceGetGraphicsRunningProcesses"):
+                    for info in self._query_processes(query, handle):
+                        memory = None if info.usedGpuMemory == _NVML_VALUE_NOT_AVAILABLE else _megabytes(info.usedGpuMemory)
+                        instance = None if info.gpuInstanceId == _NVML_NO_INSTANCE else info.gpuInstanceId
+                        # A process doing both compute and graphics is listed twice
+                        seen = found.get((info.pid, i))
+                        if seen is None:
+                            found[(info.pid, i)] = GPUProcess(
+                                pid=info.pid, vendor="nvidia", gpu=i, memory_used=memory, gpu_instance=instance,
+                            )
+                        elif memory is not None and (seen.memory_used or 0) < memory:
+                            seen.memory_used = memory
+        return list(found.values())
+
+    def driver(self) -> dict:
+        info: dict = {}
+        with self._lock:
+            version = self._string(self._lib.nvmlSystemGetDriverVersion)
+            if version:
+                info["driver_version"] = version
+            caps = set()
+            for handle in self._handles or ():
+                major, minor = ctypes.c_int(), ctypes.c_int()
+                if self._lib.nvmlDeviceGetCudaComputeCapability(
+                    handle, ctypes.byref(major), ctypes.byref(minor)
+                ) == _NVML_SUCCESS:
+                    caps.add(f"{major.value}.{minor.value}")
+        if caps:
+            info["compute_capability"] = sorted(caps)
+        return info
+
+    def close(self) -> None:
+        with self._lock:
+            if self._handles is not None:
+                self._lib.nvmlShutdown()
+                self._handles = None
+
+
+# --------------------------------------------------------------------------- #
+# nvidia-smi via GPUtil                                                       #
+# --------------------------------------------------------------------------- #
+
+class GPUtilProvider(GPUProvider):
+    """NVIDIA GPUs via GPUtil (one ``nvidia-smi`` fork per read)."""
+
+    name = "gputil"
+    kind = "nvidia"
+
+    def __init__(self):
+        try:
+            import GPUtil
+        except ImportError as e:
+            raise GPUTelemetryError(f"GPUtil unavailable: {e}") from None
+        self._gputil = GPUtil
+
+    def gpus(self) -> list[GPU]:
+        # GPUtil casts any field nvidia-smi prints as "[N/A]" to NaN
+        return [
+            GPU(
+                index=g.id,
+                name=g.name,
+                vendor="nvidia",
+                uuid=g.uuid,
+                load=_finite(g.load * 100),
+                memory_used=_finite(g.memoryUsed),
+                memory_total=_finite(g.memoryTotal),
+                temperature=_finite(g.temperature),
+            )
+            for g in self._gputil.getGPUs()
+        ]
+
+
+# --------------------------------------------------------------------------- #
+# rocm-smi                                                                    #
+# --------------------------------------------------------------------------- #
+
+def _rocm_name(card: dict) -> str:
+    """A readable product name from ``rocm-smi --showproductname`` fields."""
+    vendor = card.get("Card Vendor", "")
+    if "[" in vendor:
+        vendor = vendor.split("[")[-1].split("]")[0]
+    sku = card.get("Card SKU", "")
+    gfx = card.get("GFX Version", "")
+    if vendor and sku:
+        return f"{vendor} {sku} ({gfx})"
+    if vendor:
+        return f"{vendor} GPU"
+    return "AMD GPU"
+
+
+def _rocm_clock(value) -> Optional[int]:
+    """``"(1800Mhz)"`` -> 1800."""
+    if not isinstance(value, str):
+        return None
+    digits = "".join(ch for ch in value if ch.isdigit())
+    return int(digits) if digits else None
+
+
+def _rocm_field(card: dict, *prefixes: str) -> Optional[float]:
+    """The first finite value whose key starts with one of ``prefixes``."""
+    for prefix in prefixes:
+        for key, value in card.items():
+            if key.startswith(prefix):
+                number = _finite(value)
+                if number is not None:
+                    return number
+    return None
+
+
+def parse_rocm_smi(data: dict, names: Optional[dict] = None) -> list[GPU]:
+    """GPUs from ``rocm-smi --json`` output (``names`` from ``--showproductname``)."""
+    names = names or {}
+    gpus = []
+    for card_id, card in data.items():
+        if not isinstance(card, dict) or not card_id.startswith("card"):
+            continue
+        total = _finite(card.get("VRAM Total Memory (B)"))
+        used = _finite(card.get("VRAM Total Used Memory (B)"))
+        gpus.append(GPU(
+            index=int(card_id.replace("card", "")),
+            name=_rocm_name(names.get(card_id, {})),
+            vendor="amd",
+            uuid=card.get("Unique ID"),
+            load=_finite(card.get("GPU use (%)")),
+            memory_used=round(used / (1024 * 1024), 2) if used is not None else None,
+            memory_total=round(total / (1024 * 1024), 2) if total is not None else None,
+            temperature=_rocm_field(card, "Temperature (Sensor edge)", "Temperature (Sensor junction)"),
+            power_draw=_rocm_field(card, "Average Graphics Package Power", "Current Socket Graphics Package Power"),
+            clock_sm=_rocm_clock(card.get("sclk clock speed:")),
+            clock_memory=_rocm_clock(card.get("mclk clock speed:")),
+        ))
+    return gpus
+
+
+def parse_rocm_pids(data: dict) -> list[GPUProcess]:
+    """Processes from ``rocm-smi --showpids --json``.
+
+    Each ``"PID<n>"`` entry is a ``"name, gpu count, vram bytes, sdma, cu"``
+    string. rocm-smi only says how many GPUs a process uses, not which.
+    """
+    processes = []
+    for key, value in (data.get("system") or {}).items():
+        if not key.startswith("PID") or not isinstance(value, str):
+            continue
+        try:
+            pid = int(key[3:])
+        except ValueError:
+            continue
+        fields = [f.strip() for f in value.split(",")]
+        vram = _finite(fields[2]) if len(fields) > 2 else None
+        processes.append(GPUProcess(
+            pid=pid,
+            vendor="amd",
+            memory_used=round(vram / (1024 * 1024), 2) if vram is not None else None,
+            name=fields[0] or None,
+        ))
+    return processes
+
+
+class RocmSmiProvider(GPUProvider):
+    """AMD GPUs via ``rocm-smi --json``."""
+
+    name = "rocm-smi"
+    kind = "rocm"
+
+    def __init__(self):
+        self._binary = shutil.which("rocm-smi")
+        if not self._binary:
+            raise GPUTelemetryError("rocm-smi not found")
+        self._names: Optional[dict] = None
+
+    def _run(self, *args: str) -> dict:
+        result = subprocess.run(
+            [self._binary, *args, "--json"],
+            capture_output=True, text=True, timeout=ROCM_SMI_TIMEOUT,
+        )
+        if result.returncode != 0:
+            raise GPUTelemetryError(f"rocm-smi exited with {result.returncode}")
+        return json.loads(result.stdout)
+
+    def gpus(self) -> list[GPU]:
+        data = self._run("--showmeminfo", "vram", "--showuse", "--showtemp", "--showpower", "--showclocks")
+        if self._names is None:
+            # Product names never change: one extra fork, once
+            try:
+                self._names = self._run("--showproductname")
+            except Exception:
+                self._names = {}
+        return parse_rocm_smi(data, self._names)
+
+    def processes(self) -> list[GPUProcess]:
+        return parse_rocm_pids(self._run("--showpids"))
+
+
+# --------------------------------------------------------------------------- #
+# Fake                                                                        #
+# --------------------------------------------------------------------------- #
+
+class FakeProvider(GPUProvider):
+    """Fixed GPUs, for tests and development without a GPU."""
+
+    name = "fake"
+    kind = "fake"
+
+    def __init__(
+        self,
+        gpus: Sequence[GPU] = (),
+        driver: Optional[dict] = None,
+        error: Optional[str] = None,
+        processes: Sequence[GPUProcess] = (),
+    ):
+        self._gpus = list(gpus)
+        self._driver = dict(driver or {})
+        self._processes = list(processes)
+        self.error = error
+        self.reads = 0
+
+    def gpus(self) -> list[GPU]:
+        self.reads += 1
+        if self.error:
+            raise GPUTelemetryError(self.error)
+        return [copy.deepcopy(gpu) for gpu in self._gpus]
+
+    def processes(self) -> list[GPUProcess]:
+        if self.error:
+            raise GPUTelemetryError(self.error)
+        return [copy.deepcopy(process) for process in self._processes]
+
+    def driver(self) -> dict:
+        return dict(self._driver)
+
+
+# --------------------------------------------------------------------------- #
+# Selection                                                                   #
+# --------------------------------------------------------------------------- #
+
+PROVIDERS = {
+    "nvml": NVMLProvider,
+    "gputil": GPUtilProvider,
+    "rocm-smi": RocmSmiProvider,
+}
+
+
+def _open(name: str) -> Optional[GPUProvider]:
+    try:
+        provider = PROVIDERS[name]()
+    except Exception as e:
+        logger.info(f"GPU telemetry provider {name} unavailable: {e}")
+        return None
+    logger.info(f"GPU telemetry provider {name} enabled")
+    return provider
+
+
+def detect_providers(preference: Optional[str] = None) -> list[GPUProvider]:
+    """Open the providers named in ``preference`` (or ``GPU_TELEMETRY``).
+
+    ``auto`` (the default) means NVML, falling back to GPUtil when NVML
+    cannot be loaded and ``nvidia-smi`` exists, plus rocm-smi if installed.
+    Raises ``ValueError`` for an unknown provider name.
+    """
+    preference = preference or os.environ.get("GPU_TELEMETRY") or "auto"
+    names = [n.strip() for n in preference.split(",") if n.strip()]
+    if names == ["auto"]:
+        providers = []
+        nvidia = _open("nvml")
+        if nvidia is None and shutil.which("nvidia-smi"):
+            nvidia = _open("gputil")
+        if nvidia is not None:
+            providers.append(nvidia)
+        if shutil.which("rocm-smi"):
+            rocm = _open("rocm-smi")
+            if rocm is not None:
+                providers.append(rocm)
+        return providers
+    unknown = [n for n in names if n not in PROVIDERS and n != "none"]
+    if unknown:
+        raise ValueError(f"unknown GPU telemetry provider(s): {', '.join(unknown)}")
+    return [p for p in map(_open, (n for n in names if n != "none")) if p is not None]
+
+
+class GPUTelemetry:
+    """All GPU providers on this machine, read together."""
+
+    def __init__(self, providers: Sequence[GPUProvider]):
+        self.providers = list(providers)
+
+    @classmethod
+    def detect(cls, preference: Optional[str] = None) -> "GPUTelemetry":
+        return cls(detect_providers(preference))
+
+    def read(self) -> tuple[list[GPU], dict[str, str]]:
+        """Every provider's GPUs, plus an error message per provider kind that failed."""
+        gpus: list[GPU] = []
+        errors: dict[str, str] = {}
+        for provider in self.providers:
+            try:
+                gpus.extend(provider.gpus())
+            except Exception as e:
+                errors[provider.kind] = str(e)
+        return gpus, errors
+
+    def gpus(self) -> list[GPU]:
+        return self.read()[0]
+
+    def processes(self) -> list[GPUProcess]:
+        """Every provider's GPU processes; a provider that fails contributes none.
+
+        Read failures already show up in ``read()``'s errors, so they are only
+        logged at debug level here.
+        """
+        processes: list[GPUProcess] = []
+        for provider in self.providers:
+            try:
+                processes.extend(provider.processes())
+            except Exception as e:
+                logger.debug(f"GPU processes from {provider.name} failed: {e}")
+        return processes
+
+    def driver(self) -> dict:
+        info: dict = {}
+        for provider in self.providers:
+            try:
+                for key, value in provider.driver().items():
+                    info.setdefault(key, value)
+            except Exception as e:
+                logger.debug(f"GPU driver info from {provider.name} failed: {e}")
+        return info
+
+    def close(self) -> None:
+        for provider in self.providers:
+            provider.close()
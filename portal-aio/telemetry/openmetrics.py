@@ -0,0 +1,172 @@
+"""OpenMetrics / Prometheus text exposition.
+
+``/metrics`` is rendered from the sampler's latest sample, not by reading
+the system again, so scrapes never touch cgroups, NVML or supervisor. This
+module holds the two pieces that do not depend on the portal:
+
+* ``Family`` and ``render`` — a minimal writer for the OpenMetrics 1.0 text
+  format, and for the older Prometheus 0.0.4 format for scrapers that do not
+  ask for OpenMetrics;
+* ``sample_families`` — maps a ``_collect_metrics`` sample (CPU, memory,
+  disk, volume, GPUs, supervisor programs) to families.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Iterable, Mapping, Optional
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_MB = 1024 * 1024
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer() and abs(value) < 2**53:
+        return str(int(value))
+    return repr(float(value))
+
+
+class Family:
+    """One metric family: a name, a type (gauge or counter), help and samples."""
+
+    def __init__(self, name: str, kind: str, help: str):
+        if kind not in ("gauge", "counter"):
+            raise ValueError(f"unsupported metric type {kind!r}")
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.samples: list[tuple[dict[str, str], float]] = []
+
+    def add(self, value, **labels) -> "Family":
+        """Add a sample; None values are skipped, so optional fields need no checks."""
+        if value is not None and not isinstance(value, bool):
+            self.samples.append(({k: str(v) for k, v in labels.items() if v is not None}, float(value)))
+        return self
+
+    def lines(self, openmetrics: bool = True) -> list[str]:
+        # OpenMetrics names a counter family without its _total suffix
+        sample_name = f"{self.name}_total" if self.kind == "counter" else self.name
+        family_name = self.name if openmetrics else sample_name
+        out = [
+            f"# HELP {family_name} {_escape(self.help)}",
+            f"# TYPE {family_name} {self.kind}",
+        ]
+        for labels, value in self.samples:
+            if labels:
+                rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                out.append(f"{sample_name}{{{rendered}}} {_number(value)}")
+            else:
+                out.append(f"{sample_name} {_number(value)}")
+        return out
+
+
+def render(families: Iterable[Family], openmetrics: bool = True) -> str:
+    """The exposition text for ``families``; families without samples are left out."""
+    lines: list[str] = []
+    for family in families:
+        if family.samples:
+            lines.extend(family.lines(openmetrics))
+    if openmetrics:
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def wants_openmetrics(accept: Optional[str]) -> bool:
+    """Whether an Accept header asks for OpenMetrics (Prometheus 2.x does)."""
+    return bool(accept) and "application/openmetrics-text" in accept
+
+
+def sample_families(metrics: Mapping, now: Optional[float] = None) -> list[Family]:
+    """Families for one metrics sample. Missing sections simply produce no samples.
+
+    ``now`` is used for supervisor uptimes when the sample has no ``now``
+    of its own.
+    """
+    cpu = metrics.get("cpu") or {}
+    ram = metrics.get("ram") or {}
+    disk = metrics.get("disk") or {}
+    volume = metrics.get("volume") or {}
+    gpu = metrics.get("gpu") or {}
+
+    cpu_percent = Family("instance_cpu_usage_percent", "gauge", "CPU usage, normalized to the container's CPU quota")
+    cpu_percent.add(cpu.get("percent"))
+    cpu_cores = Family("instance_cpu_cores", "gauge", "CPU cores available (container quota where set)")
+    cpu_cores.add(cpu.get("count"))
+    memory_used = Family("instance_memory_used_bytes", "gauge", "Memory in use (container cgroup usage where available)")
+    memory_used.add(ram.get("used"))
+    memory_limit = Family("instance_memory_limit_bytes", "gauge", "Memory available (container cgroup limit where available)")
+    memory_limit.add(ram.get("total"))
+
+    fs_used = Family("instance_filesystem_used_bytes", "gauge", "Filesystem space in use")
+    fs_size = Family("instance_filesystem_size_bytes", "gauge", "Filesystem size")
+    fs_used.add(disk.get("used"), mount="/")
+    fs_size.add(disk.get("total"), mount="/")
+    if volume:
+        fs_used.add(volume.get("used"), mount=volume.get("path", "volume"))
+        fs_size.add(volume.get("total"), mount=volume.get("path", "volume"))
+
+    gpu_count = Family("instance_gpu_count", "gauge", "GPUs detected")
+    gpu_count.add(gpu.get("count"))
+    utilization = Family("instance_gpu_utilization_percent", "gauge", "GPU utilization")
+    gpu_memory_used = Family("instance_gpu_memory_used_bytes", "gauge", "GPU memory in use")
+    gpu_memory_total = Family("instance_gpu_memory_total_bytes", "gauge", "GPU memory size")
+    temperature = Family("instance_gpu_temperature_celsius", "gauge", "GPU temperature")
+    power = Family("instance_gpu_power_watts", "gauge", "GPU power draw")
+    power_limit = Family("instance_gpu_power_limit_watts", "gauge", "GPU enforced power limit")
+    clock = Family("instance_gpu_clock_hertz", "gauge", "GPU clock speed")
+    ecc = Family("instance_gpu_ecc_uncorrected_errors", "counter", "Uncorrected GPU ECC errors since the driver loaded")
+    for device in gpu.get("devices") or ():
+        labels = {"gpu": device.get("index"), "vendor": device.get("vendor"), "name": device.get("name"), "uuid": device.get("uuid")}
+        utilization.add(device.get("load"), **labels)
+        gpu_memory_used.add(_bytes(device.get("memory_used")), **labels)
+        gpu_memory_total.add(_bytes(device.get("memory_total")), **labels)
+        temperature.add(device.get("temperature"), **labels)
+        power.add(device.get("power_draw"), **labels)
+        power_limit.add(device.get("power_limit"), **labels)
+        clock.add(_hertz(device.get("clock_sm")), clock="sm", **labels)
+        clock.add(_hertz(device.get("clock_memory")), clock="memory", **labels)
+        ecc.add(device.get("ecc_errors"), **labels)
+
+    # Per program rather than per PID, so series survive process restarts
+    program_memory = Family("instance_gpu_program_memory_bytes", "gauge", "GPU memory held by processes of a supervisor program")
+    by_program: dict[tuple, float] = {}
+    for process in gpu.get("processes") or ():
+        if process.get("memory_used") is None:
+            continue
+        key = (process.get("program") or "", process.get("vendor"), process.get("gpu"))
+        by_program[key] = by_program.get(key, 0.0) + process["memory_used"]
+    for (program, vendor, index), used in sorted(by_program.items(), key=lambda item: str(item[0])):
+        program_memory.add(_bytes(used), program=program, vendor=vendor, gpu=index)
+
+    state = Family("instance_supervisor_process_state", "gauge", "Supervisor program state (1 for the current state)")
+    uptime = Family("instance_supervisor_process_uptime_seconds", "gauge", "Seconds since a running supervisor program started")
+    for process in metrics.get("supervisor") or ():
+        state.add(1, program=process.get("name"), state=process.get("state"))
+        if process.get("state") == "RUNNING" and process.get("start"):
+            current = process.get("now") or now
+            if current:
+                uptime.add(max(0, current - process["start"]), program=process.get("name"))
+
+    return [
+        cpu_percent, cpu_cores, memory_used, memory_limit, fs_used, fs_size,
+        gpu_count, utilization, gpu_memory_used, gpu_memory_total, temperature,
+        power, power_limit, clock, ecc, program_memory, state, uptime,
+    ]
+
+
+def _bytes(megabytes: Optional[float]) -> Optional[float]:
+    return megabytes * _MB if megabytes is not None else None
+
+
+def _hertz(megahertz: Optional[float]) -> Optional[float]:
+    return megahertz * 1_000_000 if megahertz is not None else None
@@ -0,0 +1,84 @@
+"""Attribute GPU processes to the supervisor programs that started them.
+
+Supervisor only knows the PID it spawned, and that is rarely the process
+holding GPU memory: launch scripts exec a shell that starts Python, and
+launchers such as torchrun fork one worker per rank. So each GPU process is
+walked up its parent chain (via ``/proc/<pid>/stat``) until a supervisor PID
+is found.
+
+Inside a container whose PID namespace differs from the driver's view, NVML
+may report PIDs that do not exist here; those keep ``name`` and ``program``
+as None.
+"""
+
+from __future__ import annotations
+
+from typing import Callable, Iterable, Mapping, Optional
+
+from .gpu import GPUProcess
+
+PROC = "/proc"
+MAX_DEPTH = 64   # Parent links followed before giving up on a process
+
+
+def parent_pid(pid: int, proc: str = PROC) -> Optional[int]:
+    """The parent of ``pid``, or None if it has exited (or never existed here)."""
+    try:
+        with open(f"{proc}/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # "pid (comm) state ppid ...", where comm may itself contain spaces and ")"
+    fields = stat[stat.rfind(b")") + 2:].split()
+    try:
+        return int(fields[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def process_name(pid: int, proc: str = PROC) -> Optional[str]:
+    try:
+        with open(f"{proc}/{pid}/comm", "rb") as f:
+            return f.read().decode(errors="replace").strip() or None
+    except OSError:
+        return None
+
+
+def attribute_processes(
+    processes: Iterable[GPUProcess],
+    programs: Mapping[int, str],
+    *,
+    parent: Callable[[int], Optional[int]] = parent_pid,
+    name: Callable[[int], Optional[str]] = process_name,
+) -> list[GPUProcess]:
+    """Fill in ``name`` and ``program`` on each process, in place, and return them.
+
+    ``programs`` maps supervisor PIDs to program names. Parent lookups are
+    shared between processes, so a launcher with many workers is walked once.
+    """
+    owners: dict[int, Optional[str]] = {}
+
+    def owner(pid: int) -> Optional[str]:
+        chain = []
+        current: Optional[int] = pid
+        while current is not None and current > 1 and len(chain) < MAX_DEPTH:
+            if current in owners:
+                found = owners[current]
+                break
+            if current in programs:
+                found = programs[current]
+                break
+            chain.append(current)
+            current = parent(current)
+        else:
+            found = None
+        for visited in chain:
+            owners[visited] = found
+        return found
+
+    processes = list(processes)
+    for process in processes:
+        if process.name is None:
+            process.name = name(process.pid)
+        process.program = owner(process.pid)
+    return processes
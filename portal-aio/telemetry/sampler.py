@@ -0,0 +1,124 @@
+"""Background sampling of system metrics.
+
+Collecting metrics is not free: disk usage means statting mounts and AMD GPU
+state still means forking ``rocm-smi``. A ``MetricsSampler`` does it once per
+``interval`` in a worker thread, however many clients are polling, and keeps
+
+* ``latest`` — the most recent full metrics dict, which is what
+  ``/system-metrics`` returns, and
+* ``series`` — a ``RingSeries`` of a few headline numbers from each sample,
+  covering the last ``history`` seconds, for sparklines.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Callable, Mapping, Optional
+
+from .series import RingSeries
+
+logger = logging.getLogger("log_monitor")
+
+DEFAULT_INTERVAL = 5.0     # Seconds between samples
+DEFAULT_HISTORY = 3600.0   # Seconds of samples kept for /system-metrics/history
+MAX_POINTS = 1000          # Largest downsampled series a caller may ask for
+
+# Series name -> dotted path into a metrics dict
+SERIES = {
+    "cpu": "cpu.percent",
+    "ram": "ram.percent",
+    "disk": "disk.percent",
+    "volume": "volume.percent",
+    "gpu_load": "gpu.avg_load_percent",
+    "gpu_memory": "gpu.memory_percent",
+}
+
+
+def _lookup(metrics: Mapping, path: str):
+    value = metrics
+    for key in path.split("."):
+        if not isinstance(value, Mapping):
+            return None
+        value = value.get(key)
+    return value
+
+
+class MetricsSampler:
+    """Samples ``collect()`` every ``interval`` seconds into ``latest`` and ``series``."""
+
+    def __init__(
+        self,
+        collect: Callable[[], dict],
+        *,
+        interval: float = DEFAULT_INTERVAL,
+        history: float = DEFAULT_HISTORY,
+        series: Mapping[str, str] = SERIES,
+        clock: Callable[[], float] = time.time,
+    ):
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self._collect = collect
+        self.interval = interval
+        self.history = history
+        self._paths = dict(series)
+        self._clock = clock
+        self.series = RingSeries(list(self._paths), max(1, int(history / interval)))
+        self.latest: Optional[dict] = None
+        self.sampled_at: Optional[float] = None
+        self._pending: Optional[asyncio.Future] = None
+
+    def record(self, metrics: dict, timestamp: Optional[float] = None) -> None:
+        """Store a collected sample (``timestamp`` defaults to now)."""
+        timestamp = self._clock() if timestamp is None else timestamp
+        self.latest = metrics
+        self.sampled_at = timestamp
+        self.series.append(timestamp, {name: _lookup(metrics, path) for name, path in self._paths.items()})
+
+    async def sample(self) -> dict:
+        """Collect and record one sample now; concurrent callers share it."""
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(asyncio.to_thread(self._collect))
+        pending = self._pending
+        try:
+            metrics = await asyncio.shield(pending)
+        finally:
+            if self._pending is pending and pending.done():
+                self._pending = None
+        if self.latest is not metrics:
+            self.record(metrics)
+        return metrics
+
+    async def current(self) -> dict:
+        """The latest sample, collecting the first one if the loop has not yet."""
+        if self.latest is None:
+            return await self.sample()
+        return self.latest
+
+    async def run(self) -> None:
+        """Sample forever at a fixed rate; errors are logged and retried next tick."""
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            try:
+                await self.sample()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Metrics sample failed: {e}")
+            next_tick += self.interval
+            # Skip ticks missed by a slow sample rather than bursting to catch up
+            now = loop.time()
+            if next_tick < now:
+                next_tick = now + self.interval
+            await asyncio.sleep(next_tick - now)
+
+    def window(self, seconds: float, points: Optional[int] = None) -> dict:
+        """The last ``seconds`` of ``series``, downsampled to at most ``points``."""
+        now = self._clock()
+        return {
+            "interval": self.interval,
+            "window": seconds,
+            "series": self.series.window(now - seconds, points),
+        }
@@ -0,0 +1,111 @@
+"""Fixed-size time series for sampled metrics.
+
+A ``RingSeries`` keeps the last ``capacity`` samples of a handful of named
+numeric fields in ``array('d')`` columns that are allocated once and then
+overwritten in place, so memory is constant and appending is O(1) however
+long the portal runs. Missing values are stored as NaN and come back out as
+``None``.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+from array import array
+from typing import Mapping, Optional, Sequence
+
+_NAN = float("nan")
+_WINDOW_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*$")
+_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_window(value: str) -> float:
+    """Seconds in a window such as ``"600"``, ``"90s"``, ``"15m"`` or ``"1h"``.
+
+    Raises ``ValueError`` for anything else, including zero.
+    """
+    match = _WINDOW_RE.match(value)
+    if not match or float(match.group(1)) <= 0:
+        raise ValueError("window must be a positive number of seconds, optionally suffixed s, m, h or d")
+    return float(match.group(1)) * _UNITS[match.group(2)]
+
+
+def _number(value) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+        return float(value)
+    return _NAN
+
+
+def _mean(values: Sequence[float]) -> Optional[float]:
+    finite = [v for v in values if v == v]  # NaN != NaN
+    if not finite:
+        return None
+    return round(sum(finite) / len(finite), 2)
+
+
+class RingSeries:
+    """The last ``capacity`` samples of ``fields``, oldest overwritten first."""
+
+    def __init__(self, fields: Sequence[str], capacity: int):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self._times = array("d", [0.0]) * capacity
+        self._columns = {name: array("d", [_NAN]) * capacity for name in self.fields}
+        self._next = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, timestamp: float, values: Mapping[str, object]) -> None:
+        """Record one sample; fields missing from ``values`` (or not finite) are None."""
+        i = self._next
+        self._times[i] = timestamp
+        for name, column in self._columns.items():
+            column[i] = _number(values.get(name))
+        self._next = (i + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def _slot(self, n: int) -> int:
+        """Physical index of the n-th oldest sample."""
+        return (self._next - self._count + n) % self.capacity
+
+    def _first_since(self, since: float) -> int:
+        """Logical index of the oldest sample at or after ``since`` (binary search)."""
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._times[self._slot(mid)] < since:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def latest(self) -> Optional[tuple[float, dict[str, Optional[float]]]]:
+        if not self._count:
+            return None
+        i = self._slot(self._count - 1)
+        return self._times[i], {
+            name: (column[i] if column[i] == column[i] else None)
+            for name, column in self._columns.items()
+        }
+
+    def window(self, since: float, points: Optional[int] = None) -> dict:
+        """Samples taken at or after ``since``, oldest first.
+
+        With ``points``, consecutive samples are averaged into at most that
+        many buckets (each stamped with its newest sample's time), which is
+        all a sparkline needs. Returns ``{"t": [...], <field>: [...], ...}``.
+        """
+        slots = [self._slot(n) for n in range(self._first_since(since), self._count)]
+        if points is not None and 0 < points < len(slots):
+            size = -(-len(slots) // points)  # ceil
+            buckets = [slots[i:i + size] for i in range(0, len(slots), size)]
+        else:
+            buckets = [[slot] for slot in slots]
+        out: dict = {"t": [self._times[bucket[-1]] for bucket in buckets]}
+        for name, column in self._columns.items():
+            out[name] = [_mean([column[slot] for slot in bucket]) for bucket in buckets]
+        return out
@@ -51,17 +51,17 @@ def test_detect_env_kind_none(tmp_path):
     assert manifest._detect_env_kind("") is None
 
 
-# --- _match_process (separator-insensitive) --------------------------------- #
+# --- match_process (separator-insensitive) ---------------------------------- #
 
 def test_match_process_normalizes_separators():
     procs = [{"name": "instance_portal", "state": "RUNNING"}]
-    assert manifest._match_process({"name": "Instance Portal"}, procs)["state"] == "RUNNING"
+    assert manifest.match_process({"name": "Instance Portal"}, procs)["state"] == "RUNNING"
 
 
 def test_match_process_substring_and_miss():
     procs = [{"name": "vllm", "state": "RUNNING"}]
-    assert manifest._match_process({"name": "vLLM API"}, procs)["name"] == "vllm"
-    assert manifest._match_process({"name": "Jupyter"}, procs) is None
+    assert manifest.match_process({"name": "vLLM API"}, procs)["name"] == "vllm"
+    assert manifest.match_process({"name": "Jupyter"}, procs) is None
 
 
 # --- _open_ports ------------------------------------------------------------ #
@@ -0,0 +1,114 @@
+"""Unit tests for capability manifest caching (portal-aio/capabilities/cache.py)."""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from capabilities import ManifestCache, etag_matches, manifest
+from capabilities.cache import etag_for, fingerprint, memoize
+
+
+# --- static facts ------------------------------------------------------------ #
+
+def test_memoize_recomputes_only_when_the_fingerprint_changes(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_text("one")
+    calls = []
+
+    @memoize(key=lambda path: fingerprint(path))
+    def read(path):
+        calls.append(path)
+        return {"text": open(path).read()}
+
+    assert read(str(source)) == {"text": "one"}
+    read(str(source))["text"] = "mutated"
+    assert read(str(source)) == {"text": "one"} and len(calls) == 1
+
+    source.write_text("two!")
+    assert read(str(source)) == {"text": "two!"} and len(calls) == 2
+    read.cache_clear()
+    read(str(source))
+    assert len(calls) == 3
+
+
+def test_fragments_are_reloaded_when_a_fragment_is_added(tmp_path):
+    (tmp_path / "10-base.yaml").write_text("tools: [{name: git}]\n")
+    assert [t["name"] for t in manifest.load_fragments(str(tmp_path))["tools"]] == ["git"]
+    (tmp_path / "20-extra.yaml").write_text("tools: [{name: ffmpeg}]\n")
+    assert [t["name"] for t in manifest.load_fragments(str(tmp_path))["tools"]] == ["git", "ffmpeg"]
+
+
+# --- ManifestCache ----------------------------------------------------------- #
+
+def _run(coro):
+    # Not asyncio.run(): that leaves no current event loop behind, which later
+    # tests relying on asyncio.get_event_loop() trip over
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def test_concurrent_callers_share_one_build_until_the_ttl_expires():
+    now = [0.0]
+    builds = []
+
+    async def build(include):
+        builds.append(include)
+        await asyncio.sleep(0.01)
+        return {"generated_at": str(len(builds)), "include": sorted(include)}
+
+    async def go():
+        cache = ManifestCache(build, ttl=2, clock=lambda: now[0])
+        first = await asyncio.gather(*(cache.get(["packages"]) for _ in range(5)))
+        again = await cache.get({"packages"})
+        other = await cache.get()
+        now[0] = 3.0
+        rebuilt = await cache.get(["packages"])
+        return first, again, other, rebuilt
+
+    first, again, other, rebuilt = _run(go())
+    assert builds == [{"packages"}, set(), {"packages"}]
+    assert all(entry is first[0] for entry in first) and again is first[0]
+    assert other.manifest["include"] == []
+    # Only generated_at changed, so the ETag did not
+    assert rebuilt.body != first[0].body and rebuilt.etag == first[0].etag
+
+
+def test_invalidate_discards_builds_in_flight():
+    builds = []
+    release = []
+
+    async def build(include):
+        builds.append(include)
+        number, gate = len(builds), asyncio.Event()
+        release.append(gate)
+        await gate.wait()
+        return {"build": number}
+
+    async def go():
+        cache = ManifestCache(build, ttl=60)
+        stale = asyncio.ensure_future(cache.get())
+        await asyncio.sleep(0)
+        cache.invalidate()                       # e.g. a provision started
+        fresh = asyncio.ensure_future(cache.get())
+        await asyncio.sleep(0)
+        release[0].set()
+        assert (await stale).manifest == {"build": 1}
+        release[1].set()
+        assert (await fresh).manifest == {"build": 2}
+        return await cache.get()
+
+    assert _run(go()).manifest == {"build": 2} and len(builds) == 2
+
+
+def test_etags():
+    etag = etag_for({"schema_version": 1})
+    assert etag.startswith('"') and etag != etag_for({"schema_version": 2})
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag) and not etag_matches('"other"', etag)
@@ -0,0 +1,70 @@
+"""Unit tests for the installed-package index (portal-aio/capabilities/packages.py)."""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from capabilities import packages
+
+
+def _env(tmp_path):
+    site = tmp_path / "env" / "lib" / "python3.12" / "site-packages"
+    site.mkdir(parents=True)
+    return str(tmp_path / "env"), site
+
+
+def _dist(site, dirname, name, version):
+    info = site / dirname
+    info.mkdir()
+    (info / "METADATA").write_text(
+        f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n\nName: not-a-header\n"
+    )
+
+
+def test_scan_reads_dist_info_and_egg_info(tmp_path):
+    _, site = _env(tmp_path)
+    _dist(site, "flash_attn-2.8.0.dist-info", "flash_attn", "2.8.0")
+    (site / "six-1.16.0-py3.12.egg-info").write_text("Metadata-Version: 1.1\nName: six\nVersion: 1.16.0\n")
+    (site / "legacy-0.3.dist-info").mkdir()   # No METADATA: fall back to the name
+    (site / "torch").mkdir()
+    assert packages.scan(str(site)) == {"flash-attn": "2.8.0", "six": "1.16.0", "legacy": "0.3"}
+
+
+def test_versions_use_the_index_until_site_packages_changes(tmp_path, monkeypatch):
+    env, site = _env(tmp_path)
+    index_dir = tmp_path / "index"
+    _dist(site, "torch-2.7.1.dist-info", "torch", "2.7.1")
+    scans = []
+    real_scan = packages.scan
+    monkeypatch.setattr(packages, "scan", lambda d: scans.append(d) or real_scan(d))
+
+    assert packages.versions(env, ["Torch", "vllm"], str(index_dir)) == {"Torch": "2.7.1", "vllm": None}
+    assert packages.versions(env, ["torch"], str(index_dir)) == {"torch": "2.7.1"}
+    assert len(scans) == 1
+    (index,) = index_dir.iterdir()
+    assert json.loads(index.read_text())["packages"] == {"torch": "2.7.1"}
+
+    _dist(site, "vllm-0.10.0.dist-info", "vllm", "0.10.0")
+    os.utime(site, ns=(0, os.stat(site).st_mtime_ns + 1))   # Coarse clocks
+    assert packages.versions(env, ["vllm"], str(index_dir)) == {"vllm": "0.10.0"}
+    assert len(scans) == 2
+
+
+def test_unwritable_index_dir_still_answers(tmp_path):
+    env, site = _env(tmp_path)
+    _dist(site, "pip-25.1.dist-info", "pip", "25.1")
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    assert packages.versions(env, ["pip"], str(blocker / "index")) == {"pip": "25.1"}
+    assert packages.versions(str(tmp_path / "missing"), ["pip"], str(tmp_path)) == {}
+
+
+def test_cli_refreshes_each_env(tmp_path, monkeypatch, capsys):
+    env, site = _env(tmp_path)
+    _dist(site, "pip-25.1.dist-info", "pip", "25.1")
+    monkeypatch.setattr(packages, "INDEX_DIR", str(tmp_path / "index"))
+    assert packages.main([env]) == 0
+    assert "1 distributions indexed" in capsys.readouterr().out
+    assert os.path.isfile(packages.index_path(env))
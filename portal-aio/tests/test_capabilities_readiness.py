@@ -0,0 +1,167 @@
+"""Unit tests for service readiness (portal-aio/capabilities/readiness.py)."""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from capabilities import ReadinessChecker, find_service
+from capabilities.readiness import Check, check_service, probe_http, probe_tcp, readiness_checks
+
+
+def _run(coro):
+    # Not asyncio.run(): that leaves no current event loop behind, which later
+    # tests relying on asyncio.get_event_loop() trip over
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+async def _serve(statuses):
+    """A local HTTP server answering ``statuses[path]`` (404 otherwise)."""
+    async def handle(reader, writer):
+        request = await reader.readuntil(b"\r\n\r\n")
+        path = request.split()[1].decode()
+        status = statuses.get(path, 404)
+        writer.write(f"HTTP/1.1 {status} X\r\nContent-Length: 0\r\n\r\n".encode())
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def _free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# --- checks ------------------------------------------------------------------ #
+
+def test_readiness_paths_come_from_fragments_with_explicit_entries_winning():
+    services = [
+        {"name": "vLLM API", "internal_port": "18000"},
+        {"name": "ComfyUI", "internal_port": 18188},
+        {"name": "Jupyter", "internal_port": 18080},
+        {"name": "Docs"},
+    ]
+    fragments = {
+        "openai_endpoints": [{"service": "vLLM API", "models_path": "/v1/models"},
+                             {"service": "ComfyUI", "models_path": "/v1/models"}],
+        "readiness": [{"service": "ComfyUI", "path": "/system_stats"}],
+    }
+    assert readiness_checks(services, fragments) == [
+        Check("vLLM API", 18000, "/v1/models"),
+        Check("ComfyUI", 18188, "/system_stats"),
+        Check("Jupyter", 18080, None),
+        Check("Docs", None, None),
+    ]
+
+
+def test_find_service_matches_normalized_names():
+    result = {"services": [{"service": "Instance Portal"}, {"service": "vLLM API"}]}
+    assert find_service(result, "instance_portal")["service"] == "Instance Portal"
+    assert find_service(result, "vLLM API")["service"] == "vLLM API"
+    assert find_service(result, "comfyui") is None
+
+
+# --- probes ------------------------------------------------------------------ #
+
+def test_http_probe_is_ready_only_on_2xx():
+    async def go():
+        server, port = await _serve({"/v1/models": 200, "/loading": 503})
+        async with server:
+            return (
+                await probe_http(port, "/v1/models", host="127.0.0.1"),
+                await probe_http(port, "/loading", host="127.0.0.1"),
+                await probe_tcp(port, host="127.0.0.1"),
+            )
+
+    models, loading, tcp = _run(go())
+    assert models == (True, "GET /v1/models returned 200")
+    assert loading == (False, "GET /loading returned 503")
+    assert tcp[0] is True
+
+
+def test_probes_fail_fast_on_a_closed_port_and_time_out_on_a_silent_one():
+    async def go():
+        closed = await probe_tcp(_free_port(), host="127.0.0.1")
+
+        async def silent(reader, writer):
+            await asyncio.sleep(5)
+
+        server = await asyncio.start_server(silent, "127.0.0.1", 0)
+        async with server:
+            port = server.sockets[0].getsockname()[1]
+            hung = await probe_http(port, "/", timeout=0.05, host="127.0.0.1")
+        return closed, hung
+
+    closed, hung = _run(go())
+    assert closed[0] is False
+    assert hung == (False, "GET / timed out after 0.05s")
+
+
+def test_a_service_needs_both_a_running_program_and_an_answering_port():
+    async def go():
+        server, port = await _serve({"/": 200})
+        async with server:
+            check = Check("ComfyUI", port, "/")
+            return [
+                await check_service(check, [{"name": "comfyui", "state": state}])
+                for state in ("RUNNING", "STARTING")
+            ] + [await check_service(check, [])]
+
+    running, starting, unsupervised = _run(go())
+    assert running["ready"] and running["program"] == "comfyui"
+    assert not starting["ready"] and starting["state"] == "STARTING"
+    # No matching program: judged on the probe alone
+    assert unsupervised["ready"] and unsupervised["program"] is None
+
+
+# --- ReadinessChecker -------------------------------------------------------- #
+
+def test_checker_shares_one_sweep_until_the_ttl_expires():
+    now = [0.0]
+    reads = []
+
+    async def processes():
+        reads.append(1)
+        await asyncio.sleep(0.01)
+        return [{"name": "comfyui", "state": "RUNNING"}]
+
+    async def go():
+        server, port = await _serve({"/": 200})
+        async with server:
+            checker = ReadinessChecker(lambda: [Check("ComfyUI", port, "/"), Check("Gone", _free_port())],
+                                       processes, ttl=2, clock=lambda: now[0])
+            first = await asyncio.gather(*(checker.get() for _ in range(5)))
+            cached = await checker.get()
+            now[0] = 3.0
+            await checker.get()
+            return checker, first, cached
+
+    checker, first, cached = _run(go())
+    assert checker.sweeps == 2 and len(reads) == 2
+    assert all(r is first[0] for r in first) and cached is first[0]
+    assert first[0]["ready"] is False
+    assert [s["ready"] for s in first[0]["services"]] == [True, False]
+
+
+def test_checker_is_not_ready_when_supervisor_cannot_be_read():
+    async def processes():
+        raise ConnectionRefusedError("supervisor.sock")
+
+    async def go():
+        server, port = await _serve({"/": 200})
+        async with server:
+            return await ReadinessChecker(lambda: [Check("ComfyUI", port, "/")], processes).get()
+
+    result = _run(go())
+    assert result["ready"] is False
+    assert result["services"][0]["ready"] is False
+    assert result["services"][0]["state"].startswith("unknown")
@@ -0,0 +1,99 @@
+"""Unit tests for the streaming log archive (portal-aio/logstream/archive.py)."""
+
+import io
+import os
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logstream import archive
+from logstream.archive import iter_log_zip
+
+
+def _tree(tmp_path):
+    log_dir = tmp_path / "log"
+    (log_dir / "portal").mkdir(parents=True)
+    (log_dir / "portal" / "vllm.log").write_text("portal vllm\n")
+    (log_dir / "vllm.log").write_text("clean vllm\n")
+    (log_dir / "dpkg.txt").write_text("dpkg\n")
+    return log_dir
+
+
+def _unzip(chunks):
+    zf = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert zf.testzip() is None
+    return {name: zf.read(name) for name in zf.namelist()}
+
+
+def test_archive_contains_every_file_under_the_directory_name(tmp_path):
+    files = _unzip(iter_log_zip(str(_tree(tmp_path))))
+    assert files == {
+        "log/dpkg.txt": b"dpkg\n",
+        "log/vllm.log": b"clean vllm\n",
+        "log/portal/vllm.log": b"portal vllm\n",
+    }
+
+
+def test_glob_matches_relative_paths_at_any_depth(tmp_path):
+    log_dir = str(_tree(tmp_path))
+    assert set(_unzip(iter_log_zip(log_dir, pattern="*.log"))) == {"log/vllm.log", "log/portal/vllm.log"}
+    assert set(_unzip(iter_log_zip(log_dir, pattern="portal/*"))) == {"log/portal/vllm.log"}
+
+
+def test_since_filters_on_mtime(tmp_path):
+    log_dir = _tree(tmp_path)
+    os.utime(log_dir / "dpkg.txt", (1_000_000, 1_000_000))
+    assert "log/dpkg.txt" not in _unzip(iter_log_zip(str(log_dir), since=2_000_000))
+
+
+def test_max_bytes_keeps_the_tail_of_each_file(tmp_path):
+    log_dir = _tree(tmp_path)
+    files = _unzip(iter_log_zip(str(log_dir), max_bytes=5))
+    assert files["log/vllm.log"] == b"vllm\n"
+    assert files["log/dpkg.txt"] == b"dpkg\n"
+
+
+def test_large_files_stream_in_several_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "READ_CHUNK", 4096)
+    monkeypatch.setattr(archive, "YIELD_THRESHOLD", 1024)
+    log_dir = tmp_path / "log"
+    log_dir.mkdir()
+    data = os.urandom(1024 * 1024)  # Incompressible, so output tracks input
+    (log_dir / "big.log").write_bytes(data)
+    chunks = list(iter_log_zip(str(log_dir)))
+    assert len(chunks) > 10
+    assert _unzip(chunks) == {"log/big.log": data}
+
+
+def test_unreadable_and_special_files_are_skipped(tmp_path):
+    log_dir = _tree(tmp_path)
+    os.mkfifo(log_dir / "pipe.log")
+    os.symlink(log_dir / "missing", log_dir / "dangling.log")
+    assert set(_unzip(iter_log_zip(str(log_dir), pattern="*.log"))) == {"log/vllm.log", "log/portal/vllm.log"}
+
+
+def test_file_removed_while_archiving_is_still_complete(tmp_path, monkeypatch):
+    log_dir = _tree(tmp_path)
+    real_open = open
+
+    def open_then_rotate(path, mode="r"):
+        f = real_open(path, mode)
+        os.unlink(path)   # Rotated away after _select and open
+        return f
+
+    monkeypatch.setattr(archive, "open", open_then_rotate, raising=False)
+    files = _unzip(iter_log_zip(str(log_dir)))
+    assert files["log/vllm.log"] == b"clean vllm\n" and len(files) == 3
+    assert not (log_dir / "vllm.log").exists()
+
+
+def test_old_mtimes_are_clamped_to_the_zip_epoch(tmp_path):
+    log_dir = _tree(tmp_path)
+    os.utime(log_dir / "dpkg.txt", (0, 0))
+    chunks = list(iter_log_zip(str(log_dir)))
+    assert zipfile.ZipFile(io.BytesIO(b"".join(chunks))).getinfo("log/dpkg.txt").date_time == (1980, 1, 1, 0, 0, 0)
+
+
+def test_empty_selection_is_still_a_valid_zip(tmp_path):
+    assert _unzip(iter_log_zip(str(_tree(tmp_path)), pattern="nothing")) == {}
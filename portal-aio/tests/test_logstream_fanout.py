@@ -0,0 +1,183 @@
+"""Unit tests for per-client WebSocket queues (portal-aio/logstream/fanout.py)."""
+
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logstream.fanout import ClientQueue
+
+
+def _msg(msg_type, file, body):
+    key = "lines" if msg_type == "overwrite_block" else "html"
+    return json.dumps({"type": msg_type, key: body, "file": file}), msg_type, file
+
+
+def _drain(queue: ClientQueue) -> list:
+    return [json.loads(f) if f.startswith("{") else f for f in queue._take_frames()]
+
+
+def _queue(**kw):
+    async def send(_):
+        pass
+    return ClientQueue(send, **kw)
+
+
+# --- coalescing and batching -------------------------------------------------- #
+
+def test_consecutive_overwrites_for_one_file_collapse_to_latest():
+    q = _queue()
+    for pct in ("10%", "50%", "100%"):
+        q.put(*_msg("overwrite", "a.log", pct))
+    assert len(q) == 1
+    assert _drain(q) == [{"type": "overwrite", "html": "100%", "file": "a.log"}]
+    assert q.coalesced == 2
+
+
+def test_overwrites_do_not_collapse_across_an_append_for_the_same_file():
+    q = _queue()
+    q.put(*_msg("overwrite", "a.log", "1"))
+    q.put(*_msg("append", "a.log", "done"))
+    q.put(*_msg("overwrite", "a.log", "2"))
+    (frame,) = _drain(q)
+    assert [m["html"] for m in frame["messages"]] == ["1", "done", "2"]
+
+
+def test_other_files_do_not_break_coalescing():
+    q = _queue()
+    q.put(*_msg("overwrite", "a.log", "1"))
+    q.put(*_msg("append", "b.log", "x"))
+    q.put(*_msg("overwrite", "a.log", "2"))
+    (frame,) = _drain(q)
+    assert [(m["file"], m["html"]) for m in frame["messages"]] == [("b.log", "x"), ("a.log", "2")]
+
+
+def test_blocks_collapse_but_not_into_a_line_overwrite():
+    q = _queue()
+    q.put(*_msg("overwrite_block", "a.log", ["1", "2"]))
+    q.put(*_msg("overwrite_block", "a.log", ["3", "4"]))
+    q.put(*_msg("overwrite", "a.log", "5"))
+    (frame,) = _drain(q)
+    assert [m["type"] for m in frame["messages"]] == ["overwrite_block", "overwrite"]
+    assert frame["messages"][0]["lines"] == ["3", "4"]
+
+
+def test_standalone_frames_are_sent_verbatim_and_split_batches():
+    q = _queue()
+    q.put(*_msg("append", "a.log", "1"))
+    q.put(*_msg("append", "a.log", "2"))
+    q.put("heartbeat")
+    q.put(*_msg("append", "a.log", "3"))
+    frames = _drain(q)
+    assert frames[0]["type"] == "batch" and len(frames[0]["messages"]) == 2
+    assert frames[1] == "heartbeat"
+    assert frames[2] == {"type": "append", "html": "3", "file": "a.log"}
+
+
+def test_subscription_drops_other_files_but_not_standalone_frames():
+    q = _queue()
+    q.files = frozenset({"a.log"})
+    q.put(*_msg("append", "a.log", "1"))
+    q.put(*_msg("append", "b.log", "2"))
+    q.put(*_msg("overwrite", "b.log", "3"))
+    q.put("heartbeat")
+    assert len(q) == 2
+    assert _drain(q) == [{"type": "append", "html": "1", "file": "a.log"}, "heartbeat"]
+
+
+# --- backpressure -------------------------------------------------------------- #
+
+def test_overflow_marks_the_client_for_dropping():
+    q = _queue(max_pending=3)
+    for i in range(5):
+        q.put(*_msg("append", "a.log", str(i)))
+    assert q.overflowed is True
+    assert len(q) == 3
+
+
+def test_run_batches_per_tick_and_stops_on_overflow():
+    sent = []
+
+    async def go():
+        async def send(frame):
+            sent.append(frame)
+
+        q = ClientQueue(send, flush_interval=0.01, max_pending=100)
+        task = asyncio.create_task(q.run())
+        for i in range(50):
+            q.put(*_msg("append", "a.log", str(i)))
+        await asyncio.sleep(0.05)
+        for i in range(101):
+            q.put(*_msg("append", "a.log", str(i)))
+        await asyncio.wait_for(task, 1)
+        return q
+
+    q = asyncio.run(go())
+    assert len(sent) == 1 and len(json.loads(sent[0])["messages"]) == 50
+    assert q.overflowed and q.frames_sent == 1 and q.bytes_sent == len(sent[0])
+
+
+def test_a_stalled_send_ends_the_writer_instead_of_blocking():
+    async def go():
+        async def send(frame):
+            await asyncio.sleep(10)
+
+        q = ClientQueue(send, flush_interval=0, send_timeout=0.05)
+        task = asyncio.create_task(q.run())
+        q.put("history")
+        await asyncio.wait_for(task, 1)
+        return q
+
+    assert asyncio.run(go()).overflowed is True
+
+
+def test_close_stops_the_writer():
+    async def go():
+        q = _queue()
+        task = asyncio.create_task(q.run())
+        await asyncio.sleep(0)
+        q.close()
+        await asyncio.wait_for(task, 1)
+        q.put("ignored")
+        return len(q)
+
+    assert asyncio.run(go()) == 0
+
+
+def test_idle_writer_sends_heartbeats():
+    async def go():
+        sent = []
+
+        async def send(frame):
+            sent.append(frame)
+
+        q = ClientQueue(send, flush_interval=0, heartbeat_interval=0.02)
+        task = asyncio.create_task(q.run())
+        await asyncio.sleep(0.07)
+        q.close()
+        await asyncio.wait_for(task, 1)
+        return sent
+
+    sent = asyncio.run(go())
+    assert len(sent) >= 2 and set(sent) == {"heartbeat"}
+
+
+def test_a_lone_pong_skips_the_flush_tick():
+    async def go():
+        sent = []
+
+        async def send(frame):
+            sent.append(frame)
+
+        q = ClientQueue(send, flush_interval=10)
+        task = asyncio.create_task(q.run())
+        q.put("pong")
+        for _ in range(5):
+            await asyncio.sleep(0)
+        q.close()
+        await asyncio.wait_for(task, 1)
+        return sent
+
+    assert asyncio.run(go()) == ["pong"]
@@ -0,0 +1,119 @@
+"""Unit tests for paginated log history (portal-aio/logstream/history.py)."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logstream.history import LineIndex, format_line
+
+
+def _write(path, lines, mode="w"):
+    with open(path, mode) as f:
+        f.writelines(f"{line}\n" for line in lines)
+
+
+def _all_pages(index, limit):
+    """Walk backwards from EOF, returning every line in file order."""
+    out, before = [], None
+    while True:
+        page = index.page(before=before, limit=limit)
+        out = page["lines"] + out
+        if not page["has_more"]:
+            return out
+        before = page["start"]
+
+
+# --- paging ------------------------------------------------------------------ #
+
+def test_last_page_is_the_tail_of_the_file(tmp_path):
+    path = tmp_path / "a.log"
+    _write(path, [f"line {i}" for i in range(50)])
+    page = LineIndex(str(path), checkpoint_lines=8).page(limit=5)
+    assert page["lines"] == [f"line {i}" for i in range(45, 50)]
+    assert page["first_line"] == 45
+    assert page["has_more"] is True
+    assert page["end"] == page["size"] == os.path.getsize(path)
+
+
+def test_paging_backwards_visits_every_line_once(tmp_path):
+    path = tmp_path / "a.log"
+    lines = [f"line {i}" for i in range(103)]
+    _write(path, lines)
+    index = LineIndex(str(path), checkpoint_lines=10)
+    for limit in (1, 7, 10, 33, 500):
+        assert _all_pages(index, limit) == lines
+
+
+def test_start_offset_points_at_the_first_returned_line(tmp_path):
+    path = tmp_path / "a.log"
+    _write(path, [f"l{i}" for i in range(40)])
+    index = LineIndex(str(path), checkpoint_lines=4)
+    page = index.page(limit=9)
+    with open(path, "rb") as f:
+        f.seek(page["start"])
+        assert f.readline() == b"l31\n"
+    # `before` landing exactly on a checkpoint excludes the line it starts
+    older = index.page(before=index.checkpoints[5], limit=2)
+    assert older["lines"] == ["l18", "l19"]
+
+
+def test_partial_last_line_is_returned(tmp_path):
+    path = tmp_path / "a.log"
+    _write(path, ["one", "two"])
+    with open(path, "a") as f:
+        f.write("thr")
+    assert LineIndex(str(path)).page()["lines"] == ["one", "two", "thr"]
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "a.log"
+    path.write_text("")
+    page = LineIndex(str(path)).page()
+    assert page["lines"] == [] and page["has_more"] is False
+
+
+def test_offsets_survive_invalid_utf8(tmp_path):
+    path = tmp_path / "a.log"
+    path.write_bytes(b"ok\n\xff\xfe bad\n" + b"".join(b"n%d\n" % i for i in range(10)))
+    index = LineIndex(str(path), checkpoint_lines=3)
+    lines = _all_pages(index, 4)
+    assert lines[1] == "�� bad"
+    assert lines[-1] == "n9" and len(lines) == 12
+
+
+# --- growth, truncation and replacement -------------------------------------- #
+
+def test_index_extends_incrementally_as_the_file_grows(tmp_path):
+    path = tmp_path / "a.log"
+    _write(path, [f"a{i}" for i in range(25)])
+    index = LineIndex(str(path), checkpoint_lines=10)
+    index.page()
+    assert index.checkpoints[:3] == [0, 30, 70]
+    _write(path, [f"b{i}" for i in range(25)], mode="a")
+    assert index.page(limit=1)["lines"] == ["b24"]
+    assert index.lines == 50 and len(index.checkpoints) == 6
+
+
+def test_truncation_and_replacement_reset_the_index(tmp_path):
+    path = tmp_path / "a.log"
+    _write(path, [f"old{i}" for i in range(30)])
+    index = LineIndex(str(path), checkpoint_lines=10)
+    index.page()
+    _write(path, ["new"])  # truncated in place
+    assert index.page()["lines"] == ["new"]
+
+    replacement = tmp_path / "b.log"
+    _write(replacement, ["x", "y"])
+    os.replace(replacement, path)
+    assert index.page()["lines"] == ["x", "y"]
+    assert index.checkpoints == [0]
+
+
+# --- formats ----------------------------------------------------------------- #
+
+def test_formats():
+    line = "50%\r\x1b[32m100%\x1b[0m <done>"
+    assert format_line(line, "raw") == line
+    assert format_line(line, "text") == "100% <done>"
+    assert format_line(line, "html") == '<span style="color:#4ade80">100%</span> &lt;done&gt;'
@@ -0,0 +1,61 @@
+"""Unit tests for ANSI → HTML rendering (portal-aio/logstream/render.py)."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logstream import render
+from logstream.render import LogLine, ansi_to_html
+
+
+# --- ansi_to_html ------------------------------------------------------------ #
+
+def test_plain_text_is_escaped():
+    assert ansi_to_html("a < b & c") == "a &lt; b &amp; c"
+
+
+def test_sgr_codes_open_and_reset_spans():
+    assert ansi_to_html("\x1b[1;31mERR\x1b[0m ok") == (
+        '<span style="font-weight:bold"><span style="color:#f87171">ERR</span></span> ok'
+    )
+
+
+def test_bare_reset_and_unclosed_spans_are_balanced():
+    assert ansi_to_html("\x1b[32mgo\x1b[m") == '<span style="color:#4ade80">go</span>'
+    assert ansi_to_html("\x1b[44mbg") == '<span style="background-color:#1e3a5f">bg</span>'
+
+
+def test_unknown_codes_and_non_sgr_csi_are_dropped():
+    # 38;5;200 (256-colour) is not in the palette; erase/cursor CSI never render
+    assert ansi_to_html("\x1b[38;5;200mx\x1b[2K\x1b[?25l") == "x"
+
+
+def test_control_characters_are_stripped_but_tabs_kept():
+    assert ansi_to_html("a\x07b\x0fc\td") == "abc\td"
+
+
+def test_results_are_memoised():
+    render.ansi_to_html.cache_clear()
+    ansi_to_html("\x1b[33mwarn\x1b[0m")
+    ansi_to_html("\x1b[33mwarn\x1b[0m")
+    assert render.ansi_to_html.cache_info().hits == 1
+
+
+# --- LogLine ----------------------------------------------------------------- #
+
+def test_logline_renders_lazily_and_once(monkeypatch):
+    calls = []
+
+    def fake(text):
+        calls.append(text)
+        return f"<{text}>"
+
+    monkeypatch.setattr(render, "ansi_to_html", fake)
+    line = LogLine("hello")
+    assert calls == []
+    assert line.html == "<hello>"
+    assert line.html == "<hello>"
+    assert calls == ["hello"]
+    assert line.text == "hello" and line.file == ""
+    assert LogLine("hello", "vllm.log").file == "vllm.log"
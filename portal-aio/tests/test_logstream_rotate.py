@@ -0,0 +1,122 @@
+"""Unit tests for in-place log rotation (portal-aio/logstream/rotate.py)."""
+
+import errno
+import gzip
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logstream import rotate
+from logstream.rotate import prune_archives, rotate_file
+
+KB = 1024
+
+
+def _fill(path, size):
+    """Write ``size`` bytes of numbered 64-byte lines."""
+    lines = b"".join(b"%063d\n" % i for i in range(size // 64))
+    path.write_bytes(lines)
+    return lines
+
+
+def _generations(directory):
+    return sorted(p for p in os.listdir(directory) if p.endswith(".gz"))
+
+
+@pytest.fixture
+def no_collapse(monkeypatch):
+    def unsupported(fd, length):
+        raise OSError(errno.EOPNOTSUPP, "not supported")
+    monkeypatch.setattr(rotate, "collapse_head", unsupported)
+    monkeypatch.setattr(rotate, "_no_collapse", set())
+
+
+def _collapse_supported(tmp_path):
+    probe = tmp_path / "probe"
+    probe.write_bytes(b"x" * 64 * KB)
+    fd = os.open(probe, os.O_RDWR)
+    try:
+        rotate.collapse_head(fd, 4096)
+        return True
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+        probe.unlink()
+
+
+def test_small_file_is_left_alone(tmp_path):
+    path = tmp_path / "a.log"
+    _fill(path, 4 * KB)
+    assert rotate_file(str(path), max_size=8 * KB, keep=KB, budget=KB * KB) is None
+    assert _generations(tmp_path) == []
+
+
+def test_collapse_keeps_the_tail_and_archives_the_head(tmp_path):
+    if not _collapse_supported(tmp_path):
+        pytest.skip("filesystem cannot collapse ranges")
+    path = tmp_path / "a.log"
+    data = _fill(path, 256 * KB)
+    result = rotate_file(str(path), max_size=128 * KB, keep=64 * KB, budget=KB * KB)
+    assert result.method == "collapse"
+    assert result.removed % 4096 == 0 and result.removed <= 192 * KB
+    assert path.read_bytes() == data[result.removed:]
+    with gzip.open(result.archive) as f:
+        assert f.read() == data[:result.removed]
+
+
+def test_collapse_never_removes_unread_bytes(tmp_path):
+    if not _collapse_supported(tmp_path):
+        pytest.skip("filesystem cannot collapse ranges")
+    path = tmp_path / "a.log"
+    data = _fill(path, 256 * KB)
+    result = rotate_file(str(path), max_size=128 * KB, keep=KB, limit=50 * KB)
+    assert result.removed <= 50 * KB and result.unread == b""
+    assert path.read_bytes() == data[result.removed:]
+    assert result.archive is None
+
+
+def test_copy_truncate_hands_back_unread_bytes(tmp_path, no_collapse):
+    path = tmp_path / "a.log"
+    data = _fill(path, 64 * KB)
+    result = rotate_file(str(path), max_size=32 * KB, keep=8 * KB, limit=40 * KB, budget=KB * KB)
+    assert result.method == "copy-truncate"
+    assert result.removed == len(data)
+    assert result.unread == data[40 * KB:]
+    assert path.read_bytes() == b""
+    with gzip.open(result.archive) as f:
+        assert f.read() == data
+
+
+def test_unsupported_filesystem_is_remembered(tmp_path, no_collapse):
+    path = tmp_path / "a.log"
+    _fill(path, 64 * KB)
+    rotate_file(str(path), max_size=32 * KB, keep=8 * KB)
+    assert os.stat(path).st_dev in rotate._no_collapse
+    assert not any(name.endswith(".tmp") for name in os.listdir(tmp_path))
+
+
+def test_writer_keeps_appending_to_the_same_file(tmp_path, no_collapse):
+    path = tmp_path / "a.log"
+    _fill(path, 64 * KB)
+    with open(path, "ab") as writer:
+        rotate_file(str(path), max_size=32 * KB, keep=8 * KB)
+        writer.write(b"after\n")
+        writer.flush()
+    assert path.read_bytes() == b"after\n"
+
+
+def test_prune_removes_oldest_generations_over_budget(tmp_path):
+    names = [f"a.log.20260101-00000{i}.gz" for i in range(4)]
+    for i, name in enumerate(names):
+        p = tmp_path / name
+        p.write_bytes(b"x" * 100)
+        os.utime(p, (1000 + i, 1000 + i))
+    foreign = tmp_path / "a.log.1.gz"      # logrotate's naming: not ours to delete
+    foreign.write_bytes(b"x" * 1000)
+    removed = prune_archives(str(tmp_path), 250)
+    assert [os.path.basename(p) for p in removed] == names[:2]
+    assert _generations(tmp_path) == sorted([foreign.name] + names[2:])
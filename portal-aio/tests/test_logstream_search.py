@@ -0,0 +1,121 @@
+"""Unit tests for log search (portal-aio/logstream/search.py)."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logstream import search as search_module
+from logstream.search import LogSearch
+
+
+def _log(tmp_path, lines, name="a.log"):
+    path = tmp_path / name
+    path.write_text("".join(f"{line}\n" for line in lines))
+    return str(path)
+
+
+def _lines(records):
+    return [(r["line"], r["text"]) for r in records]
+
+
+# --- query validation -------------------------------------------------------- #
+
+@pytest.mark.parametrize("kwargs", [{}, {"pattern": "("}, {"level": "debug"}])
+def test_invalid_queries_raise_value_error(kwargs):
+    with pytest.raises(ValueError):
+        LogSearch(**kwargs)
+
+
+# --- matching ---------------------------------------------------------------- #
+
+def test_regex_matches_report_line_numbers(tmp_path):
+    path = _log(tmp_path, ["start", "CUDA out of memory", "ok", "cuda OUT of memory"])
+    assert _lines(LogSearch("out of memory").search_file("a.log", path)) == [(2, "CUDA out of memory")]
+    assert len(list(LogSearch("out of memory", ignore_case=True).search_file("a.log", path))) == 2
+
+
+def test_matches_across_chunk_boundaries(tmp_path, monkeypatch):
+    monkeypatch.setattr(search_module, "SEARCH_CHUNK", 16)
+    lines = [f"line {i}" for i in range(100)]
+    lines[37] = "a Traceback here"
+    lines[38] = "x" * 50  # Longer than a chunk
+    path = _log(tmp_path, lines)
+    records = list(LogSearch("Traceback|^line 99$").search_file("a.log", path))
+    assert _lines(records) == [(38, "a Traceback here"), (100, "line 99")]
+
+
+def test_context_before_and_after(tmp_path, monkeypatch):
+    monkeypatch.setattr(search_module, "SEARCH_CHUNK", 20)
+    path = _log(tmp_path, [f"l{i}" for i in range(30)] + ["ERROR boom", "l31", "l32", "l33"])
+    (record,) = LogSearch("boom", context=2).search_file("a.log", path)
+    assert record["before"] == ["l28", "l29"]
+    assert record["after"] == ["l31", "l32"]
+
+
+def test_context_is_cut_short_at_end_of_file(tmp_path):
+    path = _log(tmp_path, ["x", "match", "y"])
+    (record,) = LogSearch("match", context=5).search_file("a.log", path)
+    assert record["before"] == ["x"] and record["after"] == ["y"]
+
+
+def test_levels_include_more_severe_levels(tmp_path):
+    path = _log(tmp_path, [
+        "INFO ready",
+        "WARNING: low disk",
+        "ERROR failed",
+        "Traceback (most recent call last):",
+        "RuntimeError: CUDA error",
+        "torch.OutOfMemoryError: CUDA out of memory",
+        "0 errors",
+    ])
+    errors = [r["line"] for r in LogSearch(level="error").search_file("a.log", path)]
+    warnings = [r["line"] for r in LogSearch(level="warning").search_file("a.log", path)]
+    assert errors == [3, 4, 5, 6]
+    assert warnings == [2, 3, 4, 5, 6]
+    both = LogSearch("CUDA", level="error").search_file("a.log", path)
+    assert [r["line"] for r in both] == [5, 6]
+
+
+def test_raw_portal_logs_are_cleaned_before_matching(tmp_path):
+    path = _log(tmp_path, ["\x1b[31mERROR\x1b[0m bad", "10%\r50%\r\x1b[32m100%\x1b[0m"])
+    records = list(LogSearch("ERROR bad|100%").search_file("a.log", path, raw=True))
+    assert _lines(records) == [(1, "ERROR bad"), (2, "100%")]
+
+
+def test_anchored_patterns_match_raw_lines_with_cr(tmp_path):
+    path = tmp_path / "a.log"
+    path.write_bytes(b"10%\rLoaded model\nline ok\r\nother\n")
+    for pattern, expected in (("^Loaded", [(1, "Loaded model")]), ("ok$", [(2, "line ok")])):
+        records = list(LogSearch(pattern).search_file("a.log", str(path), raw=True))
+        assert _lines(records) == expected
+        lines = path.read_bytes().decode().split("\n")
+        assert [r["text"] for r in LogSearch(pattern).search_lines("a.log", lines)] == [t for _, t in expected]
+
+
+def test_in_memory_lines_have_no_line_numbers():
+    search = LogSearch("boom", context=1)
+    (record,) = search.search_lines("a.log", ["a", "\x1b[1mboom\x1b[0m", "b"])
+    assert record == {
+        "type": "match", "file": "a.log", "line": None,
+        "text": "boom", "before": ["a"], "after": ["b"],
+    }
+
+
+# --- result cap -------------------------------------------------------------- #
+
+def test_result_cap_spans_files_and_sets_truncated(tmp_path):
+    first = _log(tmp_path, ["hit"] * 3, "a.log")
+    second = _log(tmp_path, ["hit"] * 3, "b.log")
+    search = LogSearch("hit", max_results=4)
+    records = list(search.search_file("a.log", first)) + list(search.search_file("b.log", second))
+    assert [r["file"] for r in records] == ["a.log"] * 3 + ["b.log"]
+    assert search.summary() == {"type": "summary", "matches": 4, "truncated": True}
+
+
+def test_exact_cap_is_not_truncated(tmp_path):
+    search = LogSearch("hit", max_results=2)
+    assert len(list(search.search_file("a.log", _log(tmp_path, ["hit", "hit"])))) == 2
+    assert search.truncated is False
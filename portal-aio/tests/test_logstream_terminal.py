@@ -0,0 +1,137 @@
+"""Unit tests for the incremental virtual terminal (portal-aio/logstream/terminal.py)."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logstream import terminal
+from logstream.terminal import Terminal
+
+
+def _tracker_flush(bars, prev_count):
+    """What subprocess_runner.ProgressTracker.flush writes to a portal log."""
+    out = f"\x1b[{prev_count}A" if prev_count else ""
+    out += "".join(f"\x1b[1G{bar}\x1b[K\n" for bar in bars)
+    return out
+
+
+# --- line mode --------------------------------------------------------------- #
+
+def test_completed_lines_are_appended_and_blank_lines_dropped():
+    assert Terminal().feed("a\n\nb\r\n") == [("append", "a"), ("append", "b")]
+
+
+def test_partial_line_is_previewed_then_completed_in_place():
+    t = Terminal()
+    assert t.feed("down") == [("append", "down")]
+    assert t.feed("load") == [("overwrite", "download")]
+    assert t.feed("") == []  # Unchanged preview is not resent
+    assert t.feed("ed\nnext") == [("overwrite", "downloaded"), ("append", "next")]
+
+
+def test_lone_cr_redraws_the_line_but_crlf_split_across_chunks_does_not():
+    t = Terminal()
+    t.feed("10%\r50%")
+    assert t.feed("\r100%\r") == [("overwrite", "100%")]
+    assert t.feed("\nok\n") == [("overwrite", "100%"), ("append", "ok")]
+
+
+def test_colour_before_a_redraw_does_not_clear_early():
+    t = Terminal()
+    t.feed("\x1b[32mdone")
+    assert t.feed("\r\x1b[0m\n") == [("overwrite", "\x1b[32mdone")]
+
+
+# --- columns ----------------------------------------------------------------- #
+
+def _screen(data):
+    t = Terminal()
+    t.feed(data)
+    return [row.text for row in t.rows]
+
+
+def test_erase_in_line_modes_use_the_cursor_column():
+    assert _screen("abcdef\x1b[3G\x1b[K") == ["ab"]
+    assert _screen("abcdef\x1b[3G\x1b[1K") == ["   def"]
+    assert _screen("abcdef\x1b[3G\x1b[2K") == [""]
+
+
+def test_absolute_column_overwrites_in_place():
+    assert _screen("progress 10%\x1b[10G55") == ["progress 55%"]
+    assert _screen("ab\x1b[5Gc") == ["ab  c"]
+
+
+def test_styles_survive_a_mid_row_overwrite():
+    # Overwriting the first red cell must keep the rest of the word red
+    assert _screen("\x1b[31mERROR\x1b[0m!\x1b[1GX") == ["X\x1b[31mRROR\x1b[0m!"]
+
+
+def test_relative_cursor_moves():
+    assert _screen("abcd\x1b[2DX\x1b[CY") == ["abXdY"]
+
+
+# --- blocks ------------------------------------------------------------------ #
+
+def test_tracker_block_sends_only_changed_rows():
+    t = Terminal()
+    t.feed("log line\n")
+    assert t.feed(_tracker_flush(["a 1%", "b 1%"], 0)) == [("append", "a 1%"), ("append", "b 1%")]
+    # The cursor moves up over two lines already sent: they become the block
+    assert t.feed(_tracker_flush(["a 5%", "b 1%"], 2)) == [("block", ["a 5%", "b 1%", ""], 2)]
+    assert t.feed(_tracker_flush(["a 9%", "b 1%"], 2)) == [("rows", [(0, "a 9%")])]
+    assert t.feed(_tracker_flush(["a 9%", "b 1%"], 2)) == []
+
+
+def test_block_survives_a_flush_split_across_reads():
+    t = Terminal()
+    t.feed(_tracker_flush(["a", "b", "c"], 0))
+    t.feed(_tracker_flush(["a1", "b1", "c1"], 3))
+    flush = _tracker_flush(["a2", "b2", "c2"], 3)
+    first, second = flush[:flush.index("b2")], flush[flush.index("b2"):]
+    assert t.feed(first) == [("rows", [(0, "a2")])]
+    assert t.feed(second) == [("rows", [(1, "b2"), (2, "c2")])]
+    assert t.in_block
+
+
+def test_output_below_the_block_commits_it():
+    t = Terminal()
+    t.feed(_tracker_flush(["a", "b"], 0))
+    t.feed(_tracker_flush(["a1", "b1"], 2))
+    # ProgressTracker.clear_block, then ordinary log lines
+    assert t.feed("\x1b[2A\x1b[2K\n\x1b[2K\n\x1b[2A") == [("rows", [(0, ""), (1, "")])]
+    assert t.feed("done a\ndone b\nnext\n") == [("commit", ["done a", "done b", "next"])]
+    assert not t.in_block
+    assert t.feed("more\n") == [("append", "more")]
+
+
+def test_block_growth_resends_the_whole_block():
+    t = Terminal()
+    t.feed(_tracker_flush(["a"], 0))
+    assert t.feed(_tracker_flush(["a1"], 1)) == [("block", ["a1", ""], 1)]
+    assert t.feed(_tracker_flush(["a2", "b2", "c2"], 1)) == [("block", ["a2", "b2", "c2", ""], 1)]
+
+
+def test_oversized_block_is_committed(monkeypatch):
+    monkeypatch.setattr(terminal, "MAX_BLOCK_ROWS", 3)
+    t = Terminal()
+    t.feed("a\n\x1b[A")
+    events = t.feed("a\nb\nc\nd\n")
+    assert events[-1] == ("commit", ["a", "b", "c", "d"])
+    assert not t.in_block
+
+
+def test_rows_far_above_the_cursor_are_trimmed(monkeypatch):
+    monkeypatch.setattr(terminal, "KEEP_ROWS", 5)
+    t = Terminal()
+    t.feed("".join(f"{i}\n" for i in range(50)))
+    assert len(t.rows) <= 11
+    # Cursor-up still reaches recent rows; the write lands at the cursor column
+    assert t.feed("x\x1b[2Ay") == [("block", ["4y", "49", "x"], 2)]
+
+
+def test_block_lines_for_replay():
+    t = Terminal()
+    assert t.block_lines() is None
+    t.feed(_tracker_flush(["a"], 0) + _tracker_flush(["b"], 1))
+    assert t.block_lines() == ["b", ""]
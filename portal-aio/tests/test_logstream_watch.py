@@ -0,0 +1,152 @@
+"""Unit tests for the log directory watcher (portal-aio/logstream/watch.py).
+
+The inotify half only runs where the kernel provides it (any Linux CI runner);
+the polling half and the event decoder run everywhere.
+"""
+
+import asyncio
+import os
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logstream import watch
+from logstream.watch import DirectoryWatcher
+
+needs_inotify = pytest.mark.skipif(not watch.inotify_available(), reason="inotify not available")
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+# --- parse_events ------------------------------------------------------------ #
+
+def test_parse_events_decodes_padded_names():
+    name = b"vllm.log\0\0\0\0\0\0\0\0"
+    buf = struct.pack("iIII", 1, watch.IN_MODIFY, 0, len(name)) + name
+    buf += struct.pack("iIII", 1, watch.IN_Q_OVERFLOW, 0, 0)
+    assert watch.parse_events(buf) == [
+        (1, watch.IN_MODIFY, "vllm.log"),
+        (1, watch.IN_Q_OVERFLOW, ""),
+    ]
+
+
+# --- polling fallback -------------------------------------------------------- #
+
+def test_polling_mode_always_requests_rescan(tmp_path, monkeypatch):
+    monkeypatch.setattr(watch, "inotify_available", lambda: False)
+
+    async def go():
+        w = DirectoryWatcher(str(tmp_path), poll_interval=0.01)
+        assert w.start() is False
+        assert w.using_inotify is False
+        return await w.changes(timeout=5)
+
+    assert _run(go()) is None
+
+
+def test_missing_directory_falls_back_to_polling(tmp_path):
+    async def go():
+        w = DirectoryWatcher(str(tmp_path / "absent"), poll_interval=0.01)
+        started = w.start()
+        w.close()
+        return started
+
+    assert _run(go()) is False
+
+
+# --- inotify ----------------------------------------------------------------- #
+
+@needs_inotify
+def test_reports_only_changed_log_files(tmp_path):
+    (tmp_path / "a.log").write_text("x\n")
+    (tmp_path / "b.log").write_text("y\n")
+
+    async def go():
+        w = DirectoryWatcher(str(tmp_path))
+        assert w.start() is True
+        try:
+            with open(tmp_path / "a.log", "a") as f:
+                f.write("more\n")
+            (tmp_path / "ignored.txt").write_text("z")
+            return await w.changes(timeout=5)
+        finally:
+            w.close()
+
+    assert _run(go()) == {"a.log"}
+
+
+@needs_inotify
+def test_times_out_with_empty_set_when_idle(tmp_path):
+    async def go():
+        w = DirectoryWatcher(str(tmp_path))
+        w.start()
+        try:
+            return await w.changes(timeout=0.05)
+        finally:
+            w.close()
+
+    assert _run(go()) == set()
+
+
+@needs_inotify
+def test_create_rename_and_delete_are_reported(tmp_path):
+    (tmp_path / "gone.log").write_text("bye\n")
+
+    async def go():
+        w = DirectoryWatcher(str(tmp_path))
+        w.start()
+        try:
+            (tmp_path / "new.log").write_text("hi\n")
+            (tmp_path / "tmp.rotate").write_text("kept\n")
+            os.replace(tmp_path / "tmp.rotate", tmp_path / "moved.log")
+            os.unlink(tmp_path / "gone.log")
+            seen: set = set()
+            while seen != {"new.log", "moved.log", "gone.log"}:
+                seen |= await w.changes(timeout=5)
+            return seen
+        finally:
+            w.close()
+
+    assert _run(go()) == {"new.log", "moved.log", "gone.log"}
+
+
+@needs_inotify
+def test_bursts_of_writes_coalesce_into_one_batch(tmp_path):
+    path = tmp_path / "pip.log"
+    path.write_text("")
+
+    async def go():
+        w = DirectoryWatcher(str(tmp_path))
+        w.start()
+        try:
+            with open(path, "a") as f:
+                for i in range(200):
+                    f.write(f"line {i}\n")
+                    f.flush()
+            first = await w.changes(timeout=5)
+            second = await w.changes(timeout=0.05)
+            return first, second
+        finally:
+            w.close()
+
+    assert _run(go()) == ({"pip.log"}, set())
+
+
+@needs_inotify
+def test_removing_the_directory_degrades_to_rescans(tmp_path):
+    d = tmp_path / "portal"
+    d.mkdir()
+
+    async def go():
+        w = DirectoryWatcher(str(d), poll_interval=0.01)
+        w.start()
+        d.rmdir()
+        result = await w.changes(timeout=5)
+        return result, w.using_inotify
+
+    assert _run(go()) == (None, False)
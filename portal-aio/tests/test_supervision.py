@@ -0,0 +1,299 @@
+"""Unit tests for supervisor access (portal-aio/supervision)."""
+
+import asyncio
+import os
+import socketserver
+import sys
+import threading
+import xmlrpc.client
+from xmlrpc.server import SimpleXMLRPCDispatcher, SimpleXMLRPCRequestHandler
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from supervision import SupervisorClient, SupervisorMonitor, batch, format_processes, hidden_programs
+from supervision.client import _UnixStreamTransport
+
+
+def _run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def _info(name, state="RUNNING", **extra):
+    return {"name": name, "group": name, "statename": state, "pid": 10, "start": 100, "now": 200, **extra}
+
+
+# --- client ------------------------------------------------------------------ #
+
+class _KeepAliveHandler(SimpleXMLRPCRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = False   # Not a TCP socket
+
+    def address_string(self):
+        return "unix"
+
+
+class _UnixXMLRPCServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer, SimpleXMLRPCDispatcher):
+    daemon_threads = True
+
+    def __init__(self, path):
+        SimpleXMLRPCDispatcher.__init__(self, allow_none=True)
+        socketserver.UnixStreamServer.__init__(self, path, _KeepAliveHandler)
+        self.logRequests = False
+
+
+@pytest.fixture
+def supervisord(tmp_path):
+    path = str(tmp_path / "supervisor.sock")
+    server = _UnixXMLRPCServer(path)
+    states = {"comfyui": "RUNNING"}
+
+    def get_all():
+        return [_info(name, state) for name, state in states.items()]
+
+    def stop(name):
+        if name not in states:
+            raise xmlrpc.client.Fault(10, "BAD_NAME")
+        states[name] = "STOPPED"
+        return True
+
+    server.register_function(get_all, "supervisor.getAllProcessInfo")
+    server.register_function(stop, "supervisor.stopProcess")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield path
+    server.shutdown()
+    server.server_close()
+
+
+def test_client_reuses_one_connection(supervisord, monkeypatch):
+    transports = []
+    real_init = _UnixStreamTransport.__init__
+
+    def init(self, *args, **kwargs):
+        real_init(self, *args, **kwargs)
+        transports.append(self)
+
+    monkeypatch.setattr(_UnixStreamTransport, "__init__", init)
+    client = SupervisorClient(supervisord)
+    for _ in range(5):
+        assert client.call("supervisor.getAllProcessInfo")[0]["statename"] == "RUNNING"
+    with pytest.raises(xmlrpc.client.Fault):
+        client.call("supervisor.stopProcess", "missing")
+    assert client.call("supervisor.stopProcess", "comfyui") is True
+    assert len(transports) == 1 and transports[0].connects == 1
+    client.close()
+
+
+def test_client_without_supervisor_raises(tmp_path):
+    with pytest.raises(OSError):
+        SupervisorClient(str(tmp_path / "absent.sock")).call("supervisor.getAllProcessInfo")
+
+
+# --- formatting -------------------------------------------------------------- #
+
+def test_format_processes_hides_skipped_and_marks_unstoppable(tmp_path):
+    (tmp_path / "pyworker").touch()
+    hidden = hidden_programs(str(tmp_path))
+    assert hidden == {"pyworker"} and hidden_programs(str(tmp_path / "missing")) == set()
+    out = format_processes([_info("caddy"), _info("pyworker")], hidden=hidden, unstoppable={"caddy"})
+    assert out == [{
+        "name": "caddy", "group": "caddy", "state": "RUNNING", "description": "",
+        "pid": 10, "start": 100, "now": 200, "unstoppable": True,
+    }]
+
+
+# --- monitor ----------------------------------------------------------------- #
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_monitor_serves_reads_within_max_age():
+    clock = _Clock()
+    monitor = SupervisorMonitor(lambda: format_processes([_info("comfyui")]), max_age=1.0, clock=clock)
+
+    async def scenario():
+        results = await asyncio.gather(*(monitor.get() for _ in range(5)))
+        assert all(r == results[0] for r in results)
+        clock.now = 0.5
+        await monitor.get()
+        assert monitor.reads == 1
+        clock.now = 1.5
+        await monitor.get()
+        assert monitor.reads == 2
+        monitor.current(max_age=0)
+        assert monitor.reads == 3
+
+    _run(scenario())
+
+
+def test_monitor_pushes_only_state_changes():
+    procs = [_info("comfyui", description="pid 10, uptime 0:00:00")]
+
+    def read():
+        # Both change on every read, but neither is a state change
+        procs[0]["now"] += 1
+        procs[0]["description"] = f"pid 10, uptime 0:00:{procs[0]['now'] % 60:02d}"
+        return format_processes(procs)
+
+    monitor = SupervisorMonitor(read, interval=0.01, max_age=0)
+
+    async def scenario():
+        runner = asyncio.ensure_future(monitor.run())
+        async with monitor.subscribe() as updates:
+            version, first = await asyncio.wait_for(updates.get(), 1)
+            assert first[0]["state"] == "RUNNING"
+            await asyncio.sleep(0.05)
+            assert updates.empty() and monitor.reads > 2
+            procs[0]["statename"] = "STOPPED"
+            procs[0]["description"] = "Oct 18 12:00 PM"
+            monitor.poke()
+            version2, second = await asyncio.wait_for(updates.get(), 1)
+            assert second[0]["state"] == "STOPPED" and version2 == version + 1
+        reads = monitor.reads
+        await asyncio.sleep(0.05)
+        assert monitor.subscribers == 0 and monitor.reads <= reads + 1   # Idle without subscribers
+        runner.cancel()
+
+    _run(scenario())
+
+
+# --- batch ------------------------------------------------------------------- #
+
+class _FakeSupervisor:
+    """A supervisord whose programs take one status read to change state."""
+
+    def __init__(self, programs, broken=()):
+        self.states = dict(programs)   # "group:name" or "name" -> state
+        self.broken = set(broken)
+        self.pending = {}
+        self.calls = []
+
+    def _info(self):
+        out = []
+        for full, state in self.states.items():
+            group, _, name = full.rpartition(":")
+            out.append({"name": name, "group": group or name, "statename": state})
+        return out
+
+    def _start(self, full):
+        if self.states[full] in ("RUNNING", "STARTING"):
+            return {"faultCode": 60, "faultString": "ALREADY_STARTED"}
+        self.states[full] = "STARTING"
+        self.pending[full] = "FATAL" if full in self.broken else "RUNNING"
+        return True
+
+    def _stop(self, full):
+        if self.states[full] in batch.DOWN_STATES:
+            return {"faultCode": 70, "faultString": "NOT_RUNNING"}
+        self.states[full] = "STOPPING"
+        self.pending[full] = "STOPPED"
+        return True
+
+    def _group(self, verb, group):
+        members = [f for f in self.states if f.startswith(group + ":")]
+        out = []
+        for full in members:
+            value = verb(full)
+            status = value["faultCode"] if isinstance(value, dict) else 80
+            out.append({"name": full.split(":")[1], "group": group, "status": status, "description": "OK"})
+        return out
+
+    def call(self, method, *args):
+        self.calls.append(method)
+        if method == "supervisor.getAllProcessInfo":
+            info = self._info()
+            self.states.update(self.pending)
+            self.pending.clear()
+            return info
+        assert method == "system.multicall"
+        out = []
+        for call in args[0]:
+            target, wait = call["params"]
+            assert wait is False
+            verb = self._start if "start" in call["methodName"] else self._stop
+            out.append(self._group(verb, target) if call["methodName"].endswith("Group") else verb(target))
+        return out
+
+
+def _batch(fake, actions, **kwargs):
+    kwargs.setdefault("sleep", lambda _: None)
+    return {(r["action"], r["name"]): r for r in batch.run_batch(fake, actions, **kwargs)}
+
+
+def test_batch_restarts_a_group_with_two_multicalls_and_waits_for_running():
+    fake = _FakeSupervisor({"workers:w0": "RUNNING", "workers:w1": "RUNNING", "comfyui": "STOPPED"})
+    results = _batch(fake, [batch.Action("restart", group="workers"), batch.Action("start", name="comfyui")], wait=True)
+    assert fake.calls.count("system.multicall") == 2
+    assert all(r["status"] == "ok" and r["state"] == "RUNNING" for r in results.values())
+    assert set(results) == {("restart", "workers:w0"), ("restart", "workers:w1"), ("start", "comfyui")}
+
+
+def test_batch_keeps_unstoppable_rules():
+    fake = _FakeSupervisor({"caddy": "RUNNING", "instance_portal": "RUNNING", "comfyui": "RUNNING"})
+    detached = []
+    results = _batch(
+        fake,
+        [batch.Action("stop", name="caddy"), batch.Action("restart", name="instance_portal"),
+         batch.Action("stop", name="comfyui"), batch.Action("stop", name="missing")],
+        unstoppable={"caddy", "instance_portal"}, detached_restart=detached.append,
+    )
+    assert results[("stop", "caddy")]["status"] == "error" and fake.states["caddy"] == "RUNNING"
+    assert detached == ["instance_portal"] and results[("restart", "instance_portal")]["status"] == "ok"
+    assert results[("stop", "comfyui")]["status"] == "ok"
+    assert results[("stop", "missing")]["detail"] == "not found"
+
+
+def test_batch_says_detached_restarts_are_not_waited_for():
+    fake = _FakeSupervisor({"instance_portal": "RUNNING"})
+    results = _batch(fake, [batch.Action("restart", name="instance_portal")], wait=True,
+                     unstoppable={"instance_portal"}, detached_restart=lambda name: None)
+    assert results[("restart", "instance_portal")]["detail"] == "restart handed to supervisorctl, not waited for"
+
+
+def test_batch_refuses_bare_names_in_several_groups():
+    fake = _FakeSupervisor({"a:worker": "RUNNING", "b:worker": "RUNNING", "worker2": "RUNNING"})
+    with pytest.raises(batch.BatchError, match="group:name"):
+        _batch(fake, [batch.Action("stop", name="worker")])
+    assert fake.calls == ["supervisor.getAllProcessInfo"]   # Refused before anything ran
+    results = _batch(fake, [batch.Action("stop", name="a:worker"), batch.Action("stop", name="worker2")])
+    assert set(results) == {("stop", "a:worker"), ("stop", "worker2")}
+    assert fake.states["b:worker"] == "RUNNING"
+
+
+def test_batch_reports_fatal_at_once_and_times_out_on_one_deadline():
+    fake = _FakeSupervisor({"vllm": "STOPPED", "comfyui": "RUNNING"}, broken={"vllm"})
+    results = _batch(fake, [batch.Action("start", name="vllm"), batch.Action("start", name="comfyui")], wait=True)
+    assert results[("start", "vllm")]["detail"] == "entered FATAL and will not start"
+    assert results[("start", "comfyui")]["status"] == "ok"   # ALREADY_STARTED is not an error
+
+    stuck = _FakeSupervisor({"slow": "STOPPED"})
+    stuck.call = lambda method, *args, _real=stuck.call: (
+        [{"name": "slow", "group": "slow", "statename": "STARTING"}] if method == "supervisor.getAllProcessInfo"
+        else _real(method, *args))
+    clock = _Clock()
+
+    def sleep(seconds):
+        clock.now += seconds
+
+    results = _batch(stuck, [batch.Action("start", name="slow")], wait=True, timeout=3, clock=clock, sleep=sleep)
+    assert results[("start", "slow")]["detail"] == "not running after 3s" and clock.now == pytest.approx(3)
+
+
+def test_batch_rejects_malformed_actions():
+    with pytest.raises(batch.BatchError):
+        batch.Action("reload", name="x")
+    with pytest.raises(batch.BatchError):
+        batch.Action("start", name="x", group="y")
+    with pytest.raises(batch.BatchError):
+        batch.run_batch(_FakeSupervisor({}), [])
@@ -0,0 +1,154 @@
+"""Unit tests for GPU telemetry providers (portal-aio/telemetry/gpu.py)."""
+
+import math
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telemetry import gpu as gpu_mod
+from telemetry.gpu import (
+    GPU,
+    FakeProvider,
+    GPUProcess,
+    GPUTelemetry,
+    GPUTelemetryError,
+    GPUtilProvider,
+    NVMLProvider,
+    detect_providers,
+    parse_rocm_pids,
+    parse_rocm_smi,
+)
+
+H100 = GPU(index=0, name="NVIDIA H100", vendor="nvidia", load=80.0, memory_used=1000.0, memory_total=80000.0)
+
+
+# --- GPUTelemetry ------------------------------------------------------------ #
+
+def test_read_concatenates_providers_and_reports_failures_by_kind():
+    amd = FakeProvider([GPU(index=0, name="MI300X", vendor="amd")])
+    broken = FakeProvider(error="rocm-smi exited with 1")
+    broken.kind = "rocm"
+    telemetry = GPUTelemetry([FakeProvider([H100]), amd, broken])
+    gpus, errors = telemetry.read()
+    assert [g.name for g in gpus] == ["NVIDIA H100", "MI300X"]
+    assert errors == {"rocm": "rocm-smi exited with 1"}
+
+
+def test_fake_provider_returns_copies():
+    provider = FakeProvider([H100])
+    provider.gpus()[0].load = 0.0
+    assert provider.gpus()[0].load == 80.0 and provider.reads == 2
+
+
+def test_driver_info_merges_first_answer_wins():
+    telemetry = GPUTelemetry([
+        FakeProvider(driver={"driver_version": "580.95.05"}),
+        FakeProvider(driver={"driver_version": "other", "compute_capability": ["9.0"]}),
+    ])
+    assert telemetry.driver() == {"driver_version": "580.95.05", "compute_capability": ["9.0"]}
+
+
+# --- providers --------------------------------------------------------------- #
+
+def test_nvml_without_the_library_is_a_telemetry_error():
+    with pytest.raises(GPUTelemetryError):
+        NVMLProvider("libnvidia-ml-does-not-exist.so")
+
+
+def test_gputil_nan_fields_become_none(monkeypatch):
+    fake = types.SimpleNamespace(getGPUs=lambda: [types.SimpleNamespace(
+        id=0, name="NVIDIA GB10", uuid="GPU-1", load=0.25,
+        memoryUsed=math.nan, memoryTotal=math.nan, temperature=41.0,
+    )])
+    monkeypatch.setitem(sys.modules, "GPUtil", fake)
+    (gpu,) = GPUtilProvider().gpus()
+    assert gpu.load == 25.0 and gpu.temperature == 41.0
+    assert gpu.memory_used is None and gpu.memory_total is None
+
+
+def test_parse_rocm_smi():
+    data = {
+        "card0": {
+            "VRAM Total Memory (B)": "206141652992",
+            "VRAM Total Used Memory (B)": "1073741824",
+            "GPU use (%)": "37",
+            "Temperature (Sensor edge) (C)": "45.0",
+            "Current Socket Graphics Package Power (W)": "143.0",
+            "sclk clock speed:": "(2100Mhz)",
+            "mclk clock speed:": "(1300Mhz)",
+        },
+        "card1": {"GPU use (%)": "N/A"},
+        "system": {"Driver version": "6.8.5"},
+    }
+    names = {"card0": {"Card Vendor": "Advanced Micro Devices, Inc. [AMD/ATI]", "Card SKU": "MI300X", "GFX Version": "gfx942"}}
+    first, second = parse_rocm_smi(data, names)
+    assert first.name == "AMD/ATI MI300X (gfx942)" and first.vendor == "amd"
+    assert first.load == 37.0 and first.memory_used == 1024.0
+    assert first.temperature == 45.0 and first.power_draw == 143.0
+    assert (first.clock_sm, first.clock_memory) == (2100, 1300)
+    assert second.index == 1 and second.name == "AMD GPU"
+    assert second.load is None and second.memory_total is None
+
+
+# --- selection --------------------------------------------------------------- #
+
+def test_unknown_provider_names_are_rejected():
+    with pytest.raises(ValueError, match="bogus"):
+        detect_providers("nvml,bogus")
+
+
+def test_explicit_selection_skips_unavailable_providers(monkeypatch):
+    def unavailable():
+        raise GPUTelemetryError("nope")
+    monkeypatch.setitem(gpu_mod.PROVIDERS, "nvml", unavailable)
+    monkeypatch.setitem(gpu_mod.PROVIDERS, "rocm-smi", lambda: FakeProvider([H100]))
+    providers = detect_providers("nvml,rocm-smi")
+    assert len(providers) == 1 and providers[0].gpus()[0].name == "NVIDIA H100"
+    assert detect_providers("none") == []
+
+
+def test_auto_falls_back_to_gputil_only_when_nvml_fails(monkeypatch):
+    opened = []
+
+    def factory(name, works):
+        def make():
+            opened.append(name)
+            if not works:
+                raise GPUTelemetryError(name)
+            return FakeProvider()
+        return make
+
+    monkeypatch.setattr(gpu_mod.shutil, "which", lambda binary: f"/usr/bin/{binary}")
+    monkeypatch.setitem(gpu_mod.PROVIDERS, "nvml", factory("nvml", True))
+    monkeypatch.setitem(gpu_mod.PROVIDERS, "gputil", factory("gputil", True))
+    monkeypatch.setitem(gpu_mod.PROVIDERS, "rocm-smi", factory("rocm-smi", True))
+    assert len(detect_providers("auto")) == 2
+    assert opened == ["nvml", "rocm-smi"]
+
+    opened.clear()
+    monkeypatch.setitem(gpu_mod.PROVIDERS, "nvml", factory("nvml", False))
+    assert len(detect_providers("auto")) == 2
+    assert opened == ["nvml", "gputil", "rocm-smi"]
+
+
+# --- processes --------------------------------------------------------------- #
+
+def test_processes_skip_failing_providers():
+    process = GPUProcess(pid=4242, vendor="nvidia", gpu=0, memory_used=512.0)
+    telemetry = GPUTelemetry([FakeProvider(processes=[process]), FakeProvider(error="gone")])
+    assert telemetry.processes() == [process]
+
+
+def test_parse_rocm_pids():
+    data = {"system": {
+        "PID3001": "python3, 1, 1073741824, 0, 0",
+        "PID3002": "ollama, 2, N/A, 0, 0",
+        "Driver version": "6.8.5",
+    }}
+    first, second = parse_rocm_pids(data)
+    assert (first.pid, first.name, first.memory_used, first.gpu) == (3001, "python3", 1024.0, None)
+    assert (second.pid, second.memory_used) == (3002, None)
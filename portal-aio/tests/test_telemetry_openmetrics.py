@@ -0,0 +1,76 @@
+"""Unit tests for the /metrics exposition (portal-aio/telemetry/openmetrics.py)."""
+
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telemetry.openmetrics import Family, render, sample_families, wants_openmetrics
+
+
+def test_render_openmetrics_and_prometheus_text():
+    requests = Family("portal_requests", "counter", "Requests served")
+    requests.add(3, path='/logs/"a"\n')
+    up = Family("instance_up", "gauge", "Up").add(1).add(None)
+    empty = Family("instance_unused", "gauge", "No samples")
+
+    assert render([requests, up, empty]) == (
+        "# HELP portal_requests Requests served\n"
+        "# TYPE portal_requests counter\n"
+        'portal_requests_total{path="/logs/\\"a\\"\\n"} 3\n'
+        "# HELP instance_up Up\n"
+        "# TYPE instance_up gauge\n"
+        "instance_up 1\n"
+        "# EOF\n"
+    )
+    text = render([requests], openmetrics=False)
+    assert "# TYPE portal_requests_total counter" in text and "# EOF" not in text
+
+
+def test_values():
+    family = Family("v", "gauge", "v").add(2.5).add(math.nan).add(math.inf).add(True).add(10**20)
+    assert [line.split()[-1] for line in family.lines()[2:]] == ["2.5", "NaN", "+Inf", "1e+20"]
+
+
+def test_accept_negotiation():
+    assert wants_openmetrics("application/openmetrics-text;version=1.0.0,text/plain;version=0.0.4;q=0.5")
+    assert not wants_openmetrics("text/plain") and not wants_openmetrics(None)
+
+
+def test_sample_families():
+    sample = {
+        "cpu": {"percent": 12.5, "count": 8},
+        "ram": {"total": 1000, "used": 250, "percent": 25.0},
+        "disk": {"total": 100, "used": 40},
+        "volume": {"path": "/workspace", "total": 500, "used": 5},
+        "gpu": {
+            "count": 1,
+            "devices": [{"index": 0, "vendor": "nvidia", "name": "H100", "uuid": "GPU-a",
+                         "load": 90.0, "memory_used": 2.0, "memory_total": None, "clock_sm": 1980}],
+            "processes": [
+                {"pid": 11, "vendor": "nvidia", "gpu": 0, "memory_used": 1.0, "program": "vllm"},
+                {"pid": 12, "vendor": "nvidia", "gpu": 0, "memory_used": 0.5, "program": "vllm"},
+                {"pid": 13, "vendor": "nvidia", "gpu": 0, "memory_used": 0.5, "program": None},
+            ],
+        },
+        "supervisor": [
+            {"name": "vllm", "state": "RUNNING", "start": 1000, "now": 1600},
+            {"name": "jupyter", "state": "FATAL", "start": 0, "now": 1600},
+        ],
+    }
+    text = render(sample_families(sample))
+    assert "instance_cpu_usage_percent 12.5\n" in text
+    assert 'instance_filesystem_used_bytes{mount="/workspace"} 5\n' in text
+    assert 'instance_gpu_memory_used_bytes{gpu="0",vendor="nvidia",name="H100",uuid="GPU-a"} 2097152\n' in text
+    assert "instance_gpu_memory_total_bytes" not in text
+    assert 'instance_gpu_clock_hertz{clock="sm",gpu="0",vendor="nvidia",name="H100",uuid="GPU-a"} 1980000000\n' in text
+    assert 'instance_gpu_program_memory_bytes{program="vllm",vendor="nvidia",gpu="0"} 1572864\n' in text
+    assert 'instance_gpu_program_memory_bytes{program="",vendor="nvidia",gpu="0"} 524288\n' in text
+    assert 'instance_supervisor_process_state{program="jupyter",state="FATAL"} 1\n' in text
+    assert 'instance_supervisor_process_uptime_seconds{program="vllm"} 600\n' in text
+    assert 'uptime_seconds{program="jupyter"}' not in text
+
+
+def test_an_empty_sample_renders_only_eof():
+    assert render(sample_families({})) == "# EOF\n"
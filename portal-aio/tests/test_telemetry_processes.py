@@ -0,0 +1,57 @@
+"""Unit tests for GPU process attribution (portal-aio/telemetry/processes.py)."""
+
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telemetry import GPUProcess, attribute_processes
+from telemetry.processes import parent_pid, process_name
+
+
+def _gpu_process(pid):
+    return GPUProcess(pid=pid, vendor="nvidia", gpu=0, memory_used=100.0)
+
+
+def test_parent_pid_and_name_read_proc():
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(5)"])
+    try:
+        assert parent_pid(child.pid) == os.getpid()
+        assert process_name(child.pid).startswith("python")
+    finally:
+        child.kill()
+        child.wait()
+    assert parent_pid(child.pid) is None and process_name(child.pid) is None
+
+
+def test_workers_are_attributed_through_their_launcher():
+    # supervisor -> 100 (launch.sh) -> 101 (torchrun) -> 102, 103 (ranks); 200 is unrelated
+    parents = {100: 1, 101: 100, 102: 101, 103: 101, 200: 1}
+    walked = []
+
+    def parent(pid):
+        walked.append(pid)
+        return parents.get(pid)
+
+    processes = attribute_processes(
+        [_gpu_process(102), _gpu_process(103), _gpu_process(200), _gpu_process(300)],
+        {100: "vllm"},
+        parent=parent,
+        name=lambda pid: f"p{pid}",
+    )
+    assert [(p.name, p.program) for p in processes] == [
+        ("p102", "vllm"), ("p103", "vllm"), ("p200", None), ("p300", None),
+    ]
+    # 103's walk stops at 101, already resolved for 102
+    assert walked.count(101) == 1
+
+
+def test_real_process_tree():
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(5)"])
+    try:
+        (process,) = attribute_processes([_gpu_process(child.pid)], {os.getpid(): "tests"})
+    finally:
+        child.kill()
+        child.wait()
+    assert process.program == "tests" and process.name.startswith("python")
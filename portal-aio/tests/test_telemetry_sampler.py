@@ -0,0 +1,125 @@
+"""Unit tests for background metrics sampling (portal-aio/telemetry/)."""
+
+import asyncio
+import math
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telemetry import MetricsSampler, RingSeries, parse_window
+
+
+# --- RingSeries -------------------------------------------------------------- #
+
+def test_ring_keeps_the_newest_samples_in_order():
+    ring = RingSeries(["a"], capacity=4)
+    for t in range(10):
+        ring.append(float(t), {"a": t * 10})
+    assert len(ring) == 4
+    assert ring.window(0) == {"t": [6.0, 7.0, 8.0, 9.0], "a": [60, 70, 80, 90]}
+    assert ring.latest() == (9.0, {"a": 90.0})
+
+
+def test_window_starts_at_since():
+    ring = RingSeries(["a"], capacity=8)
+    for t in range(6):
+        ring.append(float(t), {"a": t})
+    assert ring.window(3.5)["t"] == [4.0, 5.0]
+    assert ring.window(100) == {"t": [], "a": []}
+
+
+def test_missing_and_non_finite_values_come_back_as_none():
+    ring = RingSeries(["a", "b"], capacity=3)
+    ring.append(1.0, {"a": math.nan})
+    ring.append(2.0, {"a": True, "b": 5})
+    assert ring.window(0) == {"t": [1.0, 2.0], "a": [None, None], "b": [None, 5]}
+
+
+def test_downsampling_averages_buckets_and_skips_gaps():
+    ring = RingSeries(["a"], capacity=16)
+    for t in range(10):
+        ring.append(float(t), {"a": None if t == 1 else t})
+    out = ring.window(0, points=4)
+    # ceil(10 / 4) = 3 samples per bucket, stamped with the newest time
+    assert out["t"] == [2.0, 5.0, 8.0, 9.0]
+    assert out["a"] == [1.0, 4.0, 7.0, 9.0]
+
+
+def test_parse_window():
+    assert parse_window("600") == 600
+    assert parse_window("90s") == 90
+    assert parse_window("15m") == 900
+    assert parse_window("1.5h") == 5400
+    for bad in ("", "0", "-5", "1w", "m"):
+        with pytest.raises(ValueError):
+            parse_window(bad)
+
+
+# --- MetricsSampler ---------------------------------------------------------- #
+
+def _metrics(cpu):
+    return {"cpu": {"percent": cpu}, "ram": {"percent": 50.0}, "gpu": {"count": 0}}
+
+
+def test_record_extracts_series_and_keeps_the_full_sample():
+    clock = iter([100.0, 105.0, 110.0, 110.0])
+    sampler = MetricsSampler(lambda: None, interval=5, history=60, clock=lambda: next(clock))
+    sampler.record(_metrics(10.0))
+    sampler.record(_metrics(30.0))
+    assert sampler.latest == _metrics(30.0) and sampler.sampled_at == 105.0
+    assert sampler.series.capacity == 12
+    out = sampler.window(60)
+    assert out["interval"] == 5 and out["window"] == 60
+    assert out["series"]["cpu"] == [10.0, 30.0]
+    assert out["series"]["ram"] == [50.0, 50.0]
+    assert out["series"]["gpu_load"] == [None, None]
+
+
+def test_concurrent_requests_share_one_collection():
+    calls = []
+    release = threading.Event()
+
+    def collect():
+        calls.append(1)
+        release.wait(1)
+        return _metrics(len(calls))
+
+    async def go():
+        sampler = MetricsSampler(collect, interval=5)
+        waiting = [asyncio.create_task(sampler.current()) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        release.set()
+        results = await asyncio.gather(*waiting)
+        return sampler, results
+
+    sampler, results = asyncio.run(go())
+    assert len(calls) == 1 and len(sampler.series) == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_run_samples_at_the_interval_and_survives_errors():
+    calls = []
+
+    def collect():
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("nvidia-smi went away")
+        return _metrics(len(calls))
+
+    async def go():
+        sampler = MetricsSampler(collect, interval=0.02)
+        task = asyncio.create_task(sampler.run())
+        await asyncio.sleep(0.09)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return sampler
+
+    sampler = asyncio.run(go())
+    assert len(calls) >= 3
+    assert len(sampler.series) == len(calls) - 1
+    assert sampler.latest["cpu"]["percent"] == len(calls)